@@ -2,7 +2,7 @@
 import os
 import logging
 from celery import Celery
-from celery.signals import worker_ready
+from celery.signals import worker_process_init, worker_ready
 
 log = logging.getLogger(__name__)
 
@@ -51,6 +51,10 @@ celery.conf.update(
 # Tips for oppstart av worker (fra prosjektroten):
 #   celery -A app.celery_instance.celery worker -l info
 #
+# Parallell filbehandling (KS_FILE_WORKERS > 1) kjører som en chord av deltasks på vanlige
+# prefork-arbeidere; antall filer som behandles samtidig begrenses av --concurrency. Deltaskene
+# leser app/temp, så flere worker-maskiner må dele denne mappen.
+#
 # Eksempel på å trigge en oppgave:
 #   from app.tasks.main import process_files_task
 #   process_files_task.delay(temp_dir_path, keywords, min_score, user_id, ns, mode, selected_groups, fokusomraade, ai_settings)
@@ -139,3 +143,15 @@ def _on_worker_ready(sender, **kwargs):
             log.warning("[SCRUB] PURGE broker-kø: slettet %s ventende meldinger.", purged)
         except Exception:
             log.warning("[SCRUB] Purge av broker feilet (fortsetter).", exc_info=True)
+
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs):
+    # Valgfri warm-up av NLP-modeller per worker-prosess (KS_WARMUP_MODELS=all | spacy,semantic,...)
+    try:
+        from app.tasks import models as model_loader
+        loaded = model_loader.warmup_from_env()
+        if loaded:
+            log.info("[WARMUP] Modeller lastet i worker-prosess: %s", loaded)
+    except Exception:
+        log.warning("[WARMUP] Warm-up av modeller feilet (lastes ved første bruk).", exc_info=True)
@@ -12,6 +12,8 @@ __all__ = [
     "SluplanComment",
     "SluplanFile",
     "SluplanDependency",
+    "SluplanSummary",
+    "SluplanSummaryGroup",
 ]
 
 class SluplanProject(db.Model):
@@ -55,6 +57,13 @@ class SluplanDiscipline(db.Model):
 
 class SluplanTask(db.Model):
     __tablename__ = "sluplan_tasks"
+    # Rapporter/dashbord grupperer og filtrerer per prosjekt (se services/sluplan_summary.py)
+    __table_args__ = (
+        db.Index("ix_sluplan_tasks_project_discipline", "project_id", "discipline_id", "status"),
+        db.Index("ix_sluplan_tasks_project_assignee", "project_id", "assignee_id", "status"),
+        db.Index("ix_sluplan_tasks_project_dates", "project_id", "start_date", "end_date"),
+        db.Index("ix_sluplan_tasks_project_end", "project_id", "end_date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
@@ -109,6 +118,10 @@ class SluplanFile(db.Model):
 
 class SluplanDependency(db.Model):
     __tablename__ = "sluplan_dependencies"
+    __table_args__ = (
+        db.Index("ix_sluplan_dependencies_from", "from_task_id"),
+        db.Index("ix_sluplan_dependencies_to", "to_task_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     from_task_id = db.Column(db.Integer, db.ForeignKey("sluplan_tasks.id"), nullable=False)
@@ -127,3 +140,34 @@ class SluplanDependency(db.Model):
         foreign_keys=[to_task_id],
         backref=db.backref("dependencies_to", cascade="all, delete-orphan"),
     )
+
+
+class SluplanSummary(db.Model):
+    """Materialisert sammendrag per prosjekt (se services/sluplan_summary_store.py)."""
+
+    __tablename__ = "sluplan_summaries"
+
+    project_id = db.Column(db.Integer, db.ForeignKey("sluplan_projects.id"), primary_key=True)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+    built_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class SluplanSummaryGroup(db.Model):
+    """Antall og sum varighet per (fag, type, ressurs, status); 0 = uten fag/ressurs."""
+
+    __tablename__ = "sluplan_summary_groups"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "project_id", "discipline_id", "kind", "assignee_id", "status", name="uq_sluplan_summary_groups_key"
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey("sluplan_projects.id"), nullable=False, index=True)
+    discipline_id = db.Column(db.Integer, nullable=False, default=0)
+    kind = db.Column(db.String(32), nullable=False)
+    assignee_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(64), nullable=False)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+    duration_days = db.Column(db.Integer, nullable=False, default=0)
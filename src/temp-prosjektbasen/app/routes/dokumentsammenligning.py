@@ -4,7 +4,6 @@ import re
 import json
 import colorsys
 import logging
-import difflib
 from io import BytesIO
 from pathlib import Path
 from typing import List, Dict, Set, Tuple, Optional
@@ -15,14 +14,16 @@ from werkzeug.utils import secure_filename
 
 # Dokument/tekst
 from fitz import open as fitz_open  # PyMuPDF
-from docx import Document as DocxDocument
-from openpyxl import Workbook, load_workbook
+from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font
 from openpyxl.utils import get_column_letter
 
 # Diff-motor (for "Syntaktisk → diff" Excel-rapport)
 from app.utils import generate_report
-from rapidfuzz import fuzz
+from app.services.diff_engine import DIFF_TIME_BUDGET, iter_diff_blocks, word_diff as engine_word_diff
+from app.services.line_index import LineIndex
+from app.services.doc_text import extract_document, fold_punct, punct_variants
+from app.services.tag_engine import TFM_DICT
 
 # OCR (valgfritt – vi prøver å importere, men appen fungerer uten)
 try:
@@ -47,7 +48,7 @@ os.makedirs(TEMP_ROOT, exist_ok=True)
 # ==============================
 META_CHARS = set(r".^$*+?{}[]\\|()")
 
-TFM_MAP = {"AB": "Bjelke", "AD": "Dekker", "AE": "Elementer", "AF": "Fagverk", "AG": "Glassfelt", "AH": "Fundamenter", "AK": "Komplette konstruksjoner", "AL": "List - Beslistning", "AO": "Oppbygende - Utforende", "AP": "Plate", "AR": "Ramme - Oppheng", "AS": "Søyle", "AU": "Åpninger", "AV": "Vegg", "BA": "Armering Forsterkning", "BB": "Beskyttende - Stoppende", "BC": "Begrensende", "BF": "Fuging", "BG": "Pakning Tetning", "BI": "Isolasjon", "BP": "Avretningsmasse", "BS": "Spikerslag", "CB": "Balkong", "CC": "Baldakin", "CD": "Karnapp", "CG": "Rampe - Repos", "CK": "Komplett konstruksjon", "CM": "Kjemiske stoffer", "CO": "Kobling Overgang", "CP": "Pipe - Skostein", "CQ": "Festemateriell", "CR": "Rammeverk - Oppheng", "CT": "Trapp - Leider", "CX": "Tunnel - Bru (inne-ute)", "DB": "Dør med brannklasse", "DF": "Foldedør - Foldevegg", "DI": "Dør - innvendig", "DK": "Kjøretøyregulering", "DL": "Luke", "DP": "Port", "DT": "Dør - tilfluktsrom", "DU": "Dør - utvendig", "DV": "Vindu", "EB": "Overflatebekledning", "EC": "Overflatebehandling", "EH": "Himling", "FA": "Ventilert arbeidsplass", "FB": "Benk - Bord - Plate - Tavle", "FC": "Beslag", "FD": "Disk - Skranke", "FF": "Fryserom", "FH": "Hylle - Reol", "FI": "Kabinett", "FK": "Kjølerom - Svalrom", "FO": "Sittebenk - Sofa - Stol", "FR": "Rom", "FS": "Skap - Skuff", "FT": "Speil", "FV": "Vaskemaskin", "FX": "Krok - Knagg - Håndtak", "GA": "Automat - Maskin", "GB": "Benk - Bord - Plate - Tavle", "GD": "Dekontamator", "GE": "Autoklaver", "GF": "Fryseskap", "GG": "Gardiner - Forheng", "GH": "Hylle - Reol", "GK": "Kjøleskap - Kjøledisk", "GL": "Lås - Beslag", "GM": "Mattilbereding", "GN": "Nøkler", "GO": "Sofa - Sittebenk", "GP": "Stol", "GQ": "Seng - Liggebenk", "GS": "Skap - Skuffer", "GT": "Tørkeskap - Varmeskap", "GV": "Vaskemaskin", "GW": "Vekt", "GX": "Holder", "GY": "Avfallsbeholder", "HA": "Automobil - Bil", "HB": "Rullebord - Tralle", "HC": "Container - Vogn", "HM": "Maskin", "HS": "Rullestol", "HT": "Truck - kran", "HV": "Verktøy", "IB": "Brenner", "IC": "Solceller-solfangere", "ID": "Kjel for destruksjon", "IE": "Elektrokjel", "IF": "Kjel for fast-bio brensel", "IG": "Generator", "IK": "Kuldeaggregat", "IL": "Energibrønn", "IM": "Motor", "IO": "Oljekjel", "IP": "Gasskjel", "IT": "Trykkluftaggregat (enhet)", "IU": "Turbin", "IV": "Aggregatenhet", "JF": "Forsterker", "JK": "Kompressor", "JP": "Pumpe", "JQ": "Pumpe i VA-installasjoner", "JV": "Vifte", "JW": "Spesialvifte", "KA": "Aktuator", "KD": "Drivhjul - Drev", "KE": "Induktiv energioverføring", "KG": "Gjennomføring", "KH": "Transportenhet (hevende forflyttende)", "KJ": "Jordingskomponenter", "KK": "Kanal", "KM": "Mast - Antenne", "KN": "Nedløp", "KO": "Kraftoverføring", "KQ": "Rør - spesielt", "KR": "Rør - generelt", "KS": "Skinne - Bane - Spor", "KU": "Kombinert kabel", "KV": "Høyspenningskabel > 1000V", "KW": "Lavspenningskabel 50 til 1000V", "KX": "Lavspenningskabel < 50V", "KY": "Optisk kabel", "KZ": "Slange", "LB": "Varmeomformende med vifte", "LC": "Kjøleomformende med vifte", "LD": "Kjøleflater", "LE": "Kondensator", "LF": "Fordamper", "LG": "Gear clutch", "LH": "Varmeflate", "LI": "Varmeelement", "LK": "Kjøleomformende", "LL": "Lyskilde", "LN": "Likeretter", "LO": "Omformer", "LP": "Pens - Veksel - Sjalter", "LQ": "Vekselretter", "LR": "Frekvensomformer", "LS": "Strålevarme", "LU": "Luftfukter", "LV": "Varmeomformende", "LX": "Varmegjenvinner", "LZ": "Varmerkabel - Varmerør", "MA": "Absoluttfilter", "MB": "ABC-filter", "MC": "UV-filter", "ME": "Elektrostatiske filter", "MF": "Luftfilter", "MG": "Fettfilter", "MK": "Kondenspotte", "ML": "Luftutskiller", "MM": "Membran", "MO": "Utskiller", "MR": "Rist - Sil", "MS": "Syklon", "MT": "Tørke", "MU": "Filter for Lyd - Bilde - Frekvensutjevner", "MV": "Vannfilter", "MX": "Støyfilter", "NB": "Batteri - UPS", "NC": "Kondensator", "NI": "Informasjonslagring", "NK": "Kum", "NM": "Badekar - Basseng", "NO": "Åpen tank", "NT": "Tank med trykk", "NU": "Tank uten trykk", "NV": "Vekt Lodd", "NW": "Varmtvannsbereder", "NX": "Toalett", "NY": "Servant", "NZ": "Brannslukkingsapparat", "OA": "AV-maskiner", "OB": "Shuntgruppe", "OD": "Datamaskin", "OE": "Energimåler", "OF": "Systembærer", "OM": "Mottaker - Sender", "OP": "PBX", "OQ": "Dataprogramprogramvare", "OR": "Router Fordeler", "OS": "Sentralenhet Mikser i Lydsystem", "OT": "Telefonapparat", "OU": "Undersentral", "QB": "Belastningsvakt", "QD": "Differansetrykkvakt", "QE": "Elektrisk vern", "QF": "Strømningsvakt", "QG": "", "QH": "Fuktvakt", "QI": "", "QJ": "", "QK": "", "QL": "Lyddemper", "QM": "Mekanisk beskyttelse", "QN": "Nivåvakt", "QO": "Overtrykksventil", "QP": "Trykkvakt", "QQ": "Vibrasjonsvakt", "QR": "Rotasjonsvakt", "QS": "Strømvakt", "QT": "Temperaturvakt", "QU": "", "QV": "Sikkerhetsventil", "QW": "", "QX": "Solavskjerming", "QY": "Lynavleder", "QZ": "Brannvern", "RA": "AV-opptaker", "RB": "Bevegelse", "RC": "Seismometer", "RD": "Differansetrykkgiver", "RE": "Elektriske variabler", "RF": "Strømningsmåler", "RG": "Posisjon - Lengde", "RH": "Fuktighetsgiver", "RI": "Termometer", "RJ": "Fotocelle", "RK": "Kortleser", "RL": "", "RM": "Multifunksjonell Kombinert føler", "RN": "Nivågiver", "RO": "", "RP": "Trykkgiver", "RQ": "Manometer Trykkmåler", "RR": "Giver generelt", "RS": "Hastighetsmåler", "RT": "Temperaturgiver", "RU": "Ur", "RV": "Veieceller", "RW": "Virkningsgradsmåler", "RX": "Målepunkt", "RY": "Gassdetektor-Røykdetektor", "RZ": "Branndeteksjon", "SA": "Reguleringsventil manuell", "SB": "Reguleringsventil motorstyrt", "SC": "Stengeventil motorstyrt", "SD": "Alarmventil sprinkler", "SE": "Ekspansjonsventil", "SF": "Fraluftsventil", "SG": "Tilbakeslagsventil - Overtrykkspjeld", "SH": "Hurtigkobling", "SI": "Effektregulator", "SJ": "Jevntrykksventil", "SK": "Strømningsregulator - CAV", "SL": "", "SM": "Stengeventil manuell", "SN": "", "SO": "", "SP": "Trykkutjevningsventil", "SQ": "Strømningsregulator - VAV", "SR": "Reguleringsspjeld", "SS": "Stengespjeld", "ST": "Tilluftsventil", "SU": "Sugetrykksventil", "SV": "Strupeventil", "SW": "Plenumskammer", "SX": "Regulator", "SY": "", "SZ": "Brannspjeld - Røykspjeld", "UA": "Uttak alarm", "UB": "Blandebatteri", "UC": "", "UD": "Uttak data", "UE": "Uttak el", "UF": "Fellesuttak", "UG": "Uttak gass", "UH": "Høyttaler", "UI": "", "UJ": "Skriver", "UK": "Kontrollpanel - Tablå", "UL": "Uttak trykkluft", "UM": "Monitor - Display", "UN": "Nødbelysning", "UO": "Trommel", "UP": "Belysningsarmatur", "UQ": "", "UR": "Uttak radio", "US": "Stasjon", "UT": "Uttak telefon", "UU": "", "UV": "Uttak vann", "UW": "", "UX": "Koblingsboks", "UY": "Uttak antenne", "UZ": "Dyse - Spreder", "VA": "", "VB": "Bærelag", "VC": "", "VD": "Dekke", "VE": "", "VF": "", "VG": "Gress", "VH": "", "VI": "", "VJ": "", "VK": "Kantstein heller", "VL": "Masse", "VM": "Mekanisk beskyttelse", "VN": "", "VO": "", "VP": "Planterbuskertrær", "VQ": "", "VR": "", "VS": "Skilt", "VT": "", "VU": "", "VV": "", "VW": "", "VX": "", "VY": "", "VZ": "", "XA": "", "XB": "", "XC": "Kondensator", "XD": "Komp. for binærlogikk", "XE": "", "XF": "Komponenter for vern", "XG": "Komponenter for krafttilførsel", "XH": "Komponenter for signalering", "XI": "Potensiometer", "XJ": "", "XK": "Releer - Kontaktorer", "XL": "Induktiv komponenter", "XM": "Motor", "XN": "Integrerte kretser", "XO": "Urbryter - Timer", "XP": "Komponenter for måling og prøving", "XQ": "Effektbryter", "XR": "Motstand", "XS": "Bryter / Vender", "XT": "Transformator", "XU": "", "XV": "Halvlederkomponenter og elektronrør", "XW": "", "XX": "Rekkeklemmer - Samlesignal", "XY": "", "XZ": "Terminering og tilpasning", "YA": "", "YB": "", "YC": "", "YD": "", "YE": "", "YF": "", "YG": "", "YH": "", "YI": "", "YJ": "", "YK": "", "YL": "", "YM": "", "YN": "", "YO": "", "YP": "", "YQ": "", "YR": "", "YS": "", "YT": "", "YU": "", "YV": "", "YW": "", "YX": "", "YY": "", "YZ": "", "ZA": "", "ZB": "", "ZC": "", "ZD": "", "ZE": "", "ZF": "", "ZG": "", "ZH": "", "ZI": "", "ZJ": "", "ZK": "", "ZL": "", "ZM": "", "ZN": "", "ZO": "", "ZP": "", "ZQ": "", "ZR": "", "ZS": "", "ZT": "", "ZU": "", "ZV": "", "ZW": "", "ZX": "", "ZY": "", "ZZ": ""}
+TFM_MAP = TFM_DICT
 
 def is_regex(pat: str) -> bool:
     return any(ch in META_CHARS for ch in (pat or ""))
@@ -106,111 +107,18 @@ def make_flex_from_sample(sample: str) -> str:
 # ==============================
 def extract_lines_backup(path: str) -> list[str]:
     """
-    Samme strategi som i backup/diff:
+    Samme strategi som i backup/diff (én gjennomgang, se app.services.doc_text):
       - PDF: page.get_text() → splitlines
       - DOCX: avsnitt
       - XLSX/XLS: celler pr. rad
       - TXT: linjer
-    + punktum/komma-varianter pr linje
+    Punktum/komma-varianter lagres ikke som egne linjer; se punct_variants/fold_punct.
     """
-    ext = Path(path).suffix.lower()
-    raw_lines: list[str] = []
-    try:
-        if ext == '.pdf':
-            doc = fitz_open(path)
-            raw_lines = sum([page.get_text().splitlines() for page in doc], [])
-        elif ext == '.docx':
-            doc = DocxDocument(path)
-            raw_lines = [p.text for p in doc.paragraphs]
-        elif ext in ('.xlsx', '.xls'):
-            wb = load_workbook(path, read_only=True, data_only=True)
-            for ws in wb.worksheets:
-                for row in ws.iter_rows(values_only=True):
-                    raw_lines.append(' '.join(str(c) for c in row if c is not None))
-        else:
-            with open(path, 'r', errors='ignore') as f:
-                raw_lines = f.read().splitlines()
-    except Exception:
-        logging.warning(f"Kunne ikke lese fil: {path}")
-
-    lines: list[str] = []
-    for line in raw_lines:
-        s = (line or "").strip()
-        if not s:
-            continue
-        lines.append(s)                 # original
-        alt = s.replace('.', ',')       # punktum → komma
-        if alt != s:
-            lines.append(alt)
-        alt2 = s.replace(',', '.')      # komma → punktum
-        if alt2 != s:
-            lines.append(alt2)
-    return lines
-
-def extract_lines_pdf_words(path: str) -> list[str]:
-    """
-    Robust PDF-variant: bruk page.get_text('words') og grupper (block,line).
-    Gir ofte 'KA401' som ett ord selv når PDF lagrer tegn separat.
-    """
-    if Path(path).suffix.lower() != '.pdf':
-        return []
-
-    lines: list[str] = []
-    try:
-        doc = fitz_open(path)
-        for page in doc:
-            words = page.get_text("words")  # x0,y0,x1,y1,text,block,line,word
-            if not words:
-                txt = page.get_text() or ""
-                if txt:
-                    lines.extend([ln for ln in txt.splitlines() if ln.strip()])
-                continue
-            words.sort(key=lambda w: (w[5], w[6], w[7]))
-            curr = None
-            buff = []
-            for w in words:
-                key = (w[5], w[6])
-                tok = (w[4] or "").strip()
-                if not tok:
-                    continue
-                if key != curr and buff:
-                    lines.append(" ".join(buff))
-                    buff = []
-                curr = key
-                buff.append(tok)
-            if buff:
-                lines.append(" ".join(buff))
-    except Exception:
-        logging.exception("PDF word-ekstraksjon feilet (fall-back til backup)")
-
-    # samme punktum/komma-varianter
-    out: list[str] = []
-    for s in lines:
-        s = s.strip()
-        if not s:
-            continue
-        out.append(s)
-        alt = s.replace('.', ',')
-        if alt != s:
-            out.append(alt)
-        alt2 = s.replace(',', '.')
-        if alt2 != s:
-            out.append(alt2)
-    return out
+    return extract_document(path).lines
 
 def merged_lines_for_search(path: str) -> list[str]:
-    """For SØK: slå sammen backup-linjer og ordbaserte PDF-linjer (hvis PDF)."""
-    base = extract_lines_backup(path)
-    ordlinjer = extract_lines_pdf_words(path)
-    if not ordlinjer:
-        return base
-    seen = set()
-    out = []
-    for ln in base + ordlinjer:
-        if ln not in seen:
-            seen.add(ln)
-            out.append(ln)
-    return out
+    """For SØK: backup-linjer og ordbaserte PDF-linjer (hvis PDF) fra samme gjennomgang."""
+    return extract_document(path).search_lines()
 
 # ==============================
 # Mønster-normalisering (diff-lignende elastisitet)
@@ -242,7 +150,7 @@ def make_search_patterns(user_pat: str) -> List[re.Pattern]:
 # ==============================
 def find_matches_build_rows(filename: str, lines: List[str], user_pat: str) -> List[Dict]:
     """
-    Søk linje-for-linje (og i 'joined'):
+    Søk linje-for-linje (og i 'joined'), i hver linje og dens punktum/komma-varianter:
       - brukerens mønster(e) (inkl. elastisk)
       - joined-linje (K A 4 0 1 → KA401)
       - dokument-nivå 'joined'
@@ -256,7 +164,7 @@ def find_matches_build_rows(filename: str, lines: List[str], user_pat: str) -> L
     rxs = make_search_patterns(user_pat)
 
     # 1) linje-for-linje
-    for raw in lines:
+    for raw in (v for base in lines for v in punct_variants(base)):
         line = compact_spaces(raw)
         if not line:
             continue
@@ -316,19 +224,19 @@ def find_matches_build_rows(filename: str, lines: List[str], user_pat: str) -> L
                     start = m.end()
 
     # 2) dokument-nivå joined
-    full_joined = join_word_whitespace(" ".join(lines))
-    for rx in rxs:
-        for m in rx.finditer(full_joined):
-            val_raw = m.group(0)
-            val_can = canonical(val_raw)
-            if val_can not in seen_vals:
-                seen_vals.add(val_can)
-                rows.append({
-                    "Filnavn": filename,
-                    "Komplett navn": val_raw,
-                    "Regex-treff": val_raw,
-                    "Komponenttekst (TFM)": tfm_desc(val_can),
-                })
+    for full_joined in punct_variants(join_word_whitespace(" ".join(lines))):
+        for rx in rxs:
+            for m in rx.finditer(full_joined):
+                val_raw = m.group(0)
+                val_can = canonical(val_raw)
+                if val_can not in seen_vals:
+                    seen_vals.add(val_can)
+                    rows.append({
+                        "Filnavn": filename,
+                        "Komplett navn": val_raw,
+                        "Regex-treff": val_raw,
+                        "Komponenttekst (TFM)": tfm_desc(val_can),
+                    })
 
     # 3) alltid minst én rad pr fil (viser filnavn ved 0 treff)
     if not rows:
@@ -430,60 +338,17 @@ def extract_text_for_diff(path: str, use_ocr: bool) -> List[str]:
     return [ln for ln in lines if (ln or "").strip()]
 
 def to_blocks(a_lines: List[str], b_lines: List[str],
-              ignore_case: bool, ignore_ws: bool, ignore_digits: bool) -> List[Dict]:
-    """Lag blokker (equal/delete/insert/replace) for UI + wordDiff for replace."""
+              ignore_case: bool, ignore_ws: bool, ignore_digits: bool,
+              time_budget: Optional[float] = DIFF_TIME_BUDGET, stats: Optional[Dict] = None) -> List[Dict]:
+    """Lag blokker (equal/delete/insert/replace) for UI + wordDiff for replace (se app.services.diff_engine)."""
     # Normaliser for sammenligning men behold original for visning
-    a_norm = [normalize_text_for_flags(ln, ignore_case, ignore_ws, ignore_digits) for ln in a_lines]
-    b_norm = [normalize_text_for_flags(ln, ignore_case, ignore_ws, ignore_digits) for ln in b_lines]
-
-    sm = difflib.SequenceMatcher(a=a_norm, b=b_norm)
-    blocks: List[Dict] = []
-
-    for tag, i1, i2, j1, j2 in sm.get_opcodes():
-        textA = "\n".join(a_lines[i1:i2]) if i2 > i1 else ""
-        textB = "\n".join(b_lines[j1:j2]) if j2 > j1 else ""
-
-        locA = {"page": None, "para": i1 + 1} if i2 > i1 else None
-        locB = {"page": None, "para": j1 + 1} if j2 > j1 else None
-
-        if tag == "equal":
-            blocks.append({"type": "equal", "textA": textA, "textB": textB,
-                           "locationA": locA, "locationB": locB})
-        elif tag == "delete":
-            blocks.append({"type": "delete", "textA": textA, "textB": "",
-                           "locationA": locA, "locationB": None})
-        elif tag == "insert":
-            blocks.append({"type": "insert", "textA": "", "textB": textB,
-                           "locationA": None, "locationB": locB})
-        elif tag == "replace":
-            # Word-level diff for inline-visning
-            wd = word_diff(textA, textB)
-            blocks.append({"type": "replace", "textA": textA, "textB": textB,
-                           "locationA": locA, "locationB": locB, "wordDiff": wd})
-    return blocks
+    def _norm(s: str) -> str:
+        return normalize_text_for_flags(s, ignore_case, ignore_ws, ignore_digits)
+    return list(iter_diff_blocks(a_lines, b_lines, normalize=_norm, time_budget=time_budget, stats=stats))
 
 def word_diff(a_text: str, b_text: str) -> List[Dict]:
     """Lag enkel ord-diff (liste av {op:'=', '+', '-', text})."""
-    a_words = a_text.split()
-    b_words = b_text.split()
-    sm = difflib.SequenceMatcher(a=a_words, b=b_words)
-    parts: List[Dict] = []
-    for tag, i1, i2, j1, j2 in sm.get_opcodes():
-        if tag == "equal":
-            if i2 > i1:
-                parts.append({"op": "=", "text": " ".join(a_words[i1:i2])})
-        elif tag == "delete":
-            if i2 > i1:
-                parts.append({"op": "-", "text": " ".join(a_words[i1:i2])})
-        elif tag == "insert":
-            if j2 > j1:
-                parts.append({"op": "+", "text": " ".join(b_words[j1:j2])})
-        elif tag == "replace":
-            if i2 > i1:
-                parts.append({"op": "-", "text": " ".join(a_words[i1:i2])})
-            if j2 > j1:
-                parts.append({"op": "+", "text": " ".join(b_words[j1:j2])})
-    return parts
+    return engine_word_diff(a_text, b_text)
 
 
 # =========================
@@ -632,9 +497,12 @@ def diff_sjekk():
         a_lines = extract_text_for_diff(str(pA), use_ocr=use_ocr)
         b_lines = extract_text_for_diff(str(pB), use_ocr=use_ocr)
 
-        blocks = to_blocks(a_lines, b_lines, ignore_case, ignore_ws, ignore_digits)
+        stats: Dict = {}
+        blocks = to_blocks(a_lines, b_lines, ignore_case, ignore_ws, ignore_digits, stats=stats)
+        if stats.get("truncated"):
+            logging.warning("Diff-sjekk: tidsbudsjett brukt opp (%s) – deler av resultatet er grovt.", stats)
 
-        payload = {"blocks": blocks}
+        payload = {"blocks": blocks, "truncated": bool(stats.get("truncated"))}
         bio = BytesIO(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
         bio.seek(0)
         # frontend forventer JSON direkte
@@ -728,7 +596,7 @@ def kombinert_sok():
             f.save(p)
             paths.append(str(p))
 
-    # Ekstraher tekst for hvert dokument (samme som i backup)
+    # Ekstraher tekst for hvert dokument (én gjennomgang, uten variant-linjer)
     texts = {p: extract_lines_backup(p) for p in paths}
 
     wb = Workbook()
@@ -748,23 +616,18 @@ def kombinert_sok():
         colors.append((int(r*255),int(g*255),int(b*255)))
 
     THRESH = 80
+    # Én indeks over alle linjene; fuzzy-poeng beregnes bare for kandidater (samme treff som full gjennomgang).
+    # Punktum/komma normaliseres på begge sider ('12,5' == '12.5') i stedet for variant-linjer.
+    index = LineIndex([texts[p] for p in paths], threshold=THRESH, normalize=fold_punct)
 
     for row in table:
         raw_vals = [c.strip().lstrip('=') if isinstance(c, str) else '' for c in row] + [''] * (maxc - len(row))
         display_vals = [(' ' + c) if isinstance(c, str) and c.startswith('=') else c for c in row] + [''] * (maxc - len(row))
-        alt2 = raw_vals[1].replace(',', '.') if len(raw_vals) > 1 and raw_vals[1] else ''
+        # Treff for første kolonne: delstreng, partial_ratio eller token_set_ratio > THRESH
+        row_hits = index.matches(raw_vals[0], token_set=True) if raw_vals[0] else 0
 
         for idx, path in enumerate(paths):
-            lines = texts[path]
-            hit_lines = []
-            for i, text in enumerate(lines, start=1):
-                if raw_vals[0]:
-                    if raw_vals[0] in text:
-                        hit_lines.append(i)
-                    elif fuzz.partial_ratio(raw_vals[0], text) > THRESH:
-                        hit_lines.append(i)
-                    elif fuzz.token_set_ratio(raw_vals[0], text) > THRESH:
-                        hit_lines.append(i)
+            hit_lines = index.in_doc(idx, row_hits)
 
             status = 'Ingen treff'
             avvik = ''
@@ -774,27 +637,15 @@ def kombinert_sok():
                 for col_idx, val in enumerate(raw_vals[:maxc], start=1):
                     if not val:
                         continue
-                    matched = False
-                    for ln in hit_lines:
-                        line_text = lines[ln-1]
-                        if val in line_text or fuzz.partial_ratio(val, line_text) > THRESH:
-                            matched = True
-                            break
-                    if not matched:
+                    # Delstreng eller partial_ratio > THRESH i minst én av treff-linjene
+                    if not index.matches(val) & hit_lines:
                         all_ok = False
                 status = 'Komplett' if all_ok else 'Delvis'
                 if not all_ok and raw_vals[1]:
-                    found_elsewhere = False
-                    for i, text in enumerate(lines, start=1):
-                        if (raw_vals[1] in text or
-                            (alt2 and alt2 in text) or
-                            fuzz.partial_ratio(raw_vals[1], text) > THRESH or
-                            (alt2 and fuzz.partial_ratio(alt2, text) > THRESH) or
-                            fuzz.token_set_ratio(raw_vals[1], text) > THRESH):
-                            found_elsewhere = True
-                            avvik = f"{raw_vals[1]} funnet i linje {i}"
-                            break
-                    if not found_elsewhere:
+                    first = index.first_line(idx, index.matches(raw_vals[1], token_set=True))
+                    if first is not None:
+                        avvik = f"{raw_vals[1]} funnet i linje {first}"
+                    else:
                         avvik = f"{raw_vals[1]}, ikke funnet i samme dokument"
 
             # Skriv rad
@@ -1,15 +1,20 @@
-import os, re, json, tempfile, subprocess, traceback
+import re, json, logging, queue, shutil, tempfile, threading, traceback
 from io import BytesIO
-from collections import OrderedDict
 
 import pandas as pd
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+from flask import Blueprint, render_template, request, jsonify, send_file, current_app, Response, stream_with_context
 from flask_login import current_user
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill
 from openpyxl.utils import get_column_letter
 
+from app.services.ifc_index import CORE_COLUMNS, IFC_SPOOL_DIR, build_index, open_index, spool_ifc
+from app.services.masseliste_dataset import MASSELISTE_PAGE_SIZE, load_upload, open_dataset, write_xlsx
+from app.services.tag_engine import LOOSE, compile_format
+from app.services.tfm_data import load_tfm_settings
+
 masseliste_bp = Blueprint("masseliste", __name__)
+_log = logging.getLogger(__name__)
 
 # ────────────────────────────────────────────────────────────────────────────────
 # UI
@@ -21,21 +26,57 @@ def vis_masseliste():
 # ────────────────────────────────────────────────────────────────────────────────
 # EKSISTERENDE: Søk i masseliste (Excel → JSON)
 # ────────────────────────────────────────────────────────────────────────────────
+def _page_query(args) -> dict:
+    """offset/limit/q/sort/order/filters fra skjema eller query-streng (filters = JSON-objekt)."""
+    filters = args.get("filters") or "{}"
+    filters = json.loads(filters) if isinstance(filters, str) else filters
+    if not isinstance(filters, dict):
+        raise ValueError("filters må være et objekt")
+    query = {
+        "q": (args.get("q") or "").strip(),
+        "filters": filters,
+        "sort": args.get("sort") or None,
+        "order": args.get("order") or "asc",
+    }
+    if "offset" in args:
+        query["offset"] = int(args.get("offset") or 0)
+    if "limit" in args:
+        query["limit"] = int(args.get("limit") or MASSELISTE_PAGE_SIZE)
+    return query
+
 @masseliste_bp.route("/api/parse-masseliste", methods=["POST"])
 def parse_masseliste_api():
+    """
+    Les masselisten inn i et datasett på serveren (app.services.masseliste_dataset) og
+    returner første side. Flere sider hentes med /api/masseliste/<dataset>/rows.
+    """
     file = request.files.get("file")
     if not file:
         return jsonify({"error": "Ingen fil lastet opp"}), 400
 
     try:
-        df = pd.read_excel(file, dtype=str).fillna("")
-        data = df.to_dict(orient="records")
-        current_app.logger.info(f"[INFO] Lest inn {len(data)} rader fra fil {file.filename}")
-        return jsonify({"rows": data, "columns": list(df.columns)})
+        query = _page_query(request.form)
+    except ValueError as e:
+        return jsonify({"error": f"Ugyldig forespørsel: {e}"}), 400
+    try:
+        dataset = load_upload(file)
+        current_app.logger.info(f"[INFO] Lest inn {dataset.total} rader fra fil {file.filename}")
+        return jsonify(dataset.page(**query))
     except Exception as e:
         current_app.logger.exception("Under parsing")
         return jsonify({"error": f"Feil under innlasting: {str(e)}"}), 500
 
+@masseliste_bp.route("/api/masseliste/<dataset_id>/rows", methods=["GET"])
+def masseliste_rows_api(dataset_id):
+    """Én side av et innlest datasett: offset, limit, q (fritekst), filters (JSON), sort, order."""
+    dataset = open_dataset(dataset_id)
+    if dataset is None:
+        return jsonify({"error": "Masselisten finnes ikke lenger. Last opp filen på nytt."}), 404
+    try:
+        return jsonify(dataset.page(**_page_query(request.args)))
+    except ValueError as e:
+        return jsonify({"error": f"Ugyldig forespørsel: {e}"}), 400
+
 # ────────────────────────────────────────────────────────────────────────────────
 # NY: Eksport av “Søk i masseliste” → Excel
 # ────────────────────────────────────────────────────────────────────────────────
@@ -44,6 +85,24 @@ def export_parsed_masseliste():
     payload = request.get_json() or {}
     rows = payload.get("rows") or []
     columns = payload.get("columns")  # valgfri, hvis du vil styre kolonnerekkefølge
+    navn = f"{getattr(current_user, 'first_name', 'bruker')}_{getattr(current_user, 'last_name', '')}".strip() or "bruker"
+
+    if not rows and payload.get("dataset"):
+        # Hele utvalget (søk/filter/sortering) skrives fra datasettet på serveren
+        dataset = open_dataset(str(payload["dataset"]))
+        if dataset is None:
+            return jsonify({"error": "Masselisten finnes ikke lenger. Last opp filen på nytt."}), 404
+        try:
+            query = _page_query(payload)
+            query.pop("offset", None)
+            query.pop("limit", None)
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+            tmp.close()
+            write_xlsx(dataset, tmp.name, columns, **query)
+        except ValueError as e:
+            return jsonify({"error": f"Ugyldig forespørsel: {e}"}), 400
+        return send_file(tmp.name, as_attachment=True, download_name=f"{navn}-Masseliste.xlsx")
+
     if not rows:
         return jsonify({"error": "Ingen rader å eksportere."}), 400
 
@@ -90,7 +149,6 @@ def export_parsed_masseliste():
     wb.save(tmp.name)
     tmp.close()
 
-    navn = f"{getattr(current_user, 'first_name', 'bruker')}_{getattr(current_user, 'last_name', '')}".strip() or "bruker"
     return send_file(tmp.name, as_attachment=True, download_name=f"{navn}-Masseliste.xlsx")
 
 # ────────────────────────────────────────────────────────────────────────────────
@@ -189,246 +247,131 @@ def versjonssammenligning_api():
 # ────────────────────────────────────────────────────────────────────────────────
 # IFC-masseliste (skann + eksport med Pset-valg)
 # ────────────────────────────────────────────────────────────────────────────────
-BASEDIR = os.path.abspath(os.path.dirname(__file__))
-DATA_DIR = os.path.abspath(os.path.join(BASEDIR, "..", "data"))
-TFM_SETTINGS_PATH = os.path.join(DATA_DIR, "tfm-settings.json")
-
-def load_tfm_settings():
-    try:
-        with open(TFM_SETTINGS_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
-PLACEHOLDERS = {
-    "{byggnr}":   r"(?P<byggnr>\+[A-Za-z0-9]+)",
-    "{system}":   r"(?P<system>=[^-]+)",
-    "{komponent}":r"(?P<komponent>-[^%]+)",
-    "{typekode}": r"(?P<typekode>[%/].+)"
-}
-
-def format_to_regex(format_str: str) -> re.Pattern:
-    rx = format_str
-    for ph, sub in PLACEHOLDERS.items():
-        rx = rx.replace(ph, sub)
-    return re.compile(rx)
-
-def try_import_ifcopenshell():
-    try:
-        import ifcopenshell
-        from ifcopenshell.util.element import get_psets
-        return ifcopenshell, get_psets
-    except Exception as e:
-        current_app.logger.warning(f"ifcopenshell ikke tilgjengelig: {e}")
-        return None, None
-
-def ifc_to_json_via_cli(ifc_path: str) -> dict:
-    out_json = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
-    out_json.close()
-    cmd = ["ifcconvert", ifc_path, out_json.name, "--json"]
-    try:
-        subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        with open(out_json.name, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        os.unlink(out_json.name)
-        return data
-    except Exception as e:
+def _ifc_pset_columns(rows: list) -> list:
+    # Liste over alle Pset-kolonner (for checkbox-UI)
+    return sorted({k for r in rows for k in r.keys() if str(k).startswith("Pset:")})
+
+def _ifc_scan_payload(index, fmt, pattern, system_kriterier, tfm_settings) -> dict:
+    rows = index.rows(fmt, pattern, system_kriterier, tfm_settings)
+    return {"rows": rows, "pset_columns": _ifc_pset_columns(rows), "model": index.sha}
+
+def _ifc_scan_stream(path, sha, source_name, tmp, payload):
+    """
+    Bygg indeksen i en egen tråd og strøm fremdrift som NDJSON:
+    {"progress": {"phase", "done", "total"}} per bit/batch, til slutt {"rows", "pset_columns", "model"}.
+    Tråden eier mellomlagringen (tmp), så bygget fullføres og indeksen kan gjenbrukes selv om
+    klienten avbryter.
+    """
+    events = queue.Queue()
+
+    def progress(phase, done, total):
+        events.put({"progress": {"phase": phase, "done": done, "total": total}})
+
+    def work():
         try:
-            os.unlink(out_json.name)
-        except Exception:
-            pass
-        raise RuntimeError(f"Kunne ikke kjøre ifcconvert: {e}")
-
-def build_candidate_strings(elem, psets_dict: dict) -> list:
-    cands = []
-    for attr in ("Name", "Tag", "ObjectType", "GlobalId", "PredefinedType"):
-        val = getattr(elem, attr, None)
-        if val:
-            cands.append(str(val))
-    try:
-        type_obj = getattr(elem, "IsTypedBy", None)
-        if type_obj:
-            for rel in type_obj:
-                t = getattr(rel, "RelatingType", None)
-                if t and getattr(t, "Name", None):
-                    cands.append(str(t.Name))
-                if t and getattr(t, "PredefinedType", None):
-                    cands.append(str(t.PredefinedType))
-    except Exception:
-        pass
-    for pset_name, props in (psets_dict or {}).items():
-        cands.append(pset_name)
-        if isinstance(props, dict):
-            for k, v in props.items():
-                if isinstance(v, dict) and "value" in v:
-                    val = v["value"]
-                else:
-                    val = v
-                if val is None:
-                    continue
-                cands.append(f"{k}={val}")
-    return [s for s in cands if isinstance(s, str) and s]
-
-def tfm_active(komponent_str: str, tfm_settings: dict) -> bool:
-    m = re.search(r"-([A-Za-z]{2})", komponent_str or "")
-    if not m:
-        return True
-    kode2 = m.group(1).upper()
-    return bool(tfm_settings.get(kode2, True))
+            events.put({"index": build_index(path, sha, progress, source_name=source_name)})
+        except Exception as e:
+            _log.exception("Feil under IFC-indeksering")
+            events.put({"feil": [f"Feil under IFC-skanning: {e}"]})
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    threading.Thread(target=work, name=f"ifc-index-{sha[:12]}", daemon=True).start()
+
+    def generate():
+        while True:
+            event = events.get()
+            if "index" in event:
+                try:
+                    yield json.dumps(payload(event["index"])) + "\n"
+                except Exception as e:
+                    _log.exception("Feil under IFC-skanning")
+                    yield json.dumps({"feil": [f"Feil under IFC-skanning: {e}"]}) + "\n"
+                return
+            yield json.dumps(event) + "\n"
+            if "feil" in event:
+                return
+
+    return Response(stream_with_context(generate()), mimetype="text/plain")
 
 @masseliste_bp.route("/api/ifc/scan", methods=["POST"])
 def api_ifc_scan():
+    """
+    Skann IFC-modellen etter komponent-ID-er via diskindeksen (app.services.ifc_index).
+    Modellen sendes som ifc_file, eller som model (SHA-256 fra en tidligere skanning).
+    Med progress=1 strømmes fremdriften som NDJSON når indeksen må bygges.
+    """
     fmt = (request.form.get("format") or "").strip()
     kriterier_str = (request.form.get("system_kriterier") or "").strip()
     system_kriterier = [k for k in kriterier_str.split(",") if k.strip().isdigit()]
     f = request.files.get("ifc_file")
+    model = (request.form.get("model") or "").strip().lower()
+    want_progress = request.form.get("progress") in ("1", "true")
 
     if not fmt:
         return jsonify({"feil": ["Ingen format-streng valgt."]}), 400
-    if not f:
+    if not f and not model:
         return jsonify({"feil": ["Ingen IFC-fil lastet opp."]}), 400
 
     try:
-        pattern = format_to_regex(fmt)
+        pattern = compile_format(fmt, LOOSE)
     except re.error as e:
         return jsonify({"feil": [f"Regex-feil i format: {e}"]}), 400
 
-    tmp_ifc = tempfile.NamedTemporaryFile(delete=False, suffix=".ifc")
-    f.stream.seek(0)
-    tmp_ifc.write(f.read())
-    tmp_ifc.close()
-
     tfm_settings = load_tfm_settings()
-    treff = []
 
-    try:
-        ifcopenshell, get_psets = try_import_ifcopenshell()
-        if ifcopenshell:
-            model = ifcopenshell.open(tmp_ifc.name)
-            for elem in model.by_type("IfcElement"):
-                try:
-                    psets = (get_psets(elem) or {})
-                except Exception:
-                    psets = {}
-                candidates = build_candidate_strings(elem, psets)
-
-                if "{system}" in fmt and not any("=" in c for c in candidates):
-                    continue
-
-                matched_value, groups = None, None
-                for c in candidates:
-                    m = pattern.search(str(c))
-                    if m:
-                        matched_value = m.group(0)
-                        groups = m.groupdict()
-                        break
-                if not matched_value:
-                    continue
-
-                if "{system}" in fmt and system_kriterier and groups.get("system"):
-                    if groups["system"][1:3] not in system_kriterier:
-                        continue
-                if not tfm_active(groups.get("komponent", ""), tfm_settings):
-                    continue
-
-                row = OrderedDict()
-                row["Komponent-ID"] = matched_value
-                row["IFC Class"] = getattr(elem, "is_a", lambda: "IfcElement")()
-                row["Name"] = getattr(elem, "Name", "")
-                row["Tag"] = getattr(elem, "Tag", "")
-                row["ObjectType"] = getattr(elem, "ObjectType", "")
-                row["GlobalId"] = getattr(elem, "GlobalId", "")
-                try:
-                    if hasattr(elem, "IsTypedBy") and elem.IsTypedBy:
-                        t = elem.IsTypedBy[0].RelatingType
-                        row["Type.Name"] = getattr(t, "Name", "")
-                        row["Type.PredefinedType"] = getattr(t, "PredefinedType", "")
-                except Exception:
-                    pass
-                for pset_name, props in (psets or {}).items():
-                    if isinstance(props, dict):
-                        for k, v in props.items():
-                            val = v.get("value") if isinstance(v, dict) else v
-                            if val is not None:
-                                row[f"Pset:{pset_name}.{k}"] = str(val)
-                treff.append(row)
-        else:
-            data = ifc_to_json_via_cli(tmp_ifc.name)
-            objects = data.get("objects") or []
-            for obj in objects:
-                candidates = []
-                for key in ("Name", "Tag", "ObjectType", "GlobalId", "PredefinedType"):
-                    v = obj.get(key)
-                    if v:
-                        candidates.append(str(v))
-                t = obj.get("type") or {}
-                if isinstance(t, dict):
-                    if t.get("Name"): candidates.append(str(t["Name"]))
-                    if t.get("PredefinedType"): candidates.append(str(t["PredefinedType"]))
-                psets = obj.get("psets") or {}
-                for pset, props in psets.items():
-                    candidates.append(pset)
-                    if isinstance(props, dict):
-                        for k, v in props.items():
-                            candidates.append(f"{k}={v}")
-
-                if "{system}" in fmt and not any("=" in c for c in candidates):
-                    continue
-
-                matched_value, groups = None, None
-                for c in candidates:
-                    m = pattern.search(str(c))
-                    if m:
-                        matched_value = m.group(0)
-                        groups = m.groupdict()
-                        break
-                if not matched_value:
-                    continue
-
-                if "{system}" in fmt and system_kriterier and groups.get("system"):
-                    if groups["system"][1:3] not in system_kriterier:
-                        continue
-                if not tfm_active(groups.get("komponent", ""), tfm_settings):
-                    continue
-
-                row = OrderedDict()
-                row["Komponent-ID"] = matched_value
-                row["IFC Class"] = obj.get("ifc_class") or obj.get("typeName") or ""
-                row["Name"] = obj.get("Name", "")
-                row["Tag"] = obj.get("Tag", "")
-                row["ObjectType"] = obj.get("ObjectType", "")
-                row["GlobalId"] = obj.get("GlobalId", "")
-                if isinstance(t, dict):
-                    row["Type.Name"] = t.get("Name", "")
-                    row["Type.PredefinedType"] = t.get("PredefinedType", "")
-                for pset, props in (psets or {}).items():
-                    if isinstance(props, dict):
-                        for k, v in props.items():
-                            row[f"Pset:{pset}.{k}"] = str(v)
-                treff.append(row)
+    def payload(index):
+        return _ifc_scan_payload(index, fmt, pattern, system_kriterier, tfm_settings)
+
+    index = open_index(model) if model else None
+    if index is None and not f:
+        return jsonify({"feil": ["Modellen er ikke indeksert. Last opp IFC-filen på nytt."], "model": model}), 404
 
+    tmp = None
+    try:
+        if index is None:
+            IFC_SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = tempfile.mkdtemp(dir=IFC_SPOOL_DIR, prefix="ifc_")
+            path, sha = spool_ifc(f, tmp)
+            index = open_index(sha)
+            if index is None and want_progress:
+                resp = _ifc_scan_stream(path, sha, f.filename, tmp, payload)
+                tmp = None
+                return resp
+            if index is None:
+                index = build_index(path, sha, source_name=f.filename)
+        return jsonify(payload(index)), 200
     except Exception as e:
         current_app.logger.exception("Feil under IFC-scan")
         return jsonify({"feil": [f"Feil under IFC-skanning: {e}"]}), 500
     finally:
-        try:
-            os.unlink(tmp_ifc.name)
-        except Exception:
-            pass
-
-    # Returner også en liste over alle Pset-kolonner (for checkbox-UI)
-    pset_cols = sorted({k for r in treff for k in r.keys() if str(k).startswith("Pset:")})
-    return jsonify({"rows": treff, "pset_columns": pset_cols}), 200
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
 
 @masseliste_bp.route("/api/ifc/export", methods=["POST"])
 def api_ifc_export():
     data = request.get_json() or {}
     rows = data.get("rows") or []
     pset_selected = data.get("pset_columns")  # liste eller None
+    model = (data.get("model") or "").strip().lower()
+    if not rows and model:
+        # Radene bygges fra indeksen i stedet for å sendes frem og tilbake
+        index = open_index(model)
+        if index is None:
+            return jsonify({"error": "Modellen er ikke indeksert. Skann IFC-filen på nytt."}), 404
+        fmt = (data.get("format") or "").strip()
+        if not fmt:
+            return jsonify({"error": "Ingen format-streng valgt."}), 400
+        try:
+            pattern = compile_format(fmt, LOOSE)
+        except re.error as e:
+            return jsonify({"error": f"Regex-feil i format: {e}"}), 400
+        kriterier = [k for k in str(data.get("system_kriterier") or "").split(",") if k.strip().isdigit()]
+        rows = index.rows(fmt, pattern, kriterier, load_tfm_settings())
     if not rows:
         return jsonify({"error": "Ingen rader å eksportere."}), 400
 
-    core_first = ["Komponent-ID", "IFC Class", "Name", "Tag", "ObjectType", "GlobalId", "Type.Name", "Type.PredefinedType"]
+    core_first = CORE_COLUMNS
 
     all_keys = set()
     for r in rows:
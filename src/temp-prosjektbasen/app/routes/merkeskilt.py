@@ -3,7 +3,6 @@ import tempfile
 import traceback
 import re
 import json
-from pathlib import Path
 import logging
 
 from flask import Blueprint, render_template, request, jsonify, send_file, current_app
@@ -15,64 +14,23 @@ from app.models.db import db
 from app.models.merkeskilt import Merkskilt
 from app.models import User
 from app.models.project import Project
+from app.services.tag_engine import LOOSE, compile_format
+from app.services.tfm_data import TFM_SETTINGS, TFM_XLSX, invalidate, load_tfm_mapping, load_tfm_settings
 
 merkeskilt_bp = Blueprint('merkeskilt', __name__)
 logger = logging.getLogger(__name__)
 
 # ────────────────────────────────────────────────────────────────────────────────
-# Hent kode→beskrivelse‐mapping (tfm.xlsx)
+# Kode→beskrivelse (tfm.xlsx) og aktiv-innstillinger (tfm-settings.json)
+# Leses via prosessvid cache (app.services.tfm_data), lest på nytt når filen endres
 # ────────────────────────────────────────────────────────────────────────────────
-BASEDIR = Path(__file__).resolve().parents[1]            # …/app
-DATA_DIR = BASEDIR / "data"
-TFM_XLSX = DATA_DIR / "tfm.xlsx"
-TFM_SETTINGS = DATA_DIR / "tfm-settings.json"
-
-def _load_tfm_settings_dict() -> dict[str, bool]:
-    """
-    Leser tfm-settings.json og returnerer {kode: bool}. Støtter både
-    flatt dict og {innstillinger:[{kode,aktiv},...]}.
-    """
-    try:
-        if not TFM_SETTINGS.exists() or TFM_SETTINGS.stat().st_size == 0:
-            return {}
-        with TFM_SETTINGS.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, dict) and "innstillinger" in data:
-            data = {i["kode"]: bool(i["aktiv"]) for i in data.get("innstillinger", []) if "kode" in i}
-        return data if isinstance(data, dict) else {}
-    except Exception as e:
-        logger.warning("TFM settings kunne ikke lastes, bruker tomt oppsett: %s", e)
-        return {}
-
 def _save_tfm_settings(items: list[dict]) -> None:
     """Lagrer {kode: bool} for enkelhet og robusthet."""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    TFM_SETTINGS.parent.mkdir(parents=True, exist_ok=True)
     flat = {i["kode"]: bool(i["aktiv"]) for i in items if "kode" in i}
     with TFM_SETTINGS.open("w", encoding="utf-8") as f:
         json.dump(flat, f, ensure_ascii=False, indent=2)
-
-def _load_tfm_mapping() -> tuple[pd.DataFrame, dict[str, str]]:
-    """Laster TFM-mapping fra Excel. Prøver ark 'TFM', faller tilbake til første ark."""
-    try:
-        if not TFM_XLSX.exists():
-            raise FileNotFoundError(f"Mangler fil: {TFM_XLSX}")
-        try:
-            df = pd.read_excel(TFM_XLSX, sheet_name="TFM", header=None, dtype=str)
-        except Exception:
-            # Fallback: første ark
-            with pd.ExcelFile(TFM_XLSX) as xls:
-                first = xls.sheet_names[0]
-            df = pd.read_excel(TFM_XLSX, sheet_name=first, header=None, dtype=str)
-        df = df.fillna("Ikke i bruk")
-        # Filtrer ut rader uten kode (kol A)
-        df = df[df[0].notna() & (df[0].astype(str).str.strip() != "")]
-        return df, dict(zip(df[0].astype(str).str.strip(), df[1].astype(str).str.strip()))
-    except Exception as e:
-        logger.error("Kunne ikke lese %s: %s", TFM_XLSX, e)
-        return pd.DataFrame(columns=[0, 1]), {}
-
-# Ikke last ved import – last ved behov i hver route (unngå tom cache/støtte hot-reload)
-kode_mapping: dict[str, str] = {}
+    invalidate(TFM_SETTINGS)
 
 def hent_teknikere_og_admin():
     brukere = User.query.filter(User.role.in_(["tekniker", "admin"])).all()
@@ -88,16 +46,11 @@ def vis_merkeskilt():
     teknikere = hent_teknikere_og_admin()
 
     # 2) TFM-innstillinger
-    tfm_settings = _load_tfm_settings_dict()
-    mapping_df, _lokal_map = _load_tfm_mapping()
-    tfm_liste = []
-    if mapping_df.empty:
+    tfm_settings = load_tfm_settings()
+    mapping = load_tfm_mapping()
+    if not mapping:
         logger.warning("TFM-liste tom – sjekk %s og arknavn.", TFM_XLSX)
-    for _, row in mapping_df.iterrows():
-        kode         = str(row[0]).strip()
-        beskrivelse  = str(row[1]).strip()
-        aktiv        = tfm_settings.get(kode, True)
-        tfm_liste.append((kode, beskrivelse, aktiv))
+    tfm_liste = [(kode, beskrivelse, tfm_settings.get(kode, True)) for kode, beskrivelse in mapping.rows]
 
     # 3) Hent alle prosjekter for «Send til prosjekt»
     projects = Project.query.order_by(Project.project_name).all()
@@ -117,10 +70,8 @@ def generer_komponenter():
     formatvalg = data.get("format", "")
     resultat, feilmeldinger = [], []
 
-    tfm_settings = _load_tfm_settings_dict()
-    mapping_df, lok_map = _load_tfm_mapping()
-    global kode_mapping
-    kode_mapping = lok_map or {}
+    tfm_settings = load_tfm_settings()
+    mapping = load_tfm_mapping()
 
     if not formatvalg:
         return jsonify({"feil": ["Ingen format-streng valgt."]}), 400
@@ -155,7 +106,7 @@ def generer_komponenter():
             feilmeldinger.append(f"Feil i format '{formatvalg}' for '{tag}'")
             continue
 
-        beskrivelse = (kode_mapping or lok_map).get(kode2, "Ikke i bruk")
+        beskrivelse = mapping.describe(kode2)
         resultat.append({
             "komponent": komp_str,
             "beskrivelse": beskrivelse,
@@ -180,22 +131,11 @@ def scan_og_generer():
     if not filer:
         return jsonify({"feil": ["Ingen filer funnet."]}), 400
 
-    tfm_settings = _load_tfm_settings_dict()
-    mapping_df, lok_map = _load_tfm_mapping()
-    global kode_mapping
-    kode_mapping = lok_map or {}
-
-    placeholders = {
-        "{byggnr}": r"(?P<byggnr>\+[A-Za-z0-9]+)",
-        "{system}": r"(?P<system>=[^-]+)",
-        "{komponent}": r"(?P<komponent>-[^%]+)",
-        "{typekode}": r"(?P<typekode>[%/].+)"
-    }
-    regex_str = formatvalg
-    for ph, subpat in placeholders.items():
-        regex_str = regex_str.replace(ph, subpat)
+    tfm_settings = load_tfm_settings()
+    mapping = load_tfm_mapping()
+
     try:
-        mønster = re.compile(regex_str)
+        mønster = compile_format(formatvalg, LOOSE)
     except re.error as e:
         return jsonify({"feil": [f"Regex-feil: {e}"]}), 400
 
@@ -209,12 +149,12 @@ def scan_og_generer():
             for verdi in df.astype(str).values.flatten():
                 if not isinstance(verdi, str):
                     continue
-                for match in mønster.finditer(verdi):
-                    system_val = match.groupdict().get("system", "")
-                    if "{system}" in formatvalg and system_kriterier:
+                for tag in mønster.finditer(verdi):
+                    system_val = tag.system
+                    if mønster.has_system and system_kriterier:
                         if system_val[1:3] not in system_kriterier:
                             continue
-                    full_komponent = match.groupdict().get("komponent", "")
+                    full_komponent = tag.komponent
                     kode2 = full_komponent[1:3] if len(full_komponent) >= 3 else ""
                     aktiv = tfm_settings.get(kode2, True)
 
@@ -222,21 +162,16 @@ def scan_og_generer():
                     if not aktiv and not full_komponent.startswith("-STB"):
                         continue
 
-                    funn_set.add(match.group(0))
+                    funn_set.add(tag.full)
 
     resultat = []
-    for tag in funn_set:
-        match = mønster.match(tag)
-        if not match:
+    for funn in funn_set:
+        tag = mønster.match(funn)
+        if not tag:
             continue
-        gr = match.groupdict()
-        byggnr = gr.get("byggnr", "")
-        system = gr.get("system", "")
-        komponent = gr.get("komponent", "")
-        typekode = gr.get("typekode", "")
-        komponent_val = match.groupdict().get("komponent", "")
-        kode2 = komponent_val[1:3] if komponent_val else ""
-        beskrivelse = (kode_mapping or lok_map).get(kode2, "Ikke i bruk")
+        byggnr, system, komponent, typekode = tag.byggnr, tag.system, tag.komponent, tag.typekode
+        kode2 = komponent[1:3] if komponent else ""
+        beskrivelse = mapping.describe(kode2)
         komp_str = (
             formatvalg.replace("{byggnr}", byggnr)
                       .replace("{system}", system)
@@ -298,25 +233,18 @@ def last_ned_excel():
 
 @merkeskilt_bp.route("/api/tfm-liste", methods=["GET"])
 def hent_tfm_liste():
-    tfm_settings = _load_tfm_settings_dict()
-    mapping_df, _lokal_map = _load_tfm_mapping()
+    tfm_settings = load_tfm_settings()
+    mapping = load_tfm_mapping()
 
     er_admin_flag = current_user.is_authenticated and getattr(current_user, "role", "") == "admin"
 
-    resultat = []
-    if mapping_df.empty:
-        # Tom liste → returnér 200 med tom array; frontend viser tydelig beskjed
-        return jsonify([]), 200
-    for idx, row in mapping_df.iterrows():
-        kode = str(row[0]).strip()
-        beskrivelse = str(row[1]).strip()
-        aktiv = tfm_settings.get(kode, True)
-        resultat.append({
-            "kode": kode,
-            "beskrivelse": beskrivelse,
-            "aktiv": aktiv,
-            "er_admin": er_admin_flag
-        })
+    # Tom liste → returnér 200 med tom array; frontend viser tydelig beskjed
+    resultat = [{
+        "kode": kode,
+        "beskrivelse": beskrivelse,
+        "aktiv": tfm_settings.get(kode, True),
+        "er_admin": er_admin_flag
+    } for kode, beskrivelse in mapping.rows]
 
     return jsonify(resultat), 200
 
@@ -9,6 +9,9 @@ from openpyxl.styles import Font, Alignment, PatternFill
 from app.models.user import User
 from flask_login import current_user, login_required
 from typing import Dict, Iterable, Iterator, Optional
+from app.services.tag_engine import TFM_DICT as _TFM_ALL, MASTER_GENERIC, MASTER_PDF, pattern_for_filename
+from app.services.tfm_data import invalidate, load_json
+from app.services.protocol_writer import add_betingelser  # noqa: F401  (betingelser rad 202–207, MC)
 
 # ------------------- Blueprint og grunnkonfig -------------------
 bp = Blueprint("protokoller", __name__, url_prefix="/protokoller")
@@ -18,62 +21,9 @@ STATIC_DATA_DIR = os.path.abspath(os.path.join("app", "static", "data"))
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(STATIC_DATA_DIR, exist_ok=True)
 
-# ------------------- TFM-ordbok (uendret) -------------------
-TFM_DICT = {"AB": "Bjelke", "AD": "Dekker", "AE": "Elementer", "AF": "Fagverk", "AG": "Glassfelt", "AH": "Fundamenter",
-"AK": "Komplette konstruksjoner", "AL": "List - Beslistning", "AO": "Oppbygende - Utforende", "AP": "Plate", "AR": "Ramme - Oppheng",
-"AS": "Søyle", "AU": "Åpninger", "AV": "Vegg", "BA": "Armering Forsterkning", "BB": "Beskyttende - Stoppende", "BC": "Begrensende",
-"BF": "Fuging", "BG": "Pakning Tetning", "BI": "Isolasjon", "BP": "Avretningsmasse", "BS": "Spikerslag", "CB": "Balkong",
-"CC": "Baldakin", "CD": "Karnapp", "CG": "Rampe - Repos", "CK": "Komplett konstruksjon", "CM": "Kjemiske stoffer", "CO": "Kobling Overgang",
-"CP": "Pipe - Skostein", "CQ": "Festemateriell", "CR": "Rammeverk - Oppheng", "CT": "Trapp - Leider", "CX": "Tunnel - Bru (inne-ute)",
-"DB": "Dør med brannklasse", "DF": "Foldedør - Foldevegg", "DI": "Dør - innvendig", "DK": "Kjøretøyregulering", "DL": "Luke", "DP": "Port",
-"DT": "Dør - tilfluktsrom", "DU": "Dør - utvendig", "DV": "Vindu", "EB": "Overflatebekledning", "EC": "Overflatebehandling", "EH": "Himling",
-"FA": "Ventilert arbeidsplass", "FB": "Benk - Bord - Plate - Tavle", "FC": "Beslag", "FD": "Disk - Skranke", "FF": "Fryserom", "FH": "Hylle - Reol",
-"FI": "Kabinett", "FK": "Kjølerom - Svalrom", "FO": "Sittebenk - Sofa - Stol", "FR": "Rom", "FS": "Skap - Skuff", "FT": "Speil",
-"FV": "Vaskemaskin", "FX": "Krok - Knagg - Håndtak", "GA": "Automat - Maskin", "GB": "Benk - Bord - Plate - Tavle", "GD": "Dekontamator",
-"GE": "Autoklaver", "GF": "Fryseskap", "GG": "Gardiner - Forheng", "GH": "Hylle - Reol", "GK": "Kjøleskap - Kjøledisk", "GL": "Lås - Beslag",
-"GM": "Mattilbereding", "GN": "Nøkler", "GO": "Sofa - Sittebenk", "GP": "Stol", "GQ": "Seng - Liggebenk", "GS": "Skap - Skuffer",
-"GT": "Tørkeskap - Varmeskap", "GV": "Vaskemaskin", "GW": "Vekt", "GX": "Holder", "GY": "Avfallsbeholder", "HA": "Automobil - Bil",
-"HB": "Rullebord - Tralle", "HC": "Container - Vogn", "HM": "Maskin", "HS": "Rullestol", "HT": "Truck - kran", "HV": "Verktøy",
-"IB": "Brenner", "IC": "Solceller-solfangere", "ID": "Kjel for destruksjon", "IE": "Elektrokjel", "IF": "Kjel for fast-bio brensel",
-"IG": "Generator", "IK": "Kuldeaggregat", "IL": "Energibrønn", "IM": "Motor", "IO": "Oljekjel", "IP": "Gasskjel", "IT": "Trykkluftaggregat (enhet)",
-"IU": "Turbin", "IV": "Aggregatenhet", "JF": "Forsterker", "JK": "Kompressor", "JP": "Pumpe", "JQ": "Pumpe i VA-installasjoner", "JV": "Vifte",
-"JW": "Spesialvifte", "KA": "Aktuator", "KD": "Drivhjul - Drev", "KE": "Induktiv energioverføring", "KG": "Gjennomføring",
-"KH": "Transportenhet (hevende forflyttende)", "KJ": "Jordingskomponenter", "KK": "Kanal", "KM": "Mast - Antenne", "KN": "Nedløp",
-"KO": "Kraftoverføring", "KQ": "Rør - spesielt", "KR": "Rør - generelt", "KS": "Skinne - Bane - Spor", "KU": "Kombinert kabel",
-"KV": "Høyspenningskabel > 1000V", "KW": "Lavspenningskabel 50 til 1000V", "KX": "Lavspenningskabel < 50V", "KY": "Optisk kabel",
-"KZ": "Slange", "LB": "Varmeomformende med vifte", "LC": "Kjøleomformende med vifte", "LD": "Kjøleflater", "LE": "Kondensator",
-"LF": "Fordamper", "LG": "Gear clutch", "LH": "Varmeflate", "LI": "Varmeelement", "LK": "Kjøleomformende", "LL": "Lyskilde",
-"LN": "Likeretter", "LO": "Omformer", "LP": "Pens - Veksel - Sjalter", "LQ": "Vekselretter", "LR": "Frekvensomformer",
-"LS": "Strålevarme", "LU": "Luftfukter", "LV": "Varmeomformende", "LX": "Varmegjenvinner", "LZ": "Varmerkabel - Varmerør",
-"MA": "Absoluttfilter", "MB": "ABC-filter", "MC": "UV-filter", "ME": "Elektrostatiske filter", "MF": "Luftfilter", "MG": "Fettfilter",
-"MK": "Kondenspotte", "ML": "Luftutskiller", "MM": "Membran", "MO": "Utskiller", "MR": "Rist - Sil", "MS": "Syklon", "MT": "Tørke",
-"MU": "Filter for Lyd - Bilde - Frekvensutjevner", "MV": "Vannfilter", "MX": "Støyfilter", "NB": "Batteri - UPS", "NC": "Kondensator",
-"NI": "Informasjonslagring", "NK": "Kum", "NM": "Badekar - Basseng", "NO": "Åpen tank", "NT": "Tank med trykk", "NU": "Tank uten trykk",
-"NV": "Vekt Lodd", "NW": "Varmtvannsbereder", "NX": "Toalett", "NY": "Servant", "NZ": "Brannslukkingsapparat", "OA": "AV-maskiner",
-"OB": "Shuntgruppe", "OD": "Datamaskin", "OE": "Energimåler", "OF": "Systembærer", "OM": "Mottaker - Sender", "OP": "PBX",
-"OQ": "Dataprogramprogramvare", "OR": "Router Fordeler", "OS": "Sentralenhet Mikser i Lydsystem", "OT": "Telefonapparat",
-"OU": "Undersentral", "QB": "Belastningsvakt", "QD": "Differansetrykkvakt", "QE": "Elektrisk vern", "QF": "Strømningsvakt",
-"QH": "Fuktvakt", "QL": "Lyddemper", "QM": "Mekanisk beskyttelse", "QN": "Nivåvakt", "QO": "Overtrykksventil", "QP": "Trykkvakt",
-"QQ": "Vibrasjonsvakt", "QR": "Rotasjonsvakt", "QS": "Strømvakt", "QT": "Temperaturvakt", "QV": "Sikkerhetsventil", "QX": "Solavskjerming",
-"QY": "Lynavleder", "QZ": "Brannvern", "RA": "AV-opptaker", "RB": "Bevegelse", "RC": "Seismometer", "RD": "Differansetrykkgiver",
-"RE": "Elektriske variabler", "RF": "Strømningsmåler", "RG": "Posisjon - Lengde", "RH": "Fuktighetsgiver", "RI": "Termometer",
-"RJ": "Fotocelle", "RK": "Kortleser", "RM": "Multifunksjonell Kombinert føler", "RN": "Nivågiver", "RP": "Trykkgiver",
-"RQ": "Manometer Trykkmåler", "RR": "Giver generelt", "RS": "Hastighetsmåler", "RT": "Temperaturgiver", "RU": "Ur", "RV": "Veieceller",
-"RW": "Virkningsgradsmåler", "RX": "Målepunkt", "RY": "Gassdetektor-Røykdetektor", "RZ": "Branndeteksjon",
-"SA": "Reguleringsventil manuell", "SB": "Reguleringsventil motorstyrt", "SC": "Stengeventil motorstyrt",
-"SD": "Alarmventil sprinkler", "SE": "Ekspansjonsventil", "SF": "Fraluftsventil", "SG": "Tilbakeslagsventil - Overtrykkspjeld",
-"SH": "Hurtigkobling", "SI": "Effektregulator", "SJ": "Jevntrykksventil", "SM": "Stengeventil manuell", "SP": "Trykkutjevningsventil",
-"SQ": "Strømningsregulator - VAV", "SR": "Reguleringsspjeld", "SS": "Stengespjeld", "ST": "Tilluftsventil", "SU": "Sugetrykksventil",
-"SV": "Strupeventil", "SW": "Plenumskammer", "SX": "Regulator", "SZ": "Brannspjeld - Røyks-p-j-e-l-d",
-"UA": "Uttak alarm", "UD": "Uttak data", "UE": "Uttak el", "UF": "Fellesuttak", "UG": "Uttak gass", "UK": "Kontrollpanel - Tablå",
-"UL": "Uttak trykkluft", "UM": "Monitor - Display", "UN": "Nødbelysning", "UO": "Trommel", "UP": "Belysningsarmatur", "UR": "Uttak radio",
-"US": "Stasjon", "UT": "Uttak telefon", "UV": "Uttak vann", "UX": "Koblingsboks", "UY": "Uttak antenne", "UZ": "Dyse - Spreder",
-"VB": "Bærelag", "VD": "Dekke", "VG": "Gress", "VK": "Kantstein heller", "VL": "Masse", "VM": "Mekanisk beskyttelse", "VP": "Planterbuskertrær",
-"VS": "Skilt", "XC": "Kondensator", "XD": "Komp. for binærlogikk", "XF": "Komponenter for vern", "XG": "Komponenter for krafttilførsel",
-"XH": "Komponenter for signalering", "XI": "Potensiometer", "XK": "Releer - Kontaktorer", "XL": "Induktiv komponenter", "XM": "Motor",
-"XN": "Integrerte kretser", "XO": "Urbryter - Timer", "XP": "Komponenter for måling og prøving", "XQ": "Effektbryter", "XR": "Motstand",
-"XS": "Bryter / Vender", "XT": "Transformator", "XV": "Halvlederkomponenter og elektronrør", "XX": "Rekkeklemmer - Samlesignal",
-"XZ": "Terminering og tilpasning"}
+# ------------------- TFM-ordbok (felles, app.services.tag_engine) -------------------
+# Koder uten beskrivelse utelates, slik at oppslag faller tilbake til "Ukjent beskrivelse"
+TFM_DICT = {k: v for k, v in _TFM_ALL.items() if v}
 
 # ------------------- COMPAT: RegexCounts + trygg modelllasting -------------------
 class RegexCounts:
@@ -115,34 +65,13 @@ def get_fag_model(path: Optional[str] = None):
 
 
 # ------------------- Streng/generisk regex + parser-API -------------------
-# GENERELL (Excel/Doc/Txt) – tolerant
-# NYTT: komponent-mønster støtter 2–4 bokstaver, fleksibel tallblokk og valgfri /NNN
-MASTER_REGEX_GENERIC = re.compile(
-    r"(?P<full_tag>"
-    r"(?:\+(?P<byggnr>[A-Z0-9]+))?"                                   # +BYGG
-    r"(?:=(?P<system>[\d.:/]+))?"                                     # =SYSTEM (tolerant; støtter kolon)
-    r"(?:-?(?P<komponent>([A-Za-z]{2,4})[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9/]*))?"  # -LK009T/001
-    r"(?:%(?P<typekode>[A-Z0-9./:_-]+))?"                             # %TYPE (tolerant)
-    r")",
-    re.IGNORECASE,
-)
-
-# STRENG (PDF) – “kynisk”
-# NYTT: utvidet komponent-mønster identisk med over. System beholdes strengt (0000.0000), vi henter ev. kolon-del fra full_tag ved behov.
-MASTER_REGEX_PDF = re.compile(
-    r"(?P<full_tag>"
-    r"(?:\+(?P<pdf_byggnr>[^=\s+]+)=(?=\d))?"                         # +BYGGNR=
-    r"(?:=(?P<pdf_system>\b\d{3,4}\.\d{3,4}\b))?"                     # =000.000 / 0000.0000 / ...
-    r"(?:-?(?P<komponent>([A-Za-z]{2,4})[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9/]*))?"  # -LK009T/001
-    r"(?:%(?P<pdf_typekode>[^\s+]+))?"                                # %TYPE til whitespace eller '+'
-    r")",
-    re.IGNORECASE,
-)
+# Mønstrene (GENERELL – tolerant, PDF – streng) ligger i app.services.tag_engine
+MASTER_REGEX_GENERIC = MASTER_GENERIC.regex
+MASTER_REGEX_PDF = MASTER_PDF.regex
 
 def select_regex_for_filename(filename: Optional[str]):
     """Velger riktig regex basert på filtype (PDF => streng)."""
-    fn = (filename or "").lower()
-    return MASTER_REGEX_PDF if fn.endswith(".pdf") else MASTER_REGEX_GENERIC
+    return pattern_for_filename(filename).regex
 
 def get_unique_system_id(system_string: Optional[str]) -> str:
     """
@@ -164,34 +93,13 @@ def iter_tags(text: str, filename: Optional[str]) -> Iterator[Dict[str, str]]:
     Generator: finner tagger i tekst, normaliserer til keys:
     byggnr, system, komponent (uppercase), typekode, full_tag.
     """
-    rx = select_regex_for_filename(filename)
-    for m in rx.finditer(text or ""):
-        gd = m.groupdict()
-        byggnr    = gd.get("byggnr")    or gd.get("pdf_byggnr")
-        system    = gd.get("system")    or gd.get("pdf_system")
-        komponent = gd.get("komponent") or gd.get("pdf_komponent")
-        typekode  = gd.get("typekode")  or gd.get("pdf_typekode")
-        full_tag  = (gd.get("full_tag") or "").strip()
-
-        # NYTT: robust fallback – “siste bindestrek + komponent”-detektor
-        if not komponent and full_tag:
-            m_fallback = re.search(
-                r"-([A-Za-z]{2,4}[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9]*?(?:/[0-9]{1,4})?)(?=$|[\s,.;:\)\]\}])",
-                full_tag,
-                re.IGNORECASE
-            )
-            if m_fallback:
-                komponent = m_fallback.group(1)
-
-        if not komponent:
-            continue
-
+    for tag in pattern_for_filename(filename).finditer(text):
         yield {
-            "byggnr": (byggnr or "").strip(),
-            "system": (system or "").strip(),
-            "komponent": (komponent or "").strip().upper(),
-            "typekode": (typekode or "").strip(),
-            "full_tag": full_tag,
+            "byggnr": tag.byggnr,
+            "system": tag.system,
+            "komponent": tag.komponent,
+            "typekode": tag.typekode,
+            "full_tag": tag.full,
         }
 
 def parse_rows_from_text(text: str, filename: Optional[str]) -> Iterable[Dict[str, str]]:
@@ -396,9 +304,7 @@ def hent_tfm_liste():
         return jsonify({"error": "Ugyldig funksjonstype"}), 400
     settings_path = os.path.abspath(os.path.join(basedir, "..", "static", "data", mapping[funksjon]))
     try:
-        with open(settings_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return jsonify(data)
+        return jsonify(load_json(settings_path))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -414,6 +320,7 @@ def lagre_tfm_liste():
     try:
         with open(path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+        invalidate(path)
         return jsonify({"status": "ok"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -508,20 +415,3 @@ def insert_section_header(ws, row_index: int, title: str):
     c.fill = PatternFill(fill_type="solid", start_color=PASTELL_LYSEBLAA, end_color=PASTELL_LYSEBLAA)
     c.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
     c.font = Font(bold=True)
-
-def add_betingelser(worksheet):
-    conditions_text = [
-        "",
-        "Kontroll av protokoll",
-        "Dokumentasjon må overleveres før igangkjøring av anlegg.",
-        "Protokollen skal fylles ut og signeres av utførende montør.",
-        "Protokollen skal fylles ut og signeres av kontrollør som kontrollerer arbeidet.",
-        "Dokumentasjonen skal fylles ut fortløpende avhengig av fremdrift i prosjektet."
-    ]
-    start_row = 202
-    for i, line in enumerate(conditions_text):
-        worksheet.cell(row=start_row + i, column=1, value=line)
-        if line:
-            worksheet.merge_cells(start_row=start_row + i, start_column=1, end_row=start_row + i, end_column=9)
-            worksheet.cell(row=start_row + i, column=1).font = Font(bold=True)
-            worksheet.cell(row=start_row + i, column=1).alignment = Alignment(wrapText=True)
\ No newline at end of file
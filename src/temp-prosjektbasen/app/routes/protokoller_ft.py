@@ -3,14 +3,10 @@ import os
 import json
 import re
 from datetime import datetime
-from flask import request, jsonify, send_file, current_app
+from flask import request, jsonify, send_file
 from flask_login import login_required
-from openpyxl import Workbook, load_workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.formatting.rule import Rule, DifferentialStyle
-from openpyxl.worksheet.datavalidation import DataValidation
-from openpyxl.styles import PatternFill, Font
 
+from app.services.protocol_writer import build_ft_protocol
 # Hent alt vi trenger fra core
 from .protokoller_core import (
     bp,
@@ -151,10 +147,6 @@ def _normalize_rows_from_request():
 @bp.route("/download_funksjonstest_protokoll", methods=["POST"])
 @login_required
 def download_funksjonstest_protokoll():
-    from flask import current_app
-    from openpyxl.styles import Alignment
-    log = current_app.logger
-
     # ---------- robust payload -> rows (uendret prinsipp) ----------
     def _load_payload():
         payload = request.get_json(silent=True)
@@ -201,15 +193,6 @@ def download_funksjonstest_protokoll():
     if not os.path.exists(template_path):
         return jsonify({"error": "Malfil ikke funnet",
                         "hint": f"Letet etter: {template_path}"}), 500
-    wb = load_workbook(template_path)
-
-    # Finn malark (som før)
-    malark = None
-    for name in wb.sheetnames:
-        if name.lower() in ("mal", "malverk", "template", "ft_mal"):
-            malark = wb[name]; break
-    if malark is None:
-        malark = wb[wb.sheetnames[0]]
 
     # ---------- grupper per system (beholder denne logikken) ----------
     def _sys(r):
@@ -220,21 +203,6 @@ def download_funksjonstest_protokoll():
                 return v
         return "Uspesifisert"
 
-    groups = {}
-    for r in rows:
-        groups.setdefault(_sys(r), []).append(r)
-
-    # ---------- helpers ----------
-    START_ROW = 29
-    COL = {"A": 1, "B": 2, "C": 3, "E": 5, "G": 7, "H": 8}
-
-    FUNK_CHOICES = [
-        "Start og Stopp funksjoner",
-        "Reguleringsfunksjoner",
-        "Sikkerhetsfunksjoner",
-        "Øvrig",
-    ]
-
     def normalize_funksjonsvalg(val: str | None) -> str:
         s = (val or "").strip().lower()
         if not s:
@@ -247,105 +215,26 @@ def download_funksjonstest_protokoll():
             return "Sikkerhetsfunksjoner"
         return "Øvrig"
 
-    def replace_placeholders(ws, system_text: str):
-        patt = re.compile(r"\{SYSTEM(NAVN)?\}", re.I)
-        for r in ws.iter_rows(min_row=1, max_row=60, min_col=1, max_col=40):
-            for cell in r:
-                v = cell.value
-                if isinstance(v, str) and patt.search(v):
-                    cell.value = patt.sub(system_text, v)
-
-    # Validering + CF for datarader (Status i A, Funksjonsvalg i H)
-    def apply_validations_and_cf(ws, start_row: int, end_row: int):
-        if start_row > end_row:
-            return
-
-        # Status (A) – nedtrekk + CF
-        dv_status = DataValidation(
-            type="list",
-            formula1='"Ikke startet,Under arbeid,Avvik,Utført"',
-            allow_blank=True
-        )
-        ws.add_data_validation(dv_status)
-        dv_status.add(f"A{start_row}:A{end_row}")
-
-        # CF-farger for Status (samme logikk som før)
-        FILL_GRAY  = PatternFill("solid", start_color="FFF2F2F2", end_color="FFF2F2F2")
-        FILL_BLUE  = PatternFill("solid", start_color="FFDDEBF7", end_color="FFDDEBF7")
-        FILL_RED   = PatternFill("solid", start_color="FFF8D7DA", end_color="FFF8D7DA")
-        FILL_GREEN = PatternFill("solid", start_color="FFD4EDDA", end_color="FFD4EDDA")
-        FONT_BLACK = Font(color="FF000000")
-        FONT_WHITE = Font(color="FFFFFFFF")
-
-        def rule(expr, fill, font):
-            dxf = DifferentialStyle(fill=fill, font=font)
-            return Rule(type="expression", dxf=dxf, stopIfTrue=False, formula=[expr])
-
-        rngA = f"A{start_row}:A{end_row}"
-        ws.conditional_formatting.add(rngA, rule('=EXACT($A1,"Ikke startet")', FILL_GRAY,  FONT_BLACK))
-        ws.conditional_formatting.add(rngA, rule('=EXACT($A1,"Under arbeid")', FILL_BLUE,  FONT_BLACK))
-        ws.conditional_formatting.add(rngA, rule('=EXACT($A1,"Avvik")',        FILL_RED,   FONT_WHITE))
-        ws.conditional_formatting.add(rngA, rule('=EXACT($A1,"Utført")',       FILL_GREEN, FONT_BLACK))
-
-        # Funksjonsvalg (H) – nedtrekk
-        lista = '"' + ",".join(FUNK_CHOICES) + '"'
-        dv_funk = DataValidation(type="list", formula1=lista, allow_blank=True)
-        ws.add_data_validation(dv_funk)
-        dv_funk.add(f"H{start_row}:H{end_row}")
-
-    # ---------- lag ark per system og fyll (uten seksjonsoverskrifter) ----------
-    for system, liste in groups.items():
-        title = f"{system} - FT"
-        ws = wb[title] if title in wb.sheetnames else wb.copy_worksheet(malark)
-        ws.title = title
-
-        replace_placeholders(ws, system)
-
-        # Tøm dataområde (A–N) fra rad 29 og ned 1000 rader
-        for rr in range(START_ROW, START_ROW + 1000):
-            for cc in range(1, 14 + 1):  # A..N
-                ws.cell(rr, cc).value = None
-
-        r = START_ROW
-        first_data_row = r
-
-        # Skriv alle rader fortløpende
-        for obj in liste:
-            system_txt = _sys(obj)
-            komponent  = obj.get("komponent", "")
-            test       = obj.get("testutfoerelse", "") or obj.get("test", "")
-            aksept     = obj.get("aksept", "") or obj.get("forventet_resultat", "")
-            status_val = obj.get("status") or "Ikke startet"
-            funksjonsvalg = normalize_funksjonsvalg(obj.get("funksjonsvalg") or obj.get("integrert"))
-
-            ws.cell(r, COL["A"], status_val)      # Status
-            ws.cell(r, COL["B"], system_txt)      # System
-            ws.cell(r, COL["C"], komponent)       # Komponent
-            ws.cell(r, COL["E"], test)            # Testutførelse
-            ws.cell(r, COL["G"], aksept)          # Akseptkriterie
-            ws.cell(r, COL["H"], funksjonsvalg)   # Funksjonsvalg (NY)
-            r += 1
-
-        last_data_row = r - 1
-        if last_data_row >= first_data_row:
-            apply_validations_and_cf(ws, first_data_row, last_data_row)
-
-    # --- Fjern malarket helt til slutt ---
-    try:
-        if malark.title in wb.sheetnames:
-            wb.remove(wb[malark.title])
-    except Exception as e:
-        log.warning("Kunne ikke fjerne malarket %r: %s", malark.title, e)
-
-    # Sorter ark alfabetisk (som før)
-    try:
-        wb._sheets = [wb[n] for n in sorted(wb.sheetnames)]
-    except Exception:
-        pass
+    groups = {}
+    for obj in rows:
+        system_txt = _sys(obj)
+        groups.setdefault(system_txt, []).append({
+            "status": obj.get("status") or "Ikke startet",
+            "system": system_txt,
+            "komponent": obj.get("komponent", ""),
+            "test": obj.get("testutfoerelse", "") or obj.get("test", ""),
+            "aksept": obj.get("aksept", "") or obj.get("forventet_resultat", ""),
+            "funksjonsvalg": normalize_funksjonsvalg(obj.get("funksjonsvalg") or obj.get("integrert")),
+        })
+
+    # ---------- ett ark per system fra cachet mal (strømmes), sortert alfabetisk ----------
+    # Malark: første av mal/malverk/template/ft_mal, ellers første ark. {SYSTEM}/{SYSTEMNAVN}
+    # erstattes, A–N tømmes fra rad 29, data skrives fra rad 29 med validering og CF.
+    writer = build_ft_protocol(template_path, groups)
 
     # ---------- send fil ----------
     bio = io.BytesIO()
-    wb.save(bio)
+    writer.save(bio)
     bio.seek(0)
     filename = f"Funksjonstest_Protokoll_{datetime.utcnow():%Y%m%d_%H%M%S}.xlsx"
     return send_file(
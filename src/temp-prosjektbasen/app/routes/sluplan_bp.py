@@ -1,10 +1,10 @@
-from collections import Counter
 from datetime import datetime, timezone
-from typing import Dict, Iterable, Optional
+from typing import Optional
 
 from flask import Blueprint, jsonify, render_template, request, Response
 from flask_login import login_required
 
+from app.services.sluplan_schedule import ScheduleCycleError
 from app.services.sluplan_service import (
     add_comment_to_task,
     add_file_attachment,
@@ -13,9 +13,10 @@ from app.services.sluplan_service import (
     export_plan,
     generate_task_ics,
     get_alerts,
+    get_dashboard_snapshot,
     get_plan_snapshot,
     get_project_snapshot,
-    get_tasks,
+    get_schedule,
     import_plan,
     import_systems_from_excel,
     list_base_projects,
@@ -23,21 +24,16 @@ from app.services.sluplan_service import (
     list_resource_catalog,
     reset_plan,
     summarize_by_discipline,
+    summarize_by_status,
     summarize_by_time_window,
     summarize_by_user,
     update_task_fields,
+    verify_summary,
 )
 
 sluplan_bp = Blueprint("sluplan_bp", __name__, url_prefix="/sluplan")
 
 
-def _flatten(tasks: Iterable[Dict]) -> Iterable[Dict]:
-    for task in tasks:
-        yield task
-        children = task.get("children") or []
-        yield from _flatten(children)
-
-
 def _parse_project_id(value: object) -> Optional[int]:
     try:
         return int(value)
@@ -177,20 +173,28 @@ def sluplan_reports_summary():
     """Gi en enkel oppsummering av oppgaver per status (inkludert underoppgaver)."""
     project_id = _project_id_from_args()
     try:
-        tasks = get_tasks(project_id)
+        summary = summarize_by_status(project_id)
     except ValueError as exc:
         return jsonify({"error": str(exc)}), 404
-    flat = list(_flatten(tasks))
-    counter = Counter(task.get("status") or "ukjent" for task in flat)
     return jsonify(
         {
-            "total": len(flat),
-            "per_status": dict(counter),
+            **summary,
             "generated_at": datetime.now(timezone.utc).isoformat(),
         }
     )
 
 
+@sluplan_bp.route("/api/reports/summary/check", methods=["GET", "POST"])
+@login_required
+def sluplan_reports_summary_check():
+    """Kontroller det lagrede sammendraget mot oppgavene; POST bygger om ved avvik."""
+    try:
+        report = verify_summary(_project_id_from_args(), repair=request.method == "POST")
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 404
+    return jsonify(report)
+
+
 @sluplan_bp.route("/api/reports/by-discipline", methods=["GET"])
 @login_required
 def sluplan_reports_by_discipline():
@@ -228,6 +232,21 @@ def sluplan_reports_time():
     return jsonify(report)
 
 
+@sluplan_bp.route("/api/reports/dashboard", methods=["GET"])
+@login_required
+def sluplan_reports_dashboard():
+    """Returner status, fag, brukere, tidsvindu og varsler i ett kall."""
+    try:
+        snapshot = get_dashboard_snapshot(
+            _project_id_from_args(), request.args.get("from"), request.args.get("to")
+        )
+    except ValueError as exc:
+        message = str(exc)
+        status = 404 if message == "project_finnes_ikke" else 400
+        return jsonify({"error": message}), status
+    return jsonify(snapshot)
+
+
 @sluplan_bp.route("/api/plan/export", methods=["GET"])
 @login_required
 def sluplan_plan_export():
@@ -265,6 +284,19 @@ def sluplan_alerts():
     return jsonify(alerts)
 
 
+@sluplan_bp.route("/api/schedule", methods=["GET"])
+@login_required
+def sluplan_schedule():
+    """Beregn kritisk linje (tidligste/seneste datoer og slakk) for prosjektet."""
+    try:
+        schedule = get_schedule(_project_id_from_args())
+    except ScheduleCycleError as exc:
+        return jsonify({"error": str(exc), "task_ids": [str(t) for t in exc.task_ids]}), 400
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 404
+    return jsonify(schedule)
+
+
 @sluplan_bp.route("/api/tasks/reset", methods=["POST"])
 @login_required
 def sluplan_tasks_reset():
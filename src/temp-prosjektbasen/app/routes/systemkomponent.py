@@ -1,17 +1,19 @@
 import io
 import json
 import re
-import fitz  # PyMuPDF
-import docx
+import shutil
+import tempfile
 from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context, render_template
 from flask_login import login_required
 from openpyxl.styles import Alignment
-from openpyxl import Workbook, load_workbook
+from openpyxl import Workbook
 from pathlib import Path
 from app.models.project import Project
 from app.models.systembygging import Systembygging
 from app.models.komponentopptelling import Komponentopptelling
-from app.models.db import db
+from app.services.bulk_upsert import sync_komponentopptelling, sync_systembygging
+from app.services.tag_engine import TFM_DICT, compile_format
+from app.services.upload_text import iter_text, spool_upload
 
 systemkomponent_bp = Blueprint("systemkomponent", __name__, url_prefix="/systemkomponent")
 
@@ -19,92 +21,6 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 TEMP_ROOT = BASE_DIR / "temp"
 TEMP_ROOT.mkdir(exist_ok=True)
 
-# ────────────────────────────────────────────────────────────────────────────────
-# TFM_DICT (forkortet ikke – beholdt slik du la inn)
-# ────────────────────────────────────────────────────────────────────────────────
-TFM_DICT = {
-    "AB": "Bjelke", "AD": "Dekker", "AE": "Elementer", "AF": "Fagverk", "AG": "Glassfelt", "AH": "Fundamenter",
-    "AK": "Komplette konstruksjoner", "AL": "List - Beslistning", "AO": "Oppbygende - Utforende", "AP": "Plate",
-    "AR": "Ramme - Oppheng", "AS": "Søyle", "AU": "Åpninger", "AV": "Vegg", "BA": "Armering Forsterkning",
-    "BB": "Beskyttende - Stoppende", "BC": "Begrensende", "BF": "Fuging", "BG": "Pakning Tetning", "BI": "Isolasjon",
-    "BP": "Avretningsmasse", "BS": "Spikerslag", "CB": "Balkong", "CC": "Baldakin", "CD": "Karnapp",
-    "CG": "Rampe - Repos", "CK": "Komplett konstruksjon", "CM": "Kjemiske stoffer", "CO": "Kobling Overgang",
-    "CP": "Pipe - Skostein", "CQ": "Festemateriell", "CR": "Rammeverk - Oppheng", "CT": "Trapp - Leider",
-    "CX": "Tunnel - Bru (inne-ute)", "DB": "Dør med brannklasse", "DF": "Foldedør - Foldevegg", "DI": "Dør - innvendig",
-    "DK": "Kjøretøyregulering", "DL": "Luke", "DP": "Port", "DT": "Dør - tilfluktsrom", "DU": "Dør - utvendig",
-    "DV": "Vindu", "EB": "Overflatebekledning", "EC": "Overflatebehandling", "EH": "Himling",
-    "FA": "Ventilert arbeidsplass", "FB": "Benk - Bord - Plate - Tavle", "FC": "Beslag", "FD": "Disk - Skranke",
-    "FF": "Fryserom", "FH": "Hylle - Reol", "FI": "Kabinett", "FK": "Kjølerom - Svalrom",
-    "FO": "Sittebenk - Sofa - Stol", "FR": "Rom", "FS": "Skap - Skuff", "FT": "Speil", "FV": "Vaskemaskin",
-    "FX": "Krok - Knagg - Håndtak", "GA": "Automat - Maskin", "GB": "Benk - Bord - Plate - Tavle", "GD": "Dekontamator",
-    "GE": "Autoklaver", "GF": "Fryseskap", "GG": "Gardiner - Forheng", "GH": "Hylle - Reol",
-    "GK": "Kjøleskap - Kjøledisk", "GL": "Lås - Beslag", "GM": "Mattilbereding", "GN": "Nøkler",
-    "GO": "Sofa - Sittebenk", "GP": "Stol", "GQ": "Seng - Liggebenk", "GS": "Skap - Skuffer",
-    "GT": "Tørkeskap - Varmeskap", "GV": "Vaskemaskin", "GW": "Vekt", "GX": "Holder", "GY": "Avfallsbeholder",
-    "HA": "Automobil - Bil", "HB": "Rullebord - Tralle", "HC": "Container - Vogn", "HM": "Maskin",
-    "HS": "Rullestol", "HT": "Truck - kran", "HV": "Verktøy", "IB": "Brenner", "IC": "Solceller-solfangere",
-    "ID": "Kjel for destruksjon", "IE": "Elektrokjel", "IF": "Kjel for fast-bio brensel", "IG": "Generator",
-    "IK": "Kuldeaggregat", "IL": "Energibrønn", "IM": "Motor", "IO": "Oljekjel", "IP": "Gasskjel",
-    "IT": "Trykkluftaggregat (enhet)", "IU": "Turbin", "IV": "Aggregatenhet", "JF": "Forsterker", "JK": "Kompressor",
-    "JP": "Pumpe", "JQ": "Pumpe i VA-installasjoner", "JV": "Vifte", "JW": "Spesialvifte",
-    "KA": "Aktuator", "KD": "Drivhjul - Drev", "KE": "Induktiv energioverføring", "KG": "Gjennomføring",
-    "KH": "Transportenhet (hevende forflyttende)", "KJ": "Jordingskomponenter", "KK": "Kanal", "KM": "Mast - Antenne",
-    "KN": "Nedløp", "KO": "Kraftoverføring", "KQ": "Rør - spesielt", "KR": "Rør - generelt", "KS": "Skinne - Bane - Spor",
-    "KU": "Kombinert kabel", "KV": "Høyspenningskabel > 1000V", "KW": "Lavspenningskabel 50 til 1000V",
-    "KX": "Lavspenningskabel < 50V", "KY": "Optisk kabel", "KZ": "Slange", "LB": "Varmeomformende med vifte",
-    "LC": "Kjøleomformende med vifte", "LD": "Kjøleflater", "LE": "Kondensator", "LF": "Fordamper",
-    "LG": "Gear clutch", "LH": "Varmeflate", "LI": "Varmeelement", "LK": "Kjøleomformende", "LL": "Lyskilde",
-    "LN": "Likeretter", "LO": "Omformer", "LP": "Pens - Veksel - Sjalter", "LQ": "Vekselretter",
-    "LR": "Frekvensomformer", "LS": "Strålevarme", "LU": "Luftfukter", "LV": "Varmeomformende",
-    "LX": "Varmegjenvinner", "LZ": "Varmerkabel - Varmerør", "MA": "Absoluttfilter", "MB": "ABC-filter",
-    "MC": "UV-filter", "ME": "Elektrostatiske filter", "MF": "Luftfilter", "MG": "Fettfilter", "MK": "Kondenspotte",
-    "ML": "Luftutskiller", "MM": "Membran", "MO": "Utskiller", "MR": "Rist - Sil", "MS": "Syklon", "MT": "Tørke",
-    "MU": "Filter for Lyd - Bilde - Frekvensutjevner", "MV": "Vannfilter", "MX": "Støyfilter",
-    "NB": "Batteri - UPS", "NC": "Kondensator", "NI": "Informasjonslagring", "NK": "Kum", "NM": "Badekar - Basseng",
-    "NO": "Åpen tank", "NT": "Tank med trykk", "NU": "Tank uten trykk", "NV": "Vekt Lodd", "NW": "Varmtvannsbereder",
-    "NX": "Toalett", "NY": "Servant", "NZ": "Brannslukkingsapparat", "OA": "AV-maskiner", "OB": "Shuntgruppe",
-    "OD": "Datamaskin", "OE": "Energimåler", "OF": "Systembærer", "OM": "Mottaker - Sender", "OP": "PBX",
-    "OQ": "Dataprogramprogramvare", "OR": "Router Fordeler", "OS": "Sentralenhet Mikser i Lydsystem",
-    "OT": "Telefonapparat", "OU": "Undersentral", "QB": "Belastningsvakt", "QD": "Differansetrykkvakt",
-    "QE": "Elektrisk vern", "QF": "Strømningsvakt", "QG": "", "QH": "Fuktvakt", "QI": "", "QJ": "", "QK": "",
-    "QL": "Lyddemper", "QM": "Mekanisk beskyttelse", "QN": "Nivåvakt", "QO": "Overtrykksventil", "QP": "Trykkvakt",
-    "QQ": "Vibrasjonsvakt", "QR": "Rotasjonsvakt", "QS": "Strømvakt", "QT": "Temperaturvakt", "QU": "",
-    "QV": "Sikkerhetsventil", "QW": "", "QX": "Solavskjerming", "QY": "Lynavleder", "QZ": "Brannvern",
-    "RA": "AV-opptaker", "RB": "Bevegelse", "RC": "Seismometer", "RD": "Differansetrykkgiver",
-    "RE": "Elektriske variabler", "RF": "Strømningsmåler", "RG": "Posisjon - Lengde", "RH": "Fuktighetsgiver",
-    "RI": "Termometer", "RJ": "Fotocelle", "RK": "Kortleser", "RL": "", "RM": "Multifunksjonell Kombinert føler",
-    "RN": "Nivågiver", "RO": "", "RP": "Trykkgiver", "RQ": "Manometer Trykkmåler", "RR": "Giver generelt",
-    "RS": "Hastighetsmåler", "RT": "Temperaturgiver", "RU": "Ur", "RV": "Veieceller", "RW": "Virkningsgradsmåler",
-    "RX": "Målepunkt", "RY": "Gassdetektor-Røykdetektor", "RZ": "Branndeteksjon",
-    "SA": "Reguleringsventil manuell", "SB": "Reguleringsventil motorstyrt", "SC": "Stengeventil motorstyrt",
-    "SD": "Alarmventil sprinkler", "SE": "Ekspansjonsventil", "SF": "Fraluftsventil",
-    "SG": "Tilbakeslagsventil - Overtrykkspjeld", "SH": "Hurtigkobling", "SI": "Effektregulator",
-    "SJ": "Jevntrykksventil", "SK": "Strømningsregulator - CAV", "SL": "", "SM": "Stengeventil manuell", "SN": "",
-    "SO": "", "SP": "Trykkutjevningsventil", "SQ": "Strømningsregulator - VAV", "SR": "Reguleringsspjeld",
-    "SS": "Stengespjeld", "ST": "Tilluftsventil", "SU": "Sugetrykksventil", "SV": "Strupeventil",
-    "SW": "Plenumskammer", "SX": "Regulator", "SY": "", "SZ": "Brannspjeld - Røykspjeld",
-    "UA": "Uttak alarm", "UB": "Blandebatteri", "UC": "", "UD": "Uttak data", "UE": "Uttak el", "UF": "Fellesuttak",
-    "UG": "Uttak gass", "UH": "Høyttaler", "UI": "", "UJ": "Skriver", "UK": "Kontrollpanel - Tablå",
-    "UL": "Uttak trykkluft", "UM": "Monitor - Display", "UN": "Nødbelysning", "UO": "Trommel",
-    "UP": "Belysningsarmatur", "UQ": "", "UR": "Uttak radio", "US": "Stasjon", "UT": "Uttak telefon", "UU": "",
-    "UV": "Uttak vann", "UW": "", "UX": "Koblingsboks", "UY": "Uttak antenne", "UZ": "Dyse - Spreder",
-    "VA": "", "VB": "Bærelag", "VC": "", "VD": "Dekke", "VE": "", "VF": "", "VG": "Gress", "VH": "", "VI": "",
-    "VJ": "", "VK": "Kantstein heller", "VL": "Masse", "VM": "Mekanisk beskyttelse", "VN": "", "VO": "",
-    "VP": "Planterbuskertrær", "VQ": "", "VR": "", "VS": "Skilt", "VT": "", "VU": "", "VV": "", "VW": "", "VX": "",
-    "VY": "", "VZ": "", "XA": "", "XB": "", "XC": "Kondensator", "XD": "Komp. for binærlogikk", "XE": "",
-    "XF": "Komponenter for vern", "XG": "Komponenter for krafttilførsel", "XH": "Komponenter for signalering",
-    "XI": "Potensiometer", "XJ": "", "XK": "Releer - Kontaktorer", "XL": "Induktiv komponenter", "XM": "Motor",
-    "XN": "Integrerte kretser", "XO": "Urbryter - Timer", "XP": "Komponenter for måling og prøving",
-    "XQ": "Effektbryter", "XR": "Motstand", "XS": "Bryter / Vender", "XT": "Transformator", "XU": "",
-    "XV": "Halvlederkomponenter og elektronrør", "XW": "", "XX": "Rekkeklemmer - Samlesignal", "XY": "",
-    "XZ": "Terminering og tilpasning", "YA": "", "YB": "", "YC": "", "YD": "", "YE": "", "YF": "", "YG": "",
-    "YH": "", "YI": "", "YJ": "", "YK": "", "YL": "", "YM": "", "YN": "", "YO": "", "YP": "", "YQ": "", "YR": "",
-    "YS": "", "YT": "", "YU": "", "YV": "", "YW": "", "YX": "", "YY": "", "YZ": "", "ZA": "", "ZB": "", "ZC": "",
-    "ZD": "", "ZE": "", "ZF": "", "ZG": "", "ZH": "", "ZI": "", "ZJ": "", "ZK": "", "ZL": "", "ZM": "", "ZN": "",
-    "ZO": "", "ZP": "", "ZQ": "", "ZR": "", "ZS": "", "ZT": "", "ZU": "", "ZV": "", "ZW": "", "ZX": "", "ZY": "",
-    "ZZ": ""
-}
-
 # ────────────────────────────────────────────────────────────────────────────────
 # UI
 # ────────────────────────────────────────────────────────────────────────────────
@@ -115,93 +31,38 @@ def index():
     return render_template("systemkomponent.html", prosjekter=prosjekter)
 
 # ────────────────────────────────────────────────────────────────────────────────
-# Tekstekstraksjon
+# Tekstekstraksjon (strømmende, se app.services.upload_text)
 # ────────────────────────────────────────────────────────────────────────────────
-def extract_text_from_bytes(filename: str, data: bytes) -> str:
+def spool_request_files(files):
     """
-    Ekstraherer tekst fra bytes for PDF, DOCX, XLSX, TXT.
-    Trygg å bruke under streaming (ingen avhengighet til åpne filhåndtak).
+    Kopier opplastingene til en egen temp-mappe før strømmingen starter
+    (filobjektene i request lukkes når visningen returnerer).
+    Returnerer (mappe, [(filnavn, sti)]); mappen fjernes i _streamed_response().
     """
-    name = filename.lower()
-    bio = io.BytesIO(data)
+    tmp = tempfile.mkdtemp(dir=TEMP_ROOT, prefix="systemkomponent_")
+    return tmp, [(f.filename, spool_upload(f, tmp, i)) for i, f in enumerate(files)]
 
-    if name.endswith(".pdf"):
-        try:
-            doc = fitz.open(stream=data, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            return text
-        except Exception as e:
-            print(f"Feil ved lesing av PDF {filename}: {e}")
-            return ""
-
-    elif name.endswith(".docx"):
+def iter_upload_batches(spooled, pattern):
+    """
+    Gi (filnavn, tagger) per tekstbit (PDF-side, XLSX-rader, DOCX-avsnitt, TXT-buffer).
+    tags=None markerer ny fil. Hver fil slettes når den er lest.
+    """
+    for fname, path in spooled:
+        yield fname, None
         try:
-            docx_file = docx.Document(bio)
-            return "\n".join(p.text for p in docx_file.paragraphs)
-        except Exception as e:
-            print(f"Feil ved lesing av DOCX {filename}: {e}")
-            return ""
+            for tags in pattern.scan_batches(iter_text(path, fname)):
+                yield fname, tags
+        finally:
+            path.unlink(missing_ok=True)
 
-    elif name.endswith(".xlsx"):
-        try:
-            wb = load_workbook(filename=bio, data_only=True)
-            # Deaktiver aktive filtre
-            for ws in wb.worksheets:
-                if ws.auto_filter and ws.auto_filter.ref:
-                    ws.auto_filter.ref = None
-            text = ""
-            for ws in wb.worksheets:
-                for row in ws.iter_rows(values_only=True):
-                    line = " ".join("" if c is None else str(c) for c in row)
-                    text += line + "\n"
-            return text
-        except Exception as e:
-            print(f"Feil ved lesing av XLSX {filename}: {e}")
-            return ""
-
-    elif name.endswith(".txt"):
-        try:
-            return data.decode(errors="ignore")
-        except Exception as e:
-            print(f"Feil ved lesing av TXT {filename}: {e}")
-            return ""
+def _streamed_response(generate, tmp):
+    resp = Response(stream_with_context(generate()), mimetype="text/plain")
+    # Rydd også om klienten avbryter før/underveis
+    resp.call_on_close(lambda: shutil.rmtree(tmp, ignore_errors=True))
+    return resp
 
-    else:
-        print(f"Ukjent filtype: {filename}. Hopper over.")
-        return ""
-
-# ────────────────────────────────────────────────────────────────────────────────
-# Regex-bygging (mal → regex som fanger prefiks + innhold pr segment)
-# ────────────────────────────────────────────────────────────────────────────────
-def build_dynamic_regex(format_string: str) -> str:
-    """
-    Bygg regex fra en formatstreng ved å fange PREFIKS + INNHOLD for hvert segment.
-    - {byggnr}   -> (?P<byggnr_prefix>\++)(?P<byggnr>[A-Za-z0-9]+)
-    - {system}   -> (?:(?P<system_prefix>=)(?P<system>[^-\s%\n]+))?
-    - {komponent}-> (?P<komponent_prefix>-)(?P<komponent>[^\s%\n]+)
-    - {typekode} -> (?:(?P<typekode_prefix>%)(?P<typekode>\S+))?
-    """
-    parts = []
-    i = 0
-    while i < len(format_string):
-        if format_string[i:].startswith("{byggnr}"):
-            parts.append(r"(?P<byggnr_prefix>\++)(?P<byggnr>[A-Za-z0-9]+)")
-            i += len("{byggnr}")
-        elif format_string[i:].startswith("{system}"):
-            parts.append(r"(?:(?P<system_prefix>=)(?P<system>[^-\s%\n]+))?")
-            i += len("{system}")
-        elif format_string[i:].startswith("{komponent}"):
-            parts.append(r"(?P<komponent_prefix>-)(?P<komponent>[^\s%\n]+)")
-            i += len("{komponent}")
-        elif format_string[i:].startswith("{typekode}"):
-            parts.append(r"(?:(?P<typekode_prefix>%)(?P<typekode>\S+))?")
-            i += len("{typekode}")
-        else:
-            parts.append(re.escape(format_string[i]))
-            i += 1
-    return "".join(parts)
+# Aggregeringsnøkkel i komponentopptelling: TFM + påfølgende bokstaver/streker før tall/annet
+_COMP_KEY = re.compile(r'([A-Za-z]{2}[A-Za-z\-]*)')
 
 # ────────────────────────────────────────────────────────────────────────────────
 # Hjelpere: system-ID, Excel-format
@@ -303,7 +164,6 @@ def systembygging():
     Lister komponent-treff (én rad per treff) basert på formatmal og kriterier.
     """
     files = request.files.getlist("files")
-    mem_files = [{"filename": f.filename, "data": f.read()} for f in files]
     kriterier_str = request.form.get("kriterier", "")
     system_valg = [s.strip() for s in kriterier_str.split(",") if s.strip()]
     formatval = request.form.get("format", "")  # f.eks. "{byggnr}{system}{komponent}{typekode}"
@@ -311,79 +171,59 @@ def systembygging():
     if not formatval:
         return Response(json.dumps({"error": "Mangler format"}), mimetype="application/json", status=400)
 
-    regex_str = build_dynamic_regex(formatval)
-    pattern = re.compile(regex_str)
+    pattern = compile_format(formatval)
+    tmp, spooled = spool_request_files(files)
 
     def generate():
         rows = []
-        for mf in mem_files:
-            yield json.dumps({"currentFile": mf["filename"]}) + "\n"
-            text = extract_text_from_bytes(mf["filename"], mf["data"])
-            if not text:
+        for fname, tags in iter_upload_batches(spooled, pattern):
+            if tags is None:
+                yield json.dumps({"currentFile": fname}) + "\n"
                 continue
 
-            for m in pattern.finditer(text):
-                gr = m.groupdict()
-
-                byggnr    = (gr.get("byggnr") or "").strip()
-                system    = (gr.get("system") or "").strip()
-                komponent = (gr.get("komponent") or "").strip()
-                typekode  = (gr.get("typekode") or "").strip()
+            new_rows = []
+            for tag in tags:
+                system = tag.system
+                komponent = tag.komponent
 
                 # Komponent er obligatorisk
                 if not komponent:
                     continue
 
                 # Hvis malen inneholder {system}, krever vi at '=' faktisk var til stede i teksten
-                if "{system}" in formatval and not gr.get("system_prefix"):
+                if pattern.has_system and not system:
                     continue
 
                 # Kriteriefilter: sjekk de to første tegnene i system-ID (når system finnes)
                 if system_valg and system and system[:2] not in system_valg:
                     continue
 
-                # Rekonstruer full_id med eksakt fanget prefiks
-                full_id_parts = []
-                i = 0
-                while i < len(formatval):
-                    if formatval[i:].startswith("{byggnr}"):
-                        full_id_parts.append((gr.get("byggnr_prefix") or "") + byggnr)
-                        i += len("{byggnr}")
-                    elif formatval[i:].startswith("{system}"):
-                        if gr.get("system_prefix"):
-                            full_id_parts.append(gr["system_prefix"] + system)
-                        i += len("{system}")
-                    elif formatval[i:].startswith("{komponent}"):
-                        full_id_parts.append((gr.get("komponent_prefix") or "-") + komponent)
-                        i += len("{komponent}")
-                    elif formatval[i:].startswith("{typekode}"):
-                        if gr.get("typekode_prefix"):
-                            full_id_parts.append(gr["typekode_prefix"] + typekode)
-                        i += len("{typekode}")
-                    else:
-                        full_id_parts.append(formatval[i])
-                        i += 1
-
-                current_full_id = "".join(full_id_parts)
+                # full_id = treffet slik det står i teksten (med eksakt fanget prefiks)
+                current_full_id = tag.full
 
                 actual_id = komponent.lstrip("-")
                 tfm2 = actual_id[:2] if len(actual_id) >= 2 else ""
                 desc = TFM_DICT.get(tfm2, "Ukjent")
 
-                rows.append({
+                new_rows.append({
                     "full_id": current_full_id,
                     "desc": desc,
                     "system": system,
                     "component": actual_id,
-                    "files": [mf["filename"]],
+                    "files": [fname],
                     "unique_system_key": get_unique_system_id(system),
                 })
 
+            # Fortløpende antall treff sendes med en gang (per side/bit); radene kommer samlet til slutt
+            if new_rows:
+                rows.extend(new_rows)
+                yield json.dumps({"total": len(rows)}) + "\n"
+
         # Sorter stabilt for frontend
         rows_sorted = sorted(rows, key=lambda x: (x["system"], x["component"]))
         yield json.dumps({"rows": rows_sorted})
 
-    return Response(stream_with_context(generate()), mimetype="text/plain")
+    return _streamed_response(generate, tmp)
 
 # ────────────────────────────────────────────────────────────────────────────────
 # KOMPONENTOPPTELLING (streaming)
@@ -395,7 +235,6 @@ def komponentopptelling():
     Skiller mellom med/uten system-ID i kilden.
     """
     files = request.files.getlist("files")
-    mem_files = [{"filename": f.filename, "data": f.read()} for f in files]
     kriterier_str = request.form.get("kriterier", "")
     system_valg = [s.strip() for s in kriterier_str.split(",") if s.strip()]
     formatval = request.form.get("format", "")
@@ -403,31 +242,31 @@ def komponentopptelling():
     if not formatval:
         return Response(json.dumps({"error": "Mangler format"}), mimetype="application/json", status=400)
 
-    regex_str = build_dynamic_regex(formatval)
-    pattern = re.compile(regex_str)
+    pattern = compile_format(formatval)
+    tmp, spooled = spool_request_files(files)
 
     # Aggregater
     unique_component_with_system = {}
     unique_component_without_system = {}
 
     def generate():
-        for mf in mem_files:
-            yield json.dumps({"currentFile": mf["filename"]}) + "\n"
-            text = extract_text_from_bytes(mf["filename"], mf["data"])
-            if not text:
+        total = 0
+        for fname, tags in iter_upload_batches(spooled, pattern):
+            if tags is None:
+                yield json.dumps({"currentFile": fname}) + "\n"
                 continue
 
-            for m in pattern.finditer(text):
-                gr = m.groupdict()
-                system = (gr.get("system") or "").strip()
-                komponent = (gr.get("komponent") or "").strip()
+            # Antall nye treff i denne biten
+            found = 0
+            for tag in tags:
+                system = tag.system
+                komponent = tag.komponent
 
-                if "{komponent}" in formatval and not gr.get("komponent_prefix"):
-                    continue
+                # Uten '-'-prefiks (eller uten {komponent} i malen) er komponent tom
                 if not komponent:
                     continue
 
-                has_system = bool(gr.get("system_prefix") and system)
+                has_system = bool(system)
 
                 actual_id = komponent.lstrip("-")
                 tfm2 = actual_id[:2] if len(actual_id) >= 2 else ""
@@ -437,7 +276,7 @@ def komponentopptelling():
                     continue
 
                 # Aggregeringsnøkkel: TFM + påfølgende bokstaver/streker før tall/annet
-                mkey = re.match(r'([A-Za-z]{2}[A-Za-z\-]*)', actual_id)
+                mkey = _COMP_KEY.match(actual_id)
                 comp_key = mkey.group(1) if mkey else tfm2
 
                 # Kriterier på system (hvis til stede)
@@ -449,10 +288,15 @@ def komponentopptelling():
                     target[comp_key] = {"per_file": {}, "files": set()}
 
                 target_entry = target[comp_key]
-                fname = mf["filename"]
 
                 target_entry["per_file"][fname] = target_entry["per_file"].get(fname, 0) + 1
                 target_entry["files"].add(fname)
+                found += 1
+
+            # Fortløpende antall treff sendes med en gang (per side/bit); radene kommer samlet til slutt
+            if found:
+                total += found
+                yield json.dumps({"total": total}) + "\n"
 
         # Flater ut for frontend
         rows_to_send = []
@@ -475,7 +319,7 @@ def komponentopptelling():
         rows_to_send.sort(key=lambda x: (x["has_system"], x["id"]))
         yield json.dumps({"rows": rows_to_send})
 
-    return Response(stream_with_context(generate()), mimetype="text/plain")
+    return _streamed_response(generate, tmp)
 
 # ────────────────────────────────────────────────────────────────────────────────
 # GENERER EXCEL
@@ -635,17 +479,9 @@ def send_systembygging():
     if not project_id or not rows:
         return "Mangler prosjekt eller data", 400
 
-    Systembygging.query.filter_by(project_id=project_id).delete()
-
-    for r in rows:
-        db.session.add(Systembygging(
-            project_id=project_id,
-            full_id=r.get("full_id", ""),
-            desc=r.get("desc", ""),
-            files=", ".join(r.get("files", []))
-        ))
-    db.session.commit()
-    return "OK", 200
+    # Diff mot eksisterende rader i én transaksjon (app.services.bulk_upsert)
+    result = sync_systembygging(project_id, rows)
+    return jsonify({"status": "OK", **result.as_dict()}), 200
 
 @systemkomponent_bp.route("/send/komponentopptelling", methods=["POST"])
 @login_required
@@ -659,23 +495,8 @@ def send_komponentopptelling():
     if not project_id or not rows:
         return "Mangler prosjekt eller data", 400
 
-    Komponentopptelling.query.filter_by(project_id=project_id).delete()
-
-    for r in rows:
-        per_file = r.get("per_file", {})
-        count = sum(per_file.values()) if isinstance(per_file, dict) else (r.get("count") or 0)
-
-        db.session.add(Komponentopptelling(
-            project_id=project_id,
-            komponent=r.get("id", ""),
-            desc=r.get("desc", ""),
-            count=count,
-            has_system=r.get("has_system") == "Ja",
-            files=", ".join(r.get("files", []))
-        ))
-
-    db.session.commit()
-    return "OK", 200
+    result = sync_komponentopptelling(project_id, rows)
+    return jsonify({"status": "OK", **result.as_dict()}), 200
 
 # ────────────────────────────────────────────────────────────────────────────────
 # VISNING TABS
@@ -0,0 +1,115 @@
+"""Masselagring av systembygging/komponentopptelling per prosjekt (/systemkomponent/send/*).
+
+Synkroniserer prosjektets rader mot de innsendte i én transaksjon: eksisterende rader leses
+med én SELECT og pares med de nye på nøkkel (full_id / komponent, n-te forekomst mot n-te).
+Nye rader settes inn og endrede oppdateres med executemany, rader som ikke lenger finnes
+slettes i biter, og uendrede rader skrives ikke (de beholder id). SyncResult teller
+innsatte, oppdaterte, slettede og uendrede rader.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Sequence, Tuple
+
+from sqlalchemy import delete, insert, select, update
+
+from app.models.db import db
+from app.models.komponentopptelling import Komponentopptelling
+from app.models.systembygging import Systembygging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["SyncResult", "sync_project_rows", "sync_systembygging", "sync_komponentopptelling"]
+
+# Antall id-er per DELETE ... WHERE id IN (...) (SQLite har grense på bundne variabler)
+BULK_DELETE_CHUNK = int(os.getenv("BULK_DELETE_CHUNK", "500"))
+
+
+@dataclass
+class SyncResult:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out["seconds"] = round(self.seconds, 4)
+        return out
+
+
+def sync_project_rows(model, project_id: int, rows: Iterable[Mapping[str, Any]],
+                      key: str, fields: Sequence[str]) -> SyncResult:
+    """Gjør radene til prosjektet i model lik rows (dict med key og fields). Én transaksjon."""
+    t0 = time.perf_counter()
+    result = SyncResult()
+    cols = [key, *fields]
+    try:
+        existing: Dict[Any, Deque[Tuple[int, Tuple[Any, ...]]]] = defaultdict(deque)
+        stmt = (select(model.id, *(getattr(model, c) for c in cols))
+                .where(model.project_id == project_id).order_by(model.id))
+        for row_id, *values in db.session.execute(stmt):
+            existing[values[0]].append((row_id, tuple(values)))
+
+        to_insert: List[Dict[str, Any]] = []
+        to_update: List[Dict[str, Any]] = []
+        for r in rows:
+            values = tuple(r.get(c) for c in cols)
+            match = existing.get(values[0])
+            if match:
+                row_id, old = match.popleft()
+                if old == values:
+                    result.unchanged += 1
+                else:
+                    to_update.append({"id": row_id, **dict(zip(cols, values))})
+            else:
+                to_insert.append({"project_id": project_id, **dict(zip(cols, values))})
+        to_delete = [row_id for match in existing.values() for row_id, _ in match]
+
+        for i in range(0, len(to_delete), BULK_DELETE_CHUNK):
+            db.session.execute(delete(model).where(model.id.in_(to_delete[i:i + BULK_DELETE_CHUNK]))
+                               .execution_options(synchronize_session=False))
+        if to_update:
+            db.session.execute(update(model), to_update)
+        if to_insert:
+            db.session.execute(insert(model), to_insert)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    result.inserted, result.updated, result.deleted = len(to_insert), len(to_update), len(to_delete)
+    result.seconds = time.perf_counter() - t0
+    _log.info("%s prosjekt %s: %s", model.__tablename__, project_id, result.as_dict())
+    return result
+
+
+def _files(r: Mapping[str, Any]) -> str:
+    return ", ".join(r.get("files", []))
+
+
+def sync_systembygging(project_id: int, rows: Iterable[Mapping[str, Any]]) -> SyncResult:
+    """Rader fra /systembygging (full_id, desc, files[])."""
+    return sync_project_rows(Systembygging, project_id, (
+        {"full_id": r.get("full_id", ""), "desc": r.get("desc", ""), "files": _files(r)}
+        for r in rows
+    ), key="full_id", fields=("desc", "files"))
+
+
+def _count(r: Mapping[str, Any]) -> int:
+    per_file = r.get("per_file", {})
+    return sum(per_file.values()) if isinstance(per_file, dict) else (r.get("count") or 0)
+
+
+def sync_komponentopptelling(project_id: int, rows: Iterable[Mapping[str, Any]]) -> SyncResult:
+    """Rader fra /komponentopptelling (id, desc, per_file/count, has_system 'Ja'/'Nei', files[])."""
+    return sync_project_rows(Komponentopptelling, project_id, (
+        {"komponent": r.get("id", ""), "desc": r.get("desc", ""), "count": _count(r),
+         "has_system": r.get("has_system") == "Ja", "files": _files(r)}
+        for r in rows
+    ), key="komponent", fields=("desc", "count", "has_system", "files"))
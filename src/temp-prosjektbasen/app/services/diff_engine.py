@@ -0,0 +1,240 @@
+"""Skalerbar blokk-diff for dokumentsammenligning.
+
+Tre trinn:
+1. Forankring: hvert (normalisert) avsnitt får en heltalls-ID via hashing, felles start og
+   slutt skrelles av, og avsnitt som er unike i begge dokumentene brukes som ankere.
+2. Blokk-diff: patience-diff (lengste økende delsekvens av ankrene) deler dokumentene i
+   stadig mindre regioner. Små regioner løses med difflib.SequenceMatcher, slik at små
+   dokumenter gir samme resultat som før; store regioner uten unike ankere blir én endring.
+3. Ord-diff kjøres bare inne i endrede blokker (samme motor på ord-nivå).
+
+Blokkene gis ut fortløpende (generator) i dokumentrekkefølge. Med tidsbudsjett
+(DIFF_TIME_BUDGET sekunder) gis resten ut som grove endringsblokker når budsjettet er
+brukt opp, og stats["truncated"] settes.
+"""
+from __future__ import annotations
+
+import difflib
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+DIFF_TIME_BUDGET = float(os.getenv("DIFF_TIME_BUDGET", "20"))
+# Regioner med høyst så mange celler (len(a) * len(b)) løses direkte med SequenceMatcher
+DIFF_SMALL_CELLS = int(os.getenv("DIFF_SMALL_CELLS", "250000"))
+# Ord-diff hoppes over for blokker med flere ord enn dette (per side)
+DIFF_WORD_MAX = int(os.getenv("DIFF_WORD_MAX", "20000"))
+
+Opcode = Tuple[str, int, int, int, int]
+
+__all__ = [
+    "DIFF_TIME_BUDGET",
+    "opcodes",
+    "iter_diff_blocks",
+    "word_diff",
+]
+
+
+class _Budget:
+    def __init__(self, seconds: Optional[float]):
+        self.deadline = None if seconds is None else time.perf_counter() + max(0.0, seconds)
+        self.exhausted = False
+
+    def left(self) -> bool:
+        if self.deadline is not None and not self.exhausted and time.perf_counter() > self.deadline:
+            self.exhausted = True
+        return not self.exhausted
+
+
+def _intern(a: Sequence[Hashable], b: Sequence[Hashable]) -> Tuple[List[int], List[int]]:
+    ids: Dict[Hashable, int] = {}
+    a_ids = [ids.setdefault(x, len(ids)) for x in a]
+    b_ids = [ids.setdefault(x, len(ids)) for x in b]
+    return a_ids, b_ids
+
+
+def _unique_anchors(a: List[int], b: List[int], i1: int, i2: int, j1: int, j2: int) -> List[Tuple[int, int]]:
+    """Par (i, j) for verdier som forekommer nøyaktig én gang i hver region, sortert på i."""
+    seen_a: Dict[int, int] = {}
+    for i in range(i1, i2):
+        v = a[i]
+        seen_a[v] = -1 if v in seen_a else i
+    seen_b: Dict[int, int] = {}
+    for j in range(j1, j2):
+        v = b[j]
+        if seen_a.get(v, -1) >= 0:
+            seen_b[v] = -1 if v in seen_b else j
+    pairs = [(seen_a[v], j) for v, j in seen_b.items() if j >= 0]
+    pairs.sort()
+    return pairs
+
+
+def _lis(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Lengste delsekvens med økende j (patience sorting)."""
+    tails: List[int] = []
+    tail_idx: List[int] = []
+    prev = [-1] * len(pairs)
+    for k, (_i, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(k)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = k
+        prev[k] = tail_idx[pos - 1] if pos else -1
+    out: List[Tuple[int, int]] = []
+    k = tail_idx[-1] if tail_idx else -1
+    while k >= 0:
+        out.append(pairs[k])
+        k = prev[k]
+    out.reverse()
+    return out
+
+
+def _change(i1: int, i2: int, j1: int, j2: int) -> Opcode:
+    tag = "replace" if i2 > i1 and j2 > j1 else ("delete" if i2 > i1 else "insert")
+    return (tag, i1, i2, j1, j2)
+
+
+def _iter_opcodes(a: List[int], b: List[int], budget: _Budget, small_cells: int) -> Iterator[Opcode]:
+    """Rå opkoder (kan ha nabo-'equal') i dokumentrekkefølge."""
+    # Stakk med arbeid; siste element behandles først, så regioner legges på i omvendt rekkefølge
+    stack: List[Tuple[bool, int, int, int, int]] = [(False, 0, len(a), 0, len(b))]
+    while stack:
+        done, i1, i2, j1, j2 = stack.pop()
+        if done:
+            yield ("equal", i1, i2, j1, j2)
+            continue
+        if i1 == i2 or j1 == j2:
+            if i2 > i1 or j2 > j1:
+                yield _change(i1, i2, j1, j2)
+            continue
+        if (i2 - i1) * (j2 - j1) <= small_cells:
+            sm = difflib.SequenceMatcher(a=a[i1:i2], b=b[j1:j2])
+            for tag, x1, x2, y1, y2 in sm.get_opcodes():
+                yield (tag, i1 + x1, i1 + x2, j1 + y1, j1 + y2)
+            continue
+        # Felles start/slutt
+        p = 0
+        while i1 + p < i2 and j1 + p < j2 and a[i1 + p] == b[j1 + p]:
+            p += 1
+        s = 0
+        while i2 - s > i1 + p and j2 - s > j1 + p and a[i2 - s - 1] == b[j2 - s - 1]:
+            s += 1
+        if p or s:
+            if s:
+                stack.append((True, i2 - s, i2, j2 - s, j2))
+            stack.append((False, i1 + p, i2 - s, j1 + p, j2 - s))
+            if p:
+                stack.append((True, i1, i1 + p, j1, j1 + p))
+            continue
+        if not budget.left():
+            yield _change(i1, i2, j1, j2)
+            continue
+
+        anchors = _lis(_unique_anchors(a, b, i1, i2, j1, j2))
+        if not anchors:
+            # Ingen unike ankere i en stor region: grovt, men begrenset i tid
+            yield _change(i1, i2, j1, j2)
+            continue
+        # Del opp mellom ankrene; hvert anker er en lik linje
+        parts: List[Tuple[bool, int, int, int, int]] = []
+        ci, cj = i1, j1
+        for ai, bj in anchors:
+            parts.append((False, ci, ai, cj, bj))
+            parts.append((True, ai, ai + 1, bj, bj + 1))
+            ci, cj = ai + 1, bj + 1
+        parts.append((False, ci, i2, cj, j2))
+        for part in reversed(parts):
+            if part[0] or part[2] > part[1] or part[4] > part[3]:
+                stack.append(part)
+
+
+def opcodes(a: Sequence[Hashable], b: Sequence[Hashable], time_budget: Optional[float] = None,
+            small_cells: int = DIFF_SMALL_CELLS, stats: Optional[dict] = None) -> Iterator[Opcode]:
+    """
+    Opkoder som difflib.SequenceMatcher.get_opcodes(), men med patience-oppdeling av store
+    regioner. Nabo-blokker av samme type slås sammen. Gis ut fortløpende.
+    """
+    a_ids, b_ids = _intern(a, b)
+    budget = _Budget(time_budget)
+    pending: Optional[List] = None
+    for tag, i1, i2, j1, j2 in _iter_opcodes(a_ids, b_ids, budget, small_cells):
+        if pending is not None and (pending[0] == "equal") == (tag == "equal"):
+            # Slå sammen nabo-blokker (to endringer på rad blir én replace/insert/delete)
+            pending[2], pending[4] = i2, j2
+            if tag != "equal":
+                pending[0] = _change(pending[1], i2, pending[3], j2)[0]
+            continue
+        if pending is not None:
+            yield tuple(pending)
+        pending = [tag, i1, i2, j1, j2]
+    if pending is not None:
+        yield tuple(pending)
+    if stats is not None:
+        stats["truncated"] = stats.get("truncated", False) or budget.exhausted
+
+
+def word_diff(a_text: str, b_text: str, time_budget: Optional[float] = None,
+              stats: Optional[dict] = None) -> List[Dict]:
+    """Ord-diff (liste av {op: '=', '+', '-', text})."""
+    return _word_parts(a_text.split(), b_text.split(), time_budget, stats)
+
+
+def _word_parts(a_words: List[str], b_words: List[str], time_budget: Optional[float],
+                stats: Optional[dict]) -> List[Dict]:
+    parts: List[Dict] = []
+    for tag, i1, i2, j1, j2 in opcodes(a_words, b_words, time_budget=time_budget, stats=stats):
+        if tag == "equal":
+            if i2 > i1:
+                parts.append({"op": "=", "text": " ".join(a_words[i1:i2])})
+        else:
+            if i2 > i1:
+                parts.append({"op": "-", "text": " ".join(a_words[i1:i2])})
+            if j2 > j1:
+                parts.append({"op": "+", "text": " ".join(b_words[j1:j2])})
+    return parts
+
+
+def iter_diff_blocks(a_lines: Sequence[str], b_lines: Sequence[str],
+                     normalize: Optional[Callable[[str], str]] = None,
+                     time_budget: Optional[float] = DIFF_TIME_BUDGET,
+                     stats: Optional[dict] = None) -> Iterator[Dict]:
+    """
+    Blokker (equal/delete/insert/replace) for UI; replace får wordDiff.
+    Sammenligner normaliserte linjer, men viser originalteksten.
+    """
+    t0 = time.perf_counter()
+    stats = stats if stats is not None else {}
+    stats.setdefault("truncated", False)
+    deadline = None if time_budget is None else t0 + time_budget
+    norm = normalize or (lambda s: s)
+    a_norm = [norm(ln) for ln in a_lines]
+    b_norm = [norm(ln) for ln in b_lines]
+    n_blocks = 0
+    for tag, i1, i2, j1, j2 in opcodes(a_norm, b_norm, time_budget=time_budget, stats=stats):
+        textA = "\n".join(a_lines[i1:i2]) if i2 > i1 else ""
+        textB = "\n".join(b_lines[j1:j2]) if j2 > j1 else ""
+        locA = {"page": None, "para": i1 + 1} if i2 > i1 else None
+        locB = {"page": None, "para": j1 + 1} if j2 > j1 else None
+        n_blocks += 1
+        if tag == "equal":
+            yield {"type": "equal", "textA": textA, "textB": textB, "locationA": locA, "locationB": locB}
+        elif tag == "delete":
+            yield {"type": "delete", "textA": textA, "textB": "", "locationA": locA, "locationB": None}
+        elif tag == "insert":
+            yield {"type": "insert", "textA": "", "textB": textB, "locationA": None, "locationB": locB}
+        else:
+            block = {"type": "replace", "textA": textA, "textB": textB, "locationA": locA, "locationB": locB}
+            left = None if deadline is None else deadline - time.perf_counter()
+            a_words, b_words = textA.split(), textB.split()
+            if (left is None or left > 0) and len(a_words) <= DIFF_WORD_MAX and len(b_words) <= DIFF_WORD_MAX:
+                block["wordDiff"] = _word_parts(a_words, b_words, left, stats)
+            else:
+                stats["truncated"] = True
+                block["wordDiff"] = []
+            yield block
+    stats["blocks"] = n_blocks
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
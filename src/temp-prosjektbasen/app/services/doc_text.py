@@ -0,0 +1,113 @@
+"""Tekstuttrekk for dokumentsammenligning (syntaktisk søk, diff-sjekk og kombinert søk).
+
+Én gjennomgang per dokument:
+- PDF åpnes én gang, og hver side får én TextPage; både linjeteksten (som page.get_text())
+  og ordene gruppert per (blokk, linje) (som page.get_text("words")) hentes fra den.
+- DOCX: avsnitt, XLSX/XLS: celler per rad, ellers: tekstlinjer.
+
+Punktum/komma-varianter lagres ikke lenger som ekstra linjer. I stedet:
+- fold_punct() normaliserer begge sider ved fuzzy-/delstrengsøk (komma → punktum)
+- punct_variants() gir variantene av én linje ved behov (regex-søk)
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple
+
+import fitz
+from docx import Document as DocxDocument
+from openpyxl import load_workbook
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["DocText", "extract_document", "punct_variants", "fold_punct"]
+
+
+@dataclass
+class DocText:
+    lines: List[str]                                      # linjer (strippet, uten tomme)
+    word_lines: List[str] = field(default_factory=list)   # PDF: ord gruppert per (blokk, linje)
+
+    def search_lines(self) -> List[str]:
+        """Linjer + ordlinjer uten duplikater, i rekkefølge (for søk)."""
+        return list(dict.fromkeys(self.lines + self.word_lines))
+
+
+def punct_variants(s: str) -> Tuple[str, ...]:
+    """Linjen selv, punktum → komma og komma → punktum (uten duplikater)."""
+    out = [s]
+    alt = s.replace('.', ',')
+    if alt != s:
+        out.append(alt)
+    alt2 = s.replace(',', '.')
+    if alt2 != s:
+        out.append(alt2)
+    return tuple(out)
+
+
+def fold_punct(s: str) -> str:
+    """Normalisert form for matching der '12,5' og '12.5' er like."""
+    return s.replace(',', '.')
+
+
+def _clean(raw_lines) -> List[str]:
+    return [s for s in ((ln or "").strip() for ln in raw_lines) if s]
+
+
+def _pdf_text(path: str) -> DocText:
+    raw_lines: List[str] = []
+    word_lines: List[str] = []
+    try:
+        with fitz.open(path) as doc:
+            for page in doc:
+                tp = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+                txt = page.get_text(textpage=tp) or ""
+                raw_lines.extend(txt.splitlines())
+                words = page.get_text("words", textpage=tp)  # x0,y0,x1,y1,text,block,line,word
+                if not words:
+                    word_lines.extend(ln for ln in txt.splitlines() if ln.strip())
+                    continue
+                words.sort(key=lambda w: (w[5], w[6], w[7]))
+                curr, buff = None, []
+                for w in words:
+                    tok = (w[4] or "").strip()
+                    if not tok:
+                        continue
+                    key = (w[5], w[6])
+                    if key != curr and buff:
+                        word_lines.append(" ".join(buff))
+                        buff = []
+                    curr = key
+                    buff.append(tok)
+                if buff:
+                    word_lines.append(" ".join(buff))
+    except Exception:
+        _log.warning("Kunne ikke lese PDF: %s", path, exc_info=True)
+    return DocText(_clean(raw_lines), _clean(word_lines))
+
+
+def extract_document(path: str) -> DocText:
+    """Les dokumentet én gang og returner linjer (og ordlinjer for PDF)."""
+    ext = Path(path).suffix.lower()
+    if ext == '.pdf':
+        return _pdf_text(path)
+    raw_lines: List[str] = []
+    try:
+        if ext == '.docx':
+            raw_lines = [p.text for p in DocxDocument(path).paragraphs]
+        elif ext in ('.xlsx', '.xls'):
+            wb = load_workbook(path, read_only=True, data_only=True)
+            try:
+                for ws in wb.worksheets:
+                    for row in ws.iter_rows(values_only=True):
+                        raw_lines.append(' '.join(str(c) for c in row if c is not None))
+            finally:
+                wb.close()
+        else:
+            with open(path, 'r', errors='ignore') as f:
+                raw_lines = f.read().splitlines()
+    except Exception:
+        _log.warning("Kunne ikke lese fil: %s", path)
+    return DocText(_clean(raw_lines))
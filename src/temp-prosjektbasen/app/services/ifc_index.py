@@ -0,0 +1,718 @@
+"""Strømmende IFC-skanning med diskindeks per modell (IFC-masseliste).
+
+- iter_records() leser STEP-filen (ISO 10303-21) i biter og gir (#id, TYPE, argumenter) uten
+  å bygge modellen; bare elementer, typer, Pset/Qto, egenskaper og IfcRelDefinesBy* parses.
+- build_index() legger postene i en SQLite på disk, slår sammen typens og forekomstens Pset
+  per element som get_psets() (type først, forekomsten overstyrer) og publiserer én indeksfil
+  per SHA-256 av modellen under IFC_INDEX_DIR. Fremdrift rapporteres via callback.
+- IfcIndex.rows() gir radene for en format-streng; treffene lagres i indeksen, så nye
+  skanninger og eksport av samme modell bare leser rader.
+
+PredefinedType på forekomster leses som første oppramsingsverdi etter Tag og brukes bare
+som søkekandidat.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from app.services.tag_engine import TagPattern
+
+_log = logging.getLogger(__name__)
+
+__all__ = [
+    "IFC_INDEX_DIR",
+    "IFC_SPOOL_DIR",
+    "IfcIndex",
+    "iter_records",
+    "spool_ifc",
+    "open_index",
+    "build_index",
+    "tfm_active",
+    "CORE_COLUMNS",
+]
+
+APP_DIR = Path(__file__).resolve().parent.parent
+IFC_INDEX_DIR = Path(os.getenv("IFC_INDEX_DIR", str(APP_DIR / "data" / "ifc_index")))
+IFC_INDEX_MAX_MB = float(os.getenv("IFC_INDEX_MAX_MB", "4096"))
+# Opplastinger mellomlagres på samme disk som indeksen
+IFC_SPOOL_DIR = IFC_INDEX_DIR / "tmp"
+# Lesebuffer for STEP-filen og batchstørrelse for innsetting i SQLite
+IFC_READ_BYTES = int(os.getenv("IFC_READ_BYTES", str(8 * 1024 * 1024)))
+IFC_INDEX_BATCH = int(os.getenv("IFC_INDEX_BATCH", "5000"))
+# Antall Pset/typer som holdes løst i minnet under pass 2
+IFC_PSET_CACHE = int(os.getenv("IFC_PSET_CACHE", "50000"))
+IFC_INDEX_VERSION = 1
+
+CORE_COLUMNS = ["Komponent-ID", "IFC Class", "Name", "Tag", "ObjectType", "GlobalId", "Type.Name", "Type.PredefinedType"]
+
+ProgressFn = Callable[[str, int, int], None]
+
+_HASH_CHUNK = 1024 * 1024
+_evict_lock = threading.Lock()
+
+# ---------------------------------------------------------------------------
+# IFC-klasser (IfcElement og subtyper i IFC2X3, IFC4 og IFC4X3)
+# ---------------------------------------------------------------------------
+
+_CLASS_NAMES = tuple("Ifc" + part for part in """
+    Element BuildingElement BuiltElement Beam BeamStandardCase BuildingElementProxy Chimney Column
+    ColumnStandardCase Covering CurtainWall Door DoorStandardCase Footing Member MemberStandardCase Pile
+    Plate PlateStandardCase Railing Ramp RampFlight Roof ShadingDevice Slab SlabElementedCase
+    SlabStandardCase Stair StairFlight Wall WallElementedCase WallStandardCase Window WindowStandardCase
+    Bearing CaissonFoundation Course DeepFoundation EarthworksElement EarthworksFill Kerb MooringDevice
+    NavigationElement Pavement Rail ReinforcedSoil TrackElement CivilElement GeographicElement
+    DistributionElement DistributionControlElement Actuator Alarm Controller FlowInstrument
+    ProtectiveDeviceTrippingUnit Sensor UnitaryControlElement DistributionFlowElement
+    DistributionChamberElement EnergyConversionDevice AirToAirHeatRecovery Boiler Burner Chiller Coil
+    Condenser CooledBeam CoolingTower ElectricGenerator ElectricMotor Engine EvaporativeCooler Evaporator
+    HeatExchanger Humidifier MotorConnection SolarDevice Transformer TubeBundle UnitaryEquipment
+    FlowController AirTerminalBox Damper DistributionBoard ElectricDistributionBoard
+    ElectricDistributionPoint ElectricTimeControl FlowMeter ProtectiveDevice SwitchingDevice Valve
+    FlowFitting CableCarrierFitting CableFitting DuctFitting JunctionBox PipeFitting FlowMovingDevice
+    Compressor Fan Pump FlowSegment CableCarrierSegment CableSegment ConveyorSegment DuctSegment
+    PipeSegment FlowStorageDevice ElectricFlowStorageDevice Tank FlowTerminal AirTerminal
+    AudioVisualAppliance CommunicationsAppliance ElectricAppliance ElectricHeater FireSuppressionTerminal
+    Lamp LightFixture LiquidTerminal MedicalDevice MobileTelecommunicationsAppliance Outlet
+    SanitaryTerminal Signal SpaceHeater StackTerminal WasteTerminal FlowTreatmentDevice DuctSilencer
+    ElectricFlowTreatmentDevice Filter Interceptor ElementAssembly ElementComponent BuildingElementPart
+    BuildingElementComponent DiscreteAccessory Fastener MechanicalFastener ImpactProtectionDevice
+    ReinforcingElement ReinforcingBar ReinforcingMesh Tendon TendonAnchor TendonConduit Sign
+    VibrationDamper VibrationIsolator FeatureElement FeatureElementAddition ProjectionElement
+    FeatureElementSubtraction OpeningElement OpeningStandardCase VoidingFeature EarthworksCut
+    SurfaceFeature EdgeFeature ChamferEdgeFeature RoundedEdgeFeature FurnishingElement Furniture
+    SystemFurnitureElement TransportElement VirtualElement ElectricalElement EquipmentElement
+    GeotechnicalElement GeotechnicalAssembly Borehole Geomodel Geoslice GeotechnicalStratum
+    SolidStratum VoidStratum WaterStratum
+    """.split())
+_ELEMENT_CLASSES = frozenset(name.upper() for name in _CLASS_NAMES)
+_DISPLAY_NAMES = {name.upper(): name for name in _CLASS_NAMES}
+# IFC2X3: PredefinedType finnes bare på disse forekomstklassene
+_IFC2X3_PREDEFINED = frozenset({"IFCCOVERING", "IFCRAILING", "IFCSLAB", "IFCFOOTING", "IFCPILE", "IFCTENDON"})
+
+_PROPERTY_TYPES = frozenset({
+    "IFCPROPERTYSINGLEVALUE", "IFCPROPERTYENUMERATEDVALUE", "IFCPROPERTYLISTVALUE",
+    "IFCPROPERTYBOUNDEDVALUE", "IFCPROPERTYTABLEVALUE", "IFCCOMPLEXPROPERTY",
+    "IFCQUANTITYLENGTH", "IFCQUANTITYAREA", "IFCQUANTITYVOLUME", "IFCQUANTITYCOUNT",
+    "IFCQUANTITYWEIGHT", "IFCQUANTITYTIME", "IFCQUANTITYNUMBER", "IFCPHYSICALCOMPLEXQUANTITY",
+})
+
+# ---------------------------------------------------------------------------
+# STEP-lesing
+# ---------------------------------------------------------------------------
+
+# Hel post: #id = TYPE ( argumenter ) ;  – semikolon i strenger hoppes over
+_RECORD = re.compile(rb"#(\d+)\s*=\s*([A-Za-z0-9_]+)\s*\(((?:[^';]++|'[^']*+(?:''[^']*+)*+')*+);")
+_TOKEN = re.compile(
+    rb"\s*(?:'((?:[^']|'')*)'"            # 1 streng
+    rb"|#(\d+)"                            # 2 referanse
+    rb"|\.([A-Za-z0-9_]+)\."               # 3 oppramsing
+    rb"|([A-Za-z][A-Za-z0-9_]*)\s*\("      # 4 typet verdi, f.eks. IFCLABEL(
+    rb"|(\()"                              # 5 liste
+    rb"|(\))"                              # 6 slutt
+    rb"|([$*])"                            # 7 tom / avledet
+    rb"|([-+]?[0-9.][0-9.Ee+-]*)"          # 8 tall
+    rb"|\"([0-9A-Fa-f]*)\""                # 9 binær
+    rb"|(,))"                              # 10 skilletegn
+)
+_SCHEMA = re.compile(rb"FILE_SCHEMA\s*\(\s*\(\s*'([^']*)'")
+_ESCAPE = re.compile(r"\\X2\\((?:[0-9A-Fa-f]{4})*)\\X0\\|\\X4\\((?:[0-9A-Fa-f]{8})*)\\X0\\|\\X\\([0-9A-Fa-f]{2})|\\S\\(.)|\\\\")
+
+
+class Ref(int):
+    """#id-referanse."""
+
+
+class Enum(str):
+    """Oppramsingsverdi (.VERDI.)."""
+
+
+class Typed(NamedTuple):
+    name: str
+    value: Any
+
+
+def _unescape(m: re.Match) -> str:
+    x2, x4, x, s = m.groups()
+    if x2 is not None:
+        return bytes.fromhex(x2).decode("utf-16-be", errors="replace")
+    if x4 is not None:
+        return bytes.fromhex(x4).decode("utf-32-be", errors="replace")
+    if x is not None:
+        return chr(int(x, 16))
+    if s is not None:
+        return chr(ord(s) + 128)
+    return "\\"
+
+
+def _decode_string(raw: bytes) -> str:
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1")
+    text = text.replace("''", "'")
+    return _ESCAPE.sub(_unescape, text) if "\\" in text else text
+
+
+def _number(raw: bytes) -> Union[int, float]:
+    if b"." in raw or b"E" in raw or b"e" in raw:
+        return float(raw)
+    return int(raw)
+
+
+def parse_args(raw: bytes) -> List[Any]:
+    """Argumentlisten til en post som Python-verdier (Ref, Enum, Typed, str, tall, lister, None)."""
+    stack: List[List[Any]] = [[]]
+    names: List[Optional[str]] = [None]
+    pos, end = 0, len(raw)
+    match = _TOKEN.match
+    while pos < end:
+        m = match(raw, pos)
+        if m is None:
+            break
+        pos = m.end()
+        kind = m.lastindex
+        if kind == 10:
+            continue
+        if kind == 1:
+            stack[-1].append(_decode_string(m.group(1)))
+        elif kind == 2:
+            stack[-1].append(Ref(m.group(2)))
+        elif kind == 3:
+            stack[-1].append(Enum(m.group(3).decode("ascii")))
+        elif kind == 4 or kind == 5:
+            stack.append([])
+            names.append(m.group(4).decode("ascii").upper() if kind == 4 else None)
+        elif kind == 6:
+            if len(stack) == 1:
+                break
+            items, name = stack.pop(), names.pop()
+            stack[-1].append(Typed(name, items[0] if items else None) if name else items)
+        elif kind == 7:
+            stack[-1].append(None)
+        elif kind == 8:
+            stack[-1].append(_number(m.group(8)))
+        elif kind == 9:
+            stack[-1].append(m.group(9).decode("ascii"))
+    return stack[0]
+
+
+def iter_records(path: Union[str, Path], types: Optional[Callable[[str], bool]] = None,
+                 progress: Optional[Callable[[int], None]] = None) -> Iterator[Tuple[int, str, bytes]]:
+    """(#id, TYPE, rå argumenter) for hver post i DATA-seksjonen, lest i biter.
+
+    types(TYPE) avgjør hvilke poster som gis (alle når None). progress(bytes_lest) kalles per bit.
+    Bufferet kuttes etter siste ";\\n", så poster over flere linjer og biter håndteres.
+    """
+    carry = b""
+    done = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(IFC_READ_BYTES)
+            done += len(chunk)
+            buf = carry + chunk if carry else chunk
+            if chunk:
+                cut = max(buf.rfind(b";\n") + 2, buf.rfind(b";\r\n") + 3)
+                if cut < 3 and len(buf) > 4 * IFC_READ_BYTES:
+                    cut = buf.rfind(b");") + 2  # fil uten linjeskift
+                if cut < 3:
+                    carry = buf
+                    continue
+                carry, buf = buf[cut:], buf[:cut]
+            for m in _RECORD.finditer(buf):
+                name = m.group(2).decode("ascii").upper()
+                if types is None or types(name):
+                    args = m.group(3).rstrip()
+                    yield int(m.group(1)), name, args[:-1] if args.endswith(b")") else args
+            if progress is not None:
+                progress(done)
+            if not chunk:
+                return
+
+
+def _read_schema(path: Union[str, Path]) -> str:
+    with open(path, "rb") as f:
+        head = f.read(64 * 1024)
+    m = _SCHEMA.search(head)
+    return m.group(1).decode("ascii", errors="replace").upper() if m else ""
+
+# ---------------------------------------------------------------------------
+# Verdier som ifcopenshell.util.element.get_psets()
+# ---------------------------------------------------------------------------
+
+
+def _python_value(value: Any) -> Any:
+    if isinstance(value, Typed):
+        inner = value.value
+        if value.name == "IFCBOOLEAN" and isinstance(inner, Enum):
+            return inner == "T"
+        if value.name == "IFCLOGICAL" and isinstance(inner, Enum):
+            return {"T": True, "F": False}.get(inner, "UNKNOWN")
+        return _python_value(inner)
+    if isinstance(value, list):
+        return [_python_value(v) for v in value]
+    if isinstance(value, (Ref, Enum)):
+        return int(value) if isinstance(value, Ref) else str(value)
+    return value
+
+
+def _refs(value: Any) -> List[int]:
+    if isinstance(value, Ref):
+        return [int(value)]
+    if isinstance(value, list):
+        return [int(v) for v in value if isinstance(v, Ref)]
+    return []
+
+
+def _property_row(eid: int, name: str, args: List[Any]) -> Tuple[int, Optional[str], Optional[str], Optional[str]]:
+    """(id, navn, verdi-JSON, barn-JSON) for egenskap/mengde."""
+    label = args[0] if args and isinstance(args[0], str) else None
+    value: Any = None
+    children: Optional[List[int]] = None
+    if name == "IFCPROPERTYSINGLEVALUE":
+        value = _python_value(args[2]) if len(args) > 2 else None
+    elif name in ("IFCPROPERTYENUMERATEDVALUE", "IFCPROPERTYLISTVALUE"):
+        value = _python_value(args[2]) if len(args) > 2 and args[2] else None
+    elif name == "IFCPROPERTYBOUNDEDVALUE":
+        keys = ("UpperBoundValue", "LowerBoundValue", None, "SetPointValue")
+        value = {k: _python_value(args[i + 2]) for i, k in enumerate(keys) if k and len(args) > i + 2}
+    elif name == "IFCPROPERTYTABLEVALUE":
+        value = {k: _python_value(args[i + 2]) for i, k in enumerate(("DefiningValues", "DefinedValues"))
+                 if len(args) > i + 2}
+    elif name == "IFCCOMPLEXPROPERTY":
+        value = {"UsageName": args[2] if len(args) > 2 else None}
+        children = _refs(args[3]) if len(args) > 3 else []
+    elif name == "IFCPHYSICALCOMPLEXQUANTITY":
+        value = {}
+        children = _refs(args[2]) if len(args) > 2 else []
+    else:  # IfcPhysicalSimpleQuantity: Name, Description, Unit, Value
+        value = _python_value(args[3]) if len(args) > 3 else None
+    return (eid, label, json.dumps(value, ensure_ascii=False),
+            json.dumps(children) if children is not None else None)
+
+
+def _text(value: Any) -> Optional[str]:
+    return value if isinstance(value, str) and not isinstance(value, Enum) else None
+
+
+def _element_predefined(name: str, args: List[Any], schema: str) -> Optional[str]:
+    if schema.startswith("IFC2X") and name not in _IFC2X3_PREDEFINED:
+        return None
+    enums = [a for a in args[8:] if isinstance(a, Enum)]
+    if name == "IFCELEMENTASSEMBLY":  # AssemblyPlace kommer før PredefinedType
+        enums = enums[1:]
+    return str(enums[0]) if enums else None
+
+
+def _is_type_object(name: str, args: List[Any]) -> bool:
+    return (name.endswith(("TYPE", "STYLE")) and not name.startswith("IFCREL")
+            and len(args) >= 6 and isinstance(args[0], str))
+
+# ---------------------------------------------------------------------------
+# Bygging (pass 1: poster → staging-SQLite, pass 2: Pset per element → indeks)
+# ---------------------------------------------------------------------------
+
+_STAGING_SCHEMA = """
+CREATE TABLE elements (id INTEGER PRIMARY KEY, cls TEXT, guid TEXT, name TEXT, tag TEXT, object_type TEXT,
+                       predefined TEXT);
+CREATE TABLE types (id INTEGER PRIMARY KEY, name TEXT, predefined TEXT);
+CREATE TABLE type_psets (type_id INTEGER, ord INTEGER, pset_id INTEGER);
+CREATE TABLE psets (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE pset_members (pset_id INTEGER, ord INTEGER, prop_id INTEGER);
+CREATE TABLE props (id INTEGER PRIMARY KEY, name TEXT, value TEXT, children TEXT);
+CREATE TABLE rel_props (rel_id INTEGER, element_id INTEGER, pset_id INTEGER);
+CREATE TABLE rel_type (rel_id INTEGER, element_id INTEGER, type_id INTEGER);
+"""
+
+_INDEX_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE elements (id INTEGER PRIMARY KEY, cls TEXT, guid TEXT, name TEXT, tag TEXT, object_type TEXT,
+                       predefined TEXT, has_type INTEGER, type_name TEXT, type_predefined TEXT, psets TEXT);
+CREATE TABLE tag_formats (fmt TEXT PRIMARY KEY, hits INTEGER, built_at REAL);
+CREATE TABLE tag_hits (fmt TEXT, element_id INTEGER, value TEXT, system TEXT, komponent TEXT);
+CREATE INDEX ix_tag_hits_fmt ON tag_hits (fmt, element_id);
+"""
+
+_INSERTS = {
+    "elements": "INSERT OR REPLACE INTO elements VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "types": "INSERT OR REPLACE INTO types VALUES (?, ?, ?)",
+    "type_psets": "INSERT INTO type_psets VALUES (?, ?, ?)",
+    "psets": "INSERT OR REPLACE INTO psets VALUES (?, ?)",
+    "pset_members": "INSERT INTO pset_members VALUES (?, ?, ?)",
+    "props": "INSERT OR REPLACE INTO props VALUES (?, ?, ?, ?)",
+    "rel_props": "INSERT INTO rel_props VALUES (?, ?, ?)",
+    "rel_type": "INSERT INTO rel_type VALUES (?, ?, ?)",
+}
+
+
+def _relevant(name: str) -> bool:
+    return (name in _ELEMENT_CLASSES or name in _PROPERTY_TYPES
+            or name in ("IFCPROPERTYSET", "IFCELEMENTQUANTITY", "IFCRELDEFINESBYPROPERTIES", "IFCRELDEFINESBYTYPE")
+            or (name.endswith(("TYPE", "STYLE")) and not name.startswith("IFCREL")))
+
+
+class _Batches:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.rows: Dict[str, List[tuple]] = {table: [] for table in _INSERTS}
+
+    def add(self, table: str, row: tuple) -> None:
+        rows = self.rows[table]
+        rows.append(row)
+        if len(rows) >= IFC_INDEX_BATCH:
+            self.flush(table)
+
+    def extend(self, table: str, rows: Sequence[tuple]) -> None:
+        for row in rows:
+            self.add(table, row)
+
+    def flush(self, table: Optional[str] = None) -> None:
+        for name in ([table] if table else list(self.rows)):
+            if self.rows[name]:
+                self.conn.executemany(_INSERTS[name], self.rows[name])
+                self.rows[name] = []
+
+
+def _stage(path: Path, conn: sqlite3.Connection, schema: str, progress: Optional[ProgressFn]) -> int:
+    """Pass 1: relevante poster fra STEP-filen inn i staging-tabellene. Gir antall elementer."""
+    total = path.stat().st_size
+    batches = _Batches(conn)
+    elements = 0
+    report = (lambda done: progress("les", done, total)) if progress else None
+    for eid, name, raw in iter_records(path, _relevant, report):
+        try:
+            args = parse_args(raw)
+        except Exception:
+            _log.debug("IFC: kunne ikke tolke #%s=%s", eid, name, exc_info=True)
+            continue
+        if name in _ELEMENT_CLASSES:
+            if len(args) < 8:
+                continue
+            batches.add("elements", (eid, name, _text(args[0]), _text(args[2]), _text(args[7]), _text(args[4]),
+                                     _element_predefined(name, args, schema)))
+            elements += 1
+        elif name in _PROPERTY_TYPES:
+            batches.add("props", _property_row(eid, name, args))
+        elif name == "IFCPROPERTYSET" or name == "IFCELEMENTQUANTITY":
+            members = args[4] if name == "IFCPROPERTYSET" else (args[5] if len(args) > 5 else None)
+            batches.add("psets", (eid, _text(args[2]) if len(args) > 2 else None))
+            batches.extend("pset_members", [(eid, i, ref) for i, ref in enumerate(_refs(members))])
+        elif name == "IFCRELDEFINESBYPROPERTIES":
+            for pset_id in _refs(args[5] if len(args) > 5 else None):
+                batches.extend("rel_props", [(eid, obj, pset_id) for obj in _refs(args[4])])
+        elif name == "IFCRELDEFINESBYTYPE":
+            for type_id in _refs(args[5] if len(args) > 5 else None):
+                batches.extend("rel_type", [(eid, obj, type_id) for obj in _refs(args[4])])
+        elif _is_type_object(name, args):
+            predefined_at = 10 if name == "IFCFURNITURETYPE" else 9
+            predefined = args[predefined_at] if len(args) > predefined_at and name.endswith("TYPE") else None
+            batches.add("types", (eid, _text(args[2]), str(predefined) if isinstance(predefined, Enum) else None))
+            batches.extend("type_psets", [(eid, i, ref) for i, ref in enumerate(_refs(args[5]))])
+    batches.flush()
+    conn.commit()
+    return elements
+
+
+def _merge_join(cursor, element_id: int, pending: List[Optional[tuple]]) -> List[tuple]:
+    """Rader (element_id, rel_id, x) fra en sortert markør som hører til element_id."""
+    out = []
+    row = pending[0]
+    while row is not None and row[0] <= element_id:
+        if row[0] == element_id:
+            out.append(row)
+        row = cursor.fetchone()
+    pending[0] = row
+    return out
+
+
+def _resolve(staging: sqlite3.Connection, out: sqlite3.Connection, elements: int,
+             progress: Optional[ProgressFn]) -> None:
+    """Pass 2: typens og forekomstens Pset per element (som get_psets()) → indekstabellen."""
+    staging.executescript("""
+        CREATE INDEX ix_rel_props ON rel_props (element_id, rel_id);
+        CREATE INDEX ix_rel_type ON rel_type (element_id, rel_id);
+        CREATE INDEX ix_type_psets ON type_psets (type_id, ord);
+        CREATE INDEX ix_pset_members ON pset_members (pset_id, ord);
+    """)
+
+    @lru_cache(maxsize=IFC_PSET_CACHE)
+    def prop(prop_id: int) -> Tuple[Optional[str], Any]:
+        row = staging.execute("SELECT name, value, children FROM props WHERE id = ?", (prop_id,)).fetchone()
+        if row is None:
+            return None, None
+        name, value, children = row
+        value = json.loads(value) if value is not None else None
+        if children is not None:
+            value = dict(value or {})
+            value["properties"] = dict(prop(c) for c in json.loads(children) if prop(c)[0] is not None)
+        return name, value
+
+    @lru_cache(maxsize=IFC_PSET_CACHE)
+    def pset(pset_id: int) -> Tuple[Optional[str], Tuple[Tuple[str, Any], ...]]:
+        row = staging.execute("SELECT name FROM psets WHERE id = ?", (pset_id,)).fetchone()
+        if row is None:
+            return None, ()
+        members = staging.execute("SELECT prop_id FROM pset_members WHERE pset_id = ? ORDER BY ord", (pset_id,))
+        props = [prop(p) for (p,) in members]
+        return row[0], tuple((k, v) for k, v in props if k is not None) + (("id", pset_id),)
+
+    @lru_cache(maxsize=IFC_PSET_CACHE)
+    def type_info(type_id: int) -> Optional[Tuple[Optional[str], Optional[str], Tuple[int, ...]]]:
+        row = staging.execute("SELECT name, predefined FROM types WHERE id = ?", (type_id,)).fetchone()
+        if row is None:
+            return None
+        psets = staging.execute("SELECT pset_id FROM type_psets WHERE type_id = ? ORDER BY ord", (type_id,))
+        return row[0], row[1], tuple(p for (p,) in psets)
+
+    rels = staging.cursor()
+    rels.execute("SELECT element_id, rel_id, pset_id FROM rel_props ORDER BY element_id, rel_id")
+    typed = staging.cursor()
+    typed.execute("SELECT element_id, rel_id, type_id FROM rel_type ORDER BY element_id, rel_id")
+    rel_pending, type_pending = [rels.fetchone()], [typed.fetchone()]
+
+    batch: List[tuple] = []
+    done = 0
+    for eid, cls, guid, name, tag, object_type, predefined in staging.execute(
+            "SELECT id, cls, guid, name, tag, object_type, predefined FROM elements ORDER BY id"):
+        psets: Dict[str, Dict[str, Any]] = {}
+        has_type, type_name, type_predefined = 0, None, None
+        for _, _, type_id in _merge_join(typed, eid, type_pending)[:1]:
+            info = type_info(type_id)
+            if info is None:
+                continue
+            has_type, type_name, type_predefined = 1, info[0], info[1]
+            for pset_id in info[2]:
+                pset_name, props = pset(pset_id)
+                if pset_name is not None:
+                    psets[pset_name] = dict(props)
+        for _, _, pset_id in _merge_join(rels, eid, rel_pending):
+            pset_name, props = pset(pset_id)
+            if pset_name is not None:
+                psets.setdefault(pset_name, {}).update(props)
+        # Tekst som før; sammensatte verdier (dict) beholdes for søkekandidatene, men gir ingen kolonne
+        text_psets = {p: {k: v if isinstance(v, dict) else str(v) for k, v in props.items() if v is not None}
+                      for p, props in psets.items()}
+        batch.append((eid, cls, guid, name, tag, object_type, predefined, has_type, type_name, type_predefined,
+                      json.dumps(text_psets, ensure_ascii=False)))
+        done += 1
+        if len(batch) >= IFC_INDEX_BATCH:
+            out.executemany("INSERT INTO elements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+            if progress:
+                progress("psett", done, elements)
+    if batch:
+        out.executemany("INSERT INTO elements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    if progress:
+        progress("psett", done, elements)
+
+
+def _index_file(sha: str) -> Path:
+    return IFC_INDEX_DIR / sha[:2] / f"{sha}-v{IFC_INDEX_VERSION}.sqlite"
+
+
+def build_index(path: Union[str, Path], sha: str, progress: Optional[ProgressFn] = None,
+                source_name: str = "") -> "IfcIndex":
+    """Bygg indeksen for modellen (to pass, alt på disk) og publiser den atomisk."""
+    path = Path(path)
+    target = _index_file(sha)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    work = Path(tempfile.mkdtemp(dir=target.parent, prefix=f"{sha[:12]}_"))
+    started = time.perf_counter()
+    try:
+        schema = _read_schema(path)
+        staging = sqlite3.connect(work / "staging.sqlite")
+        out = sqlite3.connect(work / "index.sqlite")
+        try:
+            for conn in (staging, out):
+                conn.execute("PRAGMA journal_mode = OFF")
+                conn.execute("PRAGMA synchronous = OFF")
+            staging.executescript(_STAGING_SCHEMA)
+            out.executescript(_INDEX_SCHEMA)
+            elements = _stage(path, staging, schema, progress)
+            _resolve(staging, out, elements, progress)
+            out.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("sha256", sha), ("source", source_name or path.name), ("size", str(path.stat().st_size)),
+                ("schema", schema), ("elements", str(elements)), ("version", str(IFC_INDEX_VERSION)),
+                ("built_at", str(time.time())),
+            ])
+            out.commit()
+        finally:
+            staging.close()
+            out.close()
+        os.replace(work / "index.sqlite", target)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    _log.info("IFC-indeks %s: %s elementer på %.1f s", sha[:12], elements, time.perf_counter() - started)
+    evict(keep=target)
+    return IfcIndex(target)
+
+
+def open_index(sha: str) -> Optional["IfcIndex"]:
+    """Eksisterende indeks for modellen, eller None."""
+    if not re.fullmatch(r"[0-9a-f]{64}", sha or ""):
+        return None
+    target = _index_file(sha)
+    if not target.is_file():
+        return None
+    try:
+        os.utime(target, None)  # LRU: sist brukt
+    except OSError:
+        pass
+    return IfcIndex(target)
+
+
+def spool_ifc(storage, directory: Union[str, Path]) -> Tuple[Path, str]:
+    """Kopier opplastingen til directory i biter og regn SHA-256 underveis. Gir (sti, sha)."""
+    path = Path(directory) / "model.ifc"
+    stream = getattr(storage, "stream", storage)
+    try:
+        stream.seek(0)
+    except Exception:
+        pass
+    h = hashlib.sha256()
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: stream.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+            out.write(chunk)
+    return path, h.hexdigest()
+
+
+def evict(keep: Optional[Path] = None) -> int:
+    """Slett minst nylig brukte indekser til samlet størrelse er under IFC_INDEX_MAX_MB."""
+    limit = int(IFC_INDEX_MAX_MB * 1024 * 1024)
+    with _evict_lock:
+        entries = []
+        for p in IFC_INDEX_DIR.glob("*/*.sqlite"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= limit:
+                break
+            if p == keep:
+                continue
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+# ---------------------------------------------------------------------------
+# Lesing: treff per format og rader for masselisten
+# ---------------------------------------------------------------------------
+
+
+def tfm_active(komponent_str: str, tfm_settings: Mapping[str, bool]) -> bool:
+    m = re.search(r"-([A-Za-z]{2})", komponent_str or "")
+    if not m:
+        return True
+    kode2 = m.group(1).upper()
+    return bool(tfm_settings.get(kode2, True))
+
+
+def candidate_strings(row: sqlite3.Row, psets: Mapping[str, Mapping[str, str]]) -> List[str]:
+    """Søkekandidater i samme rekkefølge som før: attributter, type, Pset-navn og "nøkkel=verdi"."""
+    cands = [v for v in (row["name"], row["tag"], row["object_type"], row["guid"], row["predefined"]) if v]
+    if row["has_type"]:
+        cands.extend(v for v in (row["type_name"], row["type_predefined"]) if v)
+    for pset_name, props in psets.items():
+        if pset_name:
+            cands.append(pset_name)
+        cands.extend(f"{k}={v}" for k, v in props.items())
+    return cands
+
+
+class IfcIndex:
+    """Indeksfil for én modell (elementer + Pset + treff per format)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.sha = self.path.name.split("-v")[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def meta(self) -> Dict[str, str]:
+        conn = self._connect()
+        try:
+            return {k: v for k, v in conn.execute("SELECT key, value FROM meta")}
+        finally:
+            conn.close()
+
+    def _ensure_hits(self, conn: sqlite3.Connection, fmt: str, pattern: TagPattern) -> None:
+        if conn.execute("SELECT 1 FROM tag_formats WHERE fmt = ?", (fmt,)).fetchone():
+            return
+        hits: List[tuple] = []
+        need_pset = "{system}" in fmt
+        for row in conn.execute("SELECT * FROM elements ORDER BY id"):
+            psets = json.loads(row["psets"])
+            candidates = candidate_strings(row, psets)
+            if need_pset and not any("=" in c for c in candidates):
+                continue
+            for c in candidates:
+                tag = pattern.search(c)
+                if tag:
+                    if tag.full:
+                        hits.append((fmt, row["id"], tag.full, tag.system, tag.komponent))
+                    break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute("SELECT 1 FROM tag_formats WHERE fmt = ?", (fmt,)).fetchone():
+                conn.executemany("INSERT INTO tag_hits VALUES (?, ?, ?, ?, ?)", hits)
+                conn.execute("INSERT INTO tag_formats VALUES (?, ?, ?)", (fmt, len(hits), time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def rows(self, fmt: str, pattern: TagPattern, system_kriterier: Sequence[str] = (),
+             tfm_settings: Optional[Mapping[str, bool]] = None) -> List["OrderedDict[str, Any]"]:
+        """Masseliste-rader for formatet (treffene beregnes og lagres første gang)."""
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            self._ensure_hits(conn, fmt, pattern)
+            out: List["OrderedDict[str, Any]"] = []
+            for row in conn.execute(
+                    "SELECT h.value, h.system, h.komponent, e.* FROM tag_hits h JOIN elements e ON e.id = h.element_id "
+                    "WHERE h.fmt = ? ORDER BY h.element_id", (fmt,)):
+                if pattern.has_system and system_kriterier and row["system"]:
+                    if row["system"][1:3] not in system_kriterier:
+                        continue
+                if not tfm_active(row["komponent"], tfm_settings or {}):
+                    continue
+                item: "OrderedDict[str, Any]" = OrderedDict()
+                item["Komponent-ID"] = row["value"]
+                item["IFC Class"] = _DISPLAY_NAMES.get(row["cls"], row["cls"])
+                item["Name"] = row["name"]
+                item["Tag"] = row["tag"]
+                item["ObjectType"] = row["object_type"]
+                item["GlobalId"] = row["guid"]
+                if row["has_type"]:
+                    item["Type.Name"] = row["type_name"]
+                    item["Type.PredefinedType"] = row["type_predefined"]
+                for pset_name, props in json.loads(row["psets"]).items():
+                    for k, v in props.items():
+                        if not isinstance(v, dict):
+                            item[f"Pset:{pset_name}.{k}"] = v
+                out.append(item)
+            return out
+        finally:
+            conn.close()
@@ -0,0 +1,339 @@
+"""Invertert indeks over tekstlinjer for kombinert søk (/kombinert_sok).
+
+Én indeks per forespørsel over alle dokumentene. Like linjer lagres én gang med en tekst-ID,
+og mengder av linjer er heltall brukt som bitsett. Postinglister finnes for tegn-bigrammer,
+bigrammer nær start/slutt av linjen, ord, bigrammer i token_set-formen og linjelengder.
+Et søk beholder bare linjer som kan nå terskelen og poengsetter dem med samme
+rapidfuzz-funksjoner, så treffene blir de samme som ved full gjennomgang.
+
+Nedre grenser (streng '>' mot terskel, som i ruten):
+- partial_ratio(q, t) > thr: den korteste strengen (lengde m) må dele minst
+  _needle_min_shared(m) bigram-posisjoner med den andre. Et tegn utenfor LCS ødelegger høyst
+  to bigram-posisjoner, et innskutt tegn høyst én, og LCS er begrenset av ratio-formelen for
+  alle vinduslengder rapidfuzz prøver.
+- token_set_ratio(q, t) > thr: linjen har et felles ord med q, eller resultatet er ratio
+  mellom token_set-formene, med tilsvarende bigram- og lengdegrense.
+Trigrammer gir ingen sikker grense (jevnt fordelte slettinger kan fjerne alle), derfor bigrammer.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from operator import add
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from rapidfuzz import fuzz, process
+
+# Ordskille som i rapidfuzz: for rene latin-1-strenger regnes ikke \x85 og \xa0 som mellomrom,
+# for andre strenger brukes samme skille som str.split()
+_LATIN1_SPLIT = re.compile("[\t\n\x0b\x0c\r\x1c-\x1f ]+")
+# Bigrammer i de første og de siste n tegnene av hver linje indekseres også for seg (n fra
+# _EDGE_SPANS): kantvinduene i partial_ratio (kortere enn nålen) ligger helt i en av dem
+_EDGE_SPANS = (4, 8, 16)
+
+__all__ = ["LineIndex", "tokens"]
+
+
+def tokens(s: str) -> List[str]:
+    if s.isascii() or max(s) <= "\xff":
+        return [t for t in _LATIN1_SPLIT.split(s) if t]
+    return s.split()
+
+
+def _token_form(s: str) -> str:
+    """Sorterte unike ord, slik token_set_ratio sammenligner når ingen ord er felles."""
+    return " ".join(sorted(set(tokens(s))))
+
+
+def _bigrams(s: str) -> Counter:
+    return Counter(map(add, s, s[1:]))
+
+
+@lru_cache(maxsize=None)
+def _min_lcs(la: int, lb: int, thr: float) -> Optional[int]:
+    """Minste LCS-lengde der ratio mellom strenger med lengde la og lb blir > thr (None: umulig).
+    Regnes med rapidfuzz selv, så avrunding ved grensen blir den samme som i poengsettingen."""
+    for lcs in range(min(la, lb) + 1):
+        if fuzz.ratio("x" * lcs + "a" * (la - lcs), "x" * lcs + "b" * (lb - lcs)) > thr:
+            return lcs
+    return None
+
+
+def _shared_after_edits(m: int, k: int, lcs: int) -> int:
+    # Tegn i nålen utenfor LCS ødelegger ≤ 2 bigram-posisjoner, innskutte tegn i vinduet ≤ 1
+    return (m - 1) - 2 * (m - lcs) - (k - lcs)
+
+
+@lru_cache(maxsize=None)
+def _needle_bounds(m: int, thr: float) -> Tuple[int, Optional[int]]:
+    """
+    Minste antall bigram-posisjoner i nålen (lengde m) som finnes i høystakken når
+    partial_ratio > thr: (fulle vinduer med lengde m, kortere vinduer ved kantene eller None).
+    """
+    lcs = _min_lcs(m, m, thr)
+    full = _shared_after_edits(m, m, lcs) if lcs is not None else m
+    edge = None
+    for k in range(1, m):
+        lcs = _min_lcs(m, k, thr)
+        if lcs is not None:
+            b = _shared_after_edits(m, k, lcs)
+            edge = b if edge is None else min(edge, b)
+    return full, edge
+
+
+def _needle_min_shared(m: int, thr: float) -> int:
+    full, edge = _needle_bounds(m, thr)
+    return full if edge is None else min(full, edge)
+
+
+@lru_cache(maxsize=None)
+def _ratio_bounds(la: int, thr: float) -> Tuple[int, int, int]:
+    """(min felles bigram-posisjoner, min lengde, maks lengde) for ratio(a, b) > thr med len(a) = la."""
+    best, lo, hi = la - 1, None, None
+    for lb in range(1, int(la * 200 / max(thr, 1.0)) + 2):
+        lcs = _min_lcs(la, lb, thr)
+        if lcs is None:
+            continue
+        lo = lb if lo is None else lo
+        hi = lb
+        best = min(best, _shared_after_edits(la, lb, lcs))
+    return best, (lo or 0), (hi or 0)
+
+
+def _to_bits(ids: Iterable[int], nbytes: int) -> int:
+    buf = bytearray(nbytes)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _bit_ids(bits: int) -> List[int]:
+    if not bits:
+        return []
+    s = bin(bits)[:1:-1]                      # minst signifikante bit først
+    out, i = [], s.find("1")
+    while i >= 0:
+        out.append(i)
+        i = s.find("1", i + 1)
+    return out
+
+
+class _Counter:
+    """Bit-skivet teller: ett tall per linje, lagret som bitplan."""
+
+    __slots__ = ("planes",)
+
+    def __init__(self):
+        self.planes: List[int] = []
+
+    def add(self, bits: int, weight: int = 1) -> None:
+        j = 0
+        while weight:
+            if weight & 1:
+                carry, k = bits, j
+                while carry:
+                    if k >= len(self.planes):
+                        self.planes.extend([0] * (k - len(self.planes)))
+                        self.planes.append(carry)
+                        break
+                    p = self.planes[k]
+                    self.planes[k] = p ^ carry
+                    carry &= p
+                    k += 1
+            weight >>= 1
+            j += 1
+
+    def at_least(self, t: int, full: int) -> int:
+        if t <= 0:
+            return full
+        if t.bit_length() > len(self.planes):
+            return 0
+        gt, eq = 0, full
+        for b in range(len(self.planes) - 1, -1, -1):
+            p = self.planes[b]
+            if (t >> b) & 1:
+                eq &= p
+            else:
+                gt |= eq & p
+                eq &= ~p
+        return gt | eq
+
+
+class LineIndex:
+    """
+    Indeks over linjene i flere dokumenter. `matches(q)` gir bitsettet av tekst-IDer der
+    partial_ratio(q, linje) > threshold (og/eller token_set_ratio med token_set=True).
+    `in_doc` / `first_line` oversetter til ett dokument. Med `normalize` sammenlignes
+    normalize(q) mot normalize(linje) (f.eks. doc_text.fold_punct).
+    """
+
+    def __init__(self, docs: Sequence[Sequence[str]], threshold: float = 80,
+                 normalize: Optional[Callable[[str], str]] = None):
+        self.threshold = threshold
+        self.normalize = normalize
+        ids: Dict[str, int] = {}
+        self.doc_first: List[Dict[int, int]] = []
+        for lines in docs:
+            first: Dict[int, int] = {}
+            for ln, text in enumerate(lines, start=1):
+                if normalize is not None:
+                    text = normalize(text)
+                tid = ids.setdefault(text, len(ids))
+                first.setdefault(tid, ln)
+            self.doc_first.append(first)
+        self.texts: List[str] = list(ids)
+        n = len(self.texts)
+        self._nbytes = (n >> 3) + 1
+        self.full = (1 << n) - 1
+        self.doc_masks = [_to_bits(first, self._nbytes) for first in self.doc_first]
+
+        grams: Dict[str, List[List[int]]] = defaultdict(lambda: [[]])    # bigram -> [ids ≥1 gang, ≥2 ganger, …]
+        heads: Dict[int, Dict[str, List[int]]] = {e: defaultdict(list) for e in _EDGE_SPANS}
+        tails: Dict[int, Dict[str, List[int]]] = {e: defaultdict(list) for e in _EDGE_SPANS}
+        form_grams: Dict[str, List[int]] = defaultdict(list)
+        toks: Dict[str, List[int]] = defaultdict(list)
+        by_len: Dict[int, List[int]] = defaultdict(list)
+        by_form_len: Dict[int, List[int]] = defaultdict(list)
+        for tid, text in enumerate(self.texts):
+            by_len[len(text)].append(tid)
+            for g, c in _bigrams(text).items():
+                levels = grams[g]
+                levels[0].append(tid)
+                if c > 1:
+                    while len(levels) < c:
+                        levels.append([])
+                    for lv in range(1, c):
+                        levels[lv].append(tid)
+            for e in _EDGE_SPANS:
+                head, tail = text[:e], text[-e:]
+                for g in set(map(add, head, head[1:])):
+                    heads[e][g].append(tid)
+                for g in set(map(add, tail, tail[1:])):
+                    tails[e][g].append(tid)
+            for tok in set(tokens(text)):
+                toks[tok].append(tid)
+            form = _token_form(text)
+            by_form_len[len(form)].append(tid)
+            for g in set(map(add, form, form[1:])):
+                form_grams[g].append(tid)
+
+        nb = self._nbytes
+        self._grams = {g: [_to_bits(lv, nb) for lv in levels] for g, levels in grams.items()}
+        self._heads = {e: {g: _to_bits(v, nb) for g, v in heads[e].items()} for e in _EDGE_SPANS}
+        self._tails = {e: {g: _to_bits(v, nb) for g, v in tails[e].items()} for e in _EDGE_SPANS}
+        self._form_grams = {g: _to_bits(v, nb) for g, v in form_grams.items()}
+        self._tokens = {t: _to_bits(v, nb) for t, v in toks.items()}
+        self._len_bits = {ln: _to_bits(v, nb) for ln, v in by_len.items()}
+        self._form_len_bits = {ln: _to_bits(v, nb) for ln, v in by_form_len.items()}
+        self._cache: Dict[Tuple[str, bool], int] = {}
+        self.stats = {"texts": n, "queries": 0, "candidates": 0, "scored_hits": 0}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    # ---------- kandidater ----------
+    def _partial_candidates(self, q: str) -> int:
+        m = len(q)
+        q_grams = _bigrams(q)
+        longer = 0                                    # linjer med lengde ≥ m: q er nålen
+        shorter: Dict[int, int] = defaultdict(int)    # linjer kortere enn q, gruppert etter grense
+        for ln, bits in self._len_bits.items():
+            if ln >= m:
+                longer |= bits
+            else:
+                shorter[_needle_min_shared(ln, self.threshold)] |= bits
+
+        cand = 0
+        if longer:
+            full, edge = _needle_bounds(m, self.threshold)
+            cnt = _Counter()
+            for g, c in q_grams.items():
+                levels = self._grams.get(g)
+                if levels:
+                    cnt.add(levels[0], c)
+            span = next((e for e in _EDGE_SPANS if e >= m - 1), None)
+            if edge is not None and span is None:
+                full = min(full, edge)
+                edge = None
+            cand |= cnt.at_least(full, longer)
+            if edge is not None and edge < full:
+                # Kantvinduer ligger helt i starten eller helt i slutten av linjen
+                for part in (self._heads[span], self._tails[span]):
+                    cnt = _Counter()
+                    for g, c in q_grams.items():
+                        bits = part.get(g)
+                        if bits:
+                            cnt.add(bits, c)
+                    cand |= cnt.at_least(edge, longer)
+        if shorter:
+            cnt = _Counter()
+            for g in q_grams:                         # linjen er nålen: tell linjens forekomster
+                for lv in self._grams.get(g, ()):
+                    cnt.add(lv)
+            for bound, bits in shorter.items():
+                cand |= cnt.at_least(bound, bits)
+        return cand
+
+    def _token_set_candidates(self, q: str) -> int:
+        q_tokens = set(tokens(q))
+        if not q_tokens:
+            return 0
+        cand = 0
+        for t in q_tokens:                            # minst ett felles ord
+            cand |= self._tokens.get(t, 0)
+        form = " ".join(sorted(q_tokens))             # ingen felles ord: ratio mellom token-formene
+        bound, lo, hi = _ratio_bounds(len(form), self.threshold)
+        in_range = 0
+        for ln, bits in self._form_len_bits.items():
+            if lo <= ln <= hi:
+                in_range |= bits
+        if in_range:
+            cnt = _Counter()
+            for g, c in _bigrams(form).items():
+                bits = self._form_grams.get(g)
+                if bits:
+                    cnt.add(bits, c)
+            cand |= cnt.at_least(bound, in_range)
+        return cand
+
+    # ---------- søk ----------
+    def matches(self, q: str, token_set: bool = False) -> int:
+        """Bitsett av tekst-IDer med partial_ratio(q, t) > threshold (| token_set_ratio > threshold)."""
+        if self.normalize is not None and q:
+            q = self.normalize(q)
+        if not q:
+            return 0
+        key = (q, token_set)
+        hit = self._cache.get(key)
+        if hit is not None:
+            return hit
+        hit = self._cache.get((q, False))
+        if hit is None:
+            hit = self._score(q, self._partial_candidates(q), fuzz.partial_ratio)
+            self._cache[(q, False)] = hit
+        if token_set:
+            hit |= self._score(q, self._token_set_candidates(q) & ~hit, fuzz.token_set_ratio)
+            self._cache[key] = hit
+        return hit
+
+    def _score(self, q: str, cand: int, scorer) -> int:
+        thr, texts = self.threshold, self.texts
+        ids = _bit_ids(cand)
+        # process.extract poengsetter i C med forhåndsbehandlet q; score_cutoff tar med likhet, derfor '>' etterpå
+        found = process.extract(q, [texts[i] for i in ids], scorer=scorer, processor=None,
+                                score_cutoff=thr, limit=None)
+        hits = sorted(ids[k] for _, score, k in found if score > thr)
+        self.stats["queries"] += 1
+        self.stats["candidates"] += len(ids)
+        self.stats["scored_hits"] += len(hits)
+        return _to_bits(hits, self._nbytes)
+
+    def in_doc(self, doc: int, bits: int) -> int:
+        return bits & self.doc_masks[doc]
+
+    def first_line(self, doc: int, bits: int) -> Optional[int]:
+        """Laveste linjenummer (1-basert) i dokumentet blant tekst-IDene i bitsettet."""
+        first = self.doc_first[doc]
+        lines = [first[i] for i in _bit_ids(bits & self.doc_masks[doc])]
+        return min(lines) if lines else None
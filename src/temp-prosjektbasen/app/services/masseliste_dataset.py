@@ -0,0 +1,420 @@
+"""Masseliste (Excel) som datasett på disk med sider, filter og sortering på serveren.
+
+- load_upload() mellomlagrer opplastingen og leser første ark strømmende (openpyxl read_only)
+  inn i én SQLite-fil per fil-hash under MASSELISTE_DATA_DIR; samme fil gjenbruker datasettet.
+  .xls og andre formater leses med pandas.
+- Verdiene blir tekst som med read_excel(dtype=str).fillna(""): hele tall uten ".0", tomme
+  celler "", "Unnamed: n"/"Navn.1" som kolonnenavn, tomme rader og kolonner til slutt fjernet.
+- Dataset.page() gir én side med fritekstsøk, filter per kolonne og sortering (tallkolonner
+  numerisk); write_xlsx() eksporterer det samme utvalget.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as dtime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ERROR_CODES
+from openpyxl.utils import get_column_letter
+
+_log = logging.getLogger(__name__)
+
+__all__ = [
+    "MASSELISTE_DATA_DIR",
+    "MASSELISTE_PAGE_SIZE",
+    "Dataset",
+    "load_upload",
+    "open_dataset",
+    "build_dataset",
+    "write_xlsx",
+]
+
+APP_DIR = Path(__file__).resolve().parent.parent
+MASSELISTE_DATA_DIR = Path(os.getenv("MASSELISTE_DATA_DIR", str(APP_DIR / "data" / "masseliste")))
+MASSELISTE_CACHE_MAX_MB = float(os.getenv("MASSELISTE_CACHE_MAX_MB", "1024"))
+# Standard og største sidestørrelse for /api/masseliste/<id>/rows
+MASSELISTE_PAGE_SIZE = int(os.getenv("MASSELISTE_PAGE_SIZE", "200"))
+MASSELISTE_PAGE_MAX = int(os.getenv("MASSELISTE_PAGE_MAX", "5000"))
+MASSELISTE_BATCH = int(os.getenv("MASSELISTE_BATCH", "5000"))
+DATASET_VERSION = 1
+
+_SEP = "\x1f"  # skiller cellene i søkekolonnen
+_HASH_CHUNK = 1024 * 1024
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_evict_lock = threading.Lock()
+
+# ---------------------------------------------------------------------------
+# Lesing (samme tekstverdier som pandas.read_excel(dtype=str).fillna(""))
+# ---------------------------------------------------------------------------
+
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return "" if value in ERROR_CODES else value
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float)):
+        # Hele tall uten ".0", som pandas' openpyxl-leser
+        if isinstance(value, float) and math.isfinite(value) and value == int(value):
+            return str(int(value))
+        return str(value)
+    if isinstance(value, (datetime, date, dtime)):
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        return str(value)
+    return str(value)
+
+
+def _trimmed(values: Sequence[Any]) -> List[str]:
+    cells = [_cell_text(v) for v in values]
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+
+def _column_names(header: Sequence[str], width: int) -> List[str]:
+    """Kolonnenavn som pandas: tomme → "Unnamed: n", duplikater → "Navn.1", "Navn.2" … (navn som
+    finnes fra før hoppes over; de navnløse nummereres til slutt)."""
+    size = max(width, len(header))
+    unnamed = [i for i in range(size) if i >= len(header) or header[i] == ""]
+    names = [f"Unnamed: {i}" if i in unnamed else header[i] for i in range(size)]
+    skip = set(unnamed)
+    counts: Dict[str, int] = defaultdict(int)
+    for i in [i for i in range(size) if i not in skip] + unnamed:
+        col = old = names[i]
+        cur = counts[col]
+        while cur > 0:
+            counts[old] = cur + 1
+            col = f"{old}.{cur}"
+            cur = cur + 1 if col in names else counts[col]
+        names[i] = col
+        counts[col] = cur + 1
+    return names
+
+
+def _xlsx_rows(path: Path) -> Iterator[Tuple[Any, ...]]:
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _pandas_rows(path: Path) -> Iterator[Tuple[Any, ...]]:
+    import pandas as pd
+
+    df = pd.read_excel(path, dtype=str, header=None).fillna("")
+    yield from df.itertuples(index=False, name=None)
+
+
+def _is_number(text: str) -> bool:
+    return bool(_NUMBER.fullmatch(text))
+
+# ---------------------------------------------------------------------------
+# Bygging
+# ---------------------------------------------------------------------------
+
+
+def _dataset_file(sha: str) -> Path:
+    return MASSELISTE_DATA_DIR / sha[:2] / f"{sha}-v{DATASET_VERSION}.sqlite"
+
+
+def spool_hashed(storage, directory: Union[str, Path], suffix: str) -> Tuple[Path, str]:
+    """Kopier opplastingen til directory i biter og regn SHA-256 underveis. Gir (sti, sha)."""
+    path = Path(directory) / f"upload{suffix}"
+    stream = getattr(storage, "stream", storage)
+    try:
+        stream.seek(0)
+    except Exception:
+        pass
+    h = hashlib.sha256()
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: stream.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+            out.write(chunk)
+    return path, h.hexdigest()
+
+
+def build_dataset(path: Union[str, Path], sha: str, filename: str = "") -> "Dataset":
+    """Les første ark strømmende inn i datasettfilen og publiser den atomisk."""
+    path = Path(path)
+    suffix = Path(filename or path.name).suffix.lower()
+    rows = _xlsx_rows(path) if suffix in (".xlsx", ".xlsm") else _pandas_rows(path)
+    target = _dataset_file(sha)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    work = Path(tempfile.mkdtemp(dir=target.parent, prefix=f"{sha[:12]}_"))
+    started = time.perf_counter()
+    try:
+        conn = sqlite3.connect(work / "dataset.sqlite")
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE rows (rid INTEGER PRIMARY KEY, sok TEXT)")
+            header = _trimmed(next(rows, ()))
+            width = 0
+            numeric: List[bool] = []
+            pending_empty = 0
+            batch: List[tuple] = []
+            rid = 0
+
+            def flush() -> None:
+                # Bredden kan ha økt underveis; kortere rader fylles ut med ""
+                size = 2 + width
+                placeholders = ", ".join("?" * size)
+                columns = ", ".join(["rid", "sok"] + [f"c{i}" for i in range(width)])
+                conn.executemany(f"INSERT INTO rows ({columns}) VALUES ({placeholders})",
+                                 [row + ("",) * (size - len(row)) for row in batch])
+                batch.clear()
+
+            for values in rows:
+                cells = _trimmed(values)
+                if not cells:
+                    pending_empty += 1  # tomme rader beholdes bare hvis det kommer flere rader etter
+                    continue
+                for _ in range(pending_empty):
+                    rid += 1
+                    batch.append((rid, ""))
+                pending_empty = 0
+                while width < len(cells):
+                    conn.execute(f"ALTER TABLE rows ADD COLUMN c{width} TEXT NOT NULL DEFAULT ''")
+                    numeric.append(True)
+                    width += 1
+                for i, cell in enumerate(cells):
+                    if numeric[i] and cell and not _is_number(cell):
+                        numeric[i] = False
+                rid += 1
+                batch.append((rid, _SEP.join(c.casefold() for c in cells), *cells))
+                if len(batch) >= MASSELISTE_BATCH:
+                    flush()
+            flush()
+
+            columns = _column_names(header, width)
+            numeric += [False] * (len(columns) - len(numeric))
+            for i in range(width, len(columns)):
+                conn.execute(f"ALTER TABLE rows ADD COLUMN c{i} TEXT NOT NULL DEFAULT ''")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("sha256", sha), ("filename", filename or path.name), ("columns", json.dumps(columns)),
+                ("numeric", json.dumps(numeric)), ("total", str(rid)), ("version", str(DATASET_VERSION)),
+                ("built_at", str(time.time())),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(work / "dataset.sqlite", target)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    _log.info("Masseliste %s: %s rader, %s kolonner på %.1f s", sha[:12], rid, len(columns),
+              time.perf_counter() - started)
+    evict(keep=target)
+    return Dataset(target)
+
+
+def open_dataset(dataset_id: str) -> Optional["Dataset"]:
+    """Eksisterende datasett, eller None."""
+    if not re.fullmatch(r"[0-9a-f]{64}", dataset_id or ""):
+        return None
+    target = _dataset_file(dataset_id)
+    if not target.is_file():
+        return None
+    try:
+        os.utime(target, None)  # LRU: sist brukt
+    except OSError:
+        pass
+    return Dataset(target)
+
+
+def load_upload(storage, filename: str = "") -> "Dataset":
+    """Datasett for opplastingen (FileStorage); bygges bare første gang samme fil lastes opp."""
+    filename = filename or getattr(storage, "filename", "") or "masseliste.xlsx"
+    spool_dir = MASSELISTE_DATA_DIR / "tmp"
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=spool_dir, prefix="upload_")
+    try:
+        path, sha = spool_hashed(storage, tmp, Path(filename).suffix.lower() or ".xlsx")
+        return open_dataset(sha) or build_dataset(path, sha, filename)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def evict(keep: Optional[Path] = None) -> int:
+    """Slett minst nylig brukte datasett til samlet størrelse er under MASSELISTE_CACHE_MAX_MB."""
+    limit = int(MASSELISTE_CACHE_MAX_MB * 1024 * 1024)
+    with _evict_lock:
+        entries = []
+        for p in MASSELISTE_DATA_DIR.glob("*/*.sqlite"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= limit:
+                break
+            if p == keep:
+                continue
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+# ---------------------------------------------------------------------------
+# Lesing av sider
+# ---------------------------------------------------------------------------
+
+
+def _casefold(value: Optional[str]) -> str:
+    return (value or "").casefold()
+
+
+class Dataset:
+    """Datasettfil for én opplastet masseliste."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.id = self.path.name.split("-v")[0]
+        meta = self._meta()
+        self.filename = meta.get("filename", "")
+        self.columns: List[str] = json.loads(meta.get("columns", "[]"))
+        self.numeric: List[bool] = json.loads(meta.get("numeric", "[]"))
+        self.total = int(meta.get("total", "0"))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.create_function("casefold", 1, _casefold, deterministic=True)
+        return conn
+
+    def _meta(self) -> Dict[str, str]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return {k: v for k, v in conn.execute("SELECT key, value FROM meta")}
+        finally:
+            conn.close()
+
+    def _column(self, name: str) -> int:
+        try:
+            return self.columns.index(name)
+        except ValueError:
+            raise ValueError(f"ukjent kolonne: {name}") from None
+
+    def _where(self, q: str, filters: Optional[Mapping[str, str]]) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for term in (q or "").split():
+            clauses.append("instr(sok, ?) > 0")
+            params.append(term.casefold())
+        for name, value in (filters or {}).items():
+            value = str(value or "").strip()
+            if value:
+                clauses.append(f"instr(casefold(c{self._column(name)}), ?) > 0")
+                params.append(value.casefold())
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _order(self, sort: Optional[str], order: str) -> str:
+        if not sort:
+            return " ORDER BY rid"
+        i = self._column(sort)
+        direction = "DESC" if (order or "").lower() == "desc" else "ASC"
+        value = f"CAST(c{i} AS REAL)" if self.numeric[i] else f"c{i} COLLATE NOCASE"
+        # Tomme celler sist i begge retninger; rad-rekkefølgen avgjør ved like verdier
+        return f" ORDER BY c{i} = '', {value} {direction}, rid"
+
+    def _select(self) -> str:
+        return "SELECT " + ", ".join(f"c{i}" for i in range(len(self.columns))) + " FROM rows"
+
+    def page(self, offset: int = 0, limit: int = MASSELISTE_PAGE_SIZE, q: str = "",
+             filters: Optional[Mapping[str, str]] = None, sort: Optional[str] = None,
+             order: str = "asc") -> Dict[str, Any]:
+        """Én side rader (dict per rad, kolonner i filrekkefølge) med antall treff."""
+        offset = max(0, int(offset))
+        limit = max(1, min(int(limit), MASSELISTE_PAGE_MAX))
+        where, params = self._where(q, filters)
+        order_by = self._order(sort, order)
+        conn = self._connect()
+        try:
+            matched = conn.execute(f"SELECT count(*) FROM rows{where}", params).fetchone()[0] if where else self.total
+            cur = conn.execute(f"{self._select()}{where}{order_by} LIMIT ? OFFSET ?", params + [limit, offset])
+            rows = [dict(zip(self.columns, values)) for values in cur]
+        finally:
+            conn.close()
+        return {
+            "dataset": self.id,
+            "filename": self.filename,
+            "columns": self.columns,
+            "total": self.total,
+            "matched": matched,
+            "offset": offset,
+            "limit": limit,
+            "rows": rows,
+        }
+
+    def iter_rows(self, q: str = "", filters: Optional[Mapping[str, str]] = None, sort: Optional[str] = None,
+                  order: str = "asc") -> Iterator[Tuple[str, ...]]:
+        """Alle rader i utvalget som tupler (kolonner som self.columns)."""
+        where, params = self._where(q, filters)
+        conn = self._connect()
+        try:
+            yield from conn.execute(f"{self._select()}{where}{self._order(sort, order)}", params)
+        finally:
+            conn.close()
+
+    def max_lengths(self, q: str = "", filters: Optional[Mapping[str, str]] = None) -> List[int]:
+        where, params = self._where(q, filters)
+        if not self.columns:
+            return []
+        select = ", ".join(f"max(length(c{i}))" for i in range(len(self.columns)))
+        conn = self._connect()
+        try:
+            return [int(v or 0) for v in conn.execute(f"SELECT {select} FROM rows{where}", params).fetchone()]
+        finally:
+            conn.close()
+
+
+def write_xlsx(dataset: Dataset, path: Union[str, Path], columns: Optional[Sequence[str]] = None, **query) -> int:
+    """Skriv utvalget (q/filters/sort/order) til Excel som /api/masseliste/export: autofilter,
+    tekstformat på ID-kolonner og kolonnebredder. Strømmer (write_only). Gir antall rader."""
+    columns = [c for c in (columns or dataset.columns) if c in dataset.columns] or list(dataset.columns)
+    picks = [dataset.columns.index(c) for c in columns]
+    lengths = dataset.max_lengths(query.get("q", ""), query.get("filters"))
+    id_cols = {i for i, c in enumerate(columns) if c.lower() in ("komponent-id", "komponent", "id")}
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Masseliste")
+    for i, c in enumerate(columns):
+        width = max(len(c), lengths[picks[i]] if lengths else 0)
+        ws.column_dimensions[get_column_letter(i + 1)].width = min(width + 2, 80)
+    if columns:
+        ws.auto_filter.ref = f"A1:{get_column_letter(len(columns))}1"
+    ws.append(columns)
+    count = 0
+    for values in dataset.iter_rows(**query):
+        row = []
+        for i, p in enumerate(picks):
+            if i in id_cols:
+                cell = WriteOnlyCell(ws, value=values[p])
+                cell.number_format = "@"
+                row.append(cell)
+            else:
+                row.append(values[p])
+        ws.append(row)
+        count += 1
+    wb.save(path)
+    return count
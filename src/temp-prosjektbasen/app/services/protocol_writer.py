@@ -0,0 +1,668 @@
+"""Protokollgenerering (MC og funksjonstest) fra Excel-maler i strømmemodus.
+
+- load_template(path) leser malen én gang per prosess og laster den på nytt når filen endres.
+- ProtocolTemplate.layout(nøkkel, prepare) kjører de data-uavhengige stegene (kolonner,
+  overskrifter, tømming, standardverdier) én gang og lagrer arket som ferdige rader med stil.
+- ProtocolWriter skriver arbeidsboken med Workbook(write_only=True) og malens stiltabeller;
+  per ark legges bare dataverdiene oppå mens radene strømmes ut.
+
+Verdier settes som ws.cell(r, k, verdi) (None endrer ikke cellen), delete_rows flytter radene
+under opp, og patch kjører ark-operasjoner som trenger et fullt Worksheet på et kladdeark.
+Betinget formatering, datavalidering, frysing, bilder, kommentarer og hyperkoblinger fra malen
+følger ikke med (som med copy_worksheet).
+
+Strømmeveien bruker openpyxl-internals og er testet mot openpyxl 3.1.x. Med en annen versjon
+eller PROTOCOL_FAST_PATH=0 brukes vanlig openpyxl med copy_worksheet (tregere, samme resultat).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from copy import copy
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import openpyxl
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import DifferentialStyle, Rule
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.xml.functions import Element
+
+try:
+    from openpyxl.cell._writer import etree_write_cell
+except ImportError:  # internt i openpyxl; mangler den brukes vanlig openpyxl
+    etree_write_cell = None
+
+__all__ = [
+    "ProtocolTemplate", "ProtocolWriter", "SheetLayout", "load_template", "template_cache_info",
+    "build_mc_protocol", "build_ft_protocol", "add_betingelser", "apply_status_cf",
+]
+
+# Ferdige rad-elementer per arbeidsbok (malrader gjenbrukes på tvers av ark)
+PROTOCOL_ROW_CACHE = int(os.getenv("PROTOCOL_ROW_CACHE", "20000"))
+# Kladdeark-resultater (patch) som holdes per mal før cachen tømmes
+PROTOCOL_PATCH_CACHE = int(os.getenv("PROTOCOL_PATCH_CACHE", "256"))
+# openpyxl-versjoner (major, minor) strømmeveien er testet mot
+OPENPYXL_TESTED = ((3, 1),)
+
+_log = logging.getLogger(__name__)
+
+# (kolonne, verdi, data_type, stil). data_type None = verdien tolkes som ved cell.value = verdi
+LayoutCell = Tuple[int, Any, Optional[str], Optional[StyleArray]]
+Row = Tuple[LayoutCell, ...]
+
+# Arkegenskaper som copy_worksheet tar med (i tillegg til celler, dimensjoner og sammenslåing)
+_SHEET_ATTRS = ("sheet_format", "sheet_properties", "page_margins", "page_setup", "print_options")
+# Stiltabeller i arbeidsboken; StyleArray-indeksene peker hit
+_STYLE_TABLES = ("_fonts", "_fills", "_borders", "_alignments", "_protections", "_number_formats",
+                 "_cell_styles")
+
+
+def _fast_path_supported() -> bool:
+    """Kan strømmeveien brukes med installert openpyxl? (versjon + internals den bruker)"""
+    if os.getenv("PROTOCOL_FAST_PATH", "1") == "0" or etree_write_cell is None:
+        return False
+    try:
+        version = tuple(int(x) for x in openpyxl.__version__.split(".")[:2])
+    except ValueError:
+        return False
+    if version not in OPENPYXL_TESTED:
+        return False
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    return (all(hasattr(wb, name) for name in _STYLE_TABLES + ("_named_styles", "_colors"))
+            and all(hasattr(ws, name) for name in ("_get_writer", "_rows")))
+
+
+FAST_PATH = _fast_path_supported()
+if not FAST_PATH:
+    _log.info("Protokoller skrives med vanlig openpyxl (openpyxl %s, strømmevei av).", openpyxl.__version__)
+
+
+class _Collector:
+    """Mottar elementene etree_write_cell skriver (i stedet for en xmlfile)."""
+
+    def __init__(self):
+        self.elements: List[Any] = []
+        self.letters: List[str] = []
+
+    def write(self, el) -> None:
+        self.elements.append(el)
+
+
+class SheetLayout:
+    """Malark etter de data-uavhengige stegene, som ferdige rader."""
+
+    __slots__ = ("template", "sheet", "prepare", "rows", "max_row", "max_column", "merged",
+                 "row_dimensions", "column_dimensions", "sheet_attrs")
+
+    def __init__(self, template: "ProtocolTemplate", ws: Worksheet, sheet: str,
+                 prepare: Optional[Callable[[Worksheet], None]] = None):
+        self.template = template
+        self.sheet = sheet
+        self.prepare = prepare
+        rows: Dict[int, List[LayoutCell]] = defaultdict(list)
+        if FAST_PATH:
+            for (r, c), cell in sorted(ws._cells.items()):
+                if cell._value is None and not cell.has_style:
+                    continue
+                rows[r].append((c, cell._value, cell.data_type, copy(cell._style) if cell.has_style else None))
+        else:
+            # Vanlig openpyxl trenger bare verdiene (values()); arkene bygges fra malarket
+            for row in ws.iter_rows():
+                for cell in row:
+                    if cell.value is not None:
+                        rows[cell.row].append((cell.column, cell.value, cell.data_type, None))
+        self.rows: Dict[int, Row] = {r: tuple(cells) for r, cells in rows.items()}
+        self.max_row = ws.max_row
+        self.max_column = ws.max_column
+        self.merged = tuple(CellRange(str(mr)) for mr in ws.merged_cells.ranges)
+        self.row_dimensions = {k: copy(d) for k, d in ws.row_dimensions.items()}
+        self.column_dimensions = {k: copy(d) for k, d in ws.column_dimensions.items()}
+        self.sheet_attrs = {name: copy(getattr(ws, name)) for name in _SHEET_ATTRS}
+
+    def values(self, min_row: int, max_row: int, min_col: int, max_col: int) -> Iterator[Tuple[int, int, Any]]:
+        """(rad, kolonne, verdi) for celler med verdi i området."""
+        for r in range(min_row, max_row + 1):
+            for c, v, _, _ in self.rows.get(r, ()):
+                if min_col <= c <= max_col and v is not None:
+                    yield r, c, v
+
+
+class ProtocolTemplate:
+    """Innlest mal. Arbeidsboken brukes bare under låsen (kopier, kladdeark, stiltabeller)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.wb = load_workbook(path)
+        self.sheetnames = tuple(self.wb.sheetnames)
+        self._lock = threading.Lock()
+        self._layouts: Dict[Hashable, SheetLayout] = {}
+        self._patches: Dict[Hashable, Tuple[Dict[int, Row], Tuple[CellRange, ...]]] = {}
+
+    def __repr__(self) -> str:
+        return f"ProtocolTemplate({self.path!r}, layouts={len(self._layouts)})"
+
+    def layout(self, key: Hashable, prepare: Optional[Callable[[Worksheet], None]] = None,
+               sheet: Optional[str] = None) -> SheetLayout:
+        """Layout for (ark, nøkkel). prepare(ws) kjøres én gang på en kopi av malarket."""
+        sheet = sheet or self.sheetnames[0]
+        full_key = (sheet, key, FAST_PATH)
+        with self._lock:
+            hit = self._layouts.get(full_key)
+            if hit is None:
+                ws = self.wb.copy_worksheet(self.wb[sheet])
+                try:
+                    if prepare is not None:
+                        prepare(ws)
+                    hit = self._layouts[full_key] = SheetLayout(self, ws, sheet, prepare)
+                finally:
+                    self.wb.remove(ws)
+        return hit
+
+    def patch(self, rows: Mapping[int, Row], op: Callable[[Worksheet], None]) -> Tuple[Dict[int, Row], Tuple[CellRange, ...]]:
+        """Kjør op på et kladdeark med radene; gir (nye rader, nye sammenslåinger)."""
+        key = (op, tuple(sorted(rows.items())))
+        with self._lock:
+            hit = self._patches.get(key)
+            if hit is not None:
+                return hit
+            ws = self.wb.create_sheet("~kladd")
+            try:
+                for r, cells in rows.items():
+                    for c, v, dt, st in cells:
+                        cell = ws.cell(r, c)
+                        if dt is None:
+                            cell.value = v
+                        else:
+                            cell._value, cell.data_type = v, dt
+                        if st is not None:
+                            cell._style = copy(st)
+                op(ws)
+                out: Dict[int, List[LayoutCell]] = {r: [] for r in rows}
+                for (r, c), cell in sorted(ws._cells.items()):
+                    if r in out and (cell._value is not None or cell.has_style):
+                        out[r].append((c, cell._value, cell.data_type,
+                                       copy(cell._style) if cell.has_style else None))
+                hit = ({r: tuple(cells) for r, cells in out.items()},
+                       tuple(CellRange(str(mr)) for mr in ws.merged_cells.ranges))
+            finally:
+                self.wb.remove(ws)
+            if len(self._patches) >= PROTOCOL_PATCH_CACHE:
+                self._patches.clear()
+            self._patches[key] = hit
+        return hit
+
+    def _snapshot_styles(self, wb: Workbook) -> None:
+        src = self.wb
+        with self._lock:
+            for name in _STYLE_TABLES:
+                setattr(wb, name, IndexedList(getattr(src, name)))
+            wb._named_styles = copy(src._named_styles)
+            wb._colors = list(src._colors)
+        wb.loaded_theme = src.loaded_theme
+        wb.calculation = copy(src.calculation)
+        wb.epoch = src.epoch
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Malcache (samme signatur som TFM-cachen)
+# ────────────────────────────────────────────────────────────────────────────────
+_lock = threading.Lock()
+_templates: Dict[str, Tuple[Tuple[int, int], ProtocolTemplate]] = {}
+_stats = {"hits": 0, "loads": 0}
+
+
+def load_template(path: str) -> ProtocolTemplate:
+    """Innlest mal (cachet til filen endres). Kaster som load_workbook."""
+    real = os.path.realpath(path)
+    st = os.stat(real)
+    sig = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        hit = _templates.get(real)
+        if hit is not None and hit[0] == sig:
+            _stats["hits"] += 1
+            return hit[1]
+    tpl = ProtocolTemplate(real)            # utenfor låsen; feil caches ikke
+    with _lock:
+        _templates[real] = (sig, tpl)
+        _stats["loads"] += 1
+    return tpl
+
+
+def template_cache_info() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "entries": len(_templates)}
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Strømmende skriving
+# ────────────────────────────────────────────────────────────────────────────────
+class ProtocolWriter:
+    """Arbeidsbok i strømmemodus med malens stiltabeller. Ark skrives ferdig ett om gangen.
+
+    Uten strømmevei (se FAST_PATH) er arbeidsboken en vanlig kopi av malen.
+    """
+
+    def __init__(self, template: ProtocolTemplate):
+        self.template = template
+        self.fast = FAST_PATH
+        if not self.fast:
+            self.wb = load_workbook(template.path)
+            self._template_sheets = list(self.wb.worksheets)
+            return
+        self.wb = Workbook(write_only=True)
+        template._snapshot_styles(self.wb)
+        self._n_styles = {name: len(getattr(self.wb, name)) for name in _STYLE_TABLES}
+        self._styles: Dict[StyleArray, StyleArray] = {}
+        self._row_cache: Dict[int, Tuple[Row, List[Tuple[str, Any]]]] = {}
+        self._row_attr_cache: Dict[int, Tuple[SheetLayout, Dict[int, List[Tuple[str, str]]]]] = {}
+
+    def _style(self, st: StyleArray) -> StyleArray:
+        """Malens StyleArray i denne arbeidsboken.
+
+        Indekser innenfor kopien av stiltabellene er like i begge bøkene; stiler malen har fått
+        etter kopien (nye layouter/patcher) legges til her.
+        """
+        hit = self._styles.get(st)
+        if hit is None:
+            src, dst, n = self.template.wb, self.wb, self._n_styles
+            hit = copy(st)
+            for attr, table in (("fontId", "_fonts"), ("fillId", "_fills"), ("borderId", "_borders"),
+                                ("alignmentId", "_alignments"), ("protectionId", "_protections")):
+                i = getattr(st, attr)
+                if i >= n[table]:
+                    setattr(hit, attr, getattr(dst, table).add(getattr(src, table)[i]))
+            if st.numFmtId - 164 >= n["_number_formats"]:
+                hit.numFmtId = dst._number_formats.add(src._number_formats[st.numFmtId - 164]) + 164
+            self._styles[copy(st)] = hit
+        return hit
+
+    def add_sheet(self, title: str, layout: SheetLayout,
+                  values: Optional[Mapping[Tuple[int, int], Any]] = None, *,
+                  delete_rows: Optional[Tuple[int, int]] = None,
+                  patch: Optional[Tuple[Iterable[int], Callable[[Worksheet], None]]] = None):
+        """Skriv ett ark: layout + verdier {(rad, kol): verdi} → delete_rows → patch.
+
+        Returnerer arket; betinget formatering, datavalidering og sammenslåinger kan legges
+        til etterpå (skrives når arbeidsboken lagres).
+        """
+        if not self.fast:
+            return self._add_sheet_plain(title, layout, values or {}, delete_rows, patch)
+        ws = self.wb.create_sheet(title)
+        for name, value in layout.sheet_attrs.items():
+            setattr(ws, name, copy(value))
+        for key, dim in layout.column_dimensions.items():
+            ws.column_dimensions[key] = self._dimension(dim, ws)
+        merged = list(layout.merged)
+
+        rows, last = self._sheet_rows(layout, values or {}, delete_rows)
+        if patch is not None:
+            patch_rows, op = patch
+            new_rows, patch_merged = self.template.patch({r: rows(r) for r in patch_rows}, op)
+            base = rows
+
+            def rows(r: int) -> Row:
+                return new_rows[r] if r in new_rows else base(r)
+
+            merged += patch_merged
+            last = max(last, max(new_rows, default=0))
+        # Samlet (merged_cells.add sjekker overlapp mot alle eksisterende områder)
+        ws.merged_cells = MultiCellRange(merged)
+        dims = self._row_attrs(ws, layout)
+        last = max(last, max(dims, default=0))
+
+        self._write_sheet_data(ws, self._row_elements(ws, rows, last, dims))
+        return ws
+
+    def _add_sheet_plain(self, title: str, layout: SheetLayout, values: Mapping[Tuple[int, int], Any],
+                         delete_rows: Optional[Tuple[int, int]],
+                         patch: Optional[Tuple[Iterable[int], Callable[[Worksheet], None]]]) -> Worksheet:
+        """Samme steg som strømmeveien, utført på en kopi av malarket med vanlig openpyxl."""
+        ws = self.wb.copy_worksheet(self.wb[layout.sheet])
+        ws.title = title
+        if layout.prepare is not None:
+            layout.prepare(ws)
+        for (r, c), v in values.items():
+            if v is not None:
+                ws.cell(r, c, v)
+        if delete_rows and delete_rows[1] > 0:
+            ws.delete_rows(*delete_rows)
+        if patch is not None:
+            patch[1](ws)
+        return ws
+
+    def _drop_template_sheets(self) -> None:
+        for ws in self._template_sheets:
+            if ws in self.wb.worksheets:
+                self.wb.remove(ws)
+        self._template_sheets = []
+
+    def _dimension(self, dim, ws):
+        d = copy(dim)
+        d.parent = ws
+        if d._style is not None and d.has_style:
+            d._style = copy(self._style(d._style))
+        return d
+
+    def _row_attrs(self, ws, layout: SheetLayout) -> Dict[int, List[Tuple[str, str]]]:
+        """Attributter for <row> fra malens radformat (høyde, stil), én gang per layout."""
+        hit = self._row_attr_cache.get(id(layout))
+        if hit is None or hit[0] is not layout:
+            attrs = {r: list(dict(self._dimension(dim, ws)).items()) for r, dim in layout.row_dimensions.items()}
+            hit = self._row_attr_cache[id(layout)] = (layout, attrs)
+        return hit[1]
+
+    def _row_elements(self, ws, rows: Callable[[int], Row], last: int,
+                      dims: Mapping[int, List[Tuple[str, str]]]) -> Iterator[Any]:
+        """<row>-elementer som i WorksheetWriter.write_row (rader med celler eller radformat)."""
+        cache = self._row_cache
+        for r in range(1, last + 1):
+            cells = rows(r)
+            attrs = dims.get(r)
+            if not cells and attrs is None:
+                continue
+            hit = cache.get(id(cells))
+            if hit is None or hit[0] is not cells:
+                hit = (cells, self._cell_elements(ws, cells))
+                if len(cache) < PROTOCOL_ROW_CACHE:
+                    cache[id(cells)] = hit
+            row = Element("row", {"r": str(r)})
+            for k, v in attrs or ():
+                row.set(k, v)
+            # Celle-elementene gjenbrukes: raden skrives før neste bygges
+            for letter, el in hit[1]:
+                el.set("r", f"{letter}{r}")
+                row.append(el)
+            yield row
+
+    def _cell_elements(self, ws, cells: Row) -> List[Tuple[str, Any]]:
+        """Cellene i raden som XML-elementer (openpyxl sin cellewriter); 'r' settes per rad."""
+        out = _Collector()
+        for c, v, dt, st in cells:
+            cell = WriteOnlyCell(ws)
+            cell.column = c
+            if dt is None:
+                cell.value = v
+            else:
+                cell._value = v
+                cell.data_type = dt
+            if st is not None:
+                cell._style = self._style(st)
+            if cell._value is None and not cell.has_style:
+                continue
+            etree_write_cell(out, ws, cell, cell.has_style)
+            out.letters.append(get_column_letter(c))
+        return list(zip(out.letters, out.elements))
+
+    @staticmethod
+    def _write_sheet_data(ws, row_elements: Iterable[Any]) -> None:
+        """Skriv <sheetData> med ferdige rad-elementer.
+
+        Samme protokoll som WriteOnlyWorksheet._write_rows (ws.append), men uten en Cell per
+        celle; generatoren blir liggende i ws._rows så close() avslutter den som vanlig.
+        """
+        def write():
+            ws._get_writer()
+            xf = ws._writer.xf.send(True)
+            with xf.element("sheetData"):
+                for row in row_elements:
+                    xf.write(row)
+            ws._writer.xf.send(None)
+            yield
+
+        ws._rows = gen = write()
+        next(gen)
+
+    @staticmethod
+    def _sheet_rows(layout: SheetLayout, values: Mapping[Tuple[int, int], Any],
+                    delete_rows: Optional[Tuple[int, int]]) -> Tuple[Callable[[int], Row], int]:
+        """Rad → celler etter verdier og delete_rows, og siste rad som kan ha innhold."""
+        over: Dict[int, Dict[int, Any]] = defaultdict(dict)
+        for (r, c), v in values.items():
+            if v is not None:
+                over[r][c] = v
+        max_row = max(layout.max_row, max(over, default=0))
+        base = layout.rows
+
+        def grid(r: int) -> Row:
+            cells = base.get(r, ())
+            o = over.get(r)
+            if not o:
+                return cells
+            by_col = {c: (c, v, dt, st) for c, v, dt, st in cells}
+            for c, v in o.items():
+                old = by_col.get(c)
+                by_col[c] = (c, v, None, old[3] if old else None)
+            return tuple(by_col[c] for c in sorted(by_col))
+
+        if delete_rows and delete_rows[1] > 0:
+            idx, amount = delete_rows
+
+            def rows(r: int) -> Row:
+                if r < idx:
+                    return grid(r)
+                src = r + amount
+                return grid(src) if src <= max_row else ()
+
+            return rows, (max(idx - 1, max_row - amount) if idx <= max_row else max_row)
+        return grid, max_row
+
+    def sort_sheets(self, key: Callable[[str], Any]) -> None:
+        if not self.fast:
+            self._drop_template_sheets()
+        for pos, ws in enumerate(sorted(self.wb.worksheets, key=lambda ws: key(ws.title))):
+            self.wb.move_sheet(ws.title, pos - self.wb.index(ws))
+
+    def save(self, target) -> None:
+        if not self.fast:
+            self._drop_template_sheets()
+        self.wb.save(target)
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Felles for protokollene
+# ────────────────────────────────────────────────────────────────────────────────
+STATUS_CHOICES = '"Ikke startet,Under arbeid,Avvik,Utført"'
+
+BETINGELSER = [
+    "",
+    "Kontroll av protokoll",
+    "Dokumentasjon må overleveres før igangkjøring av anlegg.",
+    "Protokollen skal fylles ut og signeres av utførende montør.",
+    "Protokollen skal fylles ut og signeres av kontrollør som kontrollerer arbeidet.",
+    "Dokumentasjonen skal fylles ut fortløpende avhengig av fremdrift i prosjektet."
+]
+BETINGELSER_START_ROW = 202
+
+
+def add_betingelser(worksheet):
+    for i, line in enumerate(BETINGELSER):
+        worksheet.cell(row=BETINGELSER_START_ROW + i, column=1, value=line)
+        if line:
+            worksheet.merge_cells(start_row=BETINGELSER_START_ROW + i, start_column=1,
+                                  end_row=BETINGELSER_START_ROW + i, end_column=9)
+            worksheet.cell(row=BETINGELSER_START_ROW + i, column=1).font = Font(bold=True)
+            worksheet.cell(row=BETINGELSER_START_ROW + i, column=1).alignment = Alignment(wrapText=True)
+
+
+def _status_rules(ref: str):
+    """Regler for status-kolonner (lys grå / blå / rød / grønn; 'Avvik' med hvit font)."""
+    # Pastellfarger (ARGB, uten '#')
+    fill_gray = PatternFill(fill_type="solid", start_color="FFF2F2F2", end_color="FFF2F2F2")
+    fill_blue = PatternFill(fill_type="solid", start_color="FFDDEBF7", end_color="FFDDEBF7")
+    fill_red = PatternFill(fill_type="solid", start_color="FFF8D7DA", end_color="FFF8D7DA")
+    fill_green = PatternFill(fill_type="solid", start_color="FFD4EDDA", end_color="FFD4EDDA")
+    font_black = Font(color="FF000000")
+    font_white = Font(color="FFFFFFFF")
+
+    def rule(expr: str, fill: PatternFill, font: Font) -> Rule:
+        dxf = DifferentialStyle(fill=fill, font=font)
+        return Rule(type="expression", dxf=dxf, stopIfTrue=False, formula=[expr])
+
+    return [
+        rule(f'=EXACT({ref},"Ikke startet")', fill_gray, font_black),
+        rule(f'=EXACT({ref},"Under arbeid")', fill_blue, font_black),
+        rule(f'=EXACT({ref},"Avvik")', fill_red, font_white),
+        rule(f'=EXACT({ref},"Utført")', fill_green, font_black),
+    ]
+
+
+def apply_status_cf(ws, start_row: int, end_row: int, columns: Iterable[str] = ("A", "B", "C"),
+                    ref_row: Optional[int] = None):
+    """Betinget formatering for statuskolonner; formelen peker på ${kol}{ref_row} (start_row)."""
+    for col in columns:
+        cell_range = f"{col}{start_row}:{col}{end_row}"
+        for rule in _status_rules(f"${col}{start_row if ref_row is None else ref_row}"):
+            ws.conditional_formatting.add(cell_range, rule)
+
+
+def _copy_cell_style(src_cell, dst_cell):
+    """Kopier utseende fra src til dst (font/fill/border/alignment/format)."""
+    if src_cell.has_style:
+        dst_cell.font = copy(src_cell.font)
+        dst_cell.fill = copy(src_cell.fill)
+        dst_cell.border = copy(src_cell.border)
+        dst_cell.alignment = copy(src_cell.alignment)
+        dst_cell.number_format = src_cell.number_format
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Mekanisk komplett (MC): ett ark per system fra arket 'malverk'
+# ────────────────────────────────────────────────────────────────────────────────
+MC_SHEET = "malverk"
+MC_FIRST_ROW, MC_LAST_ROW = 3, 200
+MC_LOC_LABELS = ("Plassering", "Rom", "Lokasjon")
+MC_KTR_LABEL = "Kontrollområde"
+
+
+def _mc_prepare(labels: Tuple[str, ...]) -> Callable[[Worksheet], None]:
+    """Innsatte lokasjonskolonner etter E, tømte rader og standard status i A–C."""
+    def prepare(ws: Worksheet) -> None:
+        insert_at = 6  # kolonne F
+        for label in labels:
+            ws.insert_cols(insert_at, amount=1)
+            # kopier header-stil (rad 1–2) fra E
+            for r_i in (1, 2):
+                _copy_cell_style(ws.cell(r_i, 5), ws.cell(r_i, insert_at))
+            ws.cell(1, insert_at, label)
+            ws.cell(2, insert_at, None)
+            insert_at += 1
+        # Nullstill rad 3–200 (verdier) uten å røre headerne
+        for i in range(MC_FIRST_ROW, MC_LAST_ROW + 1):
+            for j in range(1, ws.max_column + 1):
+                ws.cell(i, j).value = None
+        for col in ("A", "B", "C"):
+            for i in range(MC_FIRST_ROW, MC_LAST_ROW + 1):
+                ws[f"{col}{i}"].value = "Ikke startet"
+    return prepare
+
+
+def build_mc_protocol(template_path: str, groups: Mapping[str, List[Mapping[str, Any]]],
+                      sort_key: Optional[Callable[[str], Any]] = None) -> ProtocolWriter:
+    """MC-protokoll: {arktittel: [{'komponent', 'desc', 'locs'}, ...]} → arbeidsbok.
+
+    'komponent' er visningsnavnet i D, 'desc' beskrivelsen i E. Kolonne for første av
+    Plassering/Rom/Lokasjon og for Kontrollområde settes inn etter E når gruppen har verdier.
+    """
+    tpl = load_template(template_path)
+    writer = ProtocolWriter(tpl)
+    footer_rows = range(BETINGELSER_START_ROW, BETINGELSER_START_ROW + len(BETINGELSER))
+
+    for title, liste in groups.items():
+        locs = [r.get("locs") or {} for r in liste]
+        primary = next((lbl for lbl in MC_LOC_LABELS if any(l.get(lbl) for l in locs)), None)
+        labels = ((primary,) if primary else ()) + ((MC_KTR_LABEL,) if any(l.get(MC_KTR_LABEL) for l in locs) else ())
+        layout = tpl.layout(("mc",) + labels, _mc_prepare(labels), sheet=MC_SHEET)
+
+        values: Dict[Tuple[int, int], Any] = {}
+        for idx, (r, loc) in enumerate(zip(liste, locs), start=MC_FIRST_ROW):
+            values[idx, 4] = r.get("komponent", "")
+            values[idx, 5] = r.get("desc", "")
+            for col, label in enumerate(labels, start=6):
+                values[idx, col] = loc.get(label, "") or ""
+
+        # Trim tomme rader som før
+        last = MC_FIRST_ROW + len(liste) - 1
+        delete = (last + 1, MC_LAST_ROW - last) if last < MC_LAST_ROW else None
+        ws = writer.add_sheet(title, layout, values, delete_rows=delete, patch=(footer_rows, add_betingelser))
+
+        dv = DataValidation(type="list", formula1=STATUS_CHOICES, allow_blank=True)
+        ws.data_validations.append(dv)
+        for col in ("A", "B", "C"):
+            dv.add(f"{col}{MC_FIRST_ROW}:{col}{MC_LAST_ROW}")
+        apply_status_cf(ws, MC_FIRST_ROW, max(last, MC_FIRST_ROW))
+
+    if sort_key is not None:
+        writer.sort_sheets(sort_key)
+    return writer
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Funksjonstest (FT): ett ark per system, data fra rad 29
+# ────────────────────────────────────────────────────────────────────────────────
+FT_SHEETS = ("mal", "malverk", "template", "ft_mal")
+FT_START_ROW = 29
+FT_CLEAR_ROWS = 1000
+FT_FUNK_CHOICES = [
+    "Start og Stopp funksjoner",
+    "Reguleringsfunksjoner",
+    "Sikkerhetsfunksjoner",
+    "Øvrig",
+]
+# (felt, kolonne): Status, System, Komponent, Testutførelse, Akseptkriterie, Funksjonsvalg
+FT_COLUMNS = (("status", 1), ("system", 2), ("komponent", 3), ("test", 5), ("aksept", 7),
+              ("funksjonsvalg", 8))
+_FT_PLACEHOLDER = re.compile(r"\{SYSTEM(NAVN)?\}", re.I)
+
+
+def _ft_prepare(ws: Worksheet) -> None:
+    """Tøm dataområdet (A–N) fra rad 29 og ned 1000 rader."""
+    for rr in range(FT_START_ROW, FT_START_ROW + FT_CLEAR_ROWS):
+        for cc in range(1, 14 + 1):
+            ws.cell(rr, cc).value = None
+
+
+def build_ft_protocol(template_path: str, groups: Mapping[str, List[Mapping[str, Any]]]) -> ProtocolWriter:
+    """Funksjonstest: {system: [{'status', 'system', 'komponent', 'test', 'aksept',
+    'funksjonsvalg'}, ...]} → arbeidsbok med arkene '<system> - FT' i alfabetisk rekkefølge.
+
+    {SYSTEM}/{SYSTEMNAVN} i A1:AN60 erstattes med systemet.
+    """
+    tpl = load_template(template_path)
+    sheet = next((n for n in tpl.sheetnames if n.lower() in FT_SHEETS), tpl.sheetnames[0])
+    layout = tpl.layout(("ft",), _ft_prepare, sheet=sheet)
+    placeholders = [(r, c, v) for r, c, v in layout.values(1, 60, 1, 40)
+                    if isinstance(v, str) and _FT_PLACEHOLDER.search(v)]
+    writer = ProtocolWriter(tpl)
+
+    for system, liste in groups.items():
+        values: Dict[Tuple[int, int], Any] = {(r, c): _FT_PLACEHOLDER.sub(system, v) for r, c, v in placeholders}
+        for r, obj in enumerate(liste, start=FT_START_ROW):
+            for field, col in FT_COLUMNS:
+                values[r, col] = obj.get(field)
+        ws = writer.add_sheet(f"{system} - FT", layout, values)
+
+        last = FT_START_ROW + len(liste) - 1
+        if liste:
+            dv_status = DataValidation(type="list", formula1=STATUS_CHOICES, allow_blank=True)
+            ws.data_validations.append(dv_status)
+            dv_status.add(f"A{FT_START_ROW}:A{last}")
+            # Formelen peker på $A1 (som før)
+            apply_status_cf(ws, FT_START_ROW, last, columns=("A",), ref_row=1)
+            dv_funk = DataValidation(type="list", formula1='"' + ",".join(FT_FUNK_CHOICES) + '"',
+                                     allow_blank=True)
+            ws.data_validations.append(dv_funk)
+            dv_funk.add(f"H{FT_START_ROW}:H{last}")
+
+    writer.sort_sheets(lambda title: title)
+    return writer
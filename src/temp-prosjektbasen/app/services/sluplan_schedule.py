@@ -0,0 +1,324 @@
+"""Kritisk linje (CPM) for SluPlan: fremover-/bakoverpass over avhengighetene i et prosjekt.
+
+Ren beregning uten databasekall (sluplan_service.get_schedule() henter dataene):
+
+- Tid regnes i hele kalenderdager fra en basisdato. En oppgave varer end - start + 1 dager
+  (som ellers i SluPlan) og ligger i [ES, EF) med EF = ES + varighet.
+- Avhengigheter FS/SS/FF/SF med lag (dager, kan være negativ). Første bokstav gjelder
+  forgjengeren (S = start, F = slutt), andre bokstav etterfølgeren:
+    FS: ES_j >= EF_i + lag      SS: ES_j >= ES_i + lag
+    FF: EF_j >= EF_i + lag      SF: EF_j >= ES_i + lag
+- Planlagt start på en bladoppgave er tidligste start ("ikke før"), så oppgaver uten
+  forgjengere blir stående der de er planlagt.
+- Sammendragsoppgaver (med barn) får en start- og en sluttnode med varighet 0: start → hvert
+  barn (SS 0), hvert barn → slutt (FF 0). Avhengigheter til/fra sammendraget kobles til
+  start- eller sluttnoden etter typen, og datoene rulles opp fra barna.
+- Topologisk sortering (Kahn) over en CSR-liste, ett fremoverpass og ett bakoverpass:
+  O(oppgaver + avhengigheter). Sykluser gir ScheduleCycleError med oppgavene i syklusen.
+- Slutt på prosjektet = seneste EF. Total slakk = LS - ES; kritisk = slakk 0. Den kritiske
+  linjen er de kritiske bladoppgavene sortert etter tidligste start, tidligste slutt og id
+  (uavhengig av rekkefølgen oppgavene kommer i).
+"""
+from __future__ import annotations
+
+import re
+from collections import deque
+from dataclasses import dataclass
+from operator import add
+from datetime import date, timedelta
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+__all__ = [
+    "DEPENDENCY_TYPES",
+    "MAX_LAG_DAYS",
+    "ScheduleCycleError",
+    "ScheduledTask",
+    "Schedule",
+    "parse_dependency_type",
+    "format_dependency_type",
+    "compute_schedule",
+]
+
+DEPENDENCY_TYPES = ("FS", "SS", "FF", "SF")
+
+# "FS", "SS+2", "FF-1", "fs +3" – lag i dager lagres i samme felt som typen
+# Største |lag|: "FS+9999" passer i type-feltet (String(8)), og datoene holder seg innenfor date.max
+MAX_LAG_DAYS = 9999
+_TYPE_RX = re.compile(r"^\s*(FS|SS|FF|SF)\s*(?:([+-])\s*(\d+)\s*[dD]?)?\s*$", re.IGNORECASE)
+
+
+class ScheduleCycleError(ValueError):
+    """Avhengighetene danner en syklus. task_ids er oppgavene i én syklus, i rekkefølge."""
+
+    def __init__(self, task_ids: Sequence[Hashable]):
+        super().__init__("avhengighetssyklus")
+        self.task_ids = list(task_ids)
+
+
+def parse_dependency_type(raw: Optional[str], lag: Any = None) -> Tuple[str, int]:
+    """Lagret type ("FS", "SS+2", ...) → (type, lag). Eksplisitt lag legges til.
+
+    Tom verdi gir ("FS", 0); ukjent type gir ValueError("ugyldig_avhengighetstype"),
+    lag som ikke er et heltall eller er utenfor ±MAX_LAG_DAYS gir ValueError("ugyldig_lag").
+    """
+    text = (raw or "FS").strip() or "FS"
+    m = _TYPE_RX.match(text)
+    if not m:
+        raise ValueError("ugyldig_avhengighetstype")
+    days = int(m.group(3) or 0) * (-1 if m.group(2) == "-" else 1)
+    if lag not in (None, ""):
+        try:
+            days += int(lag)
+        except (TypeError, ValueError):
+            raise ValueError("ugyldig_lag") from None
+    if abs(days) > MAX_LAG_DAYS:
+        raise ValueError("ugyldig_lag")
+    return m.group(1).upper(), days
+
+
+def format_dependency_type(dep_type: str, lag: int = 0) -> str:
+    """(type, lag) → lagret form: "FS", "SS+2", "FF-1". Kaster ValueError hvis den ikke passer i feltet."""
+    if dep_type not in DEPENDENCY_TYPES:
+        raise ValueError("ugyldig_avhengighetstype")
+    if abs(lag) > MAX_LAG_DAYS:
+        raise ValueError("ugyldig_lag")
+    return f"{dep_type}{lag:+d}" if lag else dep_type
+
+
+@dataclass
+class ScheduledTask:
+    id: Hashable
+    early_start: date
+    early_finish: date          # siste dag (inklusiv), som end_date
+    late_start: date
+    late_finish: date
+    total_float: int            # dager
+    critical: bool
+    summary: bool
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": str(self.id),
+            "early_start": self.early_start.isoformat(),
+            "early_finish": self.early_finish.isoformat(),
+            "late_start": self.late_start.isoformat(),
+            "late_finish": self.late_finish.isoformat(),
+            "total_float": self.total_float,
+            "critical": self.critical,
+            "summary": self.summary,
+        }
+
+
+@dataclass
+class Schedule:
+    base: date
+    finish: date                        # siste dag i prosjektet (inklusiv)
+    tasks: Dict[Hashable, ScheduledTask]
+    critical_path: List[Hashable]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "finish": self.finish.isoformat(),
+            "critical_path": [str(t) for t in self.critical_path],
+            "tasks": [t.as_dict() for t in self.tasks.values()],
+        }
+
+
+# (forgjenger bruker slutt, etterfølger bruker slutt) per type
+_ENDS = {"FS": (1, 0), "SS": (0, 0), "FF": (1, 1), "SF": (0, 1)}
+
+
+def compute_schedule(
+    tasks: Iterable[Tuple[Hashable, date, date, Optional[Hashable]]],
+    dependencies: Iterable[Tuple[Hashable, Hashable, str, int]],
+    base: Optional[date] = None,
+) -> Schedule:
+    """CPM for (id, start, slutt, parent_id) og (fra_id, til_id, type, lag).
+
+    Avhengigheter til ukjente oppgaver hoppes over. base er dag 0 (standard: tidligste start).
+    """
+    ids: List[Hashable] = []
+    starts: List[int] = []
+    durs: List[int] = []
+    parents: List[Optional[Hashable]] = []
+    raw = list(tasks)
+    if not raw:
+        return Schedule(base or date.today(), base or date.today(), {}, [])
+    base = base or min(t[1] for t in raw)
+    for tid, start, end, parent in raw:
+        ids.append(tid)
+        s = (start - base).days
+        starts.append(s)
+        durs.append(max(0, (end - start).days) + 1)
+        parents.append(parent)
+    n = len(ids)
+    index = {tid: i for i, tid in enumerate(ids)}
+
+    # Foreldre/barn; sammendrag får en ekstra sluttnode (n, n+1, ...)
+    parent_idx: List[int] = [-1] * n
+    has_children = [False] * n
+    for i, p in enumerate(parents):
+        j = index.get(p, -1) if p is not None else -1
+        if j >= 0 and j != i:
+            parent_idx[i] = j
+            has_children[j] = True
+    finish_node = list(range(n))
+    owner = list(range(n))              # node → oppgaveindeks
+    for i in range(n):
+        if has_children[i]:
+            finish_node[i] = len(owner)
+            owner.append(i)
+    m = len(owner)
+    dur = [0 if has_children[i] else durs[i] for i in range(n)] + [0] * (m - n)
+    es = [starts[i] if not has_children[i] else 0 for i in range(n)] + [0] * (m - n)
+
+    # Kanter med fast vekt (varighetene er kjent): ES_v >= ES_u + w, der
+    # w = lag + (varighet_u hvis forgjengerens slutt) - (varighet_v hvis etterfølgerens slutt)
+    e_from: List[int] = []
+    e_to: List[int] = []
+    e_w: List[int] = []
+    for i in range(n):
+        if has_children[i]:
+            e_from.append(i)
+            e_to.append(finish_node[i])
+            e_w.append(0)
+        p = parent_idx[i]
+        if p >= 0:
+            e_from += (p, finish_node[i])
+            e_to += (i, finish_node[p])
+            e_w += (0, dur[i])                      # barnets slutt <= sammendragets slutt
+    for frm, to, dep_type, lag in dependencies:
+        i = index.get(frm)
+        j = index.get(to)
+        if i is None or j is None:
+            continue
+        a, b = _ENDS[dep_type]
+        u = finish_node[i] if a else i
+        v = finish_node[j] if b else j
+        e_from.append(u)
+        e_to.append(v)
+        e_w.append(int(lag or 0) + (dur[u] if a else 0) - (dur[v] if b else 0))
+
+    # CSR etter fra-node (tellesortering): adj_to/adj_w[head[u]:head[u + 1]]
+    n_edges = len(e_from)
+    head = [0] * (m + 1)
+    for u in e_from:
+        head[u + 1] += 1
+    for u in range(m):
+        head[u + 1] += head[u]
+    pos = head[:-1]
+    adj_to = [0] * n_edges
+    adj_w = [0] * n_edges
+    for u, v, w in zip(e_from, e_to, e_w):
+        k = pos[u]
+        adj_to[k] = v
+        adj_w[k] = w
+        pos[u] = k + 1
+
+    # Kahn
+    indeg = [0] * m
+    for v in e_to:
+        indeg[v] += 1
+    queue = deque(u for u in range(m) if not indeg[u])
+    order: List[int] = []
+    while queue:
+        u = queue.popleft()
+        order.append(u)
+        for v in adj_to[head[u]:head[u + 1]]:
+            indeg[v] -= 1
+            if not indeg[v]:
+                queue.append(v)
+    if len(order) < m:
+        raise ScheduleCycleError(_find_cycle(indeg, e_from, e_to, owner, ids))
+
+    # Fremoverpass (lengste vei)
+    for u in order:
+        lo, hi = head[u], head[u + 1]
+        if lo == hi:
+            continue
+        eu = es[u]
+        for v, w in zip(adj_to[lo:hi], adj_w[lo:hi]):
+            if eu + w > es[v]:
+                es[v] = eu + w
+    finish = max(map(add, es, dur))
+
+    # Bakoverpass: LS_u <= LS_v - w
+    ls = [finish - d for d in dur]
+    for u in reversed(order):
+        lo, hi = head[u], head[u + 1]
+        if lo == hi:
+            continue
+        best = ls[u]
+        for v, w in zip(adj_to[lo:hi], adj_w[lo:hi]):
+            if ls[v] - w < best:
+                best = ls[v] - w
+        ls[u] = best
+
+    # Rapport: blad direkte, sammendrag rulles opp fra barna (barn før forelder i omvendt rekkefølge)
+    r_es = [0] * n
+    r_ef = [0] * n
+    r_ls = [0] * n
+    r_lf = [0] * n
+    r_float = [0] * n
+    big = 1 << 62
+    for i in range(n):
+        if has_children[i]:
+            f = finish_node[i]
+            r_es[i], r_ls[i], r_float[i] = big, big, big
+            r_ef[i], r_lf[i] = es[f], ls[f]
+        else:
+            r_es[i], r_ls[i] = es[i], ls[i]
+            r_ef[i], r_lf[i] = es[i] + dur[i], ls[i] + dur[i]
+            r_float[i] = ls[i] - es[i]
+    for u in reversed(order):
+        p = parent_idx[u] if u < n else -1
+        if p >= 0:
+            r_es[p] = min(r_es[p], r_es[u])
+            r_ls[p] = min(r_ls[p], r_ls[u])
+            r_float[p] = min(r_float[p], r_float[u])
+
+    # Datoer fra en oppslagstabell (få unike dager selv med mange oppgaver)
+    lo_day = min(min(r_es), min(r_ls))
+    days = [base + timedelta(days=d) for d in range(lo_day - 1, max(max(r_ef), max(r_lf)) + 1)]
+    off = 1 - lo_day
+    out: Dict[Hashable, ScheduledTask] = {}
+    for i, tid in enumerate(ids):
+        out[tid] = ScheduledTask(
+            id=tid,
+            early_start=days[r_es[i] + off],
+            early_finish=days[r_ef[i] + off - 1],
+            late_start=days[r_ls[i] + off],
+            late_finish=days[r_lf[i] + off - 1],
+            total_float=r_float[i],
+            critical=r_float[i] <= 0,
+            summary=has_children[i],
+        )
+    critical = sorted((i for i in range(n) if not has_children[i] and r_float[i] <= 0),
+                      key=lambda i: (r_es[i], r_ef[i], ids[i]))
+    return Schedule(base, days[finish + off - 1], out, [ids[i] for i in critical])
+
+
+def _find_cycle(indeg: List[int], e_from: List[int], e_to: List[int],
+                owner: List[int], ids: List[Hashable]) -> List[Hashable]:
+    """Én syklus blant nodene som ble igjen i Kahn (alle har en forgjenger som også ble igjen)."""
+    pred: Dict[int, int] = {}
+    for u, v in zip(e_from, e_to):
+        if indeg[u] and indeg[v]:
+            pred.setdefault(v, u)
+    start = next(iter(pred))
+    seen: Dict[int, int] = {}
+    path: List[int] = []
+    u = start
+    while u not in seen:
+        seen[u] = len(path)
+        path.append(u)
+        u = pred[u]
+    cycle = path[seen[u]:][::-1]        # forgjenger → etterfølger
+    out: List[Hashable] = []
+    for node in cycle:
+        tid = ids[owner[node]]
+        if not out or out[-1] != tid:
+            out.append(tid)
+    if len(out) > 1 and out[0] == out[-1]:
+        out.pop()
+    return out
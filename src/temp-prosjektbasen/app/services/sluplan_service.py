@@ -23,6 +23,15 @@ from app.models.sluplan import (
     SluplanProject,
     SluplanTask,
 )
+from app.services.sluplan_schedule import compute_schedule, format_dependency_type, parse_dependency_type
+from app.services.sluplan_summary import (
+    alert_tasks,
+    status_bucket as _status_bucket,
+    status_counts,
+    summarize_groups,
+    time_window_tasks,
+)
+from app.services.sluplan_summary_store import check_consistency, summary_groups
 
 __all__ = [
     "list_projects",
@@ -42,9 +51,13 @@ __all__ = [
     "generate_task_ics",
     "import_systems_from_excel",
     "get_alerts",
+    "get_schedule",
     "summarize_by_discipline",
     "summarize_by_user",
     "summarize_by_time_window",
+    "summarize_by_status",
+    "get_dashboard_snapshot",
+    "verify_summary",
 ]
 
 MENTION_PATTERN = re.compile(r"@([\w\-æøåÆØÅ]+)")
@@ -173,12 +186,22 @@ def _serialize_task(task: SluplanTask, children: Optional[List[Dict[str, Any]]]
     }
 
 
+def _stored_dependency_type(raw: Optional[str]) -> Tuple[str, int]:
+    # Lag lagres i type-feltet ("SS+2"); ukjente eldre verdier tolkes som FS
+    try:
+        return parse_dependency_type(raw)
+    except ValueError:
+        return "FS", 0
+
+
 def _serialize_dependency(dep: SluplanDependency) -> Dict[str, Any]:
+    dep_type, lag = _stored_dependency_type(dep.type)
     return {
         "id": str(dep.id),
         "fromId": str(dep.from_task_id),
         "toId": str(dep.to_task_id),
-        "type": dep.type or "FS",
+        "type": dep_type,
+        "lag": lag,
     }
 
 
@@ -241,7 +264,7 @@ def _load_tasks_for_project(project: SluplanProject) -> List[SluplanTask]:
         .where(SluplanTask.project_id == project.id)
         .order_by(SluplanTask.parent_id, SluplanTask.start_date, SluplanTask.id)
     )
-    return list(db.session.execute(statement).scalars())
+    return list(db.session.execute(statement).unique().scalars())
 
 
 def _build_task_tree(tasks: Iterable[SluplanTask]) -> List[Dict[str, Any]]:
@@ -261,22 +284,6 @@ def _build_task_tree(tasks: Iterable[SluplanTask]) -> List[Dict[str, Any]]:
     return [_build(task) for task in roots]
 
 
-def _status_bucket(status: Optional[str]) -> str:
-    if not status:
-        return "planned"
-    normalized = status.strip().lower()
-    if normalized in {"ferdig", "done", "completed"}:
-        return "completed"
-    if normalized in {"pågår", "in progress", "in_progress", "progress"}:
-        return "in_progress"
-    return "planned"
-
-
-def _task_duration_days(task: SluplanTask) -> int:
-    delta = (task.end_date - task.start_date).days
-    return max(0, delta) + 1
-
-
 def _duration_from_dates(start: date, end: date) -> int:
     delta = (end - start).days
     return max(0, delta) + 1
@@ -414,9 +421,12 @@ def _seed_default_plan(project: SluplanProject, systems: Optional[Iterable[str]]
 def _delete_project_tasks(project: SluplanProject) -> None:
     tasks = db.session.execute(
         select(SluplanTask).options(joinedload(SluplanTask.children)).where(SluplanTask.project_id == project.id)
-    ).scalars()
-    for task in tasks:
-        db.session.delete(task)
+    ).unique().scalars()
+    # Én flush: ellers laster kaskaden (kommentarer/filer/avhengigheter) med autoflush per
+    # oppgave, og underoppgaver som alt er slettet slettes på nytt via forelderen
+    with db.session.no_autoflush:
+        for task in tasks:
+            db.session.delete(task)
     db.session.flush()
 
 
@@ -822,20 +832,13 @@ def import_systems_from_excel(file_storage, *, project_id: Optional[int] = None)
     return get_plan_snapshot(project.id)
 
 
-def get_alerts(project_id: Optional[int] = None, reference_date: Optional[date] = None) -> Dict[str, Any]:
-    project = _project_by_id(project_id)
-    today = reference_date or date.today()
-    statement = (
-        select(SluplanTask)
-        .options(joinedload(SluplanTask.assignee))
-        .where(SluplanTask.project_id == project.id)
-    )
-
+def _alerts_payload(project: SluplanProject, today: date) -> Dict[str, Any]:
     upcoming: List[Dict[str, Any]] = []
     due_today: List[Dict[str, Any]] = []
     overdue: List[Dict[str, Any]] = []
 
-    for task in db.session.execute(statement).scalars():
+    # Kun oppgaver med frist innen 7 dager hentes (SQL), ferdige hoppes over her
+    for task in alert_tasks(project.id, today):
         if (task.status or "").strip().lower() == "ferdig":
             continue
         delta_days = (task.end_date - today).days
@@ -844,8 +847,8 @@ def get_alerts(project_id: Optional[int] = None, reference_date: Optional[date]
             "title": task.title,
             "start": _iso_date(task.start_date),
             "end": _iso_date(task.end_date),
-            "assignee": task.assignee.name if task.assignee else None,
-            "assignee_email": task.assignee.email if task.assignee else None,
+            "assignee": task.assignee,
+            "assignee_email": task.assignee_email,
             "status": task.status,
             "kind": task.kind,
             "days_until_due": delta_days,
@@ -874,88 +877,59 @@ def get_alerts(project_id: Optional[int] = None, reference_date: Optional[date]
     }
 
 
-def summarize_by_discipline(project_id: Optional[int] = None) -> List[Dict[str, Any]]:
+def get_alerts(project_id: Optional[int] = None, reference_date: Optional[date] = None) -> Dict[str, Any]:
     project = _project_by_id(project_id)
-    statement = (
-        select(SluplanTask)
-        .options(joinedload(SluplanTask.discipline))
+    return _alerts_payload(project, reference_date or date.today())
+
+
+def get_schedule(project_id: Optional[int] = None) -> Dict[str, Any]:
+    """Tidligste/seneste datoer, slakk og kritisk linje for hele prosjektet (se sluplan_schedule)."""
+    project = _project_by_id(project_id)
+    task_rows = db.session.execute(
+        select(SluplanTask.id, SluplanTask.start_date, SluplanTask.end_date, SluplanTask.parent_id)
         .where(SluplanTask.project_id == project.id)
-    )
-    summary: Dict[str, Dict[str, Any]] = {}
-    for task in db.session.execute(statement).scalars():
-        key = task.discipline.name if task.discipline else (task.kind.capitalize() if task.kind else "Annet")
-        entry = summary.setdefault(
-            key,
-            {
-                "discipline": key,
-                "task_count": 0,
-                "planned": 0,
-                "in_progress": 0,
-                "completed": 0,
-                "total_duration_days": 0,
-            },
-        )
-        entry["task_count"] += 1
-        entry[_status_bucket(task.status)] += 1
-        entry["total_duration_days"] += _task_duration_days(task)
-
-    result: List[Dict[str, Any]] = []
-    for item in summary.values():
-        count = item["task_count"] or 1
-        result.append(
-            {
-                **item,
-                "average_duration_days": round(item["total_duration_days"] / count, 2),
-            }
-        )
-    result.sort(key=lambda entry: entry["discipline"].lower())
-    return result
+        .order_by(SluplanTask.id)
+    ).all()
+    dependency_rows = db.session.execute(
+        select(SluplanDependency.from_task_id, SluplanDependency.to_task_id, SluplanDependency.type)
+        .join(SluplanTask, SluplanDependency.from_task_id == SluplanTask.id)
+        .where(SluplanTask.project_id == project.id)
+    ).all()
+    links = [(from_id, to_id, *_stored_dependency_type(raw)) for from_id, to_id, raw in dependency_rows]
+
+    schedule = compute_schedule(task_rows, links)
+    return {
+        "project": _serialize_project(project),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "days_beyond_end_date": max(0, (schedule.finish - project.end_date).days) if task_rows else 0,
+        **schedule.as_dict(),
+    }
+
+
+def summarize_by_discipline(project_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    project = _project_by_id(project_id)
+    return summarize_groups(summary_groups(project.id), "discipline")
 
 
 def summarize_by_user(project_id: Optional[int] = None) -> List[Dict[str, Any]]:
     project = _project_by_id(project_id)
-    statement = (
-        select(SluplanTask)
-        .options(joinedload(SluplanTask.assignee))
-        .where(SluplanTask.project_id == project.id)
-    )
-    summary: Dict[str, Dict[str, Any]] = {}
-    for task in db.session.execute(statement).scalars():
-        key = task.assignee.name if task.assignee else "Ikke tildelt"
-        entry = summary.setdefault(
-            key,
-            {
-                "user": key,
-                "task_count": 0,
-                "planned": 0,
-                "in_progress": 0,
-                "completed": 0,
-                "total_duration_days": 0,
-            },
-        )
-        entry["task_count"] += 1
-        entry[_status_bucket(task.status)] += 1
-        entry["total_duration_days"] += _task_duration_days(task)
-
-    result: List[Dict[str, Any]] = []
-    for item in summary.values():
-        count = item["task_count"] or 1
-        result.append(
-            {
-                **item,
-                "average_duration_days": round(item["total_duration_days"] / count, 2),
-            }
-        )
-    result.sort(key=lambda entry: entry["user"].lower())
-    return result
+    return summarize_groups(summary_groups(project.id), "user")
 
 
-def summarize_by_time_window(
-    project_id: Optional[int] = None,
-    from_value: Optional[str] = None,
-    to_value: Optional[str] = None,
-) -> Dict[str, Any]:
+def summarize_by_status(project_id: Optional[int] = None) -> Dict[str, Any]:
+    project = _project_by_id(project_id)
+    per_status = status_counts(summary_groups(project.id))
+    return {"total": sum(per_status.values()), "per_status": per_status}
+
+
+def verify_summary(project_id: Optional[int] = None, *, repair: bool = False) -> Dict[str, Any]:
+    """Sammenlign det lagrede sammendraget med en full utregning (og bygg om ved repair)."""
     project = _project_by_id(project_id)
+    report = check_consistency(project.id, repair=repair)
+    return {"generated_at": datetime.now(timezone.utc).isoformat(), **report}
+
+
+def _parse_time_window(from_value: Optional[str], to_value: Optional[str]) -> Tuple[date, date]:
     today = date.today()
 
     try:
@@ -970,20 +944,16 @@ def summarize_by_time_window(
 
     if end < start:
         start, end = end, start
+    return start, end
 
-    statement = (
-        select(SluplanTask)
-        .options(joinedload(SluplanTask.assignee), joinedload(SluplanTask.discipline))
-        .where(SluplanTask.project_id == project.id)
-    )
 
+def _time_window_payload(project: SluplanProject, start: date, end: date) -> Dict[str, Any]:
     planned = in_progress = completed = 0
     total_duration = 0
     tasks_payload: List[Dict[str, Any]] = []
 
-    for task in db.session.execute(statement).scalars():
-        if task.end_date < start or task.start_date > end:
-            continue
+    # Overlapp med vinduet filtreres og sorteres (start, tittel) i SQL
+    for task in time_window_tasks(project.id, start, end):
         bucket = _status_bucket(task.status)
         if bucket == "completed":
             completed += 1
@@ -992,7 +962,7 @@ def summarize_by_time_window(
         else:
             planned += 1
 
-        duration = _task_duration_days(task)
+        duration = _duration_from_dates(task.start_date, task.end_date)
         total_duration += duration
         tasks_payload.append(
             {
@@ -1000,16 +970,15 @@ def summarize_by_time_window(
                 "title": task.title,
                 "start": _iso_date(task.start_date),
                 "end": _iso_date(task.end_date),
-                "assignee": task.assignee.name if task.assignee else None,
-                "assignee_email": task.assignee.email if task.assignee else None,
+                "assignee": task.assignee,
+                "assignee_email": task.assignee_email,
                 "status": task.status,
-                "discipline": task.discipline.name if task.discipline else None,
+                "discipline": task.discipline,
                 "duration_days": duration,
             }
         )
 
     total_tasks = planned + in_progress + completed
-    tasks_payload.sort(key=lambda item: (item["start"], item["title"]))
 
     return {
         "project": _serialize_project(project),
@@ -1025,6 +994,39 @@ def summarize_by_time_window(
     }
 
 
+def summarize_by_time_window(
+    project_id: Optional[int] = None,
+    from_value: Optional[str] = None,
+    to_value: Optional[str] = None,
+) -> Dict[str, Any]:
+    project = _project_by_id(project_id)
+    start, end = _parse_time_window(from_value, to_value)
+    return _time_window_payload(project, start, end)
+
+
+def get_dashboard_snapshot(
+    project_id: Optional[int] = None,
+    from_value: Optional[str] = None,
+    to_value: Optional[str] = None,
+    reference_date: Optional[date] = None,
+) -> Dict[str, Any]:
+    """Alle rapportene i ett kall: lagrede grupper for status/fag/bruker, én spørring for
+    tidsvinduet og én for varsler (i stedet for å laste hele planen per rapport)."""
+    project = _project_by_id(project_id)
+    start, end = _parse_time_window(from_value, to_value)
+    groups = summary_groups(project.id)
+    per_status = status_counts(groups)
+    return {
+        "project": _serialize_project(project),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "summary": {"total": sum(per_status.values()), "per_status": per_status},
+        "by_discipline": summarize_groups(groups, "discipline"),
+        "by_user": summarize_groups(groups, "user"),
+        "time_window": _time_window_payload(project, start, end),
+        "alerts": _alerts_payload(project, reference_date or date.today()),
+    }
+
+
 def import_plan(payload: Dict[str, Any], *, project_id: Optional[int] = None) -> Dict[str, Any]:
     if not isinstance(payload, dict):
         raise ValueError("ugyldig_planformat")
@@ -1125,7 +1127,8 @@ def import_plan(payload: Dict[str, Any], *, project_id: Optional[int] = None) ->
         to_task = id_mapping.get(str(to_id))
         if not from_task or not to_task:
             continue
-        db.session.add(SluplanDependency(from_task=from_task, to_task=to_task, type=dependency.get("type") or "FS"))
+        dep_type, lag = parse_dependency_type(dependency.get("type"), dependency.get("lag"))
+        db.session.add(SluplanDependency(from_task=from_task, to_task=to_task, type=format_dependency_type(dep_type, lag)))
 
     db.session.commit()
     return get_plan_snapshot(project.id)
@@ -0,0 +1,233 @@
+"""SQL-aggregater for SluPlan-rapporter og dashbord.
+
+- grouped_counts(): én GROUP BY over (fag, type, ressurs, status) med antall og sum varighet;
+  per fag, per bruker og per status utledes fra disse radene (status tolkes med status_bucket).
+- time_window_tasks() / alert_tasks(): kun kolonnene rapportene bruker, filtrert på datoer i SQL.
+- ensure_indexes(): oppretter indeksene på sluplan_tasks/sluplan_dependencies også i
+  eksisterende databaser.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import case, cast, func, select, Integer
+
+from app.models.db import db
+from app.models.sluplan import SluplanDependency, SluplanDiscipline, SluplanPerson, SluplanTask
+
+_log = logging.getLogger(__name__)
+
+__all__ = [
+    "status_bucket",
+    "ensure_indexes",
+    "GroupRow",
+    "grouped_counts",
+    "summarize_groups",
+    "status_counts",
+    "time_window_tasks",
+    "alert_tasks",
+]
+
+ALERT_HORIZON_DAYS = 7
+
+_indexed: set = set()
+_index_lock = threading.Lock()
+
+
+def status_bucket(status: Optional[str]) -> str:
+    if not status:
+        return "planned"
+    normalized = status.strip().lower()
+    if normalized in {"ferdig", "done", "completed"}:
+        return "completed"
+    if normalized in {"pågår", "in progress", "in_progress", "progress"}:
+        return "in_progress"
+    return "planned"
+
+
+def ensure_indexes() -> None:
+    """Opprett manglende SluPlan-indekser én gang per database (CREATE INDEX IF NOT EXISTS)."""
+    engine = db.engine
+    key = str(engine.url)
+    if key in _indexed:
+        return
+    with _index_lock:
+        if key in _indexed:
+            return
+        try:
+            with engine.begin() as conn:
+                for table in (SluplanTask.__table__, SluplanDependency.__table__):
+                    for index in table.indexes:
+                        index.create(conn, checkfirst=True)
+        except Exception:
+            _log.warning("Kunne ikke opprette SluPlan-indekser", exc_info=True)
+        _indexed.add(key)
+
+
+def _duration_days():
+    """end - start + 1 (minst 1) som SQL-uttrykk, som _task_duration_days()."""
+    if db.engine.dialect.name == "sqlite":
+        delta = cast(func.julianday(SluplanTask.end_date) - func.julianday(SluplanTask.start_date), Integer)
+    else:
+        delta = SluplanTask.end_date - SluplanTask.start_date
+    return case((delta >= 0, delta + 1), else_=1)
+
+
+class GroupRow(NamedTuple):
+    discipline_id: Optional[int]
+    discipline: Optional[str]
+    kind: Optional[str]
+    assignee_id: Optional[int]
+    assignee: Optional[str]
+    status: Optional[str]
+    count: int
+    duration_days: int
+
+
+def grouped_counts(project_id: int, bind=None) -> List[GroupRow]:
+    """Antall og sum varighet per (fag, type, ressurs, status) for prosjektet.
+
+    bind: Connection/Session spørringen kjøres på (standard db.session).
+    """
+    ensure_indexes()
+    statement = (
+        select(
+            SluplanTask.discipline_id,
+            SluplanDiscipline.name,
+            SluplanTask.kind,
+            SluplanTask.assignee_id,
+            SluplanPerson.name,
+            SluplanTask.status,
+            func.count(SluplanTask.id),
+            func.sum(_duration_days()),
+        )
+        .select_from(SluplanTask)
+        .outerjoin(SluplanDiscipline, SluplanTask.discipline_id == SluplanDiscipline.id)
+        .outerjoin(SluplanPerson, SluplanTask.assignee_id == SluplanPerson.id)
+        .where(SluplanTask.project_id == project_id)
+        .group_by(
+            SluplanTask.discipline_id,
+            SluplanDiscipline.name,
+            SluplanTask.kind,
+            SluplanTask.assignee_id,
+            SluplanPerson.name,
+            SluplanTask.status,
+        )
+    )
+    return [GroupRow(*row[:6], int(row[6] or 0), int(row[7] or 0))
+            for row in (bind or db.session).execute(statement)]
+
+
+def _discipline_key(row: GroupRow) -> str:
+    if row.discipline_id is not None and row.discipline is not None:
+        return row.discipline
+    return row.kind.capitalize() if row.kind else "Annet"
+
+
+def _user_key(row: GroupRow) -> str:
+    return row.assignee if row.assignee_id is not None and row.assignee is not None else "Ikke tildelt"
+
+
+def summarize_groups(rows: Iterable[GroupRow], by: str) -> List[Dict[str, Any]]:
+    """Per fag (by="discipline") eller per bruker (by="user"), samme format som før."""
+    key_of = _discipline_key if by == "discipline" else _user_key
+    summary: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        key = key_of(row)
+        entry = summary.setdefault(
+            key,
+            {
+                by: key,
+                "task_count": 0,
+                "planned": 0,
+                "in_progress": 0,
+                "completed": 0,
+                "total_duration_days": 0,
+            },
+        )
+        entry["task_count"] += row.count
+        entry[status_bucket(row.status)] += row.count
+        entry["total_duration_days"] += row.duration_days
+
+    result: List[Dict[str, Any]] = []
+    for item in summary.values():
+        count = item["task_count"] or 1
+        result.append({**item, "average_duration_days": round(item["total_duration_days"] / count, 2)})
+    result.sort(key=lambda entry: entry[by].lower())
+    return result
+
+
+def status_counts(rows: Iterable[GroupRow]) -> Dict[str, int]:
+    """Antall per rå statusverdi ("ukjent" når tom), som /api/reports/summary."""
+    out: Dict[str, int] = {}
+    for row in rows:
+        key = row.status or "ukjent"
+        out[key] = out.get(key, 0) + row.count
+    return out
+
+
+@dataclass
+class TaskRow:
+    id: int
+    title: str
+    start_date: date
+    end_date: date
+    status: Optional[str]
+    kind: Optional[str]
+    assignee: Optional[str]
+    assignee_email: Optional[str]
+    discipline: Optional[str]
+
+
+def _task_rows(statement) -> List[TaskRow]:
+    return [TaskRow(*row) for row in db.session.execute(statement)]
+
+
+def _task_columns():
+    return (
+        select(
+            SluplanTask.id,
+            SluplanTask.title,
+            SluplanTask.start_date,
+            SluplanTask.end_date,
+            SluplanTask.status,
+            SluplanTask.kind,
+            SluplanPerson.name,
+            SluplanPerson.email,
+            SluplanDiscipline.name,
+        )
+        .select_from(SluplanTask)
+        .outerjoin(SluplanPerson, SluplanTask.assignee_id == SluplanPerson.id)
+        .outerjoin(SluplanDiscipline, SluplanTask.discipline_id == SluplanDiscipline.id)
+    )
+
+
+def time_window_tasks(project_id: int, start: date, end: date) -> List[TaskRow]:
+    """Oppgaver som overlapper [start, end], sortert på (start, tittel)."""
+    ensure_indexes()
+    return _task_rows(
+        _task_columns()
+        .where(
+            SluplanTask.project_id == project_id,
+            SluplanTask.start_date <= end,
+            SluplanTask.end_date >= start,
+        )
+        .order_by(SluplanTask.start_date, SluplanTask.title, SluplanTask.id)
+    )
+
+
+def alert_tasks(project_id: int, today: date) -> List[TaskRow]:
+    """Oppgaver med frist senest om ALERT_HORIZON_DAYS dager (ferdige filtreres av kalleren)."""
+    ensure_indexes()
+    return _task_rows(
+        _task_columns()
+        .where(
+            SluplanTask.project_id == project_id,
+            SluplanTask.end_date <= today + timedelta(days=ALERT_HORIZON_DAYS),
+        )
+        .order_by(SluplanTask.id)
+    )
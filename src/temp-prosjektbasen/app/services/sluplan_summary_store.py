@@ -0,0 +1,355 @@
+"""Materialisert SluPlan-sammendrag per prosjekt, oppdatert inkrementelt ved hver endring.
+
+- sluplan_summary_groups har én rad per (fag, type, ressurs, status) med antall og sum
+  varighet; sluplan_summaries markerer at prosjektet er bygget og holder totalen.
+- Mapper-hendelser på SluplanTask (insert/update/delete, også kaskader) samler differanser
+  i sesjonen; after_flush legger dem inn i samme transaksjon. Alle skrivestier i
+  sluplan_service (create_task, update_task_fields, reset/import) går via ORM-en.
+- summary_groups() leser bare de lagrede radene (antall grupper, ikke antall oppgaver) og
+  bygger prosjektet første gang det leses, i en egen transaksjon (forespørselens sesjon
+  committes ikke av en lesing).
+- check_consistency() regner ut på nytt fra sluplan_tasks og sammenligner, og kan bygge
+  om (repair). Endringer utenom ORM-en (Core/SQL direkte) fanges bare opp slik.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from app.models.db import db
+from app.models.sluplan import (
+    SluplanDiscipline, SluplanPerson, SluplanSummary, SluplanSummaryGroup, SluplanTask,
+)
+from app.services.sluplan_summary import GroupRow, grouped_counts
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["ensure_tables", "summary_groups", "rebuild_summary", "check_consistency"]
+
+# (project_id, discipline_id, kind, assignee_id, status); 0 = uten fag/ressurs
+Key = Tuple[int, int, str, int, str]
+
+_DELTAS = "sluplan_summary_deltas"
+# Sesjonen har flushet endringer som ikke er committet (og holder evt. skrivelåsen i SQLite)
+_PENDING = "sluplan_summary_pending"
+_FIELDS = ("project_id", "discipline_id", "kind", "assignee_id", "status", "start_date", "end_date")
+_TABLES = (SluplanSummary.__table__, SluplanSummaryGroup.__table__)
+# Kolonnene i uq_sluplan_summary_groups_key
+_GROUP_KEY = ("project_id", "discipline_id", "kind", "assignee_id", "status")
+# Dialekter med INSERT ... ON CONFLICT DO UPDATE
+_UPSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+_ready: set = set()
+_ready_lock = threading.Lock()
+
+
+def ensure_tables() -> None:
+    """Opprett sammendragstabellene én gang per database (create_all ved oppstart gjør det
+    også, men ikke for databaser som er satt opp uten denne modellen)."""
+    engine = db.engine
+    key = str(engine.url)
+    if key in _ready:
+        return
+    with _ready_lock:
+        if key in _ready:
+            return
+        with engine.begin() as conn:
+            for table in _TABLES:
+                table.create(conn, checkfirst=True)
+        _ready.add(key)
+
+
+def _has_tables(session: Session) -> bool:
+    key = str(session.get_bind().url)
+    if key in _ready:
+        return True
+    # Finnes ikke tabellene, er ingen prosjekter bygget og det er ingenting å oppdatere
+    if not inspect(session.connection()).has_table(SluplanSummary.__tablename__):
+        return False
+    _ready.add(key)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Inkrementell oppdatering
+# ---------------------------------------------------------------------------
+
+
+def _values(task: SluplanTask, old: bool) -> Dict[str, Any]:
+    values: Dict[str, Any] = {}
+    for name in _FIELDS:
+        history = get_history(task, name) if old else None
+        values[name] = history.deleted[0] if history is not None and history.deleted else getattr(task, name)
+    return values
+
+
+def _key_and_duration(values: Dict[str, Any]) -> Tuple[Key, int]:
+    key = (
+        values["project_id"],
+        values["discipline_id"] or 0,
+        values["kind"] or "",
+        values["assignee_id"] or 0,
+        values["status"] or "",
+    )
+    return key, max(0, (values["end_date"] - values["start_date"]).days) + 1
+
+
+def _add_delta(task: SluplanTask, values: Dict[str, Any], sign: int) -> None:
+    session = object_session(task)
+    if session is None or values["project_id"] is None:
+        return
+    key, duration = _key_and_duration(values)
+    entry = session.info.setdefault(_DELTAS, {}).setdefault(key, [0, 0])
+    entry[0] += sign
+    entry[1] += sign * duration
+
+
+@event.listens_for(SluplanTask, "after_insert")
+def _task_inserted(mapper, connection, task) -> None:
+    _add_delta(task, _values(task, old=False), 1)
+
+
+@event.listens_for(SluplanTask, "after_update")
+def _task_updated(mapper, connection, task) -> None:
+    before, after = _values(task, old=True), _values(task, old=False)
+    if _key_and_duration(before) != _key_and_duration(after):
+        _add_delta(task, before, -1)
+        _add_delta(task, after, 1)
+
+
+@event.listens_for(SluplanTask, "after_delete")
+def _task_deleted(mapper, connection, task) -> None:
+    _add_delta(task, _values(task, old=True), -1)
+
+
+def _add_to_group(conn, key: Key, count: int, duration: int) -> None:
+    """Legg differansen til gruppen, eller opprett den. Samtidige transaksjoner kan opprette
+    samme gruppe, så dette er én upsert (eller INSERT i savepoint + UPDATE ved konflikt)."""
+    groups = SluplanSummaryGroup.__table__
+    row = dict(zip(_GROUP_KEY, key), task_count=count, duration_days=duration)
+    upsert = _UPSERT.get(conn.dialect.name)
+    if upsert is not None:
+        statement = upsert(groups).values(**row)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=list(_GROUP_KEY),
+            set_={"task_count": groups.c.task_count + statement.excluded.task_count,
+                  "duration_days": groups.c.duration_days + statement.excluded.duration_days},
+        ))
+        return
+
+    match = [groups.c[name] == value for name, value in zip(_GROUP_KEY, key)]
+    added = update(groups).where(*match).values(
+        task_count=groups.c.task_count + count, duration_days=groups.c.duration_days + duration,
+    )
+    if conn.execute(added).rowcount:
+        return
+    try:
+        with conn.begin_nested():
+            conn.execute(groups.insert().values(**row))
+    except IntegrityError:
+        conn.execute(added)
+
+
+def _apply(session: Session, deltas: Dict[Key, List[int]]) -> None:
+    project_ids = {key[0] for key, (count, duration) in deltas.items() if count or duration}
+    if not project_ids or not _has_tables(session):
+        return
+    conn = session.connection()
+    built = set(conn.execute(
+        select(SluplanSummary.project_id).where(SluplanSummary.project_id.in_(project_ids))
+    ).scalars())
+    if not built:
+        return
+
+    groups = SluplanSummaryGroup.__table__
+    totals: Dict[int, int] = {}
+    for key, (count, duration) in deltas.items():
+        if key[0] not in built or not (count or duration):
+            continue
+        totals[key[0]] = totals.get(key[0], 0) + count
+        _add_to_group(conn, key, count, duration)
+
+    conn.execute(delete(groups).where(groups.c.project_id.in_(built), groups.c.task_count <= 0))
+    summaries = SluplanSummary.__table__
+    for project_id, count in totals.items():
+        conn.execute(
+            update(summaries).where(summaries.c.project_id == project_id).values(
+                task_count=summaries.c.task_count + count, updated_at=datetime.utcnow(),
+            )
+        )
+
+
+@event.listens_for(Session, "after_flush")
+def _session_flushed(session: Session, flush_context) -> None:
+    session.info[_PENDING] = True
+    deltas = session.info.pop(_DELTAS, None)
+    if deltas:
+        _apply(session, deltas)
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _session_rolled_back(session: Session, previous_transaction) -> None:
+    session.info.pop(_DELTAS, None)
+    session.info.pop(_PENDING, None)
+
+
+# ---------------------------------------------------------------------------
+# Lesing, bygging og kontroll
+# ---------------------------------------------------------------------------
+
+
+def _actual_groups(project_id: int, bind=None) -> Dict[Key, List[int]]:
+    actual: Dict[Key, List[int]] = {}
+    for row in grouped_counts(project_id, bind):
+        key = (project_id, row.discipline_id or 0, row.kind or "", row.assignee_id or 0, row.status or "")
+        entry = actual.setdefault(key, [0, 0])
+        entry[0] += row.count
+        entry[1] += row.duration_days
+    return actual
+
+
+def _stored_groups(project_id: int) -> Dict[Key, List[int]]:
+    statement = select(
+        SluplanSummaryGroup.discipline_id,
+        SluplanSummaryGroup.kind,
+        SluplanSummaryGroup.assignee_id,
+        SluplanSummaryGroup.status,
+        SluplanSummaryGroup.task_count,
+        SluplanSummaryGroup.duration_days,
+    ).where(SluplanSummaryGroup.project_id == project_id)
+    return {
+        (project_id, discipline_id, kind, assignee_id, status): [count, duration]
+        for discipline_id, kind, assignee_id, status, count, duration in db.session.execute(statement)
+    }
+
+
+def _stored_total(project_id: int):
+    """Lagret total, eller None når prosjektet ikke er bygget."""
+    return db.session.execute(
+        select(SluplanSummary.task_count).where(SluplanSummary.project_id == project_id)
+    ).scalar_one_or_none()
+
+
+def _rebuild(bind, project_id: int) -> int:
+    actual = _actual_groups(project_id, bind)
+    bind.execute(delete(SluplanSummaryGroup).where(SluplanSummaryGroup.project_id == project_id))
+    bind.execute(delete(SluplanSummary).where(SluplanSummary.project_id == project_id))
+    if actual:
+        bind.execute(SluplanSummaryGroup.__table__.insert(), [
+            {"project_id": project_id, "discipline_id": key[1], "kind": key[2], "assignee_id": key[3],
+             "status": key[4], "task_count": count, "duration_days": duration}
+            for key, (count, duration) in actual.items()
+        ])
+    total = sum(count for count, _ in actual.values())
+    bind.execute(SluplanSummary.__table__.insert().values(project_id=project_id, task_count=total))
+    return total
+
+
+def rebuild_summary(project_id: int) -> int:
+    """Bygg sammendraget for prosjektet fra sluplan_tasks (uten commit). Gir antall oppgaver."""
+    ensure_tables()
+    return _rebuild(db.session, project_id)
+
+
+def summary_groups(project_id: int) -> List[GroupRow]:
+    """Lagrede grupper for prosjektet (samme format som grouped_counts()); bygges ved første lesing.
+
+    Byggingen skjer i en egen transaksjon, så forespørselens sesjon committes ikke. Har sesjonen
+    flushet endringer som ikke er committet, regnes det ut fra sesjonen i stedet (en egen
+    transaksjon ville ikke sett dem, og i SQLite ventet på sesjonens skrivelås).
+    """
+    ensure_tables()
+    if _stored_total(project_id) is None:
+        if db.session.info.get(_PENDING):
+            return grouped_counts(project_id)
+        try:
+            with db.engine.begin() as conn:
+                _rebuild(conn, project_id)
+        except IntegrityError:
+            pass  # En annen forespørsel bygde samtidig; bruk den
+        if _stored_total(project_id) is None:
+            return grouped_counts(project_id)
+
+    statement = (
+        select(
+            SluplanSummaryGroup.discipline_id,
+            SluplanDiscipline.name,
+            SluplanSummaryGroup.kind,
+            SluplanSummaryGroup.assignee_id,
+            SluplanPerson.name,
+            SluplanSummaryGroup.status,
+            SluplanSummaryGroup.task_count,
+            SluplanSummaryGroup.duration_days,
+        )
+        .select_from(SluplanSummaryGroup)
+        .outerjoin(SluplanDiscipline, SluplanSummaryGroup.discipline_id == SluplanDiscipline.id)
+        .outerjoin(SluplanPerson, SluplanSummaryGroup.assignee_id == SluplanPerson.id)
+        .where(SluplanSummaryGroup.project_id == project_id)
+    )
+    return [
+        GroupRow(discipline_id or None, discipline, kind, assignee_id or None, assignee, status, count, duration)
+        for discipline_id, discipline, kind, assignee_id, assignee, status, count, duration in db.session.execute(
+            statement
+        )
+    ]
+
+
+def _describe(key: Key, stored: Iterable[int], actual: Iterable[int]) -> Dict[str, Any]:
+    _, discipline_id, kind, assignee_id, status = key
+    stored_count, stored_duration = stored
+    actual_count, actual_duration = actual
+    return {
+        "discipline_id": discipline_id or None,
+        "kind": kind,
+        "assignee_id": assignee_id or None,
+        "status": status,
+        "stored": {"task_count": stored_count, "duration_days": stored_duration},
+        "actual": {"task_count": actual_count, "duration_days": actual_duration},
+    }
+
+
+def check_consistency(project_id: int, repair: bool = False) -> Dict[str, Any]:
+    """Sammenlign lagret sammendrag med en ny utregning; bygg om ved avvik når repair=True."""
+    ensure_tables()
+    stored_total = _stored_total(project_id)
+    actual = _actual_groups(project_id)
+    stored = _stored_groups(project_id) if stored_total is not None else {}
+    mismatches = [
+        _describe(key, stored.get(key, (0, 0)), actual.get(key, (0, 0)))
+        for key in sorted(set(stored) | set(actual))
+        if list(stored.get(key, (0, 0))) != list(actual.get(key, (0, 0)))
+    ]
+    actual_total = sum(count for count, _ in actual.values())
+    consistent = stored_total is not None and not mismatches and stored_total == actual_total
+
+    repaired = False
+    if repair and not consistent:
+        if stored_total is not None:
+            _log.warning("SluPlan-sammendrag for prosjekt %s avviker (%d grupper); bygger om",
+                         project_id, len(mismatches))
+        rebuild_summary(project_id)
+        db.session.commit()
+        repaired = True
+
+    return {
+        "project_id": project_id,
+        "built": stored_total is not None,
+        "consistent": consistent,
+        "stored_total": stored_total,
+        "actual_total": actual_total,
+        "mismatches": mismatches,
+        "repaired": repaired,
+    }
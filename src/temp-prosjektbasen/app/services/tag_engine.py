@@ -0,0 +1,333 @@
+"""Felles motor for TFM-komponenttagger (+byggnr=system-komponent%typekode).
+
+Brukes av systemkomponent, merkeskilt, masseliste, protokoller og dokumentsammenligning.
+- compile_format(mal, dialekt) bygger regex fra en formatmal én gang og cacher resultatet
+  per (mal, dialekt). To dialekter, som i rutene fra før:
+  * STRICT ({byggnr}{system}{komponent}{typekode} fra systemkomponent): prefiks og innhold
+    fanges hver for seg; feltene i Tag er uten prefiks.
+  * LOOSE (merkeskilt/masseliste): plassholderne erstattes direkte; feltene i Tag er med
+    prefiks ('+', '=', '-', '%'/'/'), "" når plassholderen ikke er i malen.
+- MASTER_GENERIC/MASTER_PDF: faste mønstre for protokoller (tolerant/streng), med
+  reserve-søk etter komponent i full_tag og komponent i store bokstaver.
+- TagPattern.scan() strømmer over tekstbiter eller byte-buffere (inkrementell UTF-8) og gir
+  samme tagger som finditer() over hele teksten: mønstre som ikke kan gå over linjeskift
+  skannes linje for linje etter hvert som bitene kommer, andre samles opp først.
+  scan_batches() gir de samme taggene gruppert per innlest bit.
+- TFM_DICT: én felles ordbok for TFM-koder (to bokstaver → beskrivelse).
+"""
+from __future__ import annotations
+
+import codecs
+import re
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+__all__ = [
+    "TFM_DICT", "Tag", "TagPattern", "STRICT", "LOOSE", "MASTER_GENERIC", "MASTER_PDF",
+    "compile_format", "pattern_for_filename", "tfm_desc",
+]
+
+TFM_DICT: Dict[str, str] = {
+    "AB": "Bjelke", "AD": "Dekker", "AE": "Elementer", "AF": "Fagverk", "AG": "Glassfelt", "AH": "Fundamenter",
+    "AK": "Komplette konstruksjoner", "AL": "List - Beslistning", "AO": "Oppbygende - Utforende",
+    "AP": "Plate", "AR": "Ramme - Oppheng", "AS": "Søyle", "AU": "Åpninger", "AV": "Vegg",
+    "BA": "Armering Forsterkning", "BB": "Beskyttende - Stoppende", "BC": "Begrensende", "BF": "Fuging",
+    "BG": "Pakning Tetning", "BI": "Isolasjon", "BP": "Avretningsmasse", "BS": "Spikerslag", "CB": "Balkong",
+    "CC": "Baldakin", "CD": "Karnapp", "CG": "Rampe - Repos", "CK": "Komplett konstruksjon",
+    "CM": "Kjemiske stoffer", "CO": "Kobling Overgang", "CP": "Pipe - Skostein", "CQ": "Festemateriell",
+    "CR": "Rammeverk - Oppheng", "CT": "Trapp - Leider", "CX": "Tunnel - Bru (inne-ute)",
+    "DB": "Dør med brannklasse", "DF": "Foldedør - Foldevegg", "DI": "Dør - innvendig",
+    "DK": "Kjøretøyregulering", "DL": "Luke", "DP": "Port", "DT": "Dør - tilfluktsrom", "DU": "Dør - utvendig",
+    "DV": "Vindu", "EB": "Overflatebekledning", "EC": "Overflatebehandling", "EH": "Himling",
+    "FA": "Ventilert arbeidsplass", "FB": "Benk - Bord - Plate - Tavle", "FC": "Beslag",
+    "FD": "Disk - Skranke", "FF": "Fryserom", "FH": "Hylle - Reol", "FI": "Kabinett",
+    "FK": "Kjølerom - Svalrom", "FO": "Sittebenk - Sofa - Stol", "FR": "Rom", "FS": "Skap - Skuff",
+    "FT": "Speil", "FV": "Vaskemaskin", "FX": "Krok - Knagg - Håndtak", "GA": "Automat - Maskin",
+    "GB": "Benk - Bord - Plate - Tavle", "GD": "Dekontamator", "GE": "Autoklaver", "GF": "Fryseskap",
+    "GG": "Gardiner - Forheng", "GH": "Hylle - Reol", "GK": "Kjøleskap - Kjøledisk", "GL": "Lås - Beslag",
+    "GM": "Mattilbereding", "GN": "Nøkler", "GO": "Sofa - Sittebenk", "GP": "Stol", "GQ": "Seng - Liggebenk",
+    "GS": "Skap - Skuffer", "GT": "Tørkeskap - Varmeskap", "GV": "Vaskemaskin", "GW": "Vekt", "GX": "Holder",
+    "GY": "Avfallsbeholder", "HA": "Automobil - Bil", "HB": "Rullebord - Tralle", "HC": "Container - Vogn",
+    "HM": "Maskin", "HS": "Rullestol", "HT": "Truck - kran", "HV": "Verktøy", "IB": "Brenner",
+    "IC": "Solceller-solfangere", "ID": "Kjel for destruksjon", "IE": "Elektrokjel",
+    "IF": "Kjel for fast-bio brensel", "IG": "Generator", "IK": "Kuldeaggregat", "IL": "Energibrønn",
+    "IM": "Motor", "IO": "Oljekjel", "IP": "Gasskjel", "IT": "Trykkluftaggregat (enhet)", "IU": "Turbin",
+    "IV": "Aggregatenhet", "JF": "Forsterker", "JK": "Kompressor", "JP": "Pumpe",
+    "JQ": "Pumpe i VA-installasjoner", "JV": "Vifte", "JW": "Spesialvifte", "KA": "Aktuator",
+    "KD": "Drivhjul - Drev", "KE": "Induktiv energioverføring", "KG": "Gjennomføring",
+    "KH": "Transportenhet (hevende forflyttende)", "KJ": "Jordingskomponenter", "KK": "Kanal",
+    "KM": "Mast - Antenne", "KN": "Nedløp", "KO": "Kraftoverføring", "KQ": "Rør - spesielt",
+    "KR": "Rør - generelt", "KS": "Skinne - Bane - Spor", "KU": "Kombinert kabel",
+    "KV": "Høyspenningskabel > 1000V", "KW": "Lavspenningskabel 50 til 1000V", "KX": "Lavspenningskabel < 50V",
+    "KY": "Optisk kabel", "KZ": "Slange", "LB": "Varmeomformende med vifte", "LC": "Kjøleomformende med vifte",
+    "LD": "Kjøleflater", "LE": "Kondensator", "LF": "Fordamper", "LG": "Gear clutch", "LH": "Varmeflate",
+    "LI": "Varmeelement", "LK": "Kjøleomformende", "LL": "Lyskilde", "LN": "Likeretter", "LO": "Omformer",
+    "LP": "Pens - Veksel - Sjalter", "LQ": "Vekselretter", "LR": "Frekvensomformer", "LS": "Strålevarme",
+    "LU": "Luftfukter", "LV": "Varmeomformende", "LX": "Varmegjenvinner", "LZ": "Varmerkabel - Varmerør",
+    "MA": "Absoluttfilter", "MB": "ABC-filter", "MC": "UV-filter", "ME": "Elektrostatiske filter",
+    "MF": "Luftfilter", "MG": "Fettfilter", "MK": "Kondenspotte", "ML": "Luftutskiller", "MM": "Membran",
+    "MO": "Utskiller", "MR": "Rist - Sil", "MS": "Syklon", "MT": "Tørke",
+    "MU": "Filter for Lyd - Bilde - Frekvensutjevner", "MV": "Vannfilter", "MX": "Støyfilter",
+    "NB": "Batteri - UPS", "NC": "Kondensator", "NI": "Informasjonslagring", "NK": "Kum",
+    "NM": "Badekar - Basseng", "NO": "Åpen tank", "NT": "Tank med trykk", "NU": "Tank uten trykk",
+    "NV": "Vekt Lodd", "NW": "Varmtvannsbereder", "NX": "Toalett", "NY": "Servant",
+    "NZ": "Brannslukkingsapparat", "OA": "AV-maskiner", "OB": "Shuntgruppe", "OD": "Datamaskin",
+    "OE": "Energimåler", "OF": "Systembærer", "OM": "Mottaker - Sender", "OP": "PBX",
+    "OQ": "Dataprogramprogramvare", "OR": "Router Fordeler", "OS": "Sentralenhet Mikser i Lydsystem",
+    "OT": "Telefonapparat", "OU": "Undersentral", "QB": "Belastningsvakt", "QD": "Differansetrykkvakt",
+    "QE": "Elektrisk vern", "QF": "Strømningsvakt", "QG": "", "QH": "Fuktvakt", "QI": "", "QJ": "", "QK": "",
+    "QL": "Lyddemper", "QM": "Mekanisk beskyttelse", "QN": "Nivåvakt", "QO": "Overtrykksventil",
+    "QP": "Trykkvakt", "QQ": "Vibrasjonsvakt", "QR": "Rotasjonsvakt", "QS": "Strømvakt",
+    "QT": "Temperaturvakt", "QU": "", "QV": "Sikkerhetsventil", "QW": "", "QX": "Solavskjerming",
+    "QY": "Lynavleder", "QZ": "Brannvern", "RA": "AV-opptaker", "RB": "Bevegelse", "RC": "Seismometer",
+    "RD": "Differansetrykkgiver", "RE": "Elektriske variabler", "RF": "Strømningsmåler",
+    "RG": "Posisjon - Lengde", "RH": "Fuktighetsgiver", "RI": "Termometer", "RJ": "Fotocelle",
+    "RK": "Kortleser", "RL": "", "RM": "Multifunksjonell Kombinert føler", "RN": "Nivågiver", "RO": "",
+    "RP": "Trykkgiver", "RQ": "Manometer Trykkmåler", "RR": "Giver generelt", "RS": "Hastighetsmåler",
+    "RT": "Temperaturgiver", "RU": "Ur", "RV": "Veieceller", "RW": "Virkningsgradsmåler", "RX": "Målepunkt",
+    "RY": "Gassdetektor-Røykdetektor", "RZ": "Branndeteksjon", "SA": "Reguleringsventil manuell",
+    "SB": "Reguleringsventil motorstyrt", "SC": "Stengeventil motorstyrt", "SD": "Alarmventil sprinkler",
+    "SE": "Ekspansjonsventil", "SF": "Fraluftsventil", "SG": "Tilbakeslagsventil - Overtrykkspjeld",
+    "SH": "Hurtigkobling", "SI": "Effektregulator", "SJ": "Jevntrykksventil",
+    "SK": "Strømningsregulator - CAV", "SL": "", "SM": "Stengeventil manuell", "SN": "", "SO": "",
+    "SP": "Trykkutjevningsventil", "SQ": "Strømningsregulator - VAV", "SR": "Reguleringsspjeld",
+    "SS": "Stengespjeld", "ST": "Tilluftsventil", "SU": "Sugetrykksventil", "SV": "Strupeventil",
+    "SW": "Plenumskammer", "SX": "Regulator", "SY": "", "SZ": "Brannspjeld - Røykspjeld", "UA": "Uttak alarm",
+    "UB": "Blandebatteri", "UC": "", "UD": "Uttak data", "UE": "Uttak el", "UF": "Fellesuttak",
+    "UG": "Uttak gass", "UH": "Høyttaler", "UI": "", "UJ": "Skriver", "UK": "Kontrollpanel - Tablå",
+    "UL": "Uttak trykkluft", "UM": "Monitor - Display", "UN": "Nødbelysning", "UO": "Trommel",
+    "UP": "Belysningsarmatur", "UQ": "", "UR": "Uttak radio", "US": "Stasjon", "UT": "Uttak telefon", "UU": "",
+    "UV": "Uttak vann", "UW": "", "UX": "Koblingsboks", "UY": "Uttak antenne", "UZ": "Dyse - Spreder",
+    "VA": "", "VB": "Bærelag", "VC": "", "VD": "Dekke", "VE": "", "VF": "", "VG": "Gress", "VH": "", "VI": "",
+    "VJ": "", "VK": "Kantstein heller", "VL": "Masse", "VM": "Mekanisk beskyttelse", "VN": "", "VO": "",
+    "VP": "Planterbuskertrær", "VQ": "", "VR": "", "VS": "Skilt", "VT": "", "VU": "", "VV": "", "VW": "",
+    "VX": "", "VY": "", "VZ": "", "XA": "", "XB": "", "XC": "Kondensator", "XD": "Komp. for binærlogikk",
+    "XE": "", "XF": "Komponenter for vern", "XG": "Komponenter for krafttilførsel",
+    "XH": "Komponenter for signalering", "XI": "Potensiometer", "XJ": "", "XK": "Releer - Kontaktorer",
+    "XL": "Induktiv komponenter", "XM": "Motor", "XN": "Integrerte kretser", "XO": "Urbryter - Timer",
+    "XP": "Komponenter for måling og prøving", "XQ": "Effektbryter", "XR": "Motstand", "XS": "Bryter / Vender",
+    "XT": "Transformator", "XU": "", "XV": "Halvlederkomponenter og elektronrør", "XW": "",
+    "XX": "Rekkeklemmer - Samlesignal", "XY": "", "XZ": "Terminering og tilpasning", "YA": "", "YB": "",
+    "YC": "", "YD": "", "YE": "", "YF": "", "YG": "", "YH": "", "YI": "", "YJ": "", "YK": "", "YL": "",
+    "YM": "", "YN": "", "YO": "", "YP": "", "YQ": "", "YR": "", "YS": "", "YT": "", "YU": "", "YV": "",
+    "YW": "", "YX": "", "YY": "", "YZ": "", "ZA": "", "ZB": "", "ZC": "", "ZD": "", "ZE": "", "ZF": "",
+    "ZG": "", "ZH": "", "ZI": "", "ZJ": "", "ZK": "", "ZL": "", "ZM": "", "ZN": "", "ZO": "", "ZP": "",
+    "ZQ": "", "ZR": "", "ZS": "", "ZT": "", "ZU": "", "ZV": "", "ZW": "", "ZX": "", "ZY": "", "ZZ": "",
+}
+
+
+def tfm_desc(code: str, default: str = "Ukjent") -> str:
+    """Beskrivelse for TFM-koden (to første tegn, store bokstaver)."""
+    return TFM_DICT.get((code or "")[:2].upper(), default)
+
+
+STRICT = "strict"
+LOOSE = "loose"
+MASTER = "master"
+
+_FIELDS = ("byggnr", "system", "komponent", "typekode")
+
+
+class Tag(NamedTuple):
+    byggnr: str
+    system: str
+    komponent: str
+    typekode: str
+    full: str       # hele treffet (full_tag, strippet, for MASTER)
+
+
+# STRICT: prefiks og innhold fanges hver for seg (tidligere build_dynamic_regex)
+_STRICT_PARTS = {
+    "{byggnr}": r"(?P<byggnr_prefix>\++)(?P<byggnr>[A-Za-z0-9]+)",
+    "{system}": r"(?:(?P<system_prefix>=)(?P<system>[^-\s%\n]+))?",
+    "{komponent}": r"(?P<komponent_prefix>-)(?P<komponent>[^\s%\n]+)",
+    "{typekode}": r"(?:(?P<typekode_prefix>%)(?P<typekode>\S+))?",
+}
+# LOOSE: plassholder → gruppe med prefiks (tidligere merkeskilt/masseliste)
+_LOOSE_PARTS = {
+    "{byggnr}": r"(?P<byggnr>\+[A-Za-z0-9]+)",
+    "{system}": r"(?P<system>=[^-]+)",
+    "{komponent}": r"(?P<komponent>-[^%]+)",
+    "{typekode}": r"(?P<typekode>[%/].+)",
+}
+
+# MASTER: komponent-mønster med 2–4 bokstaver, fleksibel tallblokk og valgfri /NNN.
+# Alle deler er valgfrie, så et treff er ikke-tomt bare hvis minst én del kan starte der.
+# Oppslaget (?=...) foran krever nettopp det; tomme treff gir aldri tagger, så resultatet blir
+# det samme, men regex-motoren hopper over vanlig tekst uten å lage treff-objekter.
+_MASTER_KOMPONENT_HEAD = r"-?[A-Za-z]{2,4}[A-Za-z0-9]{0,6}\d{2,5}"
+_MASTER_KOMPONENT = r"(?:-?(?P<komponent>([A-Za-z]{2,4})[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9/]*))?"
+# GENERELL (Excel/Doc/Txt) – tolerant
+_MASTER_GENERIC_RX = re.compile(
+    r"(?=\+[A-Z0-9]|=[\d.:/]|%[A-Z0-9./:_-]|" + _MASTER_KOMPONENT_HEAD + r")"
+    r"(?P<full_tag>"
+    r"(?:\+(?P<byggnr>[A-Z0-9]+))?"                 # +BYGG
+    r"(?:=(?P<system>[\d.:/]+))?"                   # =SYSTEM (tolerant; støtter kolon)
+    + _MASTER_KOMPONENT                             # -LK009T/001
+    + r"(?:%(?P<typekode>[A-Z0-9./:_-]+))?"         # %TYPE (tolerant)
+    r")",
+    re.IGNORECASE,
+)
+# STRENG (PDF) – system strengt (0000.0000)
+_MASTER_PDF_RX = re.compile(
+    r"(?=\+[^=\s+]+=(?=\d)|=\b\d{3,4}\.\d{3,4}\b|%[^\s+]|" + _MASTER_KOMPONENT_HEAD + r")"
+    r"(?P<full_tag>"
+    r"(?:\+(?P<pdf_byggnr>[^=\s+]+)=(?=\d))?"       # +BYGGNR=
+    r"(?:=(?P<pdf_system>\b\d{3,4}\.\d{3,4}\b))?"   # =000.000 / 0000.0000 / ...
+    + _MASTER_KOMPONENT
+    + r"(?:%(?P<pdf_typekode>[^\s+]+))?"            # %TYPE til whitespace eller '+'
+    r")",
+    re.IGNORECASE,
+)
+# Reserve: "siste bindestrek + komponent" i full_tag
+_MASTER_FALLBACK = re.compile(
+    r"-([A-Za-z]{2,4}[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9]*?(?:/[0-9]{1,4})?)(?=$|[\s,.;:\)\]\}])",
+    re.IGNORECASE,
+)
+
+Source = Union[str, bytes, bytearray, memoryview, Iterable[Union[str, bytes, bytearray, memoryview]]]
+
+
+class TagPattern:
+    """Kompilert tag-mønster. Lages via compile_format() (cachet) eller MASTER_*."""
+
+    __slots__ = ("fmt", "dialect", "regex", "has_system", "line_safe", "_to_tag")
+
+    def __init__(self, regex: re.Pattern, fmt: str = "", dialect: str = STRICT,
+                 groups: Tuple[str, ...] = _FIELDS, line_safe: bool = True):
+        self.fmt = fmt
+        self.dialect = dialect
+        self.regex = regex
+        self.has_system = "{system}" in fmt
+        self.line_safe = line_safe
+        idx = [regex.groupindex.get(g) for g in groups]
+        if dialect == MASTER:
+            self._to_tag = _master_converter(idx)
+        else:
+            # Ett C-kall per treff: groups("") + "" bakerst for felt som ikke er i malen.
+            # Feltene i STRICT kan ikke inneholde mellomrom, så ingen strip er nødvendig.
+            pick = itemgetter(*[i - 1 if i else -1 for i in idx])
+            make = Tag._make
+
+            def to_tag(m: re.Match) -> Tag:
+                return make((*pick(m.groups("") + ("",)), m.group()))
+
+            self._to_tag = to_tag
+
+    def __repr__(self) -> str:
+        return f"TagPattern({self.dialect}, {self.fmt!r})"
+
+    def finditer(self, text: str) -> Iterator[Tag]:
+        """Tagger i teksten, i rekkefølge."""
+        tags = map(self._to_tag, self.regex.finditer(text or ""))
+        # MASTER gir None for treff uten komponent
+        return filter(None, tags) if self.dialect == MASTER else tags
+
+    def search(self, text: str) -> Optional[Tag]:
+        m = self.regex.search(text or "")
+        return self._to_tag(m) if m else None
+
+    def match(self, text: str) -> Optional[Tag]:
+        m = self.regex.match(text or "")
+        return self._to_tag(m) if m else None
+
+    def scan(self, source: Source, encoding: str = "utf-8") -> Iterator[Tag]:
+        """Strøm tagger fra tekst, bytes eller en iterator av tekst-/byte-biter.
+
+        Bytes dekodes inkrementelt (errors="ignore"), så tegn delt mellom buffere blir hele.
+        Resultatet er det samme som finditer() over hele den sammensatte teksten.
+        """
+        for batch in self.scan_batches(source, encoding):
+            yield from batch
+
+    def scan_batches(self, source: Source, encoding: str = "utf-8") -> Iterator[List[Tag]]:
+        """Som scan(), men én liste per innlest bit (tom når biten ikke ga ferdige treff).
+
+        Lar kallere sende resultater videre bit for bit (f.eks. side for side i en PDF).
+        """
+        if isinstance(source, (str, bytes, bytearray, memoryview)):
+            source = (source,)
+        decoder = None
+        pending: list = []
+        for chunk in source:
+            if not isinstance(chunk, str):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+                chunk = decoder.decode(chunk)
+            cut = chunk.rfind("\n") + 1 if self.line_safe else 0
+            if not cut:
+                if chunk:
+                    pending.append(chunk)
+                yield []
+                continue
+            pending.append(chunk[:cut])
+            yield list(self.finditer("".join(pending)))
+            pending = [chunk[cut:]]
+        if decoder is not None:
+            pending.append(decoder.decode(b"", final=True))
+        yield list(self.finditer("".join(pending)))
+
+
+def _master_converter(idx) -> Callable[[re.Match], Optional[Tag]]:
+    i_bygg, i_sys, i_komp, i_type, i_full = idx
+
+    def to_tag(m: re.Match) -> Optional[Tag]:
+        full = m.group(i_full)
+        if not full:
+            return None
+        full = full.strip()
+        komp = m.group(i_komp)
+        if not komp:
+            fb = _MASTER_FALLBACK.search(full)
+            if fb:
+                komp = fb.group(1)
+        if not komp:
+            return None
+        return Tag((m.group(i_bygg) or "").strip(), (m.group(i_sys) or "").strip(),
+                   komp.strip().upper(), (m.group(i_type) or "").strip(), full)
+
+    return to_tag
+
+
+MASTER_GENERIC = TagPattern(_MASTER_GENERIC_RX, "generell", MASTER,
+                            groups=("byggnr", "system", "komponent", "typekode", "full_tag"))
+MASTER_PDF = TagPattern(_MASTER_PDF_RX, "pdf", MASTER,
+                        groups=("pdf_byggnr", "pdf_system", "komponent", "pdf_typekode", "full_tag"))
+
+
+def pattern_for_filename(filename: Optional[str]) -> TagPattern:
+    """MASTER-mønster etter filtype (PDF => streng)."""
+    return MASTER_PDF if (filename or "").lower().endswith(".pdf") else MASTER_GENERIC
+
+
+def _build_regex(fmt: str, parts: Dict[str, str]) -> str:
+    out = []
+    i = 0
+    while i < len(fmt):
+        for ph, sub in parts.items():
+            if fmt.startswith(ph, i):
+                out.append(sub)
+                i += len(ph)
+                break
+        else:
+            out.append(re.escape(fmt[i]))
+            i += 1
+    return "".join(out)
+
+
+@lru_cache(maxsize=256)
+def compile_format(fmt: str, dialect: str = STRICT) -> TagPattern:
+    """Kompiler formatmalen én gang per (mal, dialekt). Kaster re.error ved ugyldig mal."""
+    if dialect == STRICT:
+        rx = _build_regex(fmt, _STRICT_PARTS)
+        line_safe = "\n" not in fmt
+    elif dialect == LOOSE:
+        # Uendret tolkning: resten av malen brukes som regex
+        rx = fmt
+        for ph, sub in _LOOSE_PARTS.items():
+            rx = rx.replace(ph, sub)
+        line_safe = False       # [^-]+ / [^%]+ (og regex i malen) kan gå over linjeskift
+    else:
+        raise ValueError(f"Ukjent dialekt: {dialect}")
+    return TagPattern(re.compile(rx), fmt, dialect, line_safe=line_safe)
@@ -0,0 +1,158 @@
+"""Prosessvid cache for TFM-referansedata (data/tfm.xlsx, tfm-settings*.json).
+
+Tabellene endres nesten aldri, men ble tidligere lest på nytt (tfm.xlsx via pandas) i hver
+forespørsel. Her leses hver fil én gang per prosess og holdes i minnet til filen endres:
+- Nøkkel: reell filsti; signatur: (st_mtime_ns, st_size). Ny signatur → lest på nytt.
+- Lagring via appen kaller invalidate(path), så endringer innenfor samme mtime-oppløsning
+  og med samme størrelse også blir sett.
+- Lesefeil caches ikke (neste kall prøver igjen), og gir samme tomme resultat som før.
+
+Verdiene deles mellom forespørsler og tråder og er skrivebeskyttet (MappingProxyType/tupler).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, Union
+
+_log = logging.getLogger(__name__)
+
+__all__ = [
+    "TFM_XLSX", "TFM_SETTINGS", "TfmMapping",
+    "load_tfm_mapping", "load_tfm_settings", "load_json", "invalidate", "cache_info",
+]
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+TFM_XLSX = DATA_DIR / "tfm.xlsx"
+TFM_SETTINGS = DATA_DIR / "tfm-settings.json"
+
+PathLike = Union[str, os.PathLike]
+Signature = Optional[Tuple[int, int]]
+
+_lock = threading.Lock()
+_cache: Dict[Tuple[str, str], Tuple[Signature, Any]] = {}
+_stats = {"hits": 0, "loads": 0}
+
+
+@dataclass(frozen=True)
+class TfmMapping:
+    rows: Tuple[Tuple[str, str], ...] = ()      # (kode, beskrivelse) i filrekkefølge
+    lookup: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+
+    def __bool__(self) -> bool:
+        return bool(self.rows)
+
+    def describe(self, code: str, default: str = "Ikke i bruk") -> str:
+        return self.lookup.get(code, default)
+
+
+def _key(kind: str, path: PathLike) -> Tuple[str, str]:
+    return kind, os.path.realpath(path)
+
+
+def _signature(path: str) -> Signature:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _cached(kind: str, path: PathLike, loader: Callable[[str], Any]) -> Any:
+    key = _key(kind, path)
+    sig = _signature(key[1])
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None and hit[0] == sig:
+            _stats["hits"] += 1
+            return hit[1]
+    value = loader(key[1])          # utenfor låsen; kan kaste (caches ikke)
+    with _lock:
+        _cache[key] = (sig, value)
+        _stats["loads"] += 1
+    return value
+
+
+def invalidate(path: Optional[PathLike] = None) -> None:
+    """Glem cachede verdier for filen (alle filer uten argument)."""
+    with _lock:
+        if path is None:
+            _cache.clear()
+            return
+        real = os.path.realpath(path)
+        for key in [k for k in _cache if k[1] == real]:
+            del _cache[key]
+
+
+def cache_info() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "entries": len(_cache)}
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# tfm.xlsx: kode → beskrivelse
+# ────────────────────────────────────────────────────────────────────────────────
+def _read_tfm_mapping(path: str) -> TfmMapping:
+    import pandas as pd
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Mangler fil: {path}")
+    try:
+        df = pd.read_excel(path, sheet_name="TFM", header=None, dtype=str)
+    except Exception:
+        # Fallback: første ark
+        with pd.ExcelFile(path) as xls:
+            first = xls.sheet_names[0]
+        df = pd.read_excel(path, sheet_name=first, header=None, dtype=str)
+    df = df.fillna("Ikke i bruk")
+    # Filtrer ut rader uten kode (kol A)
+    df = df[df[0].notna() & (df[0].astype(str).str.strip() != "")]
+    rows = tuple(zip(df[0].astype(str).str.strip(), df[1].astype(str).str.strip()))
+    return TfmMapping(rows, MappingProxyType(dict(rows)))
+
+
+def load_tfm_mapping(path: PathLike = TFM_XLSX) -> TfmMapping:
+    """TFM-mapping fra Excel (ark 'TFM', ellers første ark). Tom mapping ved feil."""
+    try:
+        return _cached("tfm_mapping", path, _read_tfm_mapping)
+    except Exception as e:
+        _log.error("Kunne ikke lese %s: %s", path, e)
+        return TfmMapping()
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# tfm-settings.json: kode → aktiv
+# ────────────────────────────────────────────────────────────────────────────────
+def _read_tfm_settings(path: str) -> Mapping[str, bool]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return MappingProxyType({})
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    # Støtter både flatt dict og {innstillinger:[{kode,aktiv},...]}
+    if isinstance(data, dict) and "innstillinger" in data:
+        data = {i["kode"]: bool(i["aktiv"]) for i in data.get("innstillinger", []) if "kode" in i}
+    return MappingProxyType(data if isinstance(data, dict) else {})
+
+
+def load_tfm_settings(path: PathLike = TFM_SETTINGS) -> Mapping[str, bool]:
+    """{kode: aktiv} fra tfm-settings.json. Tomt oppsett hvis filen mangler eller er ugyldig."""
+    try:
+        return _cached("tfm_settings", path, _read_tfm_settings)
+    except Exception as e:
+        _log.warning("TFM settings kunne ikke lastes, bruker tomt oppsett: %s", e)
+        return MappingProxyType({})
+
+
+def _read_json(path: str) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_json(path: PathLike) -> Any:
+    """Rå JSON fra fil (cachet). Kaster som json.load/open; resultatet må ikke endres."""
+    return _cached("json", path, _read_json)
@@ -0,0 +1,110 @@
+"""Strømmende tekstuttrekk fra opplastede filer (systembygging/komponentopptelling).
+
+spool_upload() kopierer opplastingen til disk i biter. iter_text() gir teksten i biter:
+PDF side for side, XLSX ark for ark (read_only, maks UPLOAD_XLSX_ROWS rader per bit),
+DOCX i grupper av avsnitt og TXT i byte-buffere. Minnebruken begrenses av største bit,
+ikke av filstørrelsen.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Union
+
+import docx
+import fitz  # PyMuPDF
+from openpyxl import load_workbook
+from werkzeug.utils import secure_filename
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["SUPPORTED_SUFFIXES", "spool_upload", "iter_text"]
+
+# Bufferstørrelse ved kopiering til disk og lesing av TXT
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(256 * 1024)))
+# Maks rader per tekstbit fra et XLSX-ark
+UPLOAD_XLSX_ROWS = int(os.getenv("UPLOAD_XLSX_ROWS", "2000"))
+# Maks avsnitt per tekstbit fra DOCX
+UPLOAD_DOCX_PARAS = int(os.getenv("UPLOAD_DOCX_PARAS", "500"))
+
+SUPPORTED_SUFFIXES = (".pdf", ".docx", ".xlsx", ".txt")
+
+Chunk = Union[str, bytes]
+
+
+def spool_upload(storage, directory: Union[str, Path], index: int = 0) -> Path:
+    """Kopier en opplasting (FileStorage eller fil-objekt) til directory uten å lese alt inn."""
+    name = secure_filename(getattr(storage, "filename", "") or "") or "upload"
+    path = Path(directory) / f"{index:04d}_{name}"
+    stream: BinaryIO = getattr(storage, "stream", storage)
+    try:
+        stream.seek(0)
+    except Exception:
+        pass
+    with open(path, "wb") as out:
+        shutil.copyfileobj(stream, out, UPLOAD_CHUNK_BYTES)
+    return path
+
+
+def _pdf_chunks(path: Path) -> Iterator[str]:
+    with fitz.open(path) as doc:
+        for page in doc:
+            yield page.get_text()
+
+
+def _docx_chunks(path: Path) -> Iterator[str]:
+    batch: List[str] = []
+    for p in docx.Document(str(path)).paragraphs:
+        batch.append(p.text)
+        if len(batch) >= UPLOAD_DOCX_PARAS:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch)
+
+
+def _xlsx_chunks(path: Path) -> Iterator[str]:
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            lines: List[str] = []
+            for row in ws.iter_rows(values_only=True):
+                lines.append(" ".join("" if c is None else str(c) for c in row))
+                if len(lines) >= UPLOAD_XLSX_ROWS:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+    finally:
+        wb.close()
+
+
+def _txt_chunks(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(UPLOAD_CHUNK_BYTES)
+            if not buf:
+                return
+            yield buf
+
+
+_READERS = {".pdf": _pdf_chunks, ".docx": _docx_chunks, ".xlsx": _xlsx_chunks, ".txt": _txt_chunks}
+
+
+def iter_text(path: Union[str, Path], filename: str = "") -> Iterator[Chunk]:
+    """Tekstbiter fra filen (TXT som bytes, dekodes i TagPattern.scan_batches()).
+
+    Filtypen avgjøres av filename (opprinnelig navn) eller path. Ukjent type eller lesefeil
+    logges; biter som allerede er gitt blir stående.
+    """
+    path = Path(path)
+    reader = _READERS.get(Path((filename or path.name).lower()).suffix)
+    if reader is None:
+        _log.info("Ukjent filtype: %s. Hopper over.", filename or path.name)
+        return
+    try:
+        yield from reader(path)
+    except Exception:
+        _log.warning("Feil ved lesing av %s", filename or path.name, exc_info=True)
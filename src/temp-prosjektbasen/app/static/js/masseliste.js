@@ -82,41 +82,116 @@ document.addEventListener("DOMContentLoaded", () => {
   const dlBtn       = document.getElementById("lastned-excel");
   wireDropzone(dropExcel, fileInput);
 
-  let masselisteRows = [];
-  let masselisteCols = [];
-  function renderSimpleTable(rows) {
-    if (!rows || !rows.length) {
+  // Datasettet ligger på serveren; bare siden som vises hentes (søk, filter og sortering på serveren)
+  const sokInput = document.getElementById("masseliste-sok");
+  const pagerDiv = document.getElementById("masseliste-pager");
+  const PAGE_SIZE = 200;
+  const visning = { dataset: null, columns: [], offset: 0, q: "", filters: {}, sort: null, order: "asc" };
+  let hentNr = 0;
+  const escapeHtml = v => String(v ?? "").replace(/[&<>"]/g, c => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;" }[c]));
+  function debounce(fn, ms) { let t; return (...a) => { clearTimeout(t); t = setTimeout(() => fn(...a), ms); }; }
+
+  function renderSimpleTable(data) {
+    const rows = data?.rows || [];
+    const cols = data?.columns || [];
+    if (!cols.length) {
       resultatDiv.innerHTML = "<div class='text-muted'>Ingen rader</div>";
+      if (pagerDiv) pagerDiv.innerHTML = "";
       if (dlBtn) dlBtn.disabled = true;
+      if (sokInput) sokInput.disabled = true;
       return;
     }
-    const cols = Array.from(rows.reduce((s, r) => { Object.keys(r).forEach(k => s.add(k)); return s; }, new Set()));
-    const head = `<thead><tr>${cols.map(c=>`<th>${c}</th>`).join("")}</tr></thead>`;
-    const body = `<tbody>${rows.map(r=>`<tr>${cols.map(c=>`<td>${r[c] ?? ""}</td>`).join("")}</tr>`).join("")}</tbody>`;
+    const pil = c => visning.sort === c ? (visning.order === "desc" ? " ▼" : " ▲") : "";
+    const head = `<thead><tr>${cols.map(c => `<th role="button" data-sort="${escapeHtml(c)}">${escapeHtml(c)}${pil(c)}</th>`).join("")}</tr>`
+      + `<tr>${cols.map(c => `<th><input class="form-control form-control-sm masseliste-filter" data-col="${escapeHtml(c)}" value="${escapeHtml(visning.filters[c] || "")}"></th>`).join("")}</tr></thead>`;
+    const body = rows.length
+      ? `<tbody>${rows.map(r => `<tr>${cols.map(c => `<td>${escapeHtml(r[c])}</td>`).join("")}</tr>`).join("")}</tbody>`
+      : `<tbody><tr><td colspan="${cols.length}" class="text-muted">Ingen treff</td></tr></tbody>`;
+    const aktivKolonne = document.activeElement?.classList?.contains("masseliste-filter") ? document.activeElement.dataset.col : null;
     resultatDiv.innerHTML = `<table class="table table-bordered table-sm">${head}${body}</table>`;
-    if (dlBtn) dlBtn.disabled = false;
+    if (aktivKolonne) {
+      // Filterfeltene tegnes på nytt med tabellen – behold fokus mens brukeren skriver
+      const felt = Array.from(resultatDiv.querySelectorAll(".masseliste-filter")).find(i => i.dataset.col === aktivKolonne);
+      if (felt) { felt.focus(); felt.setSelectionRange(felt.value.length, felt.value.length); }
+    }
+    if (dlBtn) dlBtn.disabled = !data.matched;
+    if (sokInput) sokInput.disabled = false;
+
+    if (pagerDiv) {
+      const fra = data.matched ? data.offset + 1 : 0;
+      const til = data.offset + rows.length;
+      const filtrert = data.matched !== data.total ? ` (filtrert fra ${data.total})` : "";
+      pagerDiv.innerHTML = `
+        <button type="button" class="btn btn-outline-secondary btn-sm" data-side="-1" ${data.offset <= 0 ? "disabled" : ""}>Forrige</button>
+        <span>Rad ${fra}–${til} av ${data.matched}${filtrert}</span>
+        <button type="button" class="btn btn-outline-secondary btn-sm" data-side="1" ${til >= data.matched ? "disabled" : ""}>Neste</button>`;
+    }
   }
+
+  async function hentSide() {
+    if (!visning.dataset) return;
+    const nr = ++hentNr;
+    const params = new URLSearchParams({ offset: visning.offset, limit: PAGE_SIZE, q: visning.q, order: visning.order,
+                                         filters: JSON.stringify(visning.filters) });
+    if (visning.sort) params.set("sort", visning.sort);
+    try {
+      const res = await fetch(`/api/masseliste/${visning.dataset}/rows?${params}`);
+      const data = await res.json();
+      if (nr !== hentNr) return;  // et nyere søk er underveis
+      if (!res.ok) { alert(data?.error || "Feil ved henting av rader."); return; }
+      renderSimpleTable(data);
+    } catch { alert("Nettverksfeil."); }
+  }
+  const hentSideSnart = debounce(() => { visning.offset = 0; hentSide(); }, 300);
+
+  sokInput?.addEventListener("input", () => { visning.q = sokInput.value.trim(); hentSideSnart(); });
+  pagerDiv?.addEventListener("click", e => {
+    const side = Number(e.target?.dataset?.side || 0);
+    if (!side) return;
+    visning.offset = Math.max(0, visning.offset + side * PAGE_SIZE);
+    hentSide();
+  });
+  resultatDiv?.addEventListener("click", e => {
+    const col = e.target?.closest("th[data-sort]")?.dataset.sort;
+    if (!col) return;
+    visning.order = visning.sort === col && visning.order === "asc" ? "desc" : "asc";
+    visning.sort = col;
+    visning.offset = 0;
+    hentSide();
+  });
+  resultatDiv?.addEventListener("input", e => {
+    const col = e.target?.dataset?.col;
+    if (!col || !e.target.classList.contains("masseliste-filter")) return;
+    if (e.target.value.trim()) visning.filters[col] = e.target.value.trim();
+    else delete visning.filters[col];
+    hentSideSnart();
+  });
+
   scanBtn?.addEventListener("click", async () => {
     const files = getChosenFiles(dropExcel, fileInput);
     if (!files.length) { alert("Velg en Excel-fil først."); return; }
     const fd = new FormData();
     fd.append("file", files[0]);
+    fd.append("limit", PAGE_SIZE);
     try {
       const res = await fetch("/api/parse-masseliste", { method: "POST", body: fd });
       const data = await res.json();
-      if (!res.ok) { alert(data?.error || "Feil ved parsing."); renderSimpleTable([]); return; }
-      masselisteRows = data.rows || [];
-      masselisteCols = data.columns || [];
-      renderSimpleTable(masselisteRows);
-    } catch { alert("Nettverksfeil."); renderSimpleTable([]); }
+      if (!res.ok) { alert(data?.error || "Feil ved parsing."); renderSimpleTable(null); return; }
+      Object.assign(visning, { dataset: data.dataset, columns: data.columns || [], offset: 0, q: "", filters: {},
+                               sort: null, order: "asc" });
+      if (sokInput) sokInput.value = "";
+      renderSimpleTable(data);
+    } catch { alert("Nettverksfeil."); renderSimpleTable(null); }
   });
   dlBtn?.addEventListener("click", async () => {
-    if (!masselisteRows.length) return;
+    if (!visning.dataset) return;
     try {
       const res = await fetch("/api/masseliste/export", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ rows: masselisteRows, columns: masselisteCols })
+        // Eksporterer hele utvalget (søk/filter/sortering) fra datasettet, ikke bare siden som vises
+        body: JSON.stringify({ dataset: visning.dataset, columns: visning.columns, q: visning.q,
+                               filters: visning.filters, sort: visning.sort, order: visning.order })
       });
       if (!res.ok) {
         const data = await res.json().catch(()=>null);
@@ -275,6 +350,44 @@ document.addEventListener("DOMContentLoaded", () => {
 	}
 
 	// (E) Skann / Eksport – *Format er VALGFRITT*
+	// Serveren indekserer modellen (SHA-256) første gang; senere skann/eksport av samme fil sender bare hashen.
+	const ifcModeller = {};   // "navn|størrelse|endret" → model-hash
+	let ifcSkann = null;       // { model, format, system_kriterier } for siste skann
+	const filNokkel = f => `${f.name}|${f.size}|${f.lastModified}`;
+	const faseTekst = { les: "Leser IFC", psett: "Samler Pset" };
+
+	async function lesIFCSvar(resp) {
+	  // NDJSON med fremdrift når indeksen bygges, ellers vanlig JSON
+	  if ((resp.headers.get("content-type") || "").includes("application/json")) return resp.json();
+	  const reader = resp.body.getReader();
+	  const decoder = new TextDecoder();
+	  let buffer = "", result = null;
+	  const handle = line => {
+		if (!line) return;
+		const parsed = JSON.parse(line);
+		if (parsed.progress) {
+		  const { phase, done, total } = parsed.progress;
+		  const pct = total ? Math.floor(100 * done / total) : 0;
+		  if (ifcFeil) ifcFeil.textContent = `${faseTekst[phase] || phase}: ${pct} %`;
+		} else {
+		  result = parsed;
+		}
+	  };
+	  while (true) {
+		const { done, value } = await reader.read();
+		buffer += value ? decoder.decode(value, { stream: true }) : "";
+		let nl;
+		while ((nl = buffer.indexOf("\n")) !== -1) {
+		  const line = buffer.slice(0, nl).trim();
+		  buffer = buffer.slice(nl + 1);
+		  handle(line);
+		}
+		if (done) break;
+	  }
+	  handle(buffer.trim());
+	  return result || { feil: ["Ingen data mottatt."] };
+	}
+
 	scanIFC?.addEventListener("click", async () => {
 	  if (ifcFeil) { ifcFeil.textContent = ""; ifcFeil.classList.remove("text-danger"); ifcFeil.classList.add("text-muted"); }
 
@@ -283,30 +396,48 @@ document.addEventListener("DOMContentLoaded", () => {
 
 	  const fmt = (formatInput?.value ?? "").trim();
 	  const kriterier = Object.values(valgtSystemPrefiks || {}).flat();
+	  const nokkel = filNokkel(files[0]);
 
-	  const fd = new FormData();
-	  fd.append("ifc_file", files[0]);
-	  fd.append("use_format", fmt ? "true" : "false");
-	  if (fmt) fd.append("format", fmt);
-	  if (kriterier.length) fd.append("system_kriterier", kriterier.join(","));
+	  const skann = async (medFil) => {
+		const fd = new FormData();
+		if (medFil) fd.append("ifc_file", files[0]);
+		else fd.append("model", ifcModeller[nokkel]);
+		fd.append("progress", "1");
+		fd.append("use_format", fmt ? "true" : "false");
+		if (fmt) fd.append("format", fmt);
+		if (kriterier.length) fd.append("system_kriterier", kriterier.join(","));
+		return fetch("/api/ifc/scan", { method: "POST", body: fd });
+	  };
 
 	  try {
-		const resp = await fetch("/api/ifc/scan", { method: "POST", body: fd });
+		if (ifcFeil) ifcFeil.textContent = "Skanner…";
+		let resp = await skann(!ifcModeller[nokkel]);
+		if (resp.status === 404 && ifcModeller[nokkel]) {
+		  // Indeksen er ryddet bort på serveren – last opp filen på nytt
+		  delete ifcModeller[nokkel];
+		  resp = await skann(true);
+		}
 		const isJson = (resp.headers.get("content-type") || "").includes("application/json");
-		const payload = isJson ? await resp.json() : { error: await resp.text() };
+		const payload = resp.ok || isJson ? await lesIFCSvar(resp) : { error: await resp.text() };
 
-		if (!resp.ok) {
+		if (!resp.ok || payload.feil) {
 		  const msg = payload?.feil || payload?.error || `HTTP ${resp.status}`;
 		  if (ifcFeil) { ifcFeil.classList.add("text-danger"); ifcFeil.textContent = String(msg); }
+		  ifcSkann = null;
 		  renderIFCTable([]); renderPsetVelger([]);
 		  return;
 		}
+		if (payload.model) {
+		  ifcModeller[nokkel] = payload.model;
+		  ifcSkann = { model: payload.model, format: fmt, system_kriterier: kriterier.join(",") };
+		}
 		renderIFCTable(payload.rows || []);
 		renderPsetVelger(payload.pset_columns || []);
 		setFormatHint();
 		if (!fmt && ifcFeil) { ifcFeil.textContent = "Skannet uten format."; }
 	  } catch {
 		if (ifcFeil) { ifcFeil.classList.add("text-danger"); ifcFeil.textContent = "Nettverksfeil under skanning."; }
+		ifcSkann = null;
 		renderIFCTable([]); renderPsetVelger([]);
 	  }
 	});
@@ -316,7 +447,8 @@ document.addEventListener("DOMContentLoaded", () => {
 	  try {
 		const res = await fetch("/api/ifc/export", {
 		  method: "POST", headers: { "Content-Type": "application/json" },
-		  body: JSON.stringify({ rows: ifcRows, pset_columns: selected })
+		  // Radene bygges fra modellindeksen når den finnes; ellers sendes de som før
+		  body: JSON.stringify(ifcSkann ? { ...ifcSkann, pset_columns: selected } : { rows: ifcRows, pset_columns: selected })
 		});
 		if (!res.ok) {
 		  const data = await res.json().catch(()=>null);
@@ -326,6 +326,7 @@ document.addEventListener("DOMContentLoaded", () => {
     const decoder = new TextDecoder();
     let buffer = "";
     let rowsJSON = null;
+    let currentFile = "";
 
     while (true) {
       const { done, value } = await reader.read();
@@ -339,7 +340,12 @@ document.addEventListener("DOMContentLoaded", () => {
         if (!line) continue;
         try {
           const parsed = JSON.parse(line);
-          if (parsed.currentFile) status.textContent = "Behandler: " + parsed.currentFile;
+          if (parsed.currentFile) {
+            currentFile = parsed.currentFile;
+            status.textContent = "Behandler: " + currentFile;
+          }
+          // Antall treff strømmes per side/bit – vis fortløpende antall
+          if (parsed.total !== undefined) status.textContent = `Behandler: ${currentFile} – ${parsed.total} treff så langt`;
           if (parsed.rows) rowsJSON = parsed.rows;
         } catch (err) {
           console.error("JSON-line parse error:", line, err);
@@ -504,7 +510,12 @@ document.addEventListener("DOMContentLoaded", () => {
           headers: { "Content-Type": "application/json" },
           body: JSON.stringify(payload)
         });
-        if (res.ok) alert("✅ Sendt til prosjekt!");
+        if (res.ok) {
+          const info = await res.json().catch(() => null);
+          alert(info
+            ? `✅ Sendt til prosjekt! Nye: ${info.inserted}, endret: ${info.updated}, slettet: ${info.deleted}, uendret: ${info.unchanged} (${info.seconds} s)`
+            : "✅ Sendt til prosjekt!");
+        }
         else alert("❌ Feil ved innsending: " + (await res.text()));
       } catch (err) {
         console.error("Uventet feil:", err);
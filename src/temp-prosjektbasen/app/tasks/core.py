@@ -14,16 +14,18 @@ Merk:
 from __future__ import annotations
 
 import os
-import json
 import logging
 import re
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
+from rapidfuzz.distance import LCSseq
 from rapidfuzz.fuzz import partial_ratio, ratio as fuzz_ratio, token_set_ratio
-from app.tasks.models import fag_predict
+from app.tasks.models import CLS_BATCH_SIZE, _MemoCache, fag_predict_batch
+from app.tasks.kw_index import get_keyword_index
+from app.tasks.ns_index import NSMatrixIndex, load_ns_index, token_overlap
 
 # Ikke importer modeller/statisk util her (kan gi sirkler / ModuleNotFound ved oppstart)
 # Normalisering/konfig hentes defensivt under.
@@ -51,7 +53,21 @@ EXTRACT_CFG: Dict[str, Any] = {
 }
 
 GUARDED_PREVIEW_LOW_THR = 60.0   # lav terskel for "usikre" funn (kun Review)
-EXPLAIN_TOPK = 3    
+EXPLAIN_TOPK = 3
+
+# Batch-størrelse for SentenceTransformer (setninger per encode-kall)
+SEM_BATCH_SIZE = int(os.getenv("SEM_BATCH_SIZE", "256"))
+# Maks antall semantiske scorer som holdes per dokument (LRU; minst fire batcher)
+SEM_SCORE_CACHE_MAX = max(4 * SEM_BATCH_SIZE, int(os.getenv("SEM_SCORE_CACHE_MAX", "4096")))
+
+# Deduplisering: "blocking" (token-/n-gram-blokkering) eller "exact" (alle-mot-alle som før)
+DEDUP_METHOD = os.getenv("KS_DEDUP_METHOD", "blocking")
+# Grupper opp til denne størrelsen dedupliseres alltid eksakt (billig, garantert lik oppførsel)
+DEDUP_EXACT_MAX = int(os.getenv("KS_DEDUP_EXACT_MAX", "500"))
+# Antall sjeldneste tokens / tegn-n-gram per tekst som brukes som blokkeringsnøkler
+DEDUP_PREFIX_TOKENS = 3
+DEDUP_GRAM = 4
+DEDUP_PREFIX_GRAMS = int(os.getenv("KS_DEDUP_PREFIX_GRAMS", "24"))
 
 # ---------------------------------------------------------------------------
 # Lazy imports / fallbacks
@@ -224,6 +240,34 @@ def clean_text(text: str) -> str:
     return t
 
 
+_PAGE_MARK_RE = re.compile(r'\[\[SIDE\s+(\d+)\]\]')
+
+
+def iter_clean_pages(raw_pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, str]]:
+    """
+    Strømmende variant av clean_text for sidemerket tekst.
+    Tar (sidenr, rå sidetekst) og gir (sidenr, renset sidetekst) – samme sidetekst som
+    re.split på [[SIDE n]] etter clean_text på hele dokumentet. Hver side renses sammen
+    med sin egen og neste sides markør, siden enkelte regler (URL-er, prikkledere) ser
+    på tegnene rundt markørene. Holder kun én side i minnet om gangen.
+    """
+    prev = None
+    for page_no, txt in raw_pages:
+        if prev is not None:
+            yield _clean_page(prev[0], prev[1], page_no)
+        prev = (page_no, txt or "")
+    if prev is not None:
+        yield _clean_page(prev[0], prev[1], None)
+
+
+def _clean_page(page_no: int, txt: str, next_no: int | None) -> Tuple[str, str]:
+    chunk = f"[[SIDE {page_no}]]\n{txt}"
+    if next_no is not None:
+        chunk += f"\n[[SIDE {next_no}]]"
+    parts = _PAGE_MARK_RE.split(clean_text(chunk))
+    return str(page_no), (parts[2] if len(parts) >= 3 else "")
+
+
 # ---------------------------------------------------------------------------
 # Klassifisering og validering
 # ---------------------------------------------------------------------------
@@ -268,82 +312,154 @@ def _reload_fag_model():
             _log.warning("Klarte ikke å reload'e fag-modellen: %s", e)
 
 
-def classify_group_ai(text: str, min_score: float | None = None):
-    """
-    Returnerer (best_label_eller_None, rankliste) der rankliste = [(label, score_float), ...] sortert synkende.
-    Bruker treningsartefaktet (pipeline + thresholds) hvis tilgjengelig; faller tilbake til fag_predict().
-    """
-    raw = text or ""
-    txt = _normalize_text(raw)
-    mdl = _get_fag_model()
+# Memo for klassifisering: nøkkel inkluderer modellversjon, så ingen tekst klassifiseres to ganger
+_group_memo = _MemoCache()
+_valid_memo = _MemoCache()
 
-    default_thr = 0.45 if min_score is None else float(min_score)
 
-    # Ingen/ukjent modell → fallback til fag_predict
-    if not isinstance(mdl, dict) or "pipeline" not in mdl or "labels" not in mdl:
-        r = fag_predict(raw)
-        label = r.get("label") if r.get("ok") and float(r.get("score", 0.0)) >= default_thr else None
-        rank = [(str(r.get("label")), float(r.get("score", 0.0)))] if r.get("ok") else []
-        return label, rank
+def _fag_version(mdl: Any) -> Any:
+    fn = getattr(_task_models(), "fag_model_version", None)
+    try:
+        return fn() if callable(fn) else id(mdl)
+    except Exception:
+        return id(mdl)
+
 
+def _group_from_fag_predict(r: Dict[str, Any], thr: float):
+    label = r.get("label") if r.get("ok") and float(r.get("score", 0.0)) >= thr else None
+    rank = [(str(r.get("label")), float(r.get("score", 0.0)))] if r.get("ok") else []
+    return label, rank
+
+
+def _classify_rows(mdl: Dict[str, Any], raws: List[str], txts: List[str], default_thr: float):
+    """Klassifiserer unike tekster med artefaktets pipeline i ett vektorisert kall."""
     pipe = mdl["pipeline"]
     labels = list(mdl["labels"])
-    thresholds_raw = mdl.get("thresholds", None)
-    thresholds = _as_list_like(thresholds_raw, length=len(labels), default=default_thr)
+    thresholds = _as_list_like(mdl.get("thresholds", None), length=len(labels), default=default_thr)
 
     # predict_proba-vei
     if hasattr(pipe, "predict_proba"):
-        proba = pipe.predict_proba([txt])
-        # flatten trygt til 1D liste
-        scores = _as_list_like(proba, default=0.0)
-        # Hvis modellen ga flattened over alle klasser for 1 eksempel,
-        # skal vi ha n_scores == len(labels); hvis ikke, prøv å hente første rad
-        if len(scores) != len(labels):
-            try:
-                scores = _as_list_like(proba[0], default=0.0, length=len(labels))
-            except Exception:
-                scores = [0.0] * len(labels)
-
-        rank = sorted(
-            [(str(labels[i]), float(scores[i])) for i in range(len(labels))],
-            key=lambda x: x[1],
-            reverse=True,
-        )
-        best_label, best_score = rank[0]
-        best_idx = next((i for i, lbl in enumerate(labels) if lbl == best_label), 0)
-        thr = float(thresholds[best_idx]) if 0 <= best_idx < len(thresholds) else default_thr
-        return (best_label if best_score >= thr else None), rank
+        step = max(1, CLS_BATCH_SIZE)
+        rows: List[Any] = []
+        for i in range(0, len(txts), step):
+            rows.extend(np.asarray(pipe.predict_proba(txts[i:i + step])))
+        out = []
+        for row in rows:
+            scores = _as_list_like(row, default=0.0)
+            if len(scores) != len(labels):
+                scores = _as_list_like(row, default=0.0, length=len(labels))
+            rank = sorted(
+                [(str(labels[i]), float(scores[i])) for i in range(len(labels))],
+                key=lambda x: x[1],
+                reverse=True,
+            )
+            best_label, best_score = rank[0]
+            best_idx = next((i for i, lbl in enumerate(labels) if lbl == best_label), 0)
+            thr = float(thresholds[best_idx]) if 0 <= best_idx < len(thresholds) else default_thr
+            out.append(((best_label if best_score >= thr else None), rank))
+        return out
 
     # Fallback uten proba: bruk predict + fag_predict for ca. score
     try:
-        pred = pipe.predict([txt])
-        idx_list = _as_list_like(pred, default=0.0)
-        idx = int(idx_list[0]) if idx_list else 0
-        best_label = str(labels[idx]) if 0 <= idx < len(labels) else str(idx)
-
-        r = fag_predict(raw)
-        approx_score = float(r.get("score", 1.0)) if r.get("ok") else 1.0
-        rank = [(best_label, approx_score)]
-        thr = float(thresholds[idx]) if 0 <= idx < len(thresholds) else default_thr
-        return (best_label if approx_score >= thr else None), rank
+        idx_list = _as_list_like(pipe.predict(txts), default=0.0)
+        approx = fag_predict_batch(raws)
+        out = []
+        for k, r in enumerate(approx):
+            idx = int(idx_list[k]) if k < len(idx_list) else 0
+            best_label = str(labels[idx]) if 0 <= idx < len(labels) else str(idx)
+            approx_score = float(r.get("score", 1.0)) if r.get("ok") else 1.0
+            thr = float(thresholds[idx]) if 0 <= idx < len(thresholds) else default_thr
+            out.append(((best_label if approx_score >= thr else None), [(best_label, approx_score)]))
+        return out
     except Exception:
-        r = fag_predict(raw)
-        label = r.get("label") if r.get("ok") and float(r.get("score", 0.0)) >= default_thr else None
-        rank = [(str(r.get("label")), float(r.get("score", 0.0)))] if r.get("ok") else []
-        return label, rank
+        return [_group_from_fag_predict(r, default_thr) for r in fag_predict_batch(raws)]
+
+
+def classify_group_ai_batch(texts: Iterable[str], min_score: float | None = None) -> List[Tuple[Any, List[Tuple[str, float]]]]:
+    """
+    Som classify_group_ai for mange tekster: unike, ukjente tekster klassifiseres i få
+    vektoriserte kall, resten hentes fra memo (per modellversjon og terskel).
+    """
+    raws = [t or "" for t in texts]
+    mdl = _get_fag_model()
+    default_thr = 0.45 if min_score is None else float(min_score)
+    ver = (_fag_version(mdl), default_thr)
+
+    out: List[Any] = [None] * len(raws)
+    todo: Dict[str, List[int]] = {}
+    for i, raw in enumerate(raws):
+        txt = _normalize_text(raw)
+        hit = _group_memo.get((ver, txt))
+        if hit is not None:
+            out[i] = hit
+        else:
+            todo.setdefault(txt, []).append(i)
+    if not todo:
+        return out
+
+    txts = list(todo)
+    first_raw = [raws[todo[t][0]] for t in txts]
+    # Ingen/ukjent modell → fallback til fag_predict
+    if not isinstance(mdl, dict) or "pipeline" not in mdl or "labels" not in mdl:
+        res = [_group_from_fag_predict(r, default_thr) for r in fag_predict_batch(first_raw)]
+    else:
+        try:
+            res = _classify_rows(mdl, first_raw, txts, default_thr)
+        except Exception as e:
+            _log.warning("Batch-klassifisering av %d tekster feilet: %s", len(txts), e)
+            res = [_group_from_fag_predict(r, default_thr) for r in fag_predict_batch(first_raw)]
+    for txt, r in zip(txts, res):
+        _group_memo.put((ver, txt), r)
+        for i in todo[txt]:
+            out[i] = r
+    return out
+
+
+def classify_group_ai(text: str, min_score: float | None = None):
+    """
+    Returnerer (best_label_eller_None, rankliste) der rankliste = [(label, score_float), ...] sortert synkende.
+    Bruker treningsartefaktet (pipeline + thresholds) hvis tilgjengelig; faller tilbake til fag_predict().
+    """
+    return classify_group_ai_batch([text], min_score=min_score)[0]
+
+
+def is_valid_requirement_batch(texts: Iterable[str]) -> List[bool]:
+    """Krav-validering for mange tekster; validator-modellen kalles én gang per ukjent tekst."""
+    texts = [t or "" for t in texts]
+    out = [len(t.split()) >= 4 for t in texts]
+    mdl = getattr(_task_models(), "krav_validator_model", None)
+    if not mdl:
+        return out
+
+    todo: Dict[str, List[int]] = {}
+    for i, t in enumerate(texts):
+        if not out[i]:
+            continue
+        hit = _valid_memo.get((id(mdl), t))
+        if hit is not None:
+            out[i] = hit
+        else:
+            todo.setdefault(t, []).append(i)
+    if todo:
+        xs = list(todo)
+        step = max(1, CLS_BATCH_SIZE)
+        try:
+            preds = np.concatenate([np.asarray(mdl.predict(xs[i:i + step])).ravel()
+                                    for i in range(0, len(xs), step)])
+            vals = [int(p) == 1 for p in preds]
+        except Exception:
+            vals = None
+        for j, t in enumerate(xs):
+            v = True if vals is None else vals[j]
+            if vals is not None:
+                _valid_memo.put((id(mdl), t), v)
+            for i in todo[t]:
+                out[i] = v
+    return out
 
 
 def is_valid_requirement(tekst: str) -> bool:
-    tm = _task_models()
-    words = len((tekst or "").split())
-    if not getattr(tm, "krav_validator_model", None) or words < 4:
-        return words >= 4
-    try:
-        pred = tm.krav_validator_model.predict([tekst])
-        pred = np.asarray(pred).ravel()
-        return int(pred[0]) == 1
-    except Exception:
-        return True
+    return is_valid_requirement_batch([tekst])[0]
 
 
 def classify_type(tekst: str) -> str:
@@ -529,6 +645,56 @@ def _contains_numbers_units_profile(s: str, profile: dict) -> bool:
     return bool(profile["units_re"].search(s.lower()))
 
 
+def _clause_at(clauses, j: int) -> str | None:
+    """clauses[j] eller None utenfor rekkevidde (virker for lister og _AtomBuffer)."""
+    try:
+        return clauses[j]
+    except IndexError:
+        return None
+
+
+class _AtomBuffer:
+    """
+    Lat, indekserbar buffer over (kravbit, side) fra en generator.
+    Henter kun så langt _enrich_clause faktisk ser fremover, og slipper biter bak
+    gjeldende posisjon (release), slik at minnebruken holdes begrenset.
+    """
+
+    def __init__(self, source: Iterable[Tuple[str, str]]):
+        self._src = iter(source)
+        self._items: deque = deque()
+        self._base = 0
+        self._done = False
+
+    def _fill(self, j: int) -> None:
+        while not self._done and j >= self._base + len(self._items):
+            try:
+                self._items.append(next(self._src))
+            except StopIteration:
+                self._done = True
+
+    def __getitem__(self, j: int) -> str:
+        return self.item(j)[0]
+
+    def item(self, j: int) -> Tuple[str, str]:
+        self._fill(j)
+        k = j - self._base
+        if k < 0 or k >= len(self._items):
+            raise IndexError(j)
+        return self._items[k]
+
+    def window(self, start: int, stop: int) -> List[str]:
+        self._fill(stop - 1)
+        lo = max(0, start - self._base)
+        hi = max(lo, min(len(self._items), stop - self._base))
+        return [self._items[k][0] for k in range(lo, hi)]
+
+    def release(self, j: int) -> None:
+        while self._base < j and self._items:
+            self._items.popleft()
+            self._base += 1
+
+
 def _enrich_clause(clauses: List[str], idx: int, profile: dict) -> Tuple[str, int]:
     """
     Slår sammen nabobiter til en mer komplett setning.
@@ -546,8 +712,11 @@ def _enrich_clause(clauses: List[str], idx: int, profile: dict) -> Tuple[str, in
 
     # dra inn påfølgende biter som fortsetter meningen
     j = idx + 1
-    while j < len(clauses) and (_looks_incomplete(base) or _starts_as_continuation(clauses[j])):
-        nxt = clauses[j].strip()
+    while True:
+        cj = _clause_at(clauses, j)
+        if cj is None or not (_looks_incomplete(base) or _starts_as_continuation(cj)):
+            break
+        nxt = cj.strip()
         if not nxt:
             break
         base = base.rstrip(" .;") + ". " + nxt
@@ -555,8 +724,9 @@ def _enrich_clause(clauses: List[str], idx: int, profile: dict) -> Tuple[str, in
         j += 1
 
     # hvis fortsatt ikke tall/enheter, prøv å legge til én til
-    if not _contains_numbers_units_profile(base, profile) and j < len(clauses):
-        nxt = clauses[j].strip()
+    cj = _clause_at(clauses, j)
+    if not _contains_numbers_units_profile(base, profile) and cj is not None:
+        nxt = cj.strip()
         if _contains_numbers_units_profile(nxt, profile):
             base = base.rstrip(" .;") + ". " + nxt
             used += 1
@@ -625,134 +795,135 @@ def _choose_domain_from_inputs(fokus_text: str = "", selected_groups: List[str]
     return "generic"
 
 
-# --- NS-indeksering/embedding (lettvekts-cache) ---
-def _ns_load_or_build_index(tm, standards_cfg: dict):
-    """Laster/lager en enkel NS-indeks med embeddings per side.
-    Returnerer dict: {std: [{"side": int, "tekst": str, "emb": np.ndarray}, ...], ...}
-    """
-    from contextlib import suppress
+# --- NS-indeksering/embedding (matrise-indeks på disk) ---
+def _ns_load_or_build_index(tm, standards_cfg: dict) -> NSMatrixIndex:
+    """Laster/lager NS-indeks (normalisert float32-matrise per standard, mmap fra disk).
+    Uten semantisk modell holdes kun sidetekstene (for token-overlapp)."""
+    sem = getattr(tm, "semantic_model", None)
+    model_name = str(getattr(tm, "SENTENCE_MODEL_NAME", "") or "")
+    index_dir = getattr(tm, "NS_INDEX_DIR", None) or (Path(__file__).resolve().parent.parent / "data" / "ns_index")
     try:
-        import joblib  # type: ignore
-    except Exception:
-        joblib = None  # kjører uten disk-cache hvis ikke tilgjengelig
-
-    idx: Dict[str, List[Dict[str, Any]]] = {}
-    cache_path = getattr(tm, "NS_CACHE_PATH", None)
+        return load_ns_index(standards_cfg, sem, model_name, Path(index_dir))
+    except Exception as e:
+        _log.warning("NS-indeks kunne ikke lastes: %s", e)
+        return NSMatrixIndex()
 
-    # Prøv å laste cache
-    if joblib and cache_path and Path(cache_path).exists():
-        with suppress(Exception):
-            idx = joblib.load(cache_path)  # type: ignore
 
-    # Finn hvilke standarder som mangler i index
-    missing = []
-    for std, meta in standards_cfg.items():
-        if not meta.get("aktiv"):
-            continue
-        if std not in idx or not idx[std]:
-            missing.append(std)
+def _ns_semantic_hits_batch(tm, ns_index: NSMatrixIndex, req_texts: List[str],
+                            max_hits_per_std: int = 2) -> List[List[Dict[str, Any]]]:
+    """Finn beste NS-treff per standard for alle krav i én batch. Returnerer per krav en liste:
+       [{"standard": "NS8415", "side": 12, "tekst": "…", "score": 87.3}, ...]
+    """
+    if not req_texts or not ns_index:
+        return [[] for _ in req_texts]
+    sem = getattr(tm, "semantic_model", None)
+    out: List[List[Dict[str, Any]]] = []
+
+    if sem and ns_index.has_vectors:
+        q = sem.encode(req_texts, batch_size=SEM_BATCH_SIZE, convert_to_numpy=True, normalize_embeddings=True)
+        for hits in ns_index.search(np.asarray(q, dtype=np.float32), max_hits_per_std):
+            out.append([{
+                "standard": h["standard"],
+                "side": h["side"],
+                "tekst": h["tekst"][:500].strip(),
+                "score": round(float(h["cos"]) * 100.0, 1),
+            } for h in hits])
+    else:
+        for req_text in req_texts:
+            hits: List[Dict[str, Any]] = []
+            for std, idx in ns_index.stds.items():
+                pairs = [(token_overlap(req_text, t), r) for r, t in enumerate(idx.texts)]
+                pairs.sort(key=lambda x: x[0], reverse=True)
+                for sc, r in pairs[:max_hits_per_std]:
+                    if sc <= 0:
+                        continue
+                    hits.append({
+                        "standard": std,
+                        "side": idx.pages[r],
+                        "tekst": idx.texts[r][:500].strip(),
+                        "score": round(float(sc), 1),
+                    })
+            out.append(hits)
+
+    for hits in out:
+        hits.sort(key=lambda x: x["score"], reverse=True)
+        del hits[5:]
+    return out
 
-    if missing:
-        try:
-            import fitz  # PyMuPDF
-        except Exception:
-            return idx
 
-        sem = getattr(tm, "semantic_model", None)
+def _ns_semantic_hits(tm, ns_index: NSMatrixIndex, req_text: str, max_hits_per_std: int = 2):
+    """Finn beste NS-treff per standard for ett krav (se _ns_semantic_hits_batch)."""
+    return _ns_semantic_hits_batch(tm, ns_index, [req_text], max_hits_per_std)[0]
 
-        for std in missing:
-            pdf_info = standards_cfg[std]
-            pdf_path = pdf_info.get("path")
-            if not pdf_path or not Path(pdf_path).is_file():
-                continue
-            chunks: List[Dict[str, Any]] = []
-            with fitz.open(pdf_path) as doc:
-                for i, page in enumerate(doc, start=1):
-                    txt = page.get_text("text") or ""
-                    txt = " ".join(txt.split())
-                    if not txt:
-                        continue
-                    chunks.append({"side": i, "tekst": txt})
 
-            if sem and chunks:
-                texts = [c["tekst"] for c in chunks]
-                vecs = sem.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-                for c, v in zip(chunks, vecs):
-                    c["emb"] = np.asarray(v).astype(float)
-            idx[std] = chunks
+# --- Semantisk nøkkelord-score (batch) ---
+def _semantic_kw_scores_batch(sem, texts: List[str], kw_vecs, batch_size: int = SEM_BATCH_SIZE) -> List[float]:
+    """Encoder tekstene i store batcher og returnerer maks cosinus-likhet (0-100) mot nøkkelordene.
+    `kw_vecs` er de normaliserte nøkkelord-vektorene (n_kw × dim).
+    """
+    if not texts:
+        return []
+    kw_mat = np.asarray(kw_vecs, dtype=np.float32)
+    out: List[float] = []
+    step = max(1, int(batch_size))
+    for start in range(0, len(texts), step):
+        chunk = texts[start:start + step]
+        q = sem.encode(chunk, batch_size=step, convert_to_numpy=True, normalize_embeddings=True)
+        q = np.asarray(q, dtype=np.float32)
+        if q.ndim == 1:
+            q = q.reshape(1, -1)
+        if q.size == 0:
+            out.extend([0.0] * len(chunk))
+            continue
+        sims = q @ kw_mat.T
+        out.extend(float(mx) * 100.0 for mx in sims.max(axis=1))
+    return out
 
-        if joblib and cache_path:
-            with suppress(Exception):
-                Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
-                joblib.dump(idx, cache_path)
 
-    return idx
+# ===========================================================================
+#  Kravuthenting (strømmende: sider → setninger → kravbiter → funn)
+# ===========================================================================
 
+def _iter_text_pages(text: str) -> Iterator[Tuple[str, str]]:
+    """Deler ferdig renset tekst i (sidenr, sidetekst) på [[SIDE n]]; uten markører: ("Ukjent", tekst)."""
+    parts = _PAGE_MARK_RE.split(text or "")
+    if len(parts) >= 3:
+        it = iter(parts[1:])
+        for page_no, page_text in zip(it, it):
+            yield str(page_no).strip(), page_text
+    else:
+        yield "Ukjent", text or ""
 
-def _ns_semantic_hits(tm, ns_index: dict, req_text: str, max_hits_per_std: int = 2):
-    """Finn beste NS-treff per standard for et krav. Returnerer liste med dicts:
-       [{"standard": "NS8415", "side": 12, "tekst": "…", "score": 87.3}, ...]
-    """
-    out: List[Dict[str, Any]] = []
-    sem = getattr(tm, "semantic_model", None)
 
-    def _token_overlap(a: str, b: str) -> float:
-        sa = set(re.findall(r"\w+", a.lower()))
-        sb = set(re.findall(r"\w+", b.lower()))
-        if not sa or not sb:
-            return 0.0
-        inter = len(sa & sb)
-        denom = max(1, min(len(sa), len(sb)))
-        return 100.0 * (inter / denom)
+def _iter_sentences(pages: Iterable[Tuple[str, str]], tm_nlp) -> Iterator[Tuple[str, str]]:
+    """(setning, sidenr) side for side – SpaCy hvis tilgjengelig, ellers regex-splitting."""
+    for page_no, page_text in pages:
+        page_sents: List[str] = []
+        if tm_nlp:
+            try:
+                for s in tm_nlp(page_text).sents:
+                    st = (s.text or "").strip()
+                    if st:
+                        page_sents.append(st)
+            except Exception:
+                for st in re.split(r'(?<=[.!?])\s+', page_text):
+                    st = st.strip()
+                    if st:
+                        page_sents.append(st)
+        else:
+            for st in re.split(r'(?<=[.!?])\s+', page_text):
+                st = st.strip()
+                if st:
+                    page_sents.append(st)
+        for st in page_sents:
+            yield st, page_no
 
-    if sem:
-        q = sem.encode([req_text], convert_to_numpy=True, normalize_embeddings=True)
-        q = np.asarray(q).reshape(-1)
-        if q.size == 0:
-            return []
-        for std, chunks in ns_index.items():
-            if not chunks:
-                continue
-            sims: List[Tuple[float, Dict[str, Any]]] = []
-            for c in chunks:
-                v = c.get("emb")
-                if v is None:
-                    v = sem.encode([c["tekst"]], convert_to_numpy=True, normalize_embeddings=True)
-                v = np.asarray(v).reshape(-1)
-                if v.size == 0:
-                    continue
-                sc = float(np.dot(q, v))
-                sims.append((sc, c))
-            sims.sort(key=lambda x: x[0], reverse=True)
-            for score, c in sims[:max_hits_per_std]:
-                out.append({
-                    "standard": std,
-                    "side": c["side"],
-                    "tekst": c["tekst"][:500].strip(),
-                    "score": round(float(score) * 100.0, 1),
-                })
-    else:
-        for std, chunks in ns_index.items():
-            if not chunks:
-                continue
-            pairs = [(_token_overlap(req_text, c["tekst"]), c) for c in chunks]
-            pairs.sort(key=lambda x: x[0], reverse=True)
-            for sc, c in pairs[:max_hits_per_std]:
-                if sc <= 0:
-                    continue
-                out.append({
-                    "standard": std,
-                    "side": c["side"],
-                    "tekst": c["tekst"][:500].strip(),
-                    "score": round(float(sc), 1),
-                })
-    out.sort(key=lambda x: x["score"], reverse=True)
-    return out[:5]
 
+def _iter_atoms(sentences: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+    for sent, pg in sentences:
+        for c in _split_atomic_requirements(sent):
+            yield c, pg
 
-# ===========================================================================
-#  ERSTATT HELE DEN GAMLE extract_requirements-FUNKSJONEN MED DENNE
-# ===========================================================================
 
 def extract_requirements(
     text: str,
@@ -768,6 +939,55 @@ def extract_requirements(
     selected_groups: Optional[List[str]] = None,
     **kwargs,
 ) -> List[Dict[str, Any]]:
+    """Krav fra ferdig renset tekst (med eller uten [[SIDE n]]-markører), sortert."""
+    results = list(iter_requirements(
+        _iter_text_pages(text), selected_function_groups, file_name, min_score, file_type,
+        ns_standard_selection=ns_standard_selection, mode=mode, fokus_text=fokus_text,
+        use_fokus_prefilter=use_fokus_prefilter, fokus_threshold=fokus_threshold,
+        selected_groups=selected_groups, **kwargs,
+    ))
+    results.sort(key=lambda x: (x.get("keyword", ""), -float(x.get("score", 0.0))))
+    return results
+
+
+def extract_requirements_from_pages(
+    pages: Iterable[Tuple[str, str]],
+    selected_function_groups: List[str],
+    file_name: str,
+    min_score: float,
+    file_type: str,
+    **kwargs,
+) -> List[Dict[str, Any]]:
+    """
+    Som extract_requirements, men tar (sidenr, renset sidetekst) fra en generator
+    (f.eks. iter_clean_pages over PyMuPDF-sider). Gir samme resultat som
+    extract_requirements(clean_text(<hele teksten>)).
+    """
+    results = list(iter_requirements(pages, selected_function_groups, file_name, min_score, file_type, **kwargs))
+    results.sort(key=lambda x: (x.get("keyword", ""), -float(x.get("score", 0.0))))
+    return results
+
+
+def iter_requirements(
+    pages: Iterable[Tuple[str, str]],
+    selected_function_groups: List[str],
+    file_name: str,
+    min_score: float,
+    file_type: str,
+    ns_standard_selection: str = "Ingen",
+    mode: str = "keywords_ai",
+    fokus_text: str = "",
+    use_fokus_prefilter: bool = True,
+    fokus_threshold: float = 0.60,
+    selected_groups: Optional[List[str]] = None,
+    **kwargs,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Strømmende kravuthenting. Sidene leses etter behov; funn gis i dokumentrekkefølge
+    i blokker på SEM_BATCH_SIZE (usortert – sorteringen gjøres av kallende funksjon).
+    Sammenslåing av nabobiter (_enrich_clause) ser fremover via en lat buffer, så
+    resultatet er identisk med å behandle hele dokumentet på én gang.
+    """
 
     # Reload fag-modell (best-effort, uten å feile analyse)
     _reload_fag_model()
@@ -784,105 +1004,28 @@ def extract_requirements(
     ai_min_thr = float(os.getenv("FAG_PRED_THRESHOLD", "0.60"))
 
     # --- Bygg søkeliste fra nokkelord.json (inkl. synonymer) ---
-    kw_all = []
+    kw_all: List[str] = []
+    kw_index = None
     try:
         app_dir = Path(__file__).resolve().parent.parent  # .../app
         nokkelord_path = app_dir / "data" / "nokkelord.json"
-        if nokkelord_path.exists():
-            nokkelord_data = json.loads(nokkelord_path.read_text(encoding="utf-8"))
-
-            search_terms = set()
-            for fag, funksjonssamlinger in nokkelord_data.items():
-                for fs_navn, nokkelord in funksjonssamlinger.items():
-                    if fs_navn in selected_function_groups:
-                        for nokkelord_navn, synonymer in nokkelord.items():
-                            search_terms.add(nokkelord_navn.lower())
-                            for synonym in synonymer:
-                                search_terms.add(synonym.lower())
-
-            kw_all = sorted(list(search_terms))
-            _log.info("Bygget søkeliste med %d termer fra %d valgte grupper.", len(kw_all), len(selected_function_groups))
+        kw_all, kw_index = get_keyword_index(nokkelord_path, selected_function_groups)
+        _log.info("Bygget søkeliste med %d termer fra %d valgte grupper.", len(kw_all), len(selected_function_groups))
     except Exception as e:
         _log.error("Kunne ikke bygge nøkkelordliste fra nokkelord.json: %s", e)
         # Fortsetter med tom liste hvis det feiler
 
-    # --- Del opp i setninger (m/ sideinfo hvis tilgjengelig) ---
-    sentences: List[str] = []
-    page_for_sent: List[str] = []
-    parts = re.split(r'\[\[SIDE\s+(\d+)\]\]', text or "")
+    # --- Setninger (m/ sideinfo) → “atomiske” kravkandidater, hentet etter behov ---
     tm_nlp = getattr(tm, "nlp", None)
-
-    if len(parts) >= 3:
-        it = iter(parts[1:])
-        for page_no, page_text in zip(it, it):
-            page_no = str(page_no).strip()
-            if tm_nlp:
-                try:
-                    doc = tm_nlp(page_text)
-                    for s in doc.sents:
-                        st = (s.text or "").strip()
-                        if st:
-                            sentences.append(st)
-                            page_for_sent.append(page_no)
-                except Exception:
-                    for st in re.split(r'(?<=[.!?])\s+', page_text):
-                        st = st.strip()
-                        if st:
-                            sentences.append(st)
-                            page_for_sent.append(page_no)
-            else:
-                for st in re.split(r'(?<=[.!?])\s+', page_text):
-                    st = st.strip()
-                    if st:
-                        sentences.append(st)
-                        page_for_sent.append(page_no)
-    else:
-        page_no = "Ukjent"
-        if tm_nlp:
-            try:
-                for s in tm_nlp(text or "").sents:
-                    st = (s.text or "").strip()
-                    if st:
-                        sentences.append(st)
-                        page_for_sent.append(page_no)
-            except Exception:
-                for st in re.split(r'(?<=[.!?])\s+', text or ""):
-                    st = st.strip()
-                    if st:
-                        sentences.append(st)
-                        page_for_sent.append(page_no)
-        else:
-            for st in re.split(r'(?<=[.!?])\s+', text or ""):
-                st = st.strip()
-                if st:
-                    sentences.append(st)
-                    page_for_sent.append(page_no)
-
-    if not sentences:
-        return []
-
-    # --- Bygg “atomiske” kravkandidater ---
-    raw_atoms: List[str] = []
-    raw_pages: List[str] = []
-    for sent, pg in zip(sentences, page_for_sent):
-        for c in _split_atomic_requirements(sent):
-            raw_atoms.append(c)
-            raw_pages.append(pg)
-
-    if not raw_atoms:
-        return []
+    raw = _AtomBuffer(_iter_atoms(_iter_sentences(pages, tm_nlp)))
+    if _clause_at(raw, 0) is None:
+        return
 
     # --- Scoring-hjelpere ---
     def kw_score(s: str) -> Tuple[float, str]:
-        if not kw_all:
+        if not kw_all or kw_index is None:
             return 0.0, ""
-        s_norm = s.lower()
-        best, best_kw = 0.0, ""
-        for kw in kw_all:
-            sc = float(token_set_ratio(s_norm, kw))
-            if sc > best:
-                best, best_kw = sc, kw
-        return best, best_kw
+        return kw_index.score(s)
 
     def rule_ai_score(s: str) -> float:
         sl = s.lower()
@@ -921,59 +1064,58 @@ def extract_requirements(
         except Exception:
             sem_kw_vecs = None
 
+    # Semantiske scorer beregnes i batch per unike tekst; begrenset LRU så minnet ikke vokser med dokumentet
+    sem_cache: "OrderedDict[str, float]" = OrderedDict()
+
+    def _remember(items: Iterable[Tuple[str, float]]) -> None:
+        for t, v in items:
+            sem_cache[t] = v
+            sem_cache.move_to_end(t)
+        while len(sem_cache) > SEM_SCORE_CACHE_MAX:
+            sem_cache.popitem(last=False)
+
+    def prime_semantic(texts: Iterable[str]) -> None:
+        if not (sem and sem_kw_vecs is not None and len(kw_all) > 0):
+            return
+        todo = [t for t in dict.fromkeys(texts) if t not in sem_cache]
+        if not todo:
+            return
+        try:
+            _remember(zip(todo, _semantic_kw_scores_batch(sem, todo, sem_kw_vecs)))
+        except Exception as e:
+            _log.warning("Batch-encoding av %d setninger feilet: %s", len(todo), e)
+            _remember((t, 0.0) for t in todo)
+
     def semantic_kw_score(s: str) -> float:
         if not (sem and sem_kw_vecs is not None and len(kw_all) > 0):
             return 0.0
-        q = sem.encode([s], convert_to_numpy=True, normalize_embeddings=True)
-        q = np.asarray(q).reshape(-1)
-        if q.size == 0:
+        if s not in sem_cache:
+            prime_semantic([s])
+        v = sem_cache.get(s)
+        if v is None:
             return 0.0
-        sims = np.dot(sem_kw_vecs, q)
-        try:
-            mx = float(np.max(sims))
-        except Exception:
-            mx = 0.0
-        return float(mx * 100.0)
+        sem_cache.move_to_end(s)
+        return v
 
     use_kw = mode in ("keywords", "keywords_ai")
     use_rules = mode in ("ai", "keywords_ai")
 
-    # --- Kontekstuell sammenslåing ---
-    atoms: List[str] = []
-    pages: List[str] = []
-    i = 0
-    while i < len(raw_atoms):
-        c = raw_atoms[i]
-        pg = raw_pages[i]
-        kw_sc, _mkw = (kw_score(c) if use_kw else (0.0, ""))
-        sem_sc = semantic_kw_score(c) if use_kw else 0.0
-        strong = (kw_sc >= _cfg["kw_strong"]) or (sem_sc >= _cfg["sem_strong"])
-        if strong:
-            merged, used = _enrich_clause(raw_atoms, i, dom_profile)
-            atoms.append(merged)
-            pages.append(pg)
-            i += int(used)
-        else:
-            atoms.append(c)
-            pages.append(pg)
-            i += 1
-
-    # --- NS-standard mapping ---
+    # --- NS-standard mapping (indeksen lastes ved første blokk med funn) ---
     active_stds = {k: v for k, v in PDF_STANDARDER.items() if v.get("aktiv")}
     if ns_standard_selection and ns_standard_selection != "Ingen":
         active_stds = {k: v for k, v in active_stds.items() if k == ns_standard_selection}
-    ns_index = _ns_load_or_build_index(tm, active_stds) if active_stds else {}
+    ns_index: Any = None
 
     if not _get_fag_model():
         _log.warning("Fag-modell ikke lastet – gruppe bestemmes via regex hvis AI ikke gir treff.")
 
     eff_min_score = float(min_score) if min_score is not None else float(_cfg["min_score_default"])
+    step = max(1, SEM_BATCH_SIZE)
 
-    results: List[Dict[str, Any]] = []
-
-    for s, pg in zip(atoms, pages):
+    def screen_atom(s: str) -> Tuple[float, str, float, float, float] | None:
+        """Filtrering og scoring. Fag klassifiseres etterpå, samlet for blokken (score_block)."""
         if not is_valid_requirement(s):
-            continue
+            return None
 
         kw_sc, match_kw = (kw_score(s) if use_kw else (0.0, ""))
         ai_sc = rule_ai_score(s) if use_rules else 0.0
@@ -989,7 +1131,7 @@ def extract_requirements(
         score = max(0.0, min(100.0, combined + fokus_boost(s)))
         uncertain = score < eff_min_score
         if uncertain and score < GUARDED_PREVIEW_LOW_THR:
-            continue
+            return None
 
         if use_fokus_prefilter and use_rules and fokus_text:
             fokus_tokens = [t for t in re.split(r"[ ,;/]", fokus_text.lower()) if t]
@@ -999,18 +1141,21 @@ def extract_requirements(
                 thr = float(fokus_threshold if fokus_threshold is not None else _cfg["focus_threshold"])
                 if sim < thr:
                     if not (use_kw and (kw_sc >= _cfg["kw_strong"] or sem_sc >= _cfg["sem_strong"])):
-                        continue
+                        return None
+        return kw_sc, match_kw, ai_sc, sem_sc, score
+
+    def build_req(s: str, pg: str, screened: Tuple[float, str, float, float, float],
+                  fag: Tuple[Any, List[Tuple[str, float]]]) -> Dict[str, Any]:
+        kw_sc, match_kw, ai_sc, sem_sc, score = screened
 
+        # NS-treff fylles inn i batch per blokk
         ns_treff: List[Dict[str, Any]] = []
-        if ns_index:
-            ns_hits = _ns_semantic_hits(tm, ns_index, s, max_hits_per_std=_cfg["ns_hits_per_std"])
-            ns_treff = [h for h in ns_hits if h["score"] >= _cfg["ns_hit_min"]]
 
         # --- TYPE + FAG (AI først; fallback regex) ---
         kravtype = classify_type(s)
 
         # >>> NYTT: bruk sentral AI-terskel (ai_min_thr) <<<
-        best_fag, _rank = classify_group_ai(s, min_score=ai_min_thr)
+        best_fag, _rank = fag
 
         top_sc = float(_rank[0][1]) if _rank else 0.0
         if best_fag:
@@ -1042,7 +1187,7 @@ def extract_requirements(
         }
 
         # >>> VIKTIG: eksporter både 'gruppe' OG 'fag' til UI/revisjon <<<
-        results.append({
+        return {
             "keyword": used_kw or ("(AI)"),
             "text": s,
             "score": round(float(score), 1),
@@ -1071,10 +1216,63 @@ def extract_requirements(
             "explain": explain,
             "ns_pin": None,
             "ns_quality": None,
-        })
+        }
 
-    results.sort(key=lambda x: (x.get("keyword", ""), -float(x.get("score", 0.0))))
-    return results
+    def score_block(block: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        nonlocal ns_index
+        # Sammenslåtte setninger er nye tekster – valider og encode dem samlet før scoring
+        valid = is_valid_requirement_batch(a for a, _ in block)
+        if use_kw:
+            prime_semantic(a for (a, _), ok in zip(block, valid) if ok)
+        kept = [(a, pg, sc) for (a, pg), sc in ((x, screen_atom(x[0])) for x in block) if sc is not None]
+        # Fag-klassifisering for hele blokken i ett vektorisert kall (AI-terskel: ai_min_thr)
+        fags = classify_group_ai_batch([a for a, _, _ in kept], min_score=ai_min_thr)
+        out = [build_req(a, pg, sc, fag) for (a, pg, sc), fag in zip(kept, fags)]
+
+        # --- NS-treff for alle krav i blokken i én batch ---
+        if ns_index is None:
+            ns_index = _ns_load_or_build_index(tm, active_stds) if active_stds else {}
+        if ns_index and out:
+            batch_hits = _ns_semantic_hits_batch(tm, ns_index, [r["text"] for r in out],
+                                                 max_hits_per_std=_cfg["ns_hits_per_std"])
+            for r, ns_hits in zip(out, batch_hits):
+                r["ns_treff"] = [h for h in ns_hits if h["score"] >= _cfg["ns_hit_min"]]
+        return out
+
+    # --- Kontekstuell sammenslåing (strømmende, med oppslag fremover i bufferen) ---
+    block: List[Tuple[str, str]] = []
+    primed_to = 0
+    i = 0
+    while True:
+        cur = _clause_at(raw, i)
+        if cur is None:
+            break
+        c, pg = raw.item(i)
+        if use_kw and i >= primed_to:
+            ahead = raw.window(i, i + step)
+            prime_semantic(ahead)
+            primed_to = i + len(ahead)
+        kw_sc, _mkw = (kw_score(c) if use_kw else (0.0, ""))
+        sem_sc = semantic_kw_score(c) if use_kw else 0.0
+        strong = (kw_sc >= _cfg["kw_strong"]) or (sem_sc >= _cfg["sem_strong"])
+        if strong:
+            merged, used = _enrich_clause(raw, i, dom_profile)
+            block.append((merged, pg))
+            i += int(used)
+        else:
+            block.append((c, pg))
+            i += 1
+        # _enrich_clause ser én bit bakover
+        raw.release(i - 1)
+        if len(block) >= step:
+            yield from score_block(block)
+            block = []
+
+    if block:
+        yield from score_block(block)
+
+    if kw_index is not None and use_kw:
+        _log.info("Nøkkelord-indeks: %s", kw_index.stats())
 
 
 # ---------------------------------------------------------------------------
@@ -1123,9 +1321,126 @@ def _norm_source(req: Dict[str, Any]) -> str:
     return _normalize_for_fuzzy(base)
 
 
-def deduplicate_requirements(requirements: List[Dict[str, Any]], threshold: int = 95, scope: str = "per_file") -> List[Dict[str, Any]]:
+def _dedup_sim(a: str, b: str) -> float:
+    return max(token_set_ratio(a, b), fuzz_ratio(a, b), partial_ratio(a, b))
+
+
+def _cluster_greedy(norms: List[str], threshold: float) -> List[int]:
+    """Referanse: grådig klynging – hvert krav sammenlignes mot alle klynge-representanter (O(n·k))."""
+    reps: List[str] = []
+    assign: List[int] = []
+    for tr in norms:
+        for ci, rep in enumerate(reps):
+            if _dedup_sim(tr, rep) >= threshold:
+                assign.append(ci)
+                break
+        else:
+            assign.append(len(reps))
+            reps.append(tr)
+    return assign
+
+
+def _rarest(keys: frozenset, df: Dict[str, int], n: int) -> List[str]:
+    """De n sjeldneste nøklene som forekommer i minst to krav (unike nøkler kan ikke gi treff)."""
+    return sorted((k for k in keys if df[k] > 1), key=lambda k: (df[k], k))[:n]
+
+
+def _char_grams(s: str, q: int = DEDUP_GRAM) -> frozenset:
+    return frozenset(s[i:i + q] for i in range(max(1, len(s) - q + 1)))
+
+
+def _passes(a: str, b: str, threshold: float) -> bool:
+    """
+    Samme avgjørelse som _dedup_sim(a, b) >= threshold, men billigere: score_cutoff gir tidlig
+    avbrudd, og partial_ratio (den dyre) hoppes over når LCS utelukker treff –
+    partial_ratio >= t krever LCS(kort, lang) >= len(kort)·t/(200 - t).
+    """
+    if fuzz_ratio(a, b, score_cutoff=threshold) or token_set_ratio(a, b, score_cutoff=threshold):
+        return True
+    short, long_ = (a, b) if len(a) <= len(b) else (b, a)
+    if LCSseq.similarity(short, long_) < len(short) * threshold / (200 - threshold) - 1e-9:
+        return False
+    return bool(partial_ratio(a, b, score_cutoff=threshold))
+
+
+class _PrefixIndex:
+    """
+    Prefiks-filter for én nøkkeltype: representantene indekseres på alle nøkler og på sine
+    sjeldneste nøkler. Et krav slår opp sine sjeldneste nøkler i den første og alle nøkler
+    i den andre, slik at både "kort i langt" og "langt rundt kort" finner hverandre.
+    """
+
+    def __init__(self, keysets: Iterable[frozenset]):
+        self.df: Dict[str, int] = defaultdict(int)
+        for ks in keysets:
+            for k in ks:
+                self.df[k] += 1
+        self.all_idx: Dict[str, List[int]] = defaultdict(list)
+        self.pre_idx: Dict[str, List[int]] = defaultdict(list)
+
+    def candidates(self, keys: frozenset, n: int, out: set) -> None:
+        for k in _rarest(keys, self.df, n):
+            out.update(self.all_idx.get(k, ()))
+        for k in keys:
+            out.update(self.pre_idx.get(k, ()))
+
+    def add(self, ci: int, keys: frozenset, n: int) -> None:
+        for k in keys:
+            self.all_idx[k].append(ci)
+        for k in _rarest(keys, self.df, n):
+            self.pre_idx[k].append(ci)
+
+
+def _cluster_blocked(norms: List[str], threshold: float, prefix: int = DEDUP_PREFIX_TOKENS,
+                     prefix_grams: int = DEDUP_PREFIX_GRAMS) -> List[int]:
+    """
+    Grådig klynging med blokkering: kun representanter som deler en sjelden nøkkel med kravet
+    fuzzy-sammenlignes (samme terskler og samme "første klynge vinner" som _cluster_greedy).
+    - Tokens fanger delmengder og omstokkede ledd (token_set_ratio)
+    - Tegn-4-gram fanger skrivefeil, endrede tall og delstrenger (ratio/partial_ratio).
+      Antall prefiks-gram følger hvor mange gram terskelen tillater å ødelegge (maks prefix_grams).
+    Identiske tekster gjenbruker forrige tildeling direkte.
+    """
+    toks = [frozenset(n.split()) for n in norms]
+    tok_idx = _PrefixIndex(toks)
+    gram_idx = _PrefixIndex(_char_grams(n) for n in norms)  # gram-sett holdes ikke for alle krav
+    slack = 2 * (100 - threshold) / 100  # maks indel-avstand per tegn ved gitt terskel
+
+    by_text: Dict[str, int] = {}
+    reps: List[str] = []
+    assign: List[int] = []
+    for tr, ts in zip(norms, toks):
+        ci = by_text.get(tr)
+        if ci is None:
+            gs = _char_grams(tr)
+            n_grams = min(prefix_grams, DEDUP_GRAM * int(len(tr) * slack) + 1)
+            cands: set = set()
+            tok_idx.candidates(ts, prefix, cands)
+            gram_idx.candidates(gs, n_grams, cands)
+            for c in sorted(cands):
+                if _passes(tr, reps[c], threshold):
+                    ci = c
+                    break
+            else:
+                ci = len(reps)
+                reps.append(tr)
+                tok_idx.add(ci, ts, prefix)
+                gram_idx.add(ci, gs, n_grams)
+            by_text[tr] = ci
+        assign.append(ci)
+    return assign
+
+
+def deduplicate_requirements(requirements: List[Dict[str, Any]], threshold: int = 95, scope: str = "per_file",
+                             method: str | None = None) -> List[Dict[str, Any]]:
+    """
+    Slår sammen nær-like krav per fil (scope="per_file") eller globalt.
+    method: "blocking" (token-/n-gram-blokkering, standard via KS_DEDUP_METHOD) eller "exact"
+    (sammenligning mot alle klynger). Grupper med <= KS_DEDUP_EXACT_MAX krav kjøres alltid eksakt.
+    """
     if not requirements:
         return []
+    method = (method or DEDUP_METHOD).lower()
 
     def key(req: Dict[str, Any]):
         return req['ref'].split(' / ')[0] if scope == "per_file" else "__GLOBAL__"
@@ -1138,27 +1453,21 @@ def deduplicate_requirements(requirements: List[Dict[str, Any]], threshold: int
 
     for _, reqs in groups.items():
         reqs_sorted = sorted(reqs, key=lambda x: (x.get('score', 0.0), len(x.get('text', ''))), reverse=True)
-        clusters: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]] = []
-        reps_norm: List[str] = []
-
-        for r in reqs_sorted:
-            tr = _norm_source(r)
-            placed = False
-            for ci, (_rep, items) in enumerate(clusters):
-                sim = max(
-                    token_set_ratio(tr, reps_norm[ci]),
-                    fuzz_ratio(tr, reps_norm[ci]),
-                    partial_ratio(tr, reps_norm[ci]),
-                )
-                if sim >= threshold:
-                    items.append(r)
-                    placed = True
-                    break
-            if not placed:
-                clusters.append([r, [r]])
-                reps_norm.append(_norm_source(r))
+        norms = [_norm_source(r) for r in reqs_sorted]
+        if method == "exact" or len(norms) <= DEDUP_EXACT_MAX:
+            assign = _cluster_greedy(norms, threshold)
+        else:
+            assign = _cluster_blocked(norms, threshold)
+
+        clusters: List[List[Dict[str, Any]]] = []
+        for r, ci in zip(reqs_sorted, assign):
+            if ci == len(clusters):
+                clusters.append([r])
+            else:
+                clusters[ci].append(r)
 
-        for rep, items in clusters:
+        for items in clusters:
+            rep = items[0]
             merged = dict(rep)
             merged['dup_count'] = len(items) - 1
             merged['ref'] = _merge_refs(items)
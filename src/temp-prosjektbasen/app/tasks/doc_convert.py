@@ -0,0 +1,381 @@
+# app/tasks/doc_convert.py
+# -*- coding: utf-8 -*-
+"""
+Pool av LibreOffice-arbeidere for .doc → .docx (kravsporing).
+
+Hver plass (slot) i poolen har sin egen, varige profilmappe (-env:UserInstallation), slik at
+samtidige konverteringer ikke slåss om samme brukerprofil, og profilen bare bygges første gang.
+Jobber legges i en felles kø; en ledig plass henter så mange jobber som er klare (maks
+KS_DOC_BATCH_MAX) og konverterer dem i ett soffice-kall, slik at oppstartskostnaden deles.
+
+- Tidsavbrudd per konvertering (KS_DOC_CONVERT_TIMEOUT, skaleres med batch-størrelsen)
+- Ved krasj/tidsavbrudd drepes prosessgruppen, profilen nullstilles og batchen kjøres
+  fil for fil, slik at én ødelagt fil ikke tar med seg resten
+- prefetch() starter konvertering i forkant; convert() henter ferdig resultat og venter høyst
+  tidsavbruddet per fil ganget med 1 + antall runder med uferdige jobber foran i køen
+- discard() forkaster forhåndskonverteringer som ikke ble hentet (kø-jobber avbrytes, ferdige slettes)
+- stats() gir tellere og gjennomstrømning
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import math
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+_log = logging.getLogger(__name__)
+
+SOFFICE_BIN = os.getenv("KS_SOFFICE_BIN", "soffice")
+DOC_POOL_SIZE = max(1, int(os.getenv("KS_DOC_POOL_SIZE", str(min(2, os.cpu_count() or 1)))))
+DOC_CONVERT_TIMEOUT = float(os.getenv("KS_DOC_CONVERT_TIMEOUT", "120"))
+DOC_BATCH_MAX = max(1, int(os.getenv("KS_DOC_BATCH_MAX", "16")))
+DOC_PROFILE_ROOT = Path(os.getenv("KS_DOC_PROFILE_ROOT", str(Path(tempfile.gettempdir()) / "ks_lo_profiles")))
+
+
+class _Job:
+    __slots__ = ("src", "future", "solo", "queued_at", "seq")
+
+    def __init__(self, src: Path, solo: bool = False, seq: int = 0):
+        self.src = src
+        self.future: Future = Future()
+        self.solo = solo
+        self.queued_at = time.perf_counter()
+        self.seq = seq
+
+
+class ConversionPool:
+    """Begrenset pool av headless LibreOffice-plasser med kø. Trådsikker; kaster aldri fra convert()."""
+
+    def __init__(self, size: int = DOC_POOL_SIZE, timeout: float = DOC_CONVERT_TIMEOUT,
+                 batch_max: int = DOC_BATCH_MAX, soffice: str = SOFFICE_BIN,
+                 profile_root: Path = DOC_PROFILE_ROOT):
+        self.size = max(1, int(size))
+        self.timeout = float(timeout)
+        self.batch_max = max(1, int(batch_max))
+        self.soffice = soffice
+        self.root = Path(profile_root) / f"pool_{os.getpid()}_{id(self):x}"
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _Job] = {}
+        self._procs: Dict[int, subprocess.Popen] = {}
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self._missing_bin = False
+        self._seq = 0
+        self._stats = {"submitted": 0, "converted": 0, "failed": 0, "timeouts": 0, "restarts": 0,
+                       "batches": 0, "discarded": 0, "busy_seconds": 0.0, "wait_seconds": 0.0}
+        self._started_at = time.perf_counter()
+
+    # --- Offentlig API ---
+    def submit(self, src: Path) -> Future:
+        """Legger filen i køen. Future gir sti til .docx i poolens resultatmappe, eller None."""
+        return self._submit(Path(src).resolve()).future
+
+    def _submit(self, src: Path) -> _Job:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Konverteringspoolen er stengt.")
+            job = self._pending.get(str(src))
+            if job is not None:
+                return job
+            self._seq += 1
+            job = _Job(src, seq=self._seq)
+            self._pending[str(src)] = job
+            self._stats["submitted"] += 1
+            self._ensure_started()
+        self._queue.put(job)
+        return job
+
+    def prefetch(self, paths: Iterable[Path]) -> int:
+        """Starter konvertering av filene i forkant. Returnerer antall filer lagt i kø."""
+        n = 0
+        for p in paths:
+            self.submit(p)
+            n += 1
+        return n
+
+    def convert(self, src: Path, out_dir: Path, timeout: Optional[float] = None) -> Optional[Path]:
+        """Konverterer (eller henter forhåndskonvertert) fil til out_dir/<stem>.docx. None ved feil."""
+        src = Path(src).resolve()
+        job = self._submit(src)
+        fut = job.future
+        try:
+            res = fut.result(timeout=timeout if timeout is not None else self._wait_timeout(job))
+        except Exception as e:
+            _log.warning("[.doc→.docx] Ingen konvertering av %s: %s", src.name, e)
+            res = None
+        finally:
+            with self._lock:
+                if self._pending.get(str(src)) is not None and self._pending[str(src)].future is fut:
+                    del self._pending[str(src)]
+        if res is None:
+            return None
+        out_dir.mkdir(parents=True, exist_ok=True)
+        target = out_dir / (src.stem + ".docx")
+        try:
+            shutil.move(str(res), str(target))
+        except Exception as e:
+            _log.warning("[.doc→.docx] Kunne ikke flytte resultat for %s: %s", src.name, e)
+            return None
+        shutil.rmtree(Path(res).parent, ignore_errors=True)
+        return target
+
+    def _wait_timeout(self, job: _Job) -> float:
+        """Tidsavbrudd per fil, pluss ett per runde med uferdige jobber foran i køen (fordelt på plassene)."""
+        with self._lock:
+            ahead = sum(1 for j in self._pending.values() if j.seq < job.seq and not j.future.done())
+        return self.timeout * (1 + math.ceil(ahead / self.size))
+
+    def discard(self, paths: Iterable[Path]) -> int:
+        """
+        Forkaster forhåndskonverteringer som ikke er hentet med convert(): jobber i kø avbrytes,
+        ferdige resultater slettes. Returnerer antall forkastede jobber.
+        """
+        n = 0
+        for p in paths:
+            with self._lock:
+                job = self._pending.pop(str(Path(p).resolve()), None)
+            if job is None:
+                continue
+            n += 1
+            # Avbrytes hvis ingen plass har startet den; ellers ryddes resultatet når det kommer
+            if not job.future.cancel():
+                job.future.add_done_callback(_drop_result)
+        if n:
+            with self._lock:
+                self._stats["discarded"] += n
+        return n
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            s = dict(self._stats)
+            s["queued"] = self._queue.qsize()
+            s["slots"] = self.size
+        elapsed = max(1e-9, time.perf_counter() - self._started_at)
+        s["avg_seconds"] = s["busy_seconds"] / max(1, s["converted"] + s["failed"])
+        s["per_minute"] = 60.0 * s["converted"] / elapsed
+        return s
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+            procs = list(self._procs.values())
+        for _ in threads:
+            self._queue.put(None)
+        if not wait:
+            for p in procs:
+                self._kill(p)
+        for t in threads:
+            t.join(timeout=None if wait else 1.0)
+        # Jobber som aldri ble kjørt
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and not job.future.done():
+                job.future.set_result(None)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    # --- Interne ---
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        for slot in range(self.size):
+            t = threading.Thread(target=self._worker, args=(slot,), name=f"lo-slot-{slot}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _profile(self, slot: int) -> Path:
+        return self.root / f"slot_{slot}" / "profile"
+
+    def _next_batch(self, first: _Job, deferred: List[_Job]) -> List[_Job]:
+        """Samler klare jobber (unike filnavn, siden alle havner i samme utmappe)."""
+        batch, stems = [first], {first.src.stem}
+        if first.solo:
+            return batch
+        while len(batch) < self.batch_max:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)  # la stopp-signalet gå videre
+                break
+            if job.future.cancelled():
+                continue
+            if job.solo or job.src.stem in stems:
+                deferred.append(job)
+                continue
+            batch.append(job)
+            stems.add(job.src.stem)
+        return batch
+
+    def _worker(self, slot: int) -> None:
+        deferred: List[_Job] = []
+        while True:
+            job = deferred.pop(0) if deferred else self._queue.get()
+            if job is None:
+                for j in deferred:
+                    self._queue.put(j)
+                return
+            if job.future.cancelled():
+                continue
+            batch = self._next_batch(job, deferred)
+            try:
+                self._run_batch(slot, batch)
+            except Exception as e:  # aldri la en plass dø
+                _log.warning("[.doc→.docx] Uventet feil i LibreOffice-plass %d: %s", slot, e, exc_info=True)
+                for j in batch:
+                    if not j.future.done():
+                        self._finish(j, None)
+
+    def _run_batch(self, slot: int, batch: List[_Job]) -> None:
+        if self._missing_bin:
+            for j in batch:
+                self._finish(j, None)
+            return
+        out_dir = self.root / f"slot_{slot}" / f"out_{time.monotonic_ns():x}"
+        out_dir.mkdir(parents=True, exist_ok=True)
+        profile = self._profile(slot)
+        cmd = [self.soffice, f"-env:UserInstallation={profile.as_uri()}", "--headless", "--norestore",
+               "--nolockcheck", "--convert-to", "docx", "--outdir", str(out_dir)] + [str(j.src) for j in batch]
+        t0 = time.perf_counter()
+        with self._lock:
+            self._stats["batches"] += 1
+            for j in batch:
+                self._stats["wait_seconds"] += t0 - j.queued_at
+        crashed = timed_out = False
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                    start_new_session=True)
+        except FileNotFoundError:
+            self._missing_bin = True
+            _log_missing()
+            shutil.rmtree(out_dir, ignore_errors=True)
+            for j in batch:
+                self._finish(j, None)
+            return
+        with self._lock:
+            self._procs[slot] = proc
+        try:
+            _out, err = proc.communicate(timeout=self.timeout * len(batch))
+            if proc.returncode != 0:
+                crashed = True
+                _log.warning("[.doc→.docx] LibreOffice avsluttet med kode %s (%d filer): %s",
+                             proc.returncode, len(batch), (err or "").strip()[:500])
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            self._kill(proc)
+            _log.warning("[.doc→.docx] Tidsavbrudd etter %.0fs (%d filer): %s", self.timeout * len(batch),
+                         len(batch), ", ".join(j.src.name for j in batch))
+        finally:
+            with self._lock:
+                self._procs.pop(slot, None)
+                self._stats["busy_seconds"] += time.perf_counter() - t0
+
+        if crashed or timed_out:
+            with self._lock:
+                self._stats["restarts"] += 1
+            # Ødelagt profil er en vanlig årsak til krasj – neste start bygger den på nytt
+            shutil.rmtree(profile, ignore_errors=True)
+
+        for j in batch:
+            res = out_dir / (j.src.stem + ".docx")
+            if res.exists():
+                # Hver fil får sin egen mappe, så convert() kan flytte og rydde uavhengig av resten
+                own = out_dir.with_name(f"{out_dir.name}_{j.src.stem}")
+                own.mkdir(parents=True, exist_ok=True)
+                self._finish(j, res.replace(own / res.name))
+            elif (crashed or timed_out) and len(batch) > 1:
+                # Isoler feilen: prøv resten én og én
+                retry = _Job(j.src, solo=True)
+                retry.future = j.future
+                retry.queued_at = j.queued_at
+                self._queue.put(retry)
+            else:
+                if timed_out:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                self._finish(j, None)
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    def _finish(self, job: _Job, result: Optional[Path]) -> None:
+        with self._lock:
+            self._stats["converted" if result is not None else "failed"] += 1
+        if job.future.cancelled():
+            # Forkastet (discard) mens batchen kjørte
+            if result is not None:
+                shutil.rmtree(Path(result).parent, ignore_errors=True)
+        elif not job.future.done():
+            job.future.set_result(result)
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen) -> None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except Exception:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+        try:
+            proc.wait(timeout=5)
+        except Exception:
+            pass
+
+
+def _drop_result(fut: Future) -> None:
+    """Sletter resultatet til en forkastet jobb (egen mappe per fil, se _run_batch)."""
+    res = None if fut.cancelled() else fut.result()
+    if res is not None:
+        shutil.rmtree(Path(res).parent, ignore_errors=True)
+
+
+def _log_missing() -> None:
+    _log.warning("[.doc→.docx] Fant ikke 'soffice' (LibreOffice). Installer LibreOffice i miljøet for .doc-støtte.")
+
+
+_default: Optional[ConversionPool] = None
+_default_pid: Optional[int] = None
+_default_lock = threading.Lock()
+
+
+def get_conversion_pool() -> ConversionPool:
+    """Prosess-felles pool (ny pool etter fork, f.eks. i Celery prefork-prosesser)."""
+    global _default, _default_pid
+    with _default_lock:
+        if _default is None or _default_pid != os.getpid():
+            _default = ConversionPool()
+            _default_pid = os.getpid()
+        return _default
+
+
+def _shutdown_default() -> None:
+    if _default is not None and _default_pid == os.getpid():
+        _default.shutdown(wait=False)
+
+
+atexit.register(_shutdown_default)
+
+
+__all__ = [
+    "ConversionPool",
+    "get_conversion_pool",
+    "DOC_POOL_SIZE",
+    "DOC_CONVERT_TIMEOUT",
+    "DOC_BATCH_MAX",
+]
@@ -0,0 +1,314 @@
+# app/tasks/kw_index.py
+# -*- coding: utf-8 -*-
+"""
+Forhåndsbygget nøkkelord-indeks for kravsporing: beste token_set_ratio mot kw_all uten å
+score hele listen for hver setning.
+- Eksakte treff: alle tokens i nøkkelordet finnes i setningen (gir 100, som i rapidfuzz)
+- Lemma-treff: samme sjekk på lett stemmede tokens (brukes kun som kandidater)
+- Blokkering på tegn-trigrammer for å plukke ut en kort kandidatliste
+- Fuzzy-scoring (token_set_ratio) kun på kandidatlisten
+- Kontrollskann (standard, KW_INDEX_VERIFY=0 slår den av): nøkkelord utenfor kandidatlisten som
+  kan slå kandidatene med mer enn KW_INDEX_TOLERANCE scores også, slik at resultatet alltid ligger
+  innenfor toleransen av full skanning. Uten felles ord med setningen er token_set_ratio en ren
+  Indel-ratio av de sorterte ordene, maks 200·min(L, l)/(L + l) for lengdene L og l, så bare
+  nøkkelord som deler et ord med setningen eller har lengde nær setningens må scores.
+  Uten kontrollskann er scoren omtrentlig (kan ligge under full skanning).
+
+Korte lister (under KW_INDEX_MIN_KEYWORDS) skannes direkte – der er rapidfuzz sin
+C-løkke over alle nøkkelord raskere enn kandidatutvelgelsen.
+
+Indeksen bygges én gang per versjon (mtime/størrelse) av nokkelord.json og valgte
+funksjonsgrupper, og holder tellere for treffrate og latens.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+from rapidfuzz import process as rf_process
+from rapidfuzz.fuzz import token_set_ratio
+
+_log = logging.getLogger(__name__)
+
+# Maks antall kandidater som fuzzy-verifiseres per setning
+KW_INDEX_MAX_CANDIDATES = int(os.getenv("KW_INDEX_MAX_CANDIDATES", "48"))
+# Kontrollskann av nøkkelord utenfor kandidatlisten som kan slå kandidatene (0 = kun kandidater, omtrentlig)
+KW_INDEX_VERIFY = os.getenv("KW_INDEX_VERIFY", "1") == "1"
+# Tillatt avvik (score-poeng) mot full skanning. 0 gir samme score og nøkkelord som i dag.
+KW_INDEX_TOLERANCE = float(os.getenv("KW_INDEX_TOLERANCE", "0"))
+# Under så mange nøkkelord brukes full skanning direkte (ingen indeks)
+KW_INDEX_MIN_KEYWORDS = int(os.getenv("KW_INDEX_MIN_KEYWORDS", "500"))
+# Trigrammer som finnes i mer enn denne andelen av nøkkelordene brukes ikke til blokkering
+KW_INDEX_MAX_GRAM_SHARE = 0.25
+
+_SUFFIXES = ("ene", "ane", "er", "en", "et", "ar", "a", "e")
+
+
+def _stem(tok: str) -> str:
+    """Lett norsk stemming (bestemt form/flertall) – godt nok for kandidatutvelgelse."""
+    for suf in _SUFFIXES:
+        if len(tok) > len(suf) + 3 and tok.endswith(suf):
+            return tok[: -len(suf)]
+    return tok
+
+
+def _grams(s: str) -> set:
+    out = set()
+    for tok in s.split():
+        t = f" {tok} "
+        for i in range(len(t) - 2):
+            out.add(t[i:i + 3])
+    return out
+
+
+class KeywordIndex:
+    """Indeks over en sortert nøkkelordliste. `score()` gir (score, nøkkelord) som kw_score()."""
+
+    def __init__(self, keywords: Iterable[str], max_candidates: int = KW_INDEX_MAX_CANDIDATES,
+                 tolerance: float = KW_INDEX_TOLERANCE, verify: bool = KW_INDEX_VERIFY,
+                 min_keywords: int = KW_INDEX_MIN_KEYWORDS):
+        self.keywords: List[str] = list(keywords)
+        self.max_candidates = int(max_candidates)
+        self.tolerance = max(0.0, float(tolerance))
+        self.verify = bool(verify)
+        self.direct = len(self.keywords) < int(min_keywords)
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "exact_hits": 0, "lemma_hits": 0, "fuzzy_calls": 0,
+                       "rescans": 0, "seconds": 0.0}
+
+        tok_sets = [frozenset(kw.split()) for kw in self.keywords]
+        stem_sets = [frozenset(_stem(t) for t in ts) for ts in tok_sets]
+        self._tok_sets = tok_sets
+        self._stem_sets = stem_sets
+
+        # Eksakt/lemma: hvert nøkkelord henges på sitt sjeldneste token (Aho–Corasick-aktig oppslag)
+        self._anchor = self._build_anchor(tok_sets)
+        self._stem_anchor = self._build_anchor(stem_sets)
+
+        # Kontrollskann: alle nøkkelord per ord, og nøkkelordene sortert etter lengden token_set_ratio ser
+        tok_postings: Dict[str, List[int]] = defaultdict(list)
+        for i, ts in enumerate(tok_sets):
+            for t in ts:
+                tok_postings[t].append(i)
+        self._tok_postings = dict(tok_postings)
+        lens = [len(" ".join(sorted(ts))) for ts in tok_sets]
+        self._len_order = sorted(range(len(lens)), key=lambda i: (lens[i], i))
+        self._len_sorted = [lens[i] for i in self._len_order]
+
+        # Trigram-blokkering
+        grams_per_kw = [_grams(kw) for kw in self.keywords]
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for i, gs in enumerate(grams_per_kw):
+            for g in gs:
+                postings[g].append(i)
+        cap = max(8, int(len(self.keywords) * KW_INDEX_MAX_GRAM_SHARE))
+        self._postings = {g: ids for g, ids in postings.items() if len(ids) <= cap}
+        self._n_grams = [max(1, len(gs)) for gs in grams_per_kw]
+
+    @staticmethod
+    def _build_anchor(sets: List[frozenset]) -> Dict[str, List[int]]:
+        df: Dict[str, int] = defaultdict(int)
+        for ts in sets:
+            for t in ts:
+                df[t] += 1
+        anchor: Dict[str, List[int]] = defaultdict(list)
+        for i, ts in enumerate(sets):
+            if ts:
+                anchor[min(ts, key=lambda t: (df[t], t))].append(i)
+        return dict(anchor)
+
+    def _subset_hits(self, anchor: Dict[str, List[int]], sets: List[frozenset], toks: frozenset) -> List[int]:
+        hits = []
+        for t in toks:
+            for i in anchor.get(t, ()):
+                if sets[i] <= toks:
+                    hits.append(i)
+        return hits
+
+    def _shortlist(self, s_norm: str) -> List[int]:
+        counts: Dict[int, int] = defaultdict(int)
+        for g in _grams(s_norm):
+            for i in self._postings.get(g, ()):
+                counts[i] += 1
+        if not counts:
+            return []
+        best = heapq.nlargest(self.max_candidates, counts.items(),
+                              key=lambda kv: (kv[1] / self._n_grams[kv[0]], -kv[0]))
+        return [i for i, _ in best]
+
+    def _rescan_ids(self, toks: frozenset, cutoff: float, skip: set) -> List[int]:
+        """Nøkkelord utenfor `skip` som kan nå `cutoff`: felles ord med setningen, eller lengde nær setningens."""
+        ids = set()
+        for t in toks:
+            ids.update(self._tok_postings.get(t, ()))
+        if cutoff <= 0:
+            lo, hi = 0, len(self._len_order)
+        else:
+            L = len(" ".join(sorted(toks)))
+            # 200·min(L, l)/(L + l) >= cutoff  <=>  cutoff·L/(200 - cutoff) <= l <= L·(200 - cutoff)/cutoff
+            lo = bisect_left(self._len_sorted, cutoff * L / (200.0 - cutoff) - 1e-6)
+            hi = bisect_right(self._len_sorted, L * (200.0 - cutoff) / cutoff + 1e-6)
+        ids.update(self._len_order[lo:hi])
+        return sorted(ids - skip)
+
+    def score(self, s: str) -> Tuple[float, str]:
+        """Beste (score, nøkkelord) for teksten. Ved likhet vinner første nøkkelord i listen."""
+        if not self.keywords:
+            return 0.0, ""
+        t0 = time.perf_counter()
+        s_norm = s.lower()
+        if self.direct:
+            m = rf_process.extractOne(s_norm, self.keywords, scorer=token_set_ratio, score_cutoff=1e-9)
+            self._count(t0, fuzzy_calls=len(self.keywords))
+            return (float(m[1]), m[0]) if m is not None else (0.0, "")
+        toks = frozenset(s_norm.split())
+        exact = self._subset_hits(self._anchor, self._tok_sets, toks) if toks else []
+        if exact:
+            best, best_kw = 100.0, self.keywords[min(exact)]
+            self._count(t0, exact_hit=True)
+            return best, best_kw
+
+        stems = frozenset(_stem(t) for t in toks)
+        lemma = self._subset_hits(self._stem_anchor, self._stem_sets, stems) if stems else []
+        cands = sorted(set(lemma) | set(self._shortlist(s_norm)))
+        best, best_i = 0.0, -1
+        if cands:
+            m = rf_process.extractOne(s_norm, [self.keywords[i] for i in cands], scorer=token_set_ratio,
+                                      score_cutoff=1e-9)
+            if m is not None:
+                best, best_i = float(m[1]), cands[int(m[2])]
+
+        # Kontrollskann: finnes et nøkkelord utenfor kandidatlisten som slår oss med mer enn toleransen?
+        rescanned = False
+        cutoff = best + self.tolerance
+        extra: List[int] = []
+        if self.verify and toks and cutoff <= 100.0:
+            extra = self._rescan_ids(toks, cutoff, set(cands))
+            m = rf_process.extractOne(s_norm, [self.keywords[i] for i in extra], scorer=token_set_ratio,
+                                      score_cutoff=cutoff) if extra else None
+            if m is not None:
+                sc, i = float(m[1]), extra[int(m[2])]
+                if sc > best or (sc == best and (best_i < 0 or i < best_i)):
+                    best, best_i, rescanned = sc, i, True
+        self._count(t0, lemma_hit=bool(lemma), fuzzy_calls=len(cands) + len(extra), rescan=rescanned)
+        return best, (self.keywords[best_i] if best_i >= 0 and best > 0 else "")
+
+    def score_full(self, s: str) -> Tuple[float, str]:
+        """Referanse: lineær skanning over alle nøkkelord (dagens oppførsel)."""
+        s_norm = s.lower()
+        best, best_kw = 0.0, ""
+        for kw in self.keywords:
+            sc = float(token_set_ratio(s_norm, kw))
+            if sc > best:
+                best, best_kw = sc, kw
+        return best, best_kw
+
+    def _count(self, t0: float, exact_hit: bool = False, lemma_hit: bool = False,
+               fuzzy_calls: int = 0, rescan: bool = False) -> None:
+        with self._lock:
+            st = self._stats
+            st["queries"] += 1
+            st["rescans"] += int(rescan)
+            st["exact_hits"] += int(exact_hit)
+            st["lemma_hits"] += int(lemma_hit)
+            st["fuzzy_calls"] += int(fuzzy_calls)
+            st["seconds"] += time.perf_counter() - t0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._stats)
+        q = max(1, st["queries"])
+        return {
+            **st,
+            "keywords": len(self.keywords),
+            "mode": "full" if self.direct else ("index+verify" if self.verify else "index"),
+            "hit_rate": round(st["exact_hits"] / q, 4),
+            "avg_candidates": round(st["fuzzy_calls"] / q, 2),
+            "avg_latency_ms": round(1000.0 * st["seconds"] / q, 4),
+        }
+
+    def parity_check(self, samples: Iterable[str], tolerance: float | None = None) -> Dict[str, Any]:
+        """Sammenligner indeks-score mot full skanning. ok=True når alle avvik <= tolerance."""
+        tolerance = self.tolerance if tolerance is None else float(tolerance)
+        n, max_diff, over = 0, 0.0, 0
+        for s in samples:
+            a, _ = self.score(s)
+            b, _ = self.score_full(s)
+            d = abs(a - b)
+            n += 1
+            max_diff = max(max_diff, d)
+            over += int(d > tolerance)
+        return {"n": n, "max_diff": round(max_diff, 2), "over_tolerance": over,
+                "tolerance": tolerance, "ok": over == 0}
+
+
+# ---------------------------------------------------------------------------
+# Lasting og cache per nøkkelordfil-versjon
+# ---------------------------------------------------------------------------
+_CACHE_LOCK = threading.Lock()
+_INDEX_CACHE: "OrderedDict[tuple, Tuple[List[str], KeywordIndex]]" = OrderedDict()
+_INDEX_CACHE_MAX = 8
+
+
+def _file_version(path: Path) -> Tuple[str, int, int]:
+    try:
+        st = path.stat()
+        return str(path.resolve()), int(st.st_mtime_ns), int(st.st_size)
+    except Exception:
+        return str(path), 0, 0
+
+
+def _build_search_terms(nokkelord_data: dict, selected_function_groups: Iterable[str]) -> List[str]:
+    selected = set(selected_function_groups or [])
+    search_terms = set()
+    for fag, funksjonssamlinger in nokkelord_data.items():
+        for fs_navn, nokkelord in funksjonssamlinger.items():
+            if fs_navn in selected:
+                for nokkelord_navn, synonymer in nokkelord.items():
+                    search_terms.add(nokkelord_navn.lower())
+                    for synonym in synonymer:
+                        search_terms.add(synonym.lower())
+    return sorted(search_terms)
+
+
+def get_keyword_index(nokkelord_path: Path, selected_function_groups: Iterable[str]) -> Tuple[List[str], KeywordIndex]:
+    """Returnerer (kw_all, indeks) for valgte grupper. Bygges på nytt kun når filen endres."""
+    groups = tuple(sorted(set(selected_function_groups or [])))
+    key = (_file_version(Path(nokkelord_path)), groups)
+    with _CACHE_LOCK:
+        hit = _INDEX_CACHE.get(key)
+        if hit is not None:
+            _INDEX_CACHE.move_to_end(key)
+            return hit
+
+    kw_all: List[str] = []
+    p = Path(nokkelord_path)
+    if p.exists():
+        kw_all = _build_search_terms(json.loads(p.read_text(encoding="utf-8")), groups)
+    t0 = time.perf_counter()
+    idx = KeywordIndex(kw_all)
+    _log.info("Bygget nøkkelord-indeks (%d termer) på %.1f ms.", len(kw_all), 1000 * (time.perf_counter() - t0))
+
+    with _CACHE_LOCK:
+        _INDEX_CACHE[key] = (kw_all, idx)
+        while len(_INDEX_CACHE) > _INDEX_CACHE_MAX:
+            _INDEX_CACHE.popitem(last=False)
+    return kw_all, idx
+
+
+__all__ = [
+    "KeywordIndex",
+    "get_keyword_index",
+    "KW_INDEX_MAX_CANDIDATES",
+    "KW_INDEX_TOLERANCE",
+    "KW_INDEX_VERIFY",
+    "KW_INDEX_MIN_KEYWORDS",
+]
@@ -10,19 +10,23 @@ from __future__ import annotations
 
 import logging
 import json
+import os
 from pathlib import Path
-from typing import Iterable, Any, Dict
+from typing import Iterable, Any, Callable, Dict, List, Tuple
+
+from celery import chord
 
 # Celery-instans
 from app.celery_instance import celery
 
 # Våre moduler (flytter model-import inn i task)
-from .parsing import _process_single_document
+from .parsing import _process_single_document, discard_doc_conversions, prefetch_doc_conversions
+from .doc_convert import get_conversion_pool
 from .reporting import create_reports_and_zip
 from .core import (
     deduplicate_requirements,
     _sort_requirements,
-    classify_group_ai, # Antar denne bruker modellen lastet via reload_fag_model
+    classify_group_ai_batch, # Antar denne bruker modellen lastet via reload_fag_model
     _generate_short_text,
 )
 
@@ -31,6 +35,14 @@ from .core import (
 # Hold dette i sync med web-laget (routes/kravsporing.py)
 ALLOWED_EXTS = {".pdf", ".docx", ".doc", ".txt", ".xlsx", ".msg"}
 
+# Parallell filbehandling (1 = sekvensielt som før). Kan overstyres per kjøring via ai_settings["file_workers"].
+# Med N > 1 deles filene på N deltasks (process_file_chunk_task) i en Celery-chord som arbeiderne tar parallelt
+# (også vanlige prefork-arbeidere); finish_files_task fletter og lager rapportene under den opprinnelige task-id-en.
+# Deltaskene leser filene fra temp-mappen, så arbeiderne må dele app/temp (samme maskin eller felles volum).
+FILE_WORKERS = int(os.getenv("KS_FILE_WORKERS", "1"))
+# Øvre grense for antall deltasks per kjøring (samtidigheten styres ellers av arbeidernes --concurrency)
+MAX_FILE_WORKERS = max(1, int(os.getenv("KS_MAX_FILE_WORKERS", "8")))
+
 # FJERNET global modell-lasting herfra
 
 
@@ -57,17 +69,18 @@ class ProgressProxy:
 def _safe_update_state(task, **meta):
     """Robust oppdatering av Celery state."""
     # ... (uendret) ...
+    task_id = meta.pop("task_id", None)
     try:
-        task.update_state(state=meta.pop("state", "PROGRESS"), meta=meta)
+        task.update_state(task_id=task_id, state=meta.pop("state", "PROGRESS"), meta=meta)
     except Exception:
         logging.getLogger(__name__).warning("update_state feilet (ignorerer).", exc_info=True)
 
 
-def _progress(task, temp_id: str, status: str, current: int):
-    """Sender PROGRESS state."""
-    # ... (uendret) ...
+def _progress(task, temp_id: str, status: str, current: int, task_id: str | None = None):
+    """Sender PROGRESS state (til `task_id` hvis gitt, ellers til tasken selv)."""
     _safe_update_state(
         task,
+        task_id=task_id,
         state="PROGRESS",
         status=status,
         current=int(max(0, min(current, 100))),
@@ -83,6 +96,120 @@ def _iter_files(dirpath: Path) -> Iterable[Path]:
     return sorted(files, key=lambda p: p.name.lower())
 
 
+def _resolve_file_workers(ai_settings: dict | None, total_files: int) -> int:
+    """Antall deltasks for filbehandling: ai_settings["file_workers"] > KS_FILE_WORKERS > 1."""
+    raw = None
+    if isinstance(ai_settings, dict):
+        raw = ai_settings.get("file_workers")
+    if raw is None:
+        raw = FILE_WORKERS
+    try:
+        n = int(raw)
+    except (TypeError, ValueError):
+        n = 1
+    return max(1, min(n, MAX_FILE_WORKERS, total_files))
+
+
+def _process_file(fpath: Path, opts: Dict[str, Any], self_task=None) -> Tuple[list, list, dict]:
+    """
+    Parser og trekker ut krav fra én fil. Feil returneres som meldinger (kaster ikke).
+    Returnerer (funn, feil, tekst-cache-tellere).
+    """
+    cache_stats: Dict[str, int] = {}
+    try:
+        reqs, errs = _process_single_document(
+            self_task=self_task,
+            file_path=fpath,
+            keywords=opts["keywords"],
+            min_score=opts["min_score"],
+            ns_standard_selection=opts["ns_standard_selection"],
+            mode=opts["mode"],
+            fokusomraade=opts["fokusomraade"],
+            selected_groups=opts["selected_groups"],
+            cache_stats=cache_stats,
+        )
+        return list(reqs or []), list(errs or []), cache_stats
+    except Exception as e:
+        msg = f"Feil ved behandling av {fpath.name}: {e}"
+        logging.getLogger(__name__).error(msg, exc_info=True)
+        return [], [msg], cache_stats
+
+
+def _reload_fag_model(log: logging.Logger) -> None:
+    """Laster fag-modellen på nytt slik at den nyeste trente modellen alltid brukes."""
+    try:
+        # Importer modellenes laste-logikk her inne
+        from app.tasks import models as model_loader
+        if hasattr(model_loader, "reload_fag_model"):
+            reloaded_ok = model_loader.reload_fag_model()
+            if reloaded_ok:
+                log.info("Fag-modell lastet/reloadet for denne tasken.")
+            else:
+                log.warning("Fag-modell ble IKKE reloadet, bruker muligens gammel versjon.")
+        else:
+            log.warning("Funksjonen 'reload_fag_model' ikke funnet i app.tasks.models.")
+        # TODO: Vurder å laste krav_validator-modellen her også hvis den brukes i denne tasken
+    except Exception as model_err:
+        # Ikke stopp hele tasken, men logg tydelig; la tasken prøve å fortsette
+        log.error("KRITISK FEIL ved lasting av AI-modell: %s", model_err, exc_info=True)
+
+
+def _run_files_serial(files: List[Path], opts: Dict[str, Any], progress,
+                      on_start: Callable[[int, Path], None] | None = None) -> List[Tuple[list, list, dict]]:
+    log = logging.getLogger(__name__)
+    # .doc-filer konverteres av LibreOffice-poolen mens de andre filene parses
+    n_doc = prefetch_doc_conversions(files)
+    if n_doc:
+        log.info("Forhåndskonverterer %d .doc-fil(er) med LibreOffice-poolen.", n_doc)
+    out: List[Tuple[list, list, dict]] = []
+    try:
+        for idx, fpath in enumerate(files, start=1):
+            if on_start:
+                on_start(idx, fpath)
+            out.append(_process_file(fpath, opts, self_task=progress))
+    finally:
+        if n_doc:
+            # Konverteringer som aldri ble hentet (avbrutt task, eller parseren leste ikke filen)
+            discard_doc_conversions(files)
+            log.info("LibreOffice-pool: %s", get_conversion_pool().stats())
+    return out
+
+
+def _split_files(files: List[Path], parts: int) -> List[List[Path]]:
+    """Fordeler filene på `parts` deltasks (annenhver fil, så store og små filer blandes)."""
+    return [files[i::parts] for i in range(parts)]
+
+
+def _merge_chunks(chunk_results: List[list], total_files: int) -> List[Tuple[list, list, dict]]:
+    """Inversen av _split_files: legger deltask-resultatene tilbake i filrekkefølge."""
+    parts = len(chunk_results)
+    per_file: List[Tuple[list, list, dict]] = [([], [], {})] * total_files
+    for i, chunk in enumerate(chunk_results):
+        for k, res in enumerate(chunk or []):
+            reqs, errs, cstats = res
+            per_file[i + k * parts] = (reqs, errs, cstats)
+    return per_file
+
+
+def _enrich_requirements(reqs: list) -> None:
+    """Sikrer fag/status/korttekst på hvert funn (in-place)."""
+    reqs = reqs or []
+    # Funn uten fag klassifiseres samlet (memo gjør at tekster fra uttrekket ikke kjøres på nytt)
+    missing = [r for r in reqs if "fag" not in r]
+    for r, (best_fag, _) in zip(missing, classify_group_ai_batch([r.get("text", "") or "" for r in missing])):
+        r["fag"] = [best_fag or "Uspesifisert"]
+    for r in reqs:
+        txt = r.get("text", "") or ""
+        if isinstance(r["fag"], str):
+            r["fag"] = [r["fag"]]
+        if "status" not in r:
+            r["status"] = "Aktiv"
+        st = r.get("short_text") or r.get("korttekst")
+        if not st: st = _generate_short_text(txt)
+        r["short_text"] = st
+        r["korttekst"] = st
+
+
 @celery.task(bind=True, name="app.tasks.process_files_task",
              soft_time_limit=1800, time_limit=1860)
 def process_files_task(
@@ -108,26 +235,7 @@ def process_files_task(
     _progress(self, temp_id, "Starter…", 0)
 
     # --- ✅ VIKTIG: Last inn modellen HVER gang tasken kjører ---
-    try:
-        # Importer modellenes laste-logikk her inne
-        from app.tasks import models as model_loader
-        if hasattr(model_loader, "reload_fag_model"):
-            reloaded_ok = model_loader.reload_fag_model()
-            if reloaded_ok:
-                log.info("Fag-modell lastet/reloadet for denne tasken.")
-            else:
-                log.warning("Fag-modell ble IKKE reloadet, bruker muligens gammel versjon.")
-        else:
-            log.warning("Funksjonen 'reload_fag_model' ikke funnet i app.tasks.models.")
-        # TODO: Vurder å laste krav_validator-modellen her også hvis den brukes i denne tasken
-    except Exception as model_err:
-        # Ikke stopp hele tasken, men logg tydelig
-        log.error("KRITISK FEIL ved lasting av AI-modell: %s", model_err, exc_info=True)
-        # Du kan vurdere å sette en feilmelding i resultatet her,
-        # eller la tasken fortsette med evt. default/gammel modell hvis mulig.
-        # For nå lar vi den prøve å fortsette.
-    # --- SLUTT PÅ MODELL-LASTING ---
-
+    _reload_fag_model(log)
 
     if not temp_dir.exists():
         msg = f"Midlertidig mappe finnes ikke: {temp_dir}"
@@ -141,9 +249,6 @@ def process_files_task(
     files_to_process = list(_iter_files(temp_dir))
     total_files = len(files_to_process)
 
-    processing_errors: list[str] = []
-    initial_requirements: list[dict] = []
-
     if total_files == 0:
         log.warning("Ingen filer å prosessere i %s", temp_dir)
         return {
@@ -153,52 +258,86 @@ def process_files_task(
         }
 
     # ---------- Hovedsløyfe ----------
-    for idx, fpath in enumerate(files_to_process, start=1):
+    opts = {
+        "keywords": keywords or [],
+        "min_score": float(min_score),
+        "ns_standard_selection": ns_standard_selection,
+        "mode": mode,
+        "fokusomraade": fokusomraade or "",
+        "selected_groups": selected_groups or [],
+    }
+    workers = _resolve_file_workers(ai_settings, total_files)
+
+    if workers > 1:
+        # Deltasks i en chord; finish_files_task overtar denne task-id-en, så web-laget poller som før
+        _progress(self, temp_id, f"Behandler {total_files} filer i {workers} parallelle deltasks…", 5)
+        header = [
+            process_file_chunk_task.s([str(f) for f in chunk], opts, self.request.id, temp_id)
+            for chunk in _split_files(files_to_process, workers)
+        ]
+        body = finish_files_task.s(temp_dir_path, [str(f) for f in files_to_process], float(min_score))
+        return self.replace(chord(header, body))
+
+    def _on_start(idx: int, fpath: Path):
         pct = 5 + int(60 * idx / max(1, total_files))
         _progress(self, temp_id, f"Behandler fil {idx}/{total_files}: {fpath.name}", pct)
 
-        try:
-            # Kall parsing (send proxy i stedet for ekte task)
-            reqs, errs = _process_single_document(
-                self_task=progress,
-                file_path=fpath,
-                keywords=keywords or [],
-                min_score=float(min_score),
-                ns_standard_selection=ns_standard_selection,
-                mode=mode,
-                fokusomraade=fokusomraade or "",
-                selected_groups=selected_groups or [],
-                # Pass på at _process_single_document bruker den nylig lastede modellen
-                # (enten via import i den funksjonen eller ved å passere modellobjektet)
-            )
-
-            # Berik (uendret)
-            for r in reqs or []:
-                txt = r.get("text", "") or ""
-                if "fag" not in r:
-                    # Antar classify_group_ai bruker den siste lastede modellen
-                    best_fag, _ = classify_group_ai(txt)
-                    r["fag"] = [best_fag or "Uspesifisert"]
-                elif isinstance(r["fag"], str):
-                    r["fag"] = [r["fag"]]
-                if "status" not in r:
-                    r["status"] = "Aktiv"
-                st = r.get("short_text") or r.get("korttekst")
-                if not st: st = _generate_short_text(txt)
-                r["short_text"] = st
-                r["korttekst"] = st
+    per_file = _run_files_serial(files_to_process, opts, progress, on_start=_on_start)
+    return _finish_files(self, temp_dir, files_to_process, per_file, min_score)
+
 
+@celery.task(bind=True, name="app.tasks.process_file_chunk_task",
+             soft_time_limit=1800, time_limit=1860)
+def process_file_chunk_task(self, file_paths: List[str], opts: Dict[str, Any], parent_id: str | None, temp_id: str):
+    """Deltask i process_files_task-chorden: behandler sin del av filene. Returnerer [funn, feil, tellere] per fil."""
+    log = logging.getLogger(__name__)
+    _reload_fag_model(log)
+    files = [Path(p) for p in file_paths]
+
+    def _on_start(idx: int, fpath: Path):
+        # Deltaskene er omtrent like store, så egen andel gir en jevnt stigende fremdrift
+        pct = 5 + int(60 * (idx - 1) / max(1, len(files)))
+        _progress(self, temp_id, f"Behandler fil: {fpath.name}", pct, task_id=parent_id)
+
+    return [list(r) for r in _run_files_serial(files, opts, None, on_start=_on_start)]
+
+
+@celery.task(bind=True, name="app.tasks.finish_files_task",
+             soft_time_limit=1800, time_limit=1860)
+def finish_files_task(self, chunk_results: List[list], temp_dir_path: str, file_paths: List[str], min_score):
+    """Chord-callback for process_files_task: fletter deltask-resultatene og lager rapportene."""
+    files = [Path(p) for p in file_paths]
+    per_file = _merge_chunks(chunk_results, len(files))
+    return _finish_files(self, Path(temp_dir_path), files, per_file, min_score)
+
+
+def _finish_files(task, temp_dir: Path, files: List[Path], per_file: List[Tuple[list, list, dict]], min_score) -> dict:
+    """Fletter funn per fil, etterbehandler og lager rapporter/ZIP. Returnerer task-resultatet."""
+    log = logging.getLogger(__name__)
+    temp_id = temp_dir.name
+    progress = ProgressProxy(task, logger=log)
+    processing_errors: list[str] = []
+    initial_requirements: list[dict] = []
+
+    # Flett i deterministisk (filnavn-)rekkefølge
+    text_cache = {"hits": 0, "misses": 0, "bypassed": 0}
+    for fpath, (reqs, errs, cstats) in zip(files, per_file):
+        for k, v in (cstats or {}).items():
+            text_cache[k] = text_cache.get(k, 0) + int(v)
+        try:
+            _enrich_requirements(reqs)
             initial_requirements.extend(reqs or [])
             processing_errors.extend(errs or [])
-
         except Exception as e:
             msg = f"Feil ved behandling av {fpath.name}: {e}"
             log.error(msg, exc_info=True)
             processing_errors.append(msg)
+    log.info("Tekst-cache: %d treff, %d bom, %d uten cache.",
+             text_cache["hits"], text_cache["misses"], text_cache["bypassed"])
 
     # ---------- Lagre rå funn ----------
     try:
-        _progress(self, temp_id, "Lagrer rå funn…", 70)
+        _progress(task, temp_id, "Lagrer rå funn…", 70)
         initial_path = temp_dir / "initial_requirements.json"
         with open(initial_path, "w", encoding="utf-8") as f:
             json.dump(initial_requirements, f, ensure_ascii=False, indent=2)
@@ -208,7 +347,7 @@ def process_files_task(
     # ---------- Etterbehandling ----------
     final_requirements = []
     try:
-        _progress(self, temp_id, "Etterbehandler funn…", 80)
+        _progress(task, temp_id, "Etterbehandler funn…", 80)
         filtered = [r for r in (initial_requirements or []) if float(r.get("score", 0.0)) >= float(min_score)]
         deduped = deduplicate_requirements(filtered, threshold=93, scope="per_file")
         final_requirements = _sort_requirements(deduped or [])
@@ -218,7 +357,7 @@ def process_files_task(
 
     # ---------- Rapporter ZIP ----------
     try:
-        _progress(self, temp_id, "Genererer rapporter og ZIP…", 90)
+        _progress(task, temp_id, "Genererer rapporter og ZIP…", 90)
         create_reports_and_zip(final_requirements, temp_dir, processing_errors, progress)
     except Exception as e:
         processing_errors.append(f"Generering av rapport/ZIP feilet: {e}")
@@ -227,12 +366,13 @@ def process_files_task(
 
 
     # ---------- Ferdig ----------
-    _progress(self, temp_id, "Ferdigstiller…", 98)
+    _progress(task, temp_id, "Ferdigstiller…", 98)
     result_payload = {
         "status": "Rapport generert!",
         "zip_folder": temp_id, "temp_folder_id": temp_id,
         "errors": processing_errors,
         "preview": {"requirements": final_requirements},
+        "text_cache": text_cache,
     }
     return result_payload
 
@@ -9,17 +9,24 @@ Laster og holder AI/NLP-modeller for kravsporing:
 - NB-BERT (embeddings) og NB-MNLI (entailment) [valgfrie]
 - Hjelpefunksjoner (encode/predict/status)
 
+Tunge modeller lastes LAZY via et modellregister (første bruk, trådsikkert).
+Modul-attributtene (`nlp`, `semantic_model`, `nb_model`, ...) er fortsatt
+tilgjengelige og trigger lasting ved oppslag. `warmup()` laster på forhånd.
+
 Bakover-kompatibel med tidligere fag-artefakter (pipeline+labels).
 """
 from __future__ import annotations
 
 import os
 import sys
+import time
 import types
 import logging
+import threading
+import importlib.util
 from pathlib import Path
-from collections import defaultdict
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
 
 # Joblib/pickle for modell-lagring
 try:
@@ -53,7 +60,8 @@ PKL_FAG_PROFILER = Path(_TL_FAG) if _TL_FAG else (DATA_DIR / "fag_profiler.pkl")
 
 # Legacy/andre ressurser (valgfritt)
 MODEL_PATH    = DATA_DIR / "fag_profiler.pkl"      # legacy validator
-NS_CACHE_PATH = DATA_DIR / "ns_embeddings_cache.pkl"
+NS_CACHE_PATH = DATA_DIR / "ns_embeddings_cache.pkl"   # legacy (erstattet av NS_INDEX_DIR)
+NS_INDEX_DIR  = DATA_DIR / "ns_index"                   # matrise-indeks (.npy/.json) per standard
 SYNONYM_PATH  = DATA_DIR / "synonyms.json"
 
 def _describe_file(p: Path) -> str:
@@ -96,95 +104,238 @@ def _ensure_pickle_dependencies():
 _ensure_pickle_dependencies()
 
 # ------------------------------------------------------------------------------
-# Valgfrie tredjeparts-biblioteker
-# ------------------------------------------------------------------------------
-try:
-    import spacy  # type: ignore
-except Exception:
-    spacy = None  # type: ignore
-
-try:
-    from sentence_transformers import SentenceTransformer  # type: ignore
-except Exception:
-    SentenceTransformer = None  # type: ignore
-
-try:
-    import torch  # type: ignore
-    import torch.nn.functional as F  # type: ignore
-    TORCH_AVAILABLE = True
-except Exception:
-    torch = None  # type: ignore
-    F = None      # type: ignore
-    TORCH_AVAILABLE = False
-
-try:
-    from transformers import (  # type: ignore
-        AutoTokenizer, AutoModel, AutoModelForSequenceClassification
-    )
-except Exception:
-    AutoTokenizer = AutoModel = AutoModelForSequenceClassification = None  # type: ignore
-
 # Konfig
+# ------------------------------------------------------------------------------
 NB_BERT_NAME        = os.environ.get("NB_BERT_NAME", "NbAiLab/nb-bert-base")
 MNLI_NAME           = os.environ.get("MNLI_NAME", "NbAiLab/nb-bert-base-mnli")
 SENTENCE_MODEL_NAME = os.environ.get("SENTENCE_MODEL_NAME", "paraphrase-multilingual-MiniLM-L12-v2")
 GLOBAL_FAG_THRESHOLD = float(os.environ.get("FAG_PRED_THRESHOLD", "0.40"))  # fallback-terskel
+# Modeller som lastes ved warmup_from_env() (f.eks. "spacy,semantic" eller "all")
+WARMUP_MODELS = os.environ.get("KS_WARMUP_MODELS", "")
+# Batch-inferens for fag-/validator-modeller: tekster per predict_proba-kall og antall huskede svar
+CLS_BATCH_SIZE = int(os.environ.get("KS_CLS_BATCH_SIZE", "512"))
+CLS_CACHE_SIZE = int(os.environ.get("KS_CLS_CACHE_SIZE", "50000"))
 
-# Delte objekter
-nlp = None
-fag_profiler_model_legacy = None  # legacy validator (hvis brukt annet sted)
-semantic_model = None
-nb_tokenizer = None
-nb_model = None
-NB_BERT_READY = False
-mnli_tokenizer = None
-mnli_model = None
-MNLI_READY = False
 global_ns_data = defaultdict(list)
 
+
+def _lib_available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except Exception:
+        return False
+
+
+def _rss_mb() -> Optional[float]:
+    """Nåværende RSS for prosessen i MB (psutil eller /proc), ellers None."""
+    try:
+        import psutil  # type: ignore
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        return None
+
+
 # ------------------------------------------------------------------------------
-# SpaCy (med fallback)
+# Modellregister (lazy, trådsikkert)
 # ------------------------------------------------------------------------------
-if spacy is not None:
+class _ModelRegistry:
+    """Laster hver modell ved første get(), én gang per prosess, og måler tid/minne."""
+
+    def __init__(self):
+        self._loaders: Dict[str, Any] = {}
+        self._objs: Dict[str, Any] = {}
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def register(self, name: str, loader, lib: Optional[str] = None) -> None:
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._info[name] = {"loaded": False, "ready": False, "lib": lib,
+                            "load_seconds": None, "rss_delta_mb": None, "error": None}
+
+    def names(self) -> List[str]:
+        return list(self._loaders.keys())
+
+    def is_loaded(self, name: str) -> bool:
+        return bool(self._info.get(name, {}).get("loaded"))
+
+    def get(self, name: str):
+        if name not in self._loaders:
+            raise KeyError(name)
+        if self._info[name]["loaded"]:
+            return self._objs.get(name)
+        with self._locks[name]:
+            if self._info[name]["loaded"]:
+                return self._objs.get(name)
+            rss0 = _rss_mb()
+            t0 = time.perf_counter()
+            obj, err = None, None
+            try:
+                obj = self._loaders[name]()
+            except Exception as e:
+                err = str(e)
+                _log.warning("Lasting av modell '%s' feilet: %s", name, e)
+            dt = time.perf_counter() - t0
+            rss1 = _rss_mb()
+            with self._guard:
+                self._objs[name] = obj
+                self._info[name].update({
+                    "loaded": True,
+                    "ready": obj is not None,
+                    "load_seconds": round(dt, 3),
+                    "rss_delta_mb": round(rss1 - rss0, 1) if (rss0 is not None and rss1 is not None) else None,
+                    "error": err,
+                })
+            _log.info("Modell '%s' lastet på %.2fs (klar=%s).", name, dt, obj is not None)
+            return obj
+
+    def unload(self, name: str) -> None:
+        with self._locks[name]:
+            with self._guard:
+                self._objs.pop(name, None)
+                self._info[name].update({"loaded": False, "ready": False})
+
+    def warmup(self, names=None) -> Dict[str, bool]:
+        targets = self.names() if not names else [n for n in names if n in self._loaders]
+        return {n: self.get(n) is not None for n in targets}
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self._guard:
+            out = {}
+            for n, info in self._info.items():
+                lib = info.get("lib")
+                out[n] = {**info, "available": _lib_available(lib) if lib else True}
+            return out
+
+
+registry = _ModelRegistry()
+
+
+def _load_spacy():
+    import spacy  # type: ignore
     try:
-        nlp = spacy.load("nb_core_news_lg")
+        mdl = spacy.load("nb_core_news_lg")
         _log.info("SpaCy 'nb_core_news_lg' lastet.")
+        return mdl
     except Exception as e_lg:
         _log.warning("SpaCy 'lg' feilet (%s). Forsøker 'nb_core_news_sm'…", e_lg)
         try:
-            nlp = spacy.load("nb_core_news_sm")
+            mdl = spacy.load("nb_core_news_sm")
             _log.info("SpaCy 'nb_core_news_sm' lastet.")
+            return mdl
         except Exception as e_sm:
-            nlp = None
             _log.error("SpaCy feilet også med 'sm': %s. Fortsetter uten SpaCy.", e_sm)
-else:
-    _log.info("SpaCy ikke tilgjengelig. Fortsetter uten SpaCy.")
+            return None
 
-# ------------------------------------------------------------------------------
-# Krav-validator (legacy) – valgfri
-# ------------------------------------------------------------------------------
-if MODEL_PATH.exists() and joblib is not None:
-    try:
-        fag_profiler_model_legacy = joblib.load(MODEL_PATH)  # type: ignore
-        _log.info("Krav-validator (legacy) lastet: %s", MODEL_PATH)
-    except Exception as e:
-        fag_profiler_model_legacy = None
-        _log.warning("Krav-validator (legacy) feilet: %s", e)
-else:
-    _log.debug("Krav-validator (legacy) ikke funnet eller joblib utilgjengelig: %s", MODEL_PATH)
 
-# ------------------------------------------------------------------------------
-# SentenceTransformer (semantikk) – valgfri
-# ------------------------------------------------------------------------------
-if SentenceTransformer is not None:
+def _load_validator_legacy():
+    if not (MODEL_PATH.exists() and joblib is not None):
+        _log.debug("Krav-validator (legacy) ikke funnet eller joblib utilgjengelig: %s", MODEL_PATH)
+        return None
+    mdl = joblib.load(MODEL_PATH)  # type: ignore
+    _log.info("Krav-validator (legacy) lastet: %s", MODEL_PATH)
+    return mdl
+
+
+def _load_semantic():
+    from sentence_transformers import SentenceTransformer  # type: ignore
+    mdl = SentenceTransformer(SENTENCE_MODEL_NAME)
+    _log.info("SentenceTransformer lastet: %s", SENTENCE_MODEL_NAME)
+    return mdl
+
+
+def _torch_device() -> str:
+    import torch  # type: ignore
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _load_nb_bert():
+    """Returnerer (tokenizer, model) – GPU→CPU fallback."""
+    from transformers import AutoTokenizer, AutoModel  # type: ignore
+    device = _torch_device()
+    tok = AutoTokenizer.from_pretrained(NB_BERT_NAME)
     try:
-        semantic_model = SentenceTransformer(SENTENCE_MODEL_NAME)
-        _log.info("SentenceTransformer lastet: %s", SENTENCE_MODEL_NAME)
-    except Exception as e:
-        semantic_model = None
-        _log.warning("SentenceTransformer feilet: %s", e)
-else:
-    _log.info("sentence_transformers ikke tilgjengelig – semantikk deaktivert.")
+        mdl = AutoModel.from_pretrained(NB_BERT_NAME).to(device).eval()
+    except Exception as oom:
+        _log.warning("NB-BERT på %s feilet (%s). Faller tilbake til CPU…", device, oom)
+        mdl = AutoModel.from_pretrained(NB_BERT_NAME).to("cpu").eval()
+    _log.info("NB-BERT lastet på %s.", next(mdl.parameters()).device)
+    return tok, mdl
+
+
+def _load_mnli():
+    """Returnerer (tokenizer, model) – GPU→CPU fallback."""
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification  # type: ignore
+    device = _torch_device()
+    tok = AutoTokenizer.from_pretrained(MNLI_NAME)
+    try:
+        mdl = AutoModelForSequenceClassification.from_pretrained(MNLI_NAME).to(device).eval()
+    except Exception as oom:
+        _log.warning("NB-MNLI på %s feilet (%s). Faller tilbake til CPU…", device, oom)
+        mdl = AutoModelForSequenceClassification.from_pretrained(MNLI_NAME).to("cpu").eval()
+    _log.info("NB-MNLI lastet på %s.", next(mdl.parameters()).device)
+    return tok, mdl
+
+
+registry.register("spacy", _load_spacy, lib="spacy")
+registry.register("validator_legacy", _load_validator_legacy, lib="joblib")
+registry.register("semantic", _load_semantic, lib="sentence_transformers")
+registry.register("nb_bert", _load_nb_bert, lib="transformers")
+registry.register("mnli", _load_mnli, lib="transformers")
+
+
+def _pair(name: str, i: int):
+    pair = registry.get(name)
+    return pair[i] if pair else None
+
+
+# Bakoverkompatible modul-attributter (PEP 562): lastes ved første oppslag
+_LAZY_ATTRS = {
+    "nlp": lambda: registry.get("spacy"),
+    "fag_profiler_model_legacy": lambda: registry.get("validator_legacy"),
+    "semantic_model": lambda: registry.get("semantic"),
+    "nb_tokenizer": lambda: _pair("nb_bert", 0),
+    "nb_model": lambda: _pair("nb_bert", 1),
+    "NB_BERT_READY": lambda: registry.get("nb_bert") is not None,
+    "mnli_tokenizer": lambda: _pair("mnli", 0),
+    "mnli_model": lambda: _pair("mnli", 1),
+    "MNLI_READY": lambda: registry.get("mnli") is not None,
+    "TORCH_AVAILABLE": lambda: _lib_available("torch"),
+}
+
+
+def __getattr__(name: str):
+    fn = _LAZY_ATTRS.get(name)
+    if fn is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return fn()
+
+
+def warmup(names=None) -> Dict[str, bool]:
+    """Laster modeller på forhånd (alle, eller navngitte: spacy/semantic/nb_bert/mnli/validator_legacy/fagmodell)."""
+    names = list(names) if names else None
+    out: Dict[str, bool] = {}
+    if names is None or "fagmodell" in names:
+        out["fagmodell"] = get_fag_model() is not None
+    out.update(registry.warmup([n for n in names if n != "fagmodell"] if names else None))
+    return out
+
+
+def warmup_from_env() -> Dict[str, bool]:
+    """Warm-up styrt av KS_WARMUP_MODELS (tom = ingen, "all" = alle)."""
+    raw = (WARMUP_MODELS or "").strip()
+    if not raw:
+        return {}
+    names = None if raw.lower() == "all" else [n.strip() for n in raw.split(",") if n.strip()]
+    return warmup(names)
+
 
 # ------------------------------------------------------------------------------
 # Fag-modell (NY bundle) – last + hot-reload
@@ -205,6 +356,49 @@ else:
 # ------------------------------------------------------------------------------
 _fag_bundle: Optional[dict] = None
 _fag_mtime: Optional[float] = None
+_fag_attempted = False
+_fag_lock = threading.Lock()
+_fag_info: Dict[str, Any] = {"load_seconds": None, "rss_delta_mb": None}
+
+
+class _MemoCache:
+    """Trådsikker LRU for klassifiseringssvar. Nøkkelen inneholder modellversjonen, så reload gir nye svar."""
+
+    def __init__(self, maxsize: int = CLS_CACHE_SIZE):
+        self.maxsize = max(0, int(maxsize))
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key: Hashable, val: Any) -> None:
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = val
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+_fag_memo = _MemoCache()
 
 def _try_load_pickle(p: Path):
     """Prøv joblib først, deretter ren pickle. Returner objekt eller None."""
@@ -240,7 +434,13 @@ def _extract_model_labels_thresholds(bundle: dict) -> Tuple[Any, List[str], Opti
 
 def reload_fag_model() -> Optional[dict]:
     """Laster fag-bundle fra PKL_FAG_PROFILER. Hot-reloader ved mtime-endring."""
-    global _fag_bundle, _fag_mtime
+    with _fag_lock:
+        return _reload_fag_model_locked()
+
+
+def _reload_fag_model_locked() -> Optional[dict]:
+    global _fag_bundle, _fag_mtime, _fag_attempted
+    _fag_attempted = True
     p = Path(PKL_FAG_PROFILER)
     _log.info("Forsøker å laste fag-bundle fra: %s", _describe_file(p))
     if not p.is_file():
@@ -257,7 +457,13 @@ def reload_fag_model() -> Optional[dict]:
         _log.info("Fag-bundle uendret (mtime=%s). Beholder cached.", _fag_mtime)
         return _fag_bundle
 
+    rss0, t0 = _rss_mb(), time.perf_counter()
     bundle = _try_load_pickle(p)
+    rss1 = _rss_mb()
+    _fag_info.update({
+        "load_seconds": round(time.perf_counter() - t0, 3),
+        "rss_delta_mb": round(rss1 - rss0, 1) if (rss0 is not None and rss1 is not None) else None,
+    })
     if not isinstance(bundle, dict):
         _log.error("Fag-bundle er ikke dict/kunne ikke lastes.")
         _fag_bundle, _fag_mtime = None, None
@@ -287,14 +493,18 @@ def reload_fag_model() -> Optional[dict]:
     _fag_bundle, _fag_mtime = bundle, mtime
     return _fag_bundle
 
-# Init ved import (best-effort)
-try:
-    reload_fag_model()
-except Exception as e:
-    _log.warning("reload_fag_model ved import feilet: %s", e)
+def fag_model_version() -> Optional[Tuple[Optional[float], int]]:
+    """Identifiserer lastet fag-bundle (mtime + objekt). Brukes som del av memo-nøkler."""
+    bundle = get_fag_model()
+    return (_fag_mtime, id(bundle)) if bundle is not None else None
 
 def get_fag_model() -> Optional[dict]:
-    """Returnerer gjeldende fag-bundle (dict) eller None."""
+    """Returnerer gjeldende fag-bundle (dict) eller None. Lastes ved første kall."""
+    if _fag_bundle is None and not _fag_attempted:
+        try:
+            reload_fag_model()
+        except Exception as e:
+            _log.warning("reload_fag_model ved første bruk feilet: %s", e)
     return _fag_bundle
 
 # ------------------------------------------------------------------------------
@@ -326,97 +536,83 @@ def _apply_threshold(idx: int, score: float, thresholds: Optional[List[float]])
         return score >= float(thresholds[idx])
     return score >= GLOBAL_FAG_THRESHOLD
 
-def fag_predict(text: str) -> dict:
+def predict_proba_batch(model: Any, texts: Sequence[str]) -> Any:
+    """predict_proba i biter på CLS_BATCH_SIZE tekster; returnerer (n × klasser)-matrise."""
+    import numpy as _np
+    step = max(1, CLS_BATCH_SIZE)
+    parts = [_np.asarray(model.predict_proba(list(texts[i:i + step])), dtype=float)
+             for i in range(0, len(texts), step)]
+    return _np.vstack(parts) if parts else _np.zeros((0, 0))
+
+def _fag_rows(model: Any, labels: List[str], thresholds: Optional[List[float]], xs: List[str]) -> List[dict]:
+    import numpy as _np
+    if hasattr(model, "predict_proba"):
+        proba = predict_proba_batch(model, xs)
+        idxs = [int(i) for i in _np.argmax(proba, axis=1)]
+        scores = [float(proba[r, i]) for r, i in enumerate(idxs)]
+    else:
+        # Sjeldent tilfelle (legacy uten sannsynlighet)
+        idxs = [int(i) for i in _np.asarray(model.predict(xs)).ravel()]
+        scores = [1.0] * len(idxs)
+
+    out = []
+    for idx, score in zip(idxs, scores):
+        label = labels[idx] if 0 <= idx < len(labels) else str(idx)
+        if not _apply_threshold(idx, score, thresholds):
+            out.append({"label": "Uspesifisert", "score": score, "ok": True, "reason": "below_threshold"})
+        else:
+            out.append({"label": str(label), "score": float(score), "ok": True, "reason": None})
+    return out
+
+def fag_predict_batch(texts: Sequence[str]) -> List[dict]:
     """
-    Trygg fagprediksjon basert på lastet bundle.
-    Returnerer:
-      {"label": <str>, "score": <float 0-1>, "ok": <bool>, "reason": <str|None>}
+    Fagprediksjon for mange tekster i få vektoriserte kall. Like (normaliserte) tekster
+    klassifiseres én gang; svar huskes per modellversjon (KS_CLS_CACHE_SIZE).
+    Returnerer én dict per tekst, samme format som fag_predict().
     """
     bundle = get_fag_model()
     if not isinstance(bundle, dict):
-        return {"label": "Uspesifisert", "score": 0.0, "ok": False, "reason": "model_not_loaded"}
-
-    try:
-        model, labels, thresholds = _get_bundle_components(bundle)
+        return [{"label": "Uspesifisert", "score": 0.0, "ok": False, "reason": "model_not_loaded"} for _ in texts]
 
+    ver = fag_model_version()
+    out: List[Optional[dict]] = [None] * len(texts)
+    todo: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
         x = _normalize_text(text or "")
         if not x:
-            return {"label": "Uspesifisert", "score": 0.0, "ok": False, "reason": "empty_text"}
-
-        # Forventet: CalibratedClassifierCV eller Pipeline med predict_proba
-        if hasattr(model, "predict_proba"):
-            proba = model.predict_proba([x])[0]
-            # robust 1D
-            try:
-                import numpy as _np
-                proba = _np.asarray(proba, dtype=float).reshape(-1)
-            except Exception:
-                proba = [float(p) for p in proba]
-            idx = int(max(range(len(proba)), key=lambda i: proba[i]))
-            score = float(proba[idx])
-            label = labels[idx] if 0 <= idx < len(labels) else str(idx)
+            out[i] = {"label": "Uspesifisert", "score": 0.0, "ok": False, "reason": "empty_text"}
+            continue
+        hit = _fag_memo.get(("fag", ver, x))
+        if hit is not None:
+            out[i] = dict(hit)
         else:
-            # Sjeldent tilfelle (legacy uten sannsynlighet)
-            pred = model.predict([x])
-            try:
-                import numpy as _np
-                idx = int(_np.asarray(pred).ravel()[0])
-            except Exception:
-                idx = int(pred[0]) if isinstance(pred, (list, tuple)) else 0
-            label = labels[idx] if 0 <= idx < len(labels) else str(idx)
-            score = 1.0
-
-        # Terskel-sjekk
-        if not _apply_threshold(idx, score, thresholds):
-            return {"label": "Uspesifisert", "score": score, "ok": True, "reason": "below_threshold"}
-
-        return {"label": str(label), "score": float(score), "ok": True, "reason": None}
+            todo.setdefault(x, []).append(i)
 
-    except Exception as e:
-        _log.warning("fag_predict feilet: %s", e, exc_info=True)
-        return {"label": "Uspesifisert", "score": 0.0, "ok": False, "reason": "exception"}
-
-# ------------------------------------------------------------------------------
-# NB-BERT (embeddings) – GPU→CPU fallback (valgfritt)
-# ------------------------------------------------------------------------------
-DEVICE = None
-if TORCH_AVAILABLE and (AutoTokenizer is not None and AutoModel is not None):
-    try:
-        DEVICE = "cuda" if torch.cuda.is_available() else "cpu"  # type: ignore
-        nb_tokenizer = AutoTokenizer.from_pretrained(NB_BERT_NAME)
+    if todo:
+        xs = list(todo)
         try:
-            nb_model = AutoModel.from_pretrained(NB_BERT_NAME).to(DEVICE).eval()
-            NB_BERT_READY = True
-        except Exception as oom:
-            _log.warning("NB-BERT på %s feilet (%s). Faller tilbake til CPU…", DEVICE, oom)
-            nb_model = AutoModel.from_pretrained(NB_BERT_NAME).to("cpu").eval()
-            NB_BERT_READY = True
-        _log.info("NB-BERT lastet på %s.", next(nb_model.parameters()).device)  # type: ignore
-    except Exception as e:
-        nb_tokenizer, nb_model, NB_BERT_READY = None, None, False
-        _log.warning("NB-BERT feilet: %s", e)
-else:
-    _log.info("transformers/torch ikke tilgjengelig – hopper over NB-BERT.")
+            model, labels, thresholds = _get_bundle_components(bundle)
+            rows = _fag_rows(model, labels, thresholds, xs)
+        except Exception as e:
+            _log.warning("fag_predict feilet: %s", e, exc_info=True)
+            rows = None
+        for j, x in enumerate(xs):
+            if rows is None:
+                r = {"label": "Uspesifisert", "score": 0.0, "ok": False, "reason": "exception"}
+            else:
+                r = rows[j]
+                _fag_memo.put(("fag", ver, x), r)
+            for i in todo[x]:
+                out[i] = dict(r)
+    return out  # type: ignore[return-value]
 
-# ------------------------------------------------------------------------------
-# NB-MNLI (entailment) – GPU→CPU fallback (valgfritt)
-# ------------------------------------------------------------------------------
-if TORCH_AVAILABLE and (AutoTokenizer is not None and AutoModelForSequenceClassification is not None):
-    try:
-        mnli_tokenizer = AutoTokenizer.from_pretrained(MNLI_NAME)
-        try:
-            mnli_model = AutoModelForSequenceClassification.from_pretrained(MNLI_NAME).to(DEVICE or "cpu").eval()
-            MNLI_READY = True
-        except Exception as oom:
-            _log.warning("NB-MNLI på %s feilet (%s). Faller tilbake til CPU…", DEVICE, oom)
-            mnli_model = AutoModelForSequenceClassification.from_pretrained(MNLI_NAME).to("cpu").eval()
-            MNLI_READY = True
-        _log.info("NB-MNLI lastet på %s.", next(mnli_model.parameters()).device)  # type: ignore
-    except Exception as e:
-        mnli_tokenizer, mnli_model, MNLI_READY = None, None, False
-        _log.warning("NB-MNLI feilet: %s", e)
-else:
-    _log.info("transformers/torch ikke tilgjengelig – hopper over NB-MNLI.")
+def fag_predict(text: str) -> dict:
+    """
+    Trygg fagprediksjon basert på lastet bundle.
+    Returnerer:
+      {"label": <str>, "score": <float 0-1>, "ok": <bool>, "reason": <str|None>}
+    """
+    return fag_predict_batch([text])[0]
 
 # ------------------------------------------------------------------------------
 # Semantiske hjelpere
@@ -428,7 +624,7 @@ def _mean_pooling(model_output, attention_mask):
     return (token_embeddings * input_mask_expanded).sum(1) / denom
 
 def _ensure_torch_ready():
-    if not TORCH_AVAILABLE or nb_tokenizer is None or nb_model is None:
+    if not _lib_available("torch") or registry.get("nb_bert") is None:
         raise RuntimeError("NB-BERT ikke initialisert.")
 
 def _to_numpy(x):
@@ -450,39 +646,39 @@ def _l2_normalize(v):
     except Exception:
         return v
 
-if TORCH_AVAILABLE:
-    import torch  # type: ignore
-    import torch.nn.functional as F  # type: ignore
-
-@torch.no_grad() if TORCH_AVAILABLE else (lambda fn: fn)
 def nb_bert_encode(texts: List[str]):
     """Returnerer L2-normaliserte setnings-embeddings for en liste tekster (NumPy array)."""
     _ensure_torch_ready()
-    tokens = nb_tokenizer(texts, padding=True, truncation=True, return_tensors="pt")  # type: ignore
-    dev = next(nb_model.parameters()).device  # type: ignore
-    tokens = {k: v.to(dev) for k, v in tokens.items()}
-    outputs = nb_model(**tokens)  # type: ignore
-    sent_emb = _mean_pooling(outputs, tokens["attention_mask"])
-    emb = F.normalize(sent_emb, p=2, dim=1)  # type: ignore
+    import torch  # type: ignore
+    import torch.nn.functional as F  # type: ignore
+    nb_tokenizer, nb_model = registry.get("nb_bert")
+    with torch.no_grad():
+        tokens = nb_tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
+        dev = next(nb_model.parameters()).device
+        tokens = {k: v.to(dev) for k, v in tokens.items()}
+        outputs = nb_model(**tokens)
+        sent_emb = _mean_pooling(outputs, tokens["attention_mask"])
+        emb = F.normalize(sent_emb, p=2, dim=1)
     return _to_numpy(emb)
 
-@torch.no_grad() if TORCH_AVAILABLE else (lambda fn: fn)
 def nb_mnli_predict(premise: str, hypothesis: str) -> dict:
     """Kjører NB-MNLI på (premise, hypothesis) og returnerer sannsynligheter."""
-    if not TORCH_AVAILABLE or mnli_tokenizer is None or mnli_model is None:
+    pair = registry.get("mnli") if _lib_available("torch") else None
+    if pair is None:
         raise RuntimeError("NB-MNLI ikke initialisert.")
-    dev = next(mnli_model.parameters()).device  # type: ignore
-    tokens = mnli_tokenizer(premise, hypothesis, return_tensors="pt", truncation=True, padding=True)  # type: ignore
-    tokens = {k: v.to(dev) for k, v in tokens.items()}
-    logits = mnli_model(**tokens).logits  # type: ignore
-    if hasattr(torch, "softmax"):
-        probs = torch.softmax(logits, dim=-1)[0].tolist()  # type: ignore
-    else:
-        probs = [0.0, 1.0, 0.0]
+    import torch  # type: ignore
+    mnli_tokenizer, mnli_model = pair
+    with torch.no_grad():
+        dev = next(mnli_model.parameters()).device
+        tokens = mnli_tokenizer(premise, hypothesis, return_tensors="pt", truncation=True, padding=True)
+        tokens = {k: v.to(dev) for k, v in tokens.items()}
+        logits = mnli_model(**tokens).logits
+        probs = torch.softmax(logits, dim=-1)[0].tolist()
     return {"contradiction": probs[0], "neutral": probs[1], "entailment": probs[2]}
 
 def semantic_encode(texts: List[str]) -> "np.ndarray | None":
     """Encoder tekster med SentenceTransformer (hvis tilgjengelig) og normaliserer til enhetsvektor."""
+    semantic_model = registry.get("semantic")
     if semantic_model is None:
         return None
     try:
@@ -516,12 +712,15 @@ def get_ai_status() -> Dict[str, Any]:
         acc = meta.get("accuracy")
         f1m = meta.get("f1_macro")
 
+    reg = registry.report()
     return {
-        "spacy": {"ready": bool(nlp is not None)},
-        "validator_legacy": {"ready": bool(fag_profiler_model_legacy is not None), "path": str(MODEL_PATH)},
-        "semantic": {"ready": bool(semantic_model is not None), "model": SENTENCE_MODEL_NAME},
-        "nb_bert": {"ready": bool(NB_BERT_READY), "model": NB_BERT_NAME},
-        "mnli": {"ready": bool(MNLI_READY), "model": MNLI_NAME},
+        "spacy": {"ready": reg["spacy"]["ready"], "loaded": reg["spacy"]["loaded"]},
+        "validator_legacy": {"ready": reg["validator_legacy"]["ready"], "loaded": reg["validator_legacy"]["loaded"],
+                             "path": str(MODEL_PATH)},
+        "semantic": {"ready": reg["semantic"]["ready"], "loaded": reg["semantic"]["loaded"],
+                     "model": SENTENCE_MODEL_NAME},
+        "nb_bert": {"ready": reg["nb_bert"]["ready"], "loaded": reg["nb_bert"]["loaded"], "model": NB_BERT_NAME},
+        "mnli": {"ready": reg["mnli"]["ready"], "loaded": reg["mnli"]["loaded"], "model": MNLI_NAME},
         "fagmodell": {
             "ready": bool(isinstance(bundle, dict)),
             "path": str(PKL_FAG_PROFILER),
@@ -531,32 +730,36 @@ def get_ai_status() -> Dict[str, Any]:
             "saved_at": saved_at,
             "accuracy": acc,
             "f1_macro": f1m,
+            "load_seconds": _fag_info.get("load_seconds"),
+            "rss_delta_mb": _fag_info.get("rss_delta_mb"),
         },
+        # Per modell: lastet?, lastetid, RSS-endring ved lasting, feil
+        "registry": reg,
+        "rss_mb": round(_rss_mb() or 0.0, 1) or None,
     }
 
 # ------------------------------------------------------------------------------
 # Eksporterte navn
 # ------------------------------------------------------------------------------
+# De lazy modul-attributtene (_LAZY_ATTRS) står bevisst ikke her: `import *` ville lastet alle modellene
 __all__ = [
-    "nlp",
-    "fag_profiler_model_legacy",
-    "semantic_model",
     "get_fag_model",
     "reload_fag_model",
     "fag_predict",
-    "nb_tokenizer",
-    "nb_model",
-    "NB_BERT_READY",
-    "mnli_tokenizer",
-    "mnli_model",
-    "MNLI_READY",
+    "fag_predict_batch",
+    "fag_model_version",
+    "predict_proba_batch",
     "global_ns_data",
     "MODEL_PATH",
     "NS_CACHE_PATH",
+    "NS_INDEX_DIR",
     "PKL_FAG_PROFILER",
     "SYNONYM_PATH",
     "nb_bert_encode",
     "nb_mnli_predict",
     "semantic_encode",
     "get_ai_status",
+    "registry",
+    "warmup",
+    "warmup_from_env",
 ]
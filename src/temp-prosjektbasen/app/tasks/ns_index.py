@@ -0,0 +1,244 @@
+# app/tasks/ns_index.py
+# -*- coding: utf-8 -*-
+"""
+Matrise-indeks for semantisk søk i NS-standarder (NS8415, NS8417, ...).
+
+Per standard lagres:
+- <std>.npy  : normaliserte float32-embeddings (n_sider × dim), lastes med mmap
+- <std>.json : sidenummer, sidetekst og versjonsinfo (kilde-PDF mtime/størrelse + modellnavn)
+
+Søk skjer i batch for alle krav i et dokument (én matrise-multiplikasjon per standard).
+Valgfri ANN-modus (NS_ANN=1) bruker faiss HNSW dersom biblioteket er installert,
+ellers faller den tilbake til eksakt søk.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover
+    faiss = None  # type: ignore
+
+_log = logging.getLogger(__name__)
+
+NS_ANN = os.getenv("NS_ANN", "0") == "1"
+NS_ANN_M = int(os.getenv("NS_ANN_M", "32"))          # HNSW-naboer per node
+NS_ANN_EF = int(os.getenv("NS_ANN_EF", "64"))        # søkebredde
+NS_INDEX_VERSION = 1
+
+
+def _source_stamp(pdf_path: str) -> Dict[str, Any]:
+    try:
+        st = Path(pdf_path).stat()
+        return {"source": str(Path(pdf_path).resolve()), "mtime": int(st.st_mtime), "size": int(st.st_size)}
+    except Exception:
+        return {"source": str(pdf_path), "mtime": 0, "size": 0}
+
+
+class _StdIndex:
+    """Én standard: sider + (valgfri) embedding-matrise og ANN-indeks."""
+
+    def __init__(self, name: str, pages: List[int], texts: List[str], matrix: Optional[np.ndarray]):
+        self.name = name
+        self.pages = pages
+        self.texts = texts
+        self.matrix = matrix
+        self.ann = None
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def topk(self, q: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """q: (n_q × dim) normaliserte vektorer. Returnerer per spørring [(rad, cos), ...] synkende."""
+        if self.matrix is None or len(self) == 0 or q.size == 0:
+            return [[] for _ in range(len(q))]
+        k = max(1, min(int(k), len(self)))
+        if self.ann is not None:
+            sims, ids = self.ann.search(np.ascontiguousarray(q, dtype=np.float32), k)
+            return [[(int(i), float(s)) for i, s in zip(row_i, row_s) if i >= 0]
+                    for row_i, row_s in zip(ids, sims)]
+        sims = q @ self.matrix.T
+        if k < sims.shape[1]:
+            part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(sims.shape[1]), (sims.shape[0], 1))
+        out: List[List[Tuple[int, float]]] = []
+        for r, cols in enumerate(part):
+            row = sorted(((int(c), float(sims[r, c])) for c in cols), key=lambda x: (-x[1], x[0]))
+            out.append(row)
+        return out
+
+
+class NSMatrixIndex:
+    """Samling av standard-indekser. Tom indeks er falsy (som tidligere dict-indeks)."""
+
+    def __init__(self, stds: Optional[Dict[str, _StdIndex]] = None):
+        self.stds: Dict[str, _StdIndex] = stds or {}
+
+    def __bool__(self) -> bool:
+        return any(len(s) for s in self.stds.values())
+
+    @property
+    def has_vectors(self) -> bool:
+        return any(s.matrix is not None and len(s) for s in self.stds.values())
+
+    def search(self, q: np.ndarray, k: int) -> List[List[Dict[str, Any]]]:
+        """Batch-søk. Returnerer per spørring liste av {"standard", "side", "tekst", "cos"}."""
+        q = np.asarray(q, dtype=np.float32)
+        if q.ndim == 1:
+            q = q.reshape(1, -1)
+        out: List[List[Dict[str, Any]]] = [[] for _ in range(len(q))]
+        for name, std in self.stds.items():
+            for qi, row in enumerate(std.topk(q, k)):
+                for r, cos in row:
+                    out[qi].append({"standard": name, "side": std.pages[r], "tekst": std.texts[r], "cos": cos})
+        return out
+
+
+_LOCK = threading.Lock()
+_LOADED: Dict[Tuple[str, str], Tuple[Dict[str, Any], _StdIndex]] = {}
+
+
+def _paths(index_dir: Path, std: str) -> Tuple[Path, Path, Path]:
+    return index_dir / f"{std}.npy", index_dir / f"{std}.json", index_dir / f"{std}.faiss"
+
+
+def _read_pdf_pages(pdf_path: str) -> Tuple[List[int], List[str]]:
+    import fitz  # PyMuPDF
+    pages: List[int] = []
+    texts: List[str] = []
+    with fitz.open(pdf_path) as doc:
+        for i, page in enumerate(doc, start=1):
+            txt = " ".join((page.get_text("text") or "").split())
+            if txt:
+                pages.append(i)
+                texts.append(txt)
+    return pages, texts
+
+
+def _attach_ann(std: _StdIndex, faiss_path: Path) -> None:
+    if not NS_ANN or std.matrix is None or len(std) == 0:
+        return
+    if faiss is None:
+        _log.info("NS_ANN=1, men faiss er ikke installert – bruker eksakt søk for %s.", std.name)
+        return
+    try:
+        if faiss_path.exists():
+            ann = faiss.read_index(str(faiss_path))
+        else:
+            ann = faiss.IndexHNSWFlat(std.matrix.shape[1], NS_ANN_M, faiss.METRIC_INNER_PRODUCT)
+            ann.add(np.ascontiguousarray(std.matrix, dtype=np.float32))
+            faiss.write_index(ann, str(faiss_path))
+        ann.hnsw.efSearch = NS_ANN_EF
+        std.ann = ann
+    except Exception as e:
+        _log.warning("ANN-indeks for %s feilet (%s) – bruker eksakt søk.", std.name, e)
+
+
+def _build_std(std: str, pdf_path: str, sem, model_name: str, index_dir: Path) -> Optional[_StdIndex]:
+    npy_path, meta_path, faiss_path = _paths(index_dir, std)
+    pages, texts = _read_pdf_pages(pdf_path)
+    matrix = None
+    if sem is not None and texts:
+        vecs = sem.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        matrix = np.ascontiguousarray(np.asarray(vecs, dtype=np.float32))
+    meta = {
+        "version": NS_INDEX_VERSION,
+        "model": model_name if matrix is not None else None,
+        **_source_stamp(pdf_path),
+        "pages": pages,
+        "texts": texts,
+    }
+    try:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        if matrix is not None:
+            tmp = npy_path.with_name(npy_path.stem + ".tmp.npy")
+            np.save(tmp, matrix)
+            os.replace(tmp, npy_path)
+            matrix = np.load(npy_path, mmap_mode="r")
+        faiss_path.unlink(missing_ok=True)
+        tmp_meta = meta_path.with_suffix(".json.tmp")
+        tmp_meta.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_meta, meta_path)
+    except Exception as e:
+        _log.warning("Kunne ikke skrive NS-indeks for %s: %s", std, e)
+    _log.info("Bygget NS-indeks for %s: %d sider.", std, len(pages))
+    return _StdIndex(std, pages, texts, matrix)
+
+
+def _load_std(std: str, pdf_path: str, sem, model_name: str, index_dir: Path) -> Optional[_StdIndex]:
+    npy_path, meta_path, faiss_path = _paths(index_dir, std)
+    want_model = model_name if sem is not None else None
+    stamp = _source_stamp(pdf_path)
+    if meta_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            fresh = (
+                meta.get("version") == NS_INDEX_VERSION
+                and meta.get("mtime") == stamp["mtime"]
+                and meta.get("size") == stamp["size"]
+                and (want_model is None or meta.get("model") == want_model)
+            )
+            if fresh:
+                matrix = np.load(npy_path, mmap_mode="r") if (want_model and npy_path.exists()) else None
+                if want_model is None or matrix is not None:
+                    return _StdIndex(std, list(meta["pages"]), list(meta["texts"]), matrix)
+        except Exception as e:
+            _log.warning("NS-indeks for %s kunne ikke leses (%s) – bygger på nytt.", std, e)
+    return _build_std(std, pdf_path, sem, model_name, index_dir)
+
+
+def load_ns_index(standards_cfg: dict, sem, model_name: str, index_dir: Path) -> NSMatrixIndex:
+    """Laster (eller bygger) indeks for alle aktive standarder. Holdes i minnet per prosess."""
+    stds: Dict[str, _StdIndex] = {}
+    for std, meta in (standards_cfg or {}).items():
+        if not meta.get("aktiv"):
+            continue
+        pdf_path = meta.get("path")
+        if not pdf_path or not Path(pdf_path).is_file():
+            continue
+        key = (std, str(index_dir))
+        stamp = {**_source_stamp(pdf_path), "model": model_name if sem is not None else None}
+        with _LOCK:
+            cached = _LOADED.get(key)
+            if cached is not None and cached[0] == stamp:
+                stds[std] = cached[1]
+                continue
+            try:
+                idx = _load_std(std, pdf_path, sem, model_name, index_dir)
+            except Exception as e:
+                _log.warning("NS-indeks for %s feilet: %s", std, e)
+                continue
+            if idx is None:
+                continue
+            _attach_ann(idx, _paths(index_dir, std)[2])
+            _LOADED[key] = (stamp, idx)
+            stds[std] = idx
+    return NSMatrixIndex(stds)
+
+
+def token_overlap(a: str, b: str) -> float:
+    sa = set(re.findall(r"\w+", a.lower()))
+    sb = set(re.findall(r"\w+", b.lower()))
+    if not sa or not sb:
+        return 0.0
+    inter = len(sa & sb)
+    denom = max(1, min(len(sa), len(sb)))
+    return 100.0 * (inter / denom)
+
+
+__all__ = [
+    "NSMatrixIndex",
+    "load_ns_index",
+    "token_overlap",
+    "NS_ANN",
+]
@@ -7,11 +7,11 @@ from __future__ import annotations
 
 import logging
 import shutil
-import subprocess
 import io
 import secrets
 import re
 from pathlib import Path
+from typing import Iterator
 
 # Tredjepartsbiblioteker for fil-parsing
 import fitz  # PyMuPDF for PDF
@@ -19,7 +19,9 @@ import extract_msg  # For .msg (Outlook-eposter)
 from docx import Document  # For .docx
 from openpyxl import load_workbook  # For .xlsx
 
-from .core import extract_requirements, clean_text
+from .core import extract_requirements, extract_requirements_from_pages, clean_text, iter_clean_pages
+from .text_cache import TextCacheCorrupt, get_text_cache
+from .doc_convert import get_conversion_pool
 
 log = logging.getLogger(__name__)
 
@@ -31,26 +33,54 @@ TEMP_ROOT.mkdir(parents=True, exist_ok=True)
 
 def _convert_doc_to_docx(input_path: Path, out_dir: Path) -> Path | None:
     """
-    Konverterer .doc → .docx ved hjelp av LibreOffice (soffice).
+    Konverterer .doc → .docx via LibreOffice-poolen (app.tasks.doc_convert).
     Returnerer sti til .docx ved suksess, ellers None.
     """
     try:
-        out_dir.mkdir(parents=True, exist_ok=True)
-        cmd = ["soffice", "--headless", "--convert-to", "docx", "--outdir", str(out_dir), str(input_path)]
-        res = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        if res.returncode != 0:
-            log.warning("[.doc→.docx] Konvertering feilet for %s: %s", input_path.name, res.stderr or res.stdout)
-            return None
-        out_path = out_dir / (input_path.stem + ".docx")
-        return out_path if out_path.exists() else None
-    except FileNotFoundError:
-        log.warning("[.doc→.docx] Fant ikke 'soffice' (LibreOffice). Installer LibreOffice i miljøet for .doc-støtte.")
-        return None
+        return get_conversion_pool().convert(input_path, out_dir)
     except Exception as e:
         log.warning("[.doc→.docx] Uforutsett feil for %s: %s", input_path.name, e, exc_info=True)
         return None
 
 
+def prefetch_doc_conversions(files: list[Path]) -> int:
+    """
+    Legger .doc-filer som ikke allerede ligger i tekst-cachen i konverteringskøen,
+    slik at LibreOffice jobber mens andre filer parses. Returnerer antall filer i kø.
+    """
+    docs = [f for f in files if f.suffix.lower() == ".doc"]
+    if not docs:
+        return 0
+    cache = get_text_cache()
+    if cache is not None:
+        todo = []
+        for f in docs:
+            try:
+                if cache.contains(cache.key(f, PARSER_VERSION)):
+                    continue
+            except Exception:
+                pass
+            todo.append(f)
+        docs = todo
+    try:
+        return get_conversion_pool().prefetch(docs)
+    except Exception as e:
+        log.warning("[.doc→.docx] Kunne ikke starte forhåndskonvertering: %s", e)
+        return 0
+
+
+def discard_doc_conversions(files: list[Path]) -> int:
+    """Forkaster forhåndskonverteringer for filene som ikke ble lest (f.eks. når tasken avbrytes)."""
+    docs = [f for f in files if f.suffix.lower() == ".doc"]
+    if not docs:
+        return 0
+    try:
+        return get_conversion_pool().discard(docs)
+    except Exception as e:
+        log.warning("[.doc→.docx] Kunne ikke forkaste forhåndskonverteringer: %s", e)
+        return 0
+
+
 def _extract_text_from_docx_bytes(data: bytes) -> str:
     """Henter ut tekst fra en .docx-fil gitt som bytes."""
     try:
@@ -63,12 +93,18 @@ def _extract_text_from_docx_bytes(data: bytes) -> str:
 
 def _pdf_to_text_with_pages(pdf_doc) -> str:
     """Ekstraherer tekst side for side og tagger med [[SIDE n]]."""
-    parts = []
-    for i, page in enumerate(pdf_doc):
-        # 'text' er mest robuste uttrekksmetode for semantikk
-        txt = page.get_text("text")
-        parts.append(f"[[SIDE {i+1}]]\n{txt}")
-    return "\n".join(parts)
+    return "\n".join(f"[[SIDE {no}]]\n{txt}" for no, txt in _iter_pdf_pages(pdf_doc, close=False))
+
+
+def _iter_pdf_pages(pdf_doc, close: bool = True) -> Iterator[tuple[int, str]]:
+    """Gir (sidenr, tekst) én side om gangen; lukker dokumentet når sidene er lest."""
+    try:
+        for i, page in enumerate(pdf_doc):
+            # 'text' er mest robuste uttrekksmetode for semantikk
+            yield i + 1, page.get_text("text")
+    finally:
+        if close:
+            pdf_doc.close()
 
 
 def _xlsx_to_text(xlsx_path: Path) -> str:
@@ -115,47 +151,22 @@ def _html_to_text(s: str) -> str:
     return txt
 
 
-def _process_single_document(
-    self_task,
-    file_path: Path,
-    keywords: list,
-    min_score: float,
-    ns_standard_selection: str,
-    mode: str,
-    fokusomraade: str,
-    selected_groups: list | None
-):
-    """
-    Leser én enkelt fil (inkl. vedlegg i .msg), trekker ut tekst,
-    og kjører kravuthenting på teksten.
-    Returnerer en tuple med (funn, feilmeldinger).
-    """
-    results: list[tuple[list, list[str]]] = []
+# Øk ved endringer i tekstuttrekket under – ugyldiggjør tekst-cachen
+PARSER_VERSION = "2"
+# Filtyper der parsing er dyr nok til å caches (txt/csv leses direkte)
+CACHED_EXTS = {".pdf", ".docx", ".doc", ".xlsx", ".msg"}
+_NAME_TOKEN = "\x00FIL\x00"
 
-    def process_text_content(text_content: str, source_name: str, file_type: str):
-        """Hjelpefunksjon som kaller selve krav-logikken."""
-        file_reqs, file_errs = [], []
-        try:
-            if text_content:
-                cleaned = clean_text(text_content)
-                file_reqs = extract_requirements(
-                    text=cleaned,
-                    selected_function_groups=selected_groups or [],
-                    file_name=source_name,
-                    min_score=float(min_score),
-                    file_type=file_type,
-                    ns_standard_selection=ns_standard_selection,
-                    mode=mode,
-                    fokus_text=fokusomraade or "",
-                    use_fokus_prefilter=True,
-                    fokus_threshold=0.60,
-                    selected_groups=selected_groups or [],
-                )
-        except Exception as e:
-            log.error("FEIL under prosessering av innhold fra %s: %s", source_name, e, exc_info=True)
-            file_errs.append(f"Alvorlig feil under prosessering av innhold fra '{source_name}': {e}")
-        return file_reqs, file_errs
 
+def _extract_items(file_path: Path, state: dict) -> Iterator[dict]:
+    """
+    Trekker ut tekst fra én fil (inkl. vedlegg i .msg) uten kravuthenting.
+    Gir elementer i samme rekkefølge som de oppstår, enten
+    {"label", "type", "text"} (tekst som skal prosesseres, kildenavn = filnavn + label),
+    {"label", "type", "pages"} (PDF: generator over (sidenr, rå sidetekst), leses strømmende)
+    eller {"error": melding}.
+    Setter state["cacheable"] = False ved forbigående feil (lesefeil, manglende LibreOffice o.l.).
+    """
     filename = file_path.name
     fext = file_path.suffix.lower()
 
@@ -165,7 +176,9 @@ def _process_single_document(
             msg = extract_msg.Message(str(file_path))
         except Exception as e:
             log.error("FEIL ved åpning av MSG %s: %s", filename, e, exc_info=True)
-            return [], [f"Kritisk feil ved lesing av e-post '{filename}': {e}"]
+            state["cacheable"] = False
+            yield {"error": f"Kritisk feil ved lesing av e-post '{filename}': {e}"}
+            return
 
         # 1) E-post-tekst (body/htmlBody)
         body_txt = msg.body or ""
@@ -176,8 +189,7 @@ def _process_single_document(
         if not body_txt and html_txt:
             body_txt = _html_to_text(html_txt)
         if body_txt:
-            reqs, errs = process_text_content(body_txt, f"{filename} (E-post)", file_type="msg")
-            results.append((reqs, errs))
+            yield {"label": " (E-post)", "type": "msg", "text": body_txt}
 
         # 2) Vedlegg
         for att in getattr(msg, "attachments", []) or []:
@@ -192,23 +204,21 @@ def _process_single_document(
             att_filename = getattr(att, "long_filename", None) or getattr(att, "short_filename", None) or "vedlegg"
             att_ext = Path(att_filename).suffix.lower()
             att_bytes = getattr(att, "data", None)
+            label = f" -> {att_filename}"
 
             if not att_bytes:
-                results.append(([], [f"Kunne ikke lese vedlegg '{att_filename}' fra '{filename}' (ingen data)."]))
+                yield {"error": f"Kunne ikke lese vedlegg '{att_filename}' fra '{filename}' (ingen data)."}
                 continue
 
             att_content = ""
             try:
                 if att_ext == ".pdf":
-                    with fitz.open(stream=att_bytes, filetype="pdf") as pdf_doc:
-                        att_content = _pdf_to_text_with_pages(pdf_doc)
-                    reqs, errs = process_text_content(att_content, f"{filename} -> {att_filename}", file_type="pdf")
-                    results.append((reqs, errs))
+                    pdf_doc = fitz.open(stream=att_bytes, filetype="pdf")
+                    yield {"label": label, "type": "pdf", "pages": _iter_pdf_pages(pdf_doc)}
 
                 elif att_ext == ".docx":
                     att_content = _extract_text_from_docx_bytes(att_bytes)
-                    reqs, errs = process_text_content(att_content, f"{filename} -> {att_filename}", file_type="docx")
-                    results.append((reqs, errs))
+                    yield {"label": label, "type": "docx", "text": att_content}
 
                 elif att_ext == ".doc":
                     att_tmp_dir = TEMP_ROOT / f"doc_att_{secrets.token_hex(4)}"
@@ -219,10 +229,10 @@ def _process_single_document(
                         docx_path = _convert_doc_to_docx(src_path, att_tmp_dir)
                         if docx_path and docx_path.exists():
                             att_content = _extract_text_from_docx_bytes(docx_path.read_bytes())
-                            reqs, errs = process_text_content(att_content, f"{filename} -> {att_filename}", file_type="doc")
-                            results.append((reqs, errs))
+                            yield {"label": label, "type": "doc", "text": att_content}
                         else:
-                            results.append(([], [f"Konvertering av DOC-vedlegg feilet for '{att_filename}'."]))
+                            yield {"error": f"Konvertering av DOC-vedlegg feilet for '{att_filename}'."}
+                            state["cacheable"] = False
                     finally:
                         shutil.rmtree(att_tmp_dir, ignore_errors=True)
 
@@ -232,8 +242,7 @@ def _process_single_document(
                     except Exception:
                         att_content = ""
                     if att_content:
-                        reqs, errs = process_text_content(att_content, f"{filename} -> {att_filename}", file_type="txt")
-                        results.append((reqs, errs))
+                        yield {"label": label, "type": "txt", "text": att_content}
 
                 elif att_ext in (".csv",):
                     try:
@@ -245,70 +254,242 @@ def _process_single_document(
                     except Exception:
                         att_content = ""
                     if att_content:
-                        reqs, errs = process_text_content(att_content, f"{filename} -> {att_filename}", file_type="csv")
-                        results.append((reqs, errs))
+                        yield {"label": label, "type": "csv", "text": att_content}
 
                 else:
                     # Ukjent eller ikke-støttet vedleggstype – hopp over stille men informer
-                    results.append(([], [f"Vedlegg '{att_filename}' (type {att_ext or 'ukjent'}) ble ikke prosessert."]))
+                    yield {"error": f"Vedlegg '{att_filename}' (type {att_ext or 'ukjent'}) ble ikke prosessert."}
             except Exception as e:
                 log.warning("Kunne ikke prosessere vedlegg %s: %s", att_filename, e)
-                results.append(([], [f"Kunne ikke lese vedlegg '{att_filename}' fra '{filename}'."]))
-    else:
-        # Håndter enkeltstående filer
-        extracted_text = ""
+                yield {"error": f"Kunne ikke lese vedlegg '{att_filename}' fra '{filename}'."}
+                state["cacheable"] = False
+        return
+
+    # Håndter enkeltstående filer
+    extracted_text = ""
+    try:
+        if fext == ".pdf":
+            doc = fitz.open(file_path)
+            yield {"label": "", "type": "pdf", "pages": _iter_pdf_pages(doc)}
+
+        elif fext == ".docx":
+            doc = Document(file_path)
+            extracted_text = "\n".join(p.text for p in doc.paragraphs)
+            yield {"label": "", "type": "docx", "text": extracted_text}
+
+        elif fext == ".doc":
+            conv_dir = TEMP_ROOT / f"doc_{secrets.token_hex(4)}"
+            conv_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                docx_path = _convert_doc_to_docx(file_path, conv_dir)
+                if docx_path and docx_path.exists():
+                    extracted_text = _extract_text_from_docx_bytes(docx_path.read_bytes())
+                    yield {"label": "", "type": "doc", "text": extracted_text}
+                else:
+                    raise RuntimeError("Konvertering ga ingen .docx-utfil.")
+            finally:
+                shutil.rmtree(conv_dir, ignore_errors=True)
+
+        elif fext == ".txt":
+            try:
+                extracted_text = file_path.read_text(encoding="utf-8", errors="ignore")
+            except Exception as e:
+                log.error("FEIL ved lesing av TXT %s: %s", filename, e, exc_info=True)
+                extracted_text = ""
+            yield {"label": "", "type": "txt", "text": extracted_text}
+
+        elif fext == ".xlsx":
+            extracted_text = _xlsx_to_text(file_path)
+            yield {"label": "", "type": "xlsx", "text": extracted_text}
+
+        elif fext == ".csv":
+            extracted_text = _csv_to_text(file_path)
+            yield {"label": "", "type": "csv", "text": extracted_text}
+
+        else:
+            yield {"error": f"Filtype {fext or 'ukjent'} støttes ikke for '{filename}'."}
+
+    except Exception as e:
+        log.error("FEIL ved lesing av fil %s: %s", filename, e, exc_info=True)
+        yield {"error": f"Kritisk feil ved lesing av fil '{filename}': {e}"}
+        state["cacheable"] = False
+
+
+
+def _load_items(file_path: Path, cache_stats: dict | None = None) -> Iterator[dict]:
+    """
+    Gir tekst-elementer for filen fra tekst-cachen (SHA-256 + PARSER_VERSION),
+    ellers parses filen og elementene skrives til cachen mens de leses.
+    Teller treff/bom i cache_stats. En skadet oppføring kaster TextCacheCorrupt underveis
+    (den er da slettet); kalleren forkaster det som er lest og kaller på nytt.
+    """
+    def _count(k: str):
+        if cache_stats is not None:
+            cache_stats[k] = cache_stats.get(k, 0) + 1
+
+    filename = file_path.name
+    cache = get_text_cache() if file_path.suffix.lower() in CACHED_EXTS else None
+    key = None
+    if cache is not None:
         try:
-            if fext == ".pdf":
-                with fitz.open(file_path) as doc:
-                    extracted_text = _pdf_to_text_with_pages(doc)
-                reqs, errs = process_text_content(extracted_text, filename, file_type="pdf")
-                results.append((reqs, errs))
-
-            elif fext == ".docx":
-                doc = Document(file_path)
-                extracted_text = "\n".join(p.text for p in doc.paragraphs)
-                reqs, errs = process_text_content(extracted_text, filename, file_type="docx")
-                results.append((reqs, errs))
-
-            elif fext == ".doc":
-                conv_dir = TEMP_ROOT / f"doc_{secrets.token_hex(4)}"
-                conv_dir.mkdir(parents=True, exist_ok=True)
-                try:
-                    docx_path = _convert_doc_to_docx(file_path, conv_dir)
-                    if docx_path and docx_path.exists():
-                        extracted_text = _extract_text_from_docx_bytes(docx_path.read_bytes())
-                        reqs, errs = process_text_content(extracted_text, filename, file_type="doc")
-                        results.append((reqs, errs))
-                    else:
-                        raise RuntimeError("Konvertering ga ingen .docx-utfil.")
-                finally:
-                    shutil.rmtree(conv_dir, ignore_errors=True)
-
-            elif fext == ".txt":
-                try:
-                    extracted_text = file_path.read_text(encoding="utf-8", errors="ignore")
-                except Exception as e:
-                    log.error("FEIL ved lesing av TXT %s: %s", filename, e, exc_info=True)
-                    extracted_text = ""
-                reqs, errs = process_text_content(extracted_text, filename, file_type="txt")
-                results.append((reqs, errs))
-
-            elif fext == ".xlsx":
-                extracted_text = _xlsx_to_text(file_path)
-                reqs, errs = process_text_content(extracted_text, filename, file_type="xlsx")
-                results.append((reqs, errs))
-
-            elif fext == ".csv":
-                extracted_text = _csv_to_text(file_path)
-                reqs, errs = process_text_content(extracted_text, filename, file_type="csv")
-                results.append((reqs, errs))
+            key = cache.key(file_path, PARSER_VERSION)
+        except Exception as e:
+            log.warning("Tekst-cache: kunne ikke hashe %s: %s", filename, e)
+        if key is not None:
+            records = cache.get(key)
+            if records is not None:
+                yield from _items_from_records(records, filename)
+                # Telles først når hele oppføringen er lest og validert
+                _count("hits")
+                return
+
+    _count("bypassed" if key is None else "misses")
+    state = {"cacheable": True}
+    writer = cache.writer(key) if key is not None else None
+    committed = False
+    try:
+        prev = None
+        for item in _extract_items(file_path, state):
+            _drain(prev)
+            if writer is not None:
+                item = _record_item(item, writer, filename, state)
+            prev = item
+            yield item
+        _drain(prev)
+        if writer is not None and state["cacheable"]:
+            writer.commit()
+            committed = True
+    finally:
+        if writer is not None and not committed:
+            writer.abort()
+
+
+def _drain(item: dict | None) -> None:
+    """Leser resten av sidene i et PDF-element (f.eks. etter feil i kravuthentingen)."""
+    if item is not None and "pages" in item:
+        for _ in item["pages"]:
+            pass
+
+
+def _record_item(item: dict, writer, filename: str, state: dict) -> dict:
+    # Filnavn lagres som token, slik at like filer med ulike navn deler oppføring
+    if "error" in item:
+        writer.write({"kind": "error", "error": item["error"].replace(filename, _NAME_TOKEN)})
+        return item
+    if "pages" in item:
+        writer.write({"kind": "pages", "label": item["label"], "type": item["type"]})
+        return {**item, "pages": _tee_pages(item["pages"], writer, state)}
+    writer.write({"kind": "text", "label": item["label"], "type": item["type"], "text": item["text"]})
+    return item
+
+
+def _tee_pages(pages, writer, state: dict) -> Iterator[tuple[int, str]]:
+    try:
+        for no, txt in pages:
+            writer.write({"kind": "page", "p": no, "t": txt})
+            yield no, txt
+    except Exception:
+        state["cacheable"] = False
+        raise
+    writer.write({"kind": "end"})
+
+
+def _items_from_records(records, filename: str) -> Iterator[dict]:
+    it = iter(records)
+    for rec in it:
+        kind = rec.get("kind")
+        if kind == "error":
+            yield {"error": rec["error"].replace(_NAME_TOKEN, filename)}
+        elif kind == "text":
+            yield {"label": rec["label"], "type": rec["type"], "text": rec["text"]}
+        elif kind == "pages":
+            item = {"label": rec["label"], "type": rec["type"], "pages": _pages_from_records(it)}
+            yield item
+            _drain(item)
+
+
+def _pages_from_records(it) -> Iterator[tuple[int, str]]:
+    for rec in it:
+        if rec.get("kind") != "page":
+            return
+        yield rec["p"], rec["t"]
 
-            else:
-                results.append(([], [f"Filtype {fext or 'ukjent'} støttes ikke for '{filename}'."]))
 
+def _process_single_document(
+    self_task,
+    file_path: Path,
+    keywords: list,
+    min_score: float,
+    ns_standard_selection: str,
+    mode: str,
+    fokusomraade: str,
+    selected_groups: list | None,
+    cache_stats: dict | None = None,
+):
+    """
+    Leser én enkelt fil (inkl. vedlegg i .msg), trekker ut tekst,
+    og kjører kravuthenting på teksten.
+    Uttrukket tekst gjenbrukes fra tekst-cachen når filinnholdet er uendret.
+    Returnerer en tuple med (funn, feilmeldinger).
+    """
+    opts = dict(
+        selected_function_groups=selected_groups or [],
+        min_score=float(min_score),
+        ns_standard_selection=ns_standard_selection,
+        mode=mode,
+        fokus_text=fokusomraade or "",
+        use_fokus_prefilter=True,
+        fokus_threshold=0.60,
+        selected_groups=selected_groups or [],
+    )
+
+    def process_text_content(text_content: str, source_name: str, file_type: str):
+        """Hjelpefunksjon som kaller selve krav-logikken."""
+        file_reqs, file_errs = [], []
+        try:
+            if text_content:
+                cleaned = clean_text(text_content)
+                file_reqs = extract_requirements(text=cleaned, file_name=source_name, file_type=file_type, **opts)
         except Exception as e:
-            log.error("FEIL ved lesing av fil %s: %s", filename, e, exc_info=True)
-            results.append(([], [f"Kritisk feil ved lesing av fil '{filename}': {e}"]))
+            log.error("FEIL under prosessering av innhold fra %s: %s", source_name, e, exc_info=True)
+            file_errs.append(f"Alvorlig feil under prosessering av innhold fra '{source_name}': {e}")
+        return file_reqs, file_errs
+
+    def process_pages_content(pages, source_name: str, file_type: str):
+        """Som process_text_content, men sidene renses og behandles strømmende (PDF)."""
+        file_reqs, file_errs = [], []
+        try:
+            file_reqs = extract_requirements_from_pages(
+                iter_clean_pages(pages), file_name=source_name, file_type=file_type, **opts)
+        except TextCacheCorrupt:
+            raise
+        except Exception as e:
+            log.error("FEIL under prosessering av innhold fra %s: %s", source_name, e, exc_info=True)
+            file_errs.append(f"Alvorlig feil under prosessering av innhold fra '{source_name}': {e}")
+        return file_reqs, file_errs
+
+    filename = file_path.name
+
+    def process_items() -> list[tuple[list, list[str]]]:
+        out: list[tuple[list, list[str]]] = []
+        for item in _load_items(file_path, cache_stats):
+            if "error" in item:
+                out.append(([], [item["error"]]))
+                continue
+            source_name = f"{filename}{item['label']}"
+            if "pages" in item:
+                reqs, errs = process_pages_content(item["pages"], source_name, file_type=item["type"])
+            else:
+                reqs, errs = process_text_content(item["text"], source_name, file_type=item["type"])
+            out.append((reqs, errs))
+        return out
+
+    try:
+        results = process_items()
+    except TextCacheCorrupt:
+        # Skadet cache-oppføring (slettet): forkast det som ble lest og parse filen på nytt
+        log.warning("Tekst-cache: skadet oppføring for %s – parser filen på nytt.", filename)
+        results = process_items()
 
     final_reqs = [req for res_tuple in results for req in (res_tuple[0] or [])]
     final_errs = [err for res_tuple in results for err in (res_tuple[1] or [])]
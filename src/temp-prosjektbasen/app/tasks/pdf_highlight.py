@@ -0,0 +1,181 @@
+# app/tasks/pdf_highlight.py
+# -*- coding: utf-8 -*-
+"""
+Utheving av mange termer (nøkkelord, synonymer og kravtekster) i PDF i én passering per side.
+
+- Ordene på siden hentes én gang med bokser (page.get_text("words"))
+- Sideteksten bygges som små bokstaver uten mellomrom, og termene matches uten mellomrom.
+  clean_text() limer sammen linjer ("ha\nbehovsstyrt" -> "habehovsstyrt") og fjerner mellomrom
+  foran tegnsetting, så kravtekster fra rapporten treffer likevel
+- Orddeling ved linjeskift ("venti-" + "lasjon"): sider med slike ord matches også uten
+  bindestreken, slik at nøkkelordet "ventilasjon" uthever begge delene
+- Alle termer matches samtidig med en Aho–Corasick-automat (tid ~ tekstlengde + antall treff)
+- Treff mappes tilbake til ordboksene, slås sammen per linje og legges inn som én
+  uthevingsannotasjon per side
+
+Merk: treff uthever hele ord (også når termen bare er en del av ordet, f.eks. "ventil" i
+"ventilasjonsanlegg"), og siden mellomrom ignoreres kan en term også treffe over en ordgrense.
+Termer som krysser sideskift uthever ikke.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+import fitz
+
+_log = logging.getLogger(__name__)
+
+_WS = re.compile(r"\s+")
+# Orddeling på slutten av en linje: "venti-" (ordtegn før bindestreken) foran et ord på neste linje
+_HYPHEN_END = re.compile(r"\w-$")
+_WORD_START = re.compile(r"\w")
+# Ligaturer (ﬁ, ﬂ …) foldes ut slik at "ﬁlter" matcher "filter". TEXT_DEHYPHENATE som i search_for();
+# MuPDF slår ikke sammen ord i "words"-modus, så _page_text() gjør det selv.
+_WORD_FLAGS = (fitz.TEXTFLAGS_WORDS | fitz.TEXT_DEHYPHENATE) & ~fitz.TEXT_PRESERVE_LIGATURES
+
+
+def normalize_term(s: str) -> str:
+    return _WS.sub(" ", (s or "").lower()).strip()
+
+
+def _match_key(s: str) -> str:
+    return _WS.sub("", (s or "").lower())
+
+
+class TermAutomaton:
+    """Aho–Corasick over tegn. `find(text)` gir (start, slutt) for alle forekomster av alle termer."""
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = sorted({t for t in (normalize_term(x) for x in terms) if t})
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[int, ...]] = [()]
+        for term in sorted({_match_key(t) for t in self.terms}):
+            node = 0
+            for ch in term:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                node = nxt
+            out[node] = out[node] + (len(term),)
+
+        # Feillenker bredde-først; utdata arves fra feilnoden
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: List[Tuple[int, int]] = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                end = i + 1
+                for n in out[node]:
+                    hits.append((end - n, end))
+        return hits
+
+
+def _hyphen_breaks(words) -> List[int]:
+    """Indekser til ord som er delt ved linjeskift ("venti-" med "lasjon" først på neste linje)."""
+    found = []
+    for i in range(len(words) - 1):
+        w, nxt = words[i], words[i + 1]
+        if _HYPHEN_END.search(w[4]) and (nxt[5], nxt[6]) != (w[5], w[6]) and _WORD_START.match(nxt[4]):
+            found.append(i)
+    return found
+
+
+def _page_text(words, dehyphenate=()) -> Tuple[List[int], str]:
+    """Sidetekst uten mellomrom og startposisjonen til hvert ord i den."""
+    starts: List[int] = []
+    parts: List[str] = []
+    pos = 0
+    for i, w in enumerate(words):
+        starts.append(pos)
+        txt = _match_key(w[4])
+        if i in dehyphenate:
+            txt = txt[:-1]
+        parts.append(txt)
+        pos += len(txt)
+    return starts, "".join(parts)
+
+
+def page_highlight_rects(page, automaton: TermAutomaton) -> List[fitz.Rect]:
+    """Rektangler (ett per berørt tekstlinje-segment) for alle treff på siden."""
+    words = page.get_text("words", flags=_WORD_FLAGS)
+    if not words:
+        return []
+    # Med bindestrek for kravtekster (clean_text beholder den), uten for nøkkelord
+    passes = [_page_text(words)]
+    breaks = _hyphen_breaks(words)
+    if breaks:
+        passes.append(_page_text(words, set(breaks)))
+
+    marked = set()
+    for starts, text in passes:
+        for a, b in automaton.find(text):
+            first = bisect_right(starts, a) - 1
+            last = bisect_right(starts, b - 1) - 1
+            marked.update(range(first, last + 1))
+    if not marked:
+        return []
+
+    # Slå sammen nabo-ord på samme linje (blokk, linje) til ett rektangel
+    rects: List[fitz.Rect] = []
+    prev_key, prev_idx = None, -2
+    for idx in sorted(marked):
+        x0, y0, x1, y1, _t, blk, ln, _wn = words[idx]
+        key = (blk, ln)
+        if key == prev_key and idx == prev_idx + 1:
+            rects[-1] |= fitz.Rect(x0, y0, x1, y1)
+        else:
+            rects.append(fitz.Rect(x0, y0, x1, y1))
+        prev_key, prev_idx = key, idx
+    return rects
+
+
+def highlight_terms(doc, terms: Iterable[str]) -> Dict[str, float]:
+    """Uthever alle termer i et åpent fitz-dokument. Returnerer enkle tellere (sider, treff, sekunder)."""
+    t0 = time.perf_counter()
+    automaton = terms if isinstance(terms, TermAutomaton) else TermAutomaton(terms)
+    stats = {"terms": len(automaton), "pages": 0, "pages_hit": 0, "rects": 0, "seconds": 0.0}
+    if len(automaton):
+        for page in doc:
+            stats["pages"] += 1
+            rects = page_highlight_rects(page, automaton)
+            if rects:
+                page.add_highlight_annot(quads=[r.quad for r in rects]).update()
+                stats["pages_hit"] += 1
+                stats["rects"] += len(rects)
+    stats["seconds"] = time.perf_counter() - t0
+    _log.debug("PDF-utheving: %s", stats)
+    return stats
+
+
+__all__ = ["TermAutomaton", "normalize_term", "page_highlight_rects", "highlight_terms"]
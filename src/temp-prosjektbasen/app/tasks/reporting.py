@@ -32,14 +32,19 @@ from docx.enum.table import WD_TABLE_ALIGNMENT
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from openpyxl import Workbook, load_workbook
-from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Alignment, Font, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 from rapidfuzz.fuzz import ratio as fuzz_ratio
+from rapidfuzz.process import extractOne as extract_one
 import matplotlib.pyplot as plt
 
 # Importerer delt konfigurasjon
 from app.config import GROUP_COLORS
 
+# One-pass utheving av mange termer i PDF
+from app.tasks.pdf_highlight import highlight_terms
+
 # Definerer stier som er relevante for dette modulet
 CURRENT_DIR = Path(__file__).resolve().parent.parent  # Peker til 'app'-mappen
 TEMP_ROOT = CURRENT_DIR / "temp"
@@ -107,36 +112,26 @@ def highlight_docx(path, keywords, output):
     doc.save(output)
 
 
-def highlight_pdf(path, keywords, output):
+def highlight_pdf(path, keywords, output, snippets=None):
+    """
+    Uthever nøkkelord (med synonymer) og evt. kravtekster (`snippets`) i én passering per side.
+    Se app.tasks.pdf_highlight: ordene hentes én gang per side, og alle termer matches samlet.
+    """
     word_map = _load_word_family_map()
-    doc = fitz.open(path)
     keywords_lower = [k.lower() for k in (keywords or [])]
     all_terms = set(keywords_lower)
     for base in keywords_lower:
         if base in word_map:
             all_terms.update(word_map[base])
+    # Kravteksten avsluttes med punktum også når setningen er kuttet ("oppetid." mot "oppetid: 99,9 %")
+    all_terms.update(t for t in (s.rstrip(" .!?;:") for s in (snippets or []) if s) if t)
 
-    # Sett egnede flags hvis tilgjengelig i denne PyMuPDF-versjonen
-    flags = 0
-    if hasattr(fitz, "TEXT_IGNORECASE"):
-        flags |= fitz.TEXT_IGNORECASE
-    if hasattr(fitz, "TEXT_DEHYPHENATE"):
-        flags |= fitz.TEXT_DEHYPHENATE
-
-    for page in doc:
-        for kw in all_terms:
-            if not kw:
-                continue
-            try:
-                rects = page.search_for(kw, flags=flags)
-            except TypeError:
-                # Eldre versjoner: fall tilbake uten flags
-                rects = page.search_for(kw)
-            for inst in rects:
-                page.add_highlight_annot(inst).update()
-
-    doc.save(output, garbage=4, deflate=True, clean=True)
-    doc.close()
+    doc = fitz.open(path)
+    try:
+        highlight_terms(doc, all_terms)
+        doc.save(output, garbage=4, deflate=True, clean=True)
+    finally:
+        doc.close()
 
 
 def highlight_excel(path, keywords, output):
@@ -179,60 +174,161 @@ def highlight_text(path, keywords, output):
 
 # === Rapport-genereringsfunksjoner ===
 
-def generate_total_excel_report_grouped(
-    all_requirements: dict,
-    keywords: list,
-    total_files_scanned: int,
-    total_requirements_found: int,
-    keyword_counts: defaultdict,
-    synonym_counts: defaultdict,
-    semantic_search_counts: defaultdict,
-    grouped_requirements: defaultdict
-) -> io.BytesIO:
+_KRAV_HEADERS = [
+    "Søkeord","Korttekst","Funnet tekst","Kravtype","Treff %",
+    "Dokument og side","Valgt løsning","Risiko","Kommentar",
+    "Kravverb","# setninger","Lengde","NS-dokument(er)","NS-referanse","NS (valgt)","NS-kvalitet","Forklaring","Topp fag","Gruppe"
+]
+_THIN = Side(style="thin")
+_CELL_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_WRAP_TOP = Alignment(wrap_text=True, vertical="top")
+_HDR_FONT = Font(bold=True)
+_HDR_FILL = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
+
+
+def _named_style(wb, name: str, **attrs) -> str:
     """
-    Lager samlet Excel-rapport  ett ark per gruppe.
+    Registrerer en navngitt stil én gang per arbeidsbok og returnerer navnet.
+    `cell.style = navn` er et billig oppslag; font/fill/border/alignment per celle
+    hasher stilobjektene på nytt for hver eneste celle.
     """
-    # Helper: trygt formattere NS-referanse fra krav["ns_pin"]
-    def _fmt_ns_pin(krav: dict) -> str:
-        pin = krav.get("ns_pin")
-        if isinstance(pin, dict):
-            std = (pin.get("standard") or "").strip()
-            side = (pin.get("side") or "")
-            if std or side:
-                return f"{std} s.{side}" if side else std
-        return ""
-
-    # Helper: formatter "Forklaring" felt fra krav["explain"]
-    def _fmt_explain(krav: dict) -> str:
-        ex = krav.get("explain")
-        if isinstance(ex, dict):
-            try:
-                kw  = float(ex.get("kw_sc", 0))
-                sem = float(ex.get("sem_sc", 0))
-                ai  = float(ex.get("ai_sc", 0))
-                fok = float(ex.get("fokus_boost", 0))
-            except Exception:
-                kw = sem = ai = fok = 0.0
-            return f"KW:{kw:.1f}% | SEM:{sem:.1f}% | AI:{ai:.1f}% | FOKUS:{fok:.1f}"
-        return ""
-       
-    # ---------- Opprett workbook  standardoppsett ----------
-    wb = Workbook()
-    ws_all = wb.active
-    ws_all.title = "Alle funn"
-    headers = [
-        "Søkeord","Korttekst","Funnet tekst","Kravtype","Treff %",
-        "Dokument og side","Valgt løsning","Risiko","Kommentar",
-        "Kravverb","# setninger","Lengde","NS-dokument(er)","NS-referanse","NS (valgt)","NS-kvalitet","Forklaring","Topp fag","Gruppe"
-    ]
-    ws_all.append(headers)
-    bold_font = Font(bold=True)
-    gray_fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-    thin_border = Border(
-        left=Side(style="thin"), right=Side(style="thin"),
-        top=Side(style="thin"), bottom=Side(style="thin")
+    if name not in wb.named_styles:
+        wb.add_named_style(NamedStyle(name=name, **attrs))
+    return name
+
+
+def _krav_col_width(h: str) -> int:
+    return (
+        50 if h in ["Funnet tekst", "Valgt løsning", "Kommentar", "NS-referanse"]
+        else 40 if h in ["Korttekst","NS (valgt)"]
+        else 30 if h == "Dokument og side"
+        else 22
     )
 
+
+# Helper: trygt formattere NS-referanse fra krav["ns_pin"]
+def _fmt_ns_pin(krav: dict) -> str:
+    pin = krav.get("ns_pin")
+    if isinstance(pin, dict):
+        std = (pin.get("standard") or "").strip()
+        side = (pin.get("side") or "")
+        if std or side:
+            return f"{std} s.{side}" if side else std
+    return ""
+
+
+# Helper: formatter "Forklaring" felt fra krav["explain"]
+def _fmt_explain(krav: dict) -> str:
+    ex = krav.get("explain")
+    if isinstance(ex, dict):
+        try:
+            kw  = float(ex.get("kw_sc", 0))
+            sem = float(ex.get("sem_sc", 0))
+            ai  = float(ex.get("ai_sc", 0))
+            fok = float(ex.get("fokus_boost", 0))
+        except Exception:
+            kw = sem = ai = fok = 0.0
+        return f"KW:{kw:.1f}% | SEM:{sem:.1f}% | AI:{ai:.1f}% | FOKUS:{fok:.1f}"
+    return ""
+
+
+def _krav_row(krav: dict, gruppe: str) -> list:
+    """Én rad i kravarkene (Alle funn / Usikre funn / per gruppe)."""
+    nlp_v = krav.get("nlp_vurdering", {}) or {}
+    kravverb = "Ja" if nlp_v.get("inneholder_kravsverb") else "Nei"
+    ant_setn = nlp_v.get("antall_setninger", "")
+    ant_tegn = nlp_v.get("lengde", "")
+
+    ns_treff = krav.get("ns_treff") or []
+    std_dok = ", ".join(sorted({t.get("standard") for t in ns_treff if t.get("standard")})) if ns_treff else ""
+
+    utdrag = []
+    for t in ns_treff:
+        tekst = (t.get("tekst") or "")
+        preview = tekst[:100].replace("\n", " ").strip() + ("..." if len(tekst) > 100 else "")
+        side = t.get("side", "")
+        sc = t.get("score")
+        try:
+            sc_txt = f"{float(sc):.1f}%"
+        except Exception:
+            sc_txt = ""
+        std = t.get("standard") or ""
+        score_suffix = f" [Score: {sc_txt}]" if sc_txt else ""
+        utdrag.append(f"{std} (s.{side}): {preview}{score_suffix}")
+
+    ns_ref = "\n".join(utdrag) if utdrag else "Ingen relevante treff."
+
+    return [
+        krav.get("keyword", ""),
+        (krav.get("short_text") or krav.get("korttekst") or ""),
+        krav.get("text", ""),
+        krav.get("kravtype", ""),
+        float(krav.get("score", 0.0)) / 100.0,  # lagres som 0–1 for Excel-prosentformat
+        krav.get("ref", ""),
+        "→ Beskriv valgt løsning her",
+        "",
+        "",
+        kravverb,
+        ant_setn,
+        ant_tegn,
+        std_dok,
+        ns_ref,
+        # NS (valgt)  NS-kvalitet
+        _fmt_ns_pin(krav),
+        (krav.get("ns_quality") or ""),
+        # Forklaring  topp fag
+        _fmt_explain(krav),
+        (
+            ", ".join(
+                f"{f.get('label','?')} ({f.get('score',0):.1f}%)"
+                for f in krav.get("top_fag", [])
+            ) if isinstance(krav.get("top_fag"), list) else ""
+        ),
+        gruppe,
+    ]
+
+
+def _stream_krav_sheet(wb, title: str, items: list, gruppe_of, boxed_header: bool = False) -> None:
+    """
+    Skriver ett kravark i write-only-modus (rad for rad, ingen celle-objekter holdes i minnet).
+    Bredder og autofilter settes før radene, siden write-only ikke kan endre dem i etterkant.
+    """
+    headers = _KRAV_HEADERS
+    ws = wb.create_sheet(title)
+    for i, h in enumerate(headers, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = _krav_col_width(h)
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{len(items) + 1}"
+
+    hdr = []
+    for h in headers:
+        c = WriteOnlyCell(ws, value=h)
+        c.font = _HDR_FONT
+        c.fill = _HDR_FILL
+        if boxed_header:
+            c.alignment = _WRAP_TOP
+            c.border = _CELL_BORDER
+        hdr.append(c)
+    ws.append(hdr)
+
+    cell = _named_style(wb, "Krav", alignment=_WRAP_TOP, border=_CELL_BORDER)
+    percent = _named_style(wb, "Krav prosent", alignment=_WRAP_TOP, border=_CELL_BORDER, number_format="0.0%")
+    for krav in items:
+        row = []
+        for i, v in enumerate(_krav_row(krav, gruppe_of(krav))):
+            c = WriteOnlyCell(ws, value=v)
+            c.style = percent if i == 4 else cell  # "Treff %"
+            row.append(c)
+        ws.append(row)
+
+
+def _write_total_excel_report(
+    target,
+    all_requirements: dict,
+    grouped_requirements: defaultdict
+) -> None:
+    """Skriver samlet Excel-rapport (ett ark per gruppe) til fil/sti `target` i write-only-modus."""
+    wb = Workbook(write_only=True)
+
     # ---------- Normaliser innkommende krav til en flat liste ----------
     # Tillat at data kan komme som:
     # - grouped_requirements (defaultdict[str, list[dict]])
@@ -270,87 +366,10 @@ def generate_total_excel_report_grouped(
                 fag = it.get("fag") or []
                 it["gruppe"] = (fag[0] if isinstance(fag, list) and fag else "Uspesifisert")
 
-    # ---------- Fyll "Alle funn"-arket ----------
-    for krav in (requirements or []):
-        nlp_v = krav.get("nlp_vurdering", {}) or {}
-        kravverb = "Ja" if nlp_v.get("inneholder_kravsverb") else "Nei"
-        ant_setn = nlp_v.get("antall_setninger", "")
-        ant_tegn = nlp_v.get("lengde", "")
-
-        ns_treff = krav.get("ns_treff") or []
-        std_dok = ", ".join(sorted({t.get("standard") for t in ns_treff if t.get("standard")})) if ns_treff else ""
-
-        utdrag = []
-        for t in ns_treff:
-            tekst = (t.get("tekst") or "")
-            preview = tekst[:100].replace("\n", " ").strip() + ("..." if len(tekst) > 100 else "")
-            side = t.get("side", "")
-            sc = t.get("score")
-            try:
-                sc_txt = f"{float(sc):.1f}%"
-            except Exception:
-                sc_txt = ""
-            std = t.get("standard") or ""
-            score_suffix = f" [Score: {sc_txt}]" if sc_txt else ""
-            utdrag.append(f"{std} (s.{side}): {preview}{score_suffix}")
-
-        ns_ref = "\n".join(utdrag) if utdrag else "Ingen relevante treff."
-
-        ws_all.append([
-            krav.get("keyword", ""),
-            (krav.get("short_text") or krav.get("korttekst") or ""),
-            krav.get("text", ""),
-            krav.get("kravtype", ""),
-            float(krav.get("score", 0.0)) / 100.0,  # lagres som 0–1 for Excel-prosentformat
-            krav.get("ref", ""),
-            "→ Beskriv valgt løsning her",
-            "",
-            "",
-            kravverb,
-            ant_setn,
-            ant_tegn,
-            std_dok,
-            ns_ref,
-            # NS (valgt)  NS-kvalitet
-            _fmt_ns_pin(krav),
-            (krav.get("ns_quality") or ""),
-            # Forklaring  topp fag
-            _fmt_explain(krav),
-            (
-                ", ".join(
-                    f"{f.get('label','?')} ({f.get('score',0):.1f}%)"
-                    for f in krav.get("top_fag", [])
-                ) if isinstance(krav.get("top_fag"), list) else ""
-            ),
-            krav.get("gruppe", "Uspesifisert"),
-        ])
-
-    # ---------- Formatering for "Alle funn" ----------
-    for r in ws_all.iter_rows(min_row=2, max_row=ws_all.max_row, min_col=1, max_col=len(headers)):
-        for c in r:
-            c.alignment = Alignment(wrap_text=True, vertical="top")
-            c.border = Border(
-                left=Side(style="thin"), right=Side(style="thin"),
-                top=Side(style="thin"), bottom=Side(style="thin")
-            )
-    # Header: fet  grå, kolonnebredder
-    for i, h in enumerate(headers, start=1):
-        cell = ws_all.cell(row=1, column=i)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-        width = (
-            50 if h in ["Funnet tekst", "Valgt løsning", "Kommentar", "NS-referanse"]
-            else 40 if h in ["Korttekst","NS (valgt)"]
-            else 30 if h == "Dokument og side"
-            else 22
-        )
-        ws_all.column_dimensions[get_column_letter(i)].width = width
-
-    # Prosentformat på "Treff %" (kolonne 5)
-    for row in range(2, ws_all.max_row + 1):
-        ws_all.cell(row=row, column=5).number_format = "0.0%"
+    requirements = requirements or []
 
-    ws_all.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{ws_all.max_row}"
+    # ---------- "Alle funn"-arket ----------
+    _stream_krav_sheet(wb, "Alle funn", requirements, lambda k: k.get("gruppe", "Uspesifisert"))
 
     # ---------- Ark for "Usikre funn" (preview) ----------
     preview_items = []
@@ -360,77 +379,8 @@ def generate_total_excel_report_grouped(
             preview_items = pr
 
     if preview_items:
-        ws_prev = wb.create_sheet("Usikre funn")
-        ws_prev.append(headers)
-        for krav in preview_items:
-            nlp_v = krav.get("nlp_vurdering", {}) or {}
-            kravverb = "Ja" if nlp_v.get("inneholder_kravsverb") else "Nei"
-            ant_setn = nlp_v.get("antall_setninger", "")
-            ant_tegn = nlp_v.get("lengde", "")
-            ns_treff = krav.get("ns_treff") or []
-            std_dok = ", ".join(sorted({t.get("standard") for t in ns_treff if t.get("standard")})) if ns_treff else ""
-
-            utdrag = []
-            for t in ns_treff:
-                tekst = (t.get("tekst") or "")
-                preview = tekst[:100].replace("\n", " ").strip() + ("..." if len(tekst) > 100 else "")
-                side = t.get("side", "")
-                sc = t.get("score")
-                try:
-                    sc_txt = f"{float(sc):.1f}%"
-                except Exception:
-                    sc_txt = ""
-                std = t.get("standard") or ""
-                score_suffix = f" [Score: {sc_txt}]" if sc_txt else ""
-                utdrag.append(f"{std} (s.{side}): {preview}{score_suffix}")
-
-            ns_ref = "\n".join(utdrag) if utdrag else "Ingen relevante treff."
-
-            ws_prev.append([
-                krav.get("keyword", ""),
-                (krav.get("short_text") or krav.get("korttekst") or ""),
-                krav.get("text", ""),
-                krav.get("kravtype", ""),
-                float(krav.get("score", 0.0)) / 100.0,
-                krav.get("ref", ""),
-                "→ Beskriv valgt løsning her",
-                "",
-                "",
-                kravverb,
-                ant_setn,
-                ant_tegn,
-                std_dok,
-                ns_ref,
-                # NS (valgt)  NS-kvalitet
-                _fmt_ns_pin(krav),
-                (krav.get("ns_quality") or ""),
-                _fmt_explain(krav),
-                (
-                    ", ".join(
-                        f"{f.get('label','?')} ({f.get('score',0):.1f}%)"
-                        for f in krav.get("top_fag", [])
-                    ) if isinstance(krav.get("top_fag"), list) else ""
-                ),
-                krav.get("gruppe", "Uspesifisert"),
-            ])
-
-        # Formatering "Usikre funn"
-        for r in ws_prev.iter_rows(min_row=1, max_row=ws_prev.max_row, min_col=1, max_col=len(headers)):
-            for c in r:
-                c.alignment = Alignment(wrap_text=True, vertical="top")
-                c.border = thin_border
-        for i, h in enumerate(headers, start=1):
-            cell = ws_prev.cell(row=1, column=i)
-            cell.font = bold_font
-            cell.fill = gray_fill
-            width = 50 if h in ["Funnet tekst", "Valgt løsning", "Kommentar", "NS-referanse"] \
-                    else 40 if h in ["Korttekst","NS (valgt)"] \
-                    else 30 if h == "Dokument og side" \
-                    else 22
-            ws_prev.column_dimensions[get_column_letter(i)].width = width
-        for row in range(2, ws_prev.max_row + 1):
-            ws_prev.cell(row=row, column=5).number_format = "0.0%"
-        ws_prev.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{ws_prev.max_row}"
+        _stream_krav_sheet(wb, "Usikre funn", preview_items, lambda k: k.get("gruppe", "Uspesifisert"),
+                           boxed_header=True)
 
     # ---------- Ett ark per gruppe ----------
     def _group_key(it: dict) -> str:
@@ -440,104 +390,39 @@ def generate_total_excel_report_grouped(
             return fag[0] if isinstance(fag, list) and fag else "Uspesifisert"
         return g
 
-    grupper = sorted({ _group_key(it) for it in (requirements or []) }, key=lambda k: (k == "Uspesifisert", k))
+    by_group = defaultdict(list)
+    for it in requirements:
+        by_group[_group_key(it)].append(it)
 
-    for group_name in grupper:
+    for group_name in sorted(by_group.keys(), key=lambda k: (k == "Uspesifisert", k)):
         title = (group_name or "Uspesifisert")[:31] or "Uspesifisert"
-        ws_g = wb.create_sheet(title)
-        ws_g.append(headers)
-
-        group_rows = [it for it in (requirements or []) if _group_key(it) == group_name]
-
-        for krav in group_rows:
-            nlp_v = krav.get("nlp_vurdering", {}) or {}
-            kravverb = "Ja" if nlp_v.get("inneholder_kravsverb") else "Nei"
-            ant_setn = nlp_v.get("antall_setninger", "")
-            ant_tegn = nlp_v.get("lengde", "")
-
-            ns_treff = krav.get("ns_treff") or []
-            std_dok = ", ".join(sorted({t.get("standard") for t in ns_treff if t.get("standard")})) if ns_treff else ""
-
-            utdrag = []
-            for t in ns_treff:
-                tekst = (t.get("tekst") or "")
-                preview = tekst[:100].replace("\n", " ").strip() + ("..." if len(tekst) > 100 else "")
-                side = t.get("side", "")
-                sc = t.get("score")
-                try:
-                    sc_txt = f"{float(sc):.1f}%"
-                except Exception:
-                    sc_txt = ""
-                std = t.get("standard") or ""
-                score_suffix = f" [Score: {sc_txt}]" if sc_txt else ""
-                utdrag.append(f"{std} (s.{side}): {preview}{score_suffix}")
-
-            ns_ref = "\n".join(utdrag) if utdrag else "Ingen relevante treff."
-
-            ws_g.append([
-                krav.get("keyword", ""),
-                (krav.get("short_text") or krav.get("korttekst") or ""),
-                krav.get("text", ""),
-                krav.get("kravtype", ""),
-                float(krav.get("score", 0.0)) / 100.0,
-                krav.get("ref", ""),
-                "→ Beskriv valgt løsning her",
-                "",
-                "",
-                kravverb,
-                ant_setn,
-                ant_tegn,
-                std_dok,
-                ns_ref,
-                # NS (valgt)  NS-kvalitet
-                _fmt_ns_pin(krav),
-                (krav.get("ns_quality") or ""),
-                _fmt_explain(krav),
-                (
-                    ", ".join(
-                        f"{f.get('label','?')} ({f.get('score',0):.1f}%)"
-                        for f in krav.get("top_fag", [])
-                    ) if isinstance(krav.get("top_fag"), list) else ""
-                ),
-                group_name or "Uspesifisert",
-            ])
-
-        # Formatering for gruppearket
-        # 1) Header
-        for i, h in enumerate(headers, start=1):
-            cell = ws_g.cell(row=1, column=i)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-            width = (
-                50 if h in ["Funnet tekst", "Valgt løsning", "Kommentar", "NS-referanse"]
-                else 40 if h in ["Korttekst","NS (valgt)"]
-                else 30 if h == "Dokument og side"
-                else 22
-            )
-            ws_g.column_dimensions[get_column_letter(i)].width = width
-        # 2) Celler
-        for r in ws_g.iter_rows(min_row=2, max_row=ws_g.max_row, min_col=1, max_col=len(headers)):
-            for c in r:
-                c.alignment = Alignment(wrap_text=True, vertical="top")
-                c.border = Border(
-                    left=Side(style="thin"), right=Side(style="thin"),
-                    top=Side(style="thin"), bottom=Side(style="thin")
-                )
+        label = group_name or "Uspesifisert"
+        _stream_krav_sheet(wb, title, by_group[group_name], lambda k, _l=label: _l)
 
-        # Prosentformat i grupper (kolonne 5)
-        for row in range(2, ws_g.max_row + 1):
-            ws_g.cell(row=row, column=5).number_format = "0.0%"
+    # ---------- Skriv ut workbook ----------
+    wb.save(target)
 
-        ws_g.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{ws_g.max_row}"
 
-    # ---------- Skriv ut workbook ----------
+def generate_total_excel_report_grouped(
+    all_requirements: dict,
+    keywords: list,
+    total_files_scanned: int,
+    total_requirements_found: int,
+    keyword_counts: defaultdict,
+    synonym_counts: defaultdict,
+    semantic_search_counts: defaultdict,
+    grouped_requirements: defaultdict
+) -> io.BytesIO:
+    """
+    Lager samlet Excel-rapport  ett ark per gruppe.
+    """
     buf = io.BytesIO()
-    wb.save(buf)
+    _write_total_excel_report(buf, all_requirements, grouped_requirements)
     buf.seek(0)
     return buf
 
 
-def generate_colored_delivery_report(grouped_requirements: defaultdict) -> io.BytesIO:
+def _build_delivery_doc(grouped_requirements: defaultdict) -> Document:
     doc = Document()
     doc.add_heading("Leverandørleveranser", 0)
     doc.add_paragraph(
@@ -559,10 +444,13 @@ def generate_colored_delivery_report(grouped_requirements: defaultdict) -> io.By
         c._tc.get_or_add_tcPr().append(shd)
 
     def filtrer_unike(kravliste: list, terskel=95):
-        unike = []
+        # extractOne sammenligner mot alle unike i C (samme avgjørelse som any(ratio >= terskel))
+        unike, unike_txt = [], []
         for item in kravliste:
-            if not any(fuzz_ratio((item.get('text') or '').lower(), (ex.get('text') or '').lower()) >= terskel for ex in unike):
+            txt = (item.get('text') or '').lower()
+            if extract_one(txt, unike_txt, scorer=fuzz_ratio, processor=None, score_cutoff=terskel) is None:
                 unike.append(item)
+                unike_txt.append(txt)
         return unike
 
     for grp in sorted(grouped_requirements.keys(), key=lambda g: (g == "Uspesifisert", g)):
@@ -573,53 +461,61 @@ def generate_colored_delivery_report(grouped_requirements: defaultdict) -> io.By
             row[1].text = krav.get("text", "")
             row[2].text = krav.get("kravtype", "")
             row[3].text = krav.get("ref", "")
-            # Forklaring
+            # Forklaring og topp fag (kolonne 5 og 6) med liten/grå skrift
             ex = krav.get("explain") or {}
+            forklaring = ""
             if isinstance(ex, dict) and ex:
-                row[4].text = (
+                forklaring = (
                     f"KW:{float(ex.get('kw_sc',0)):.1f}% | "
                     f"SEM:{float(ex.get('sem_sc',0)):.1f}% | "
                     f"AI:{float(ex.get('ai_sc',0)):.1f}% | "
                     f"FOKUS:{float(ex.get('fokus_boost',0)):.1f}"
                 )
-            else:
-                row[4].text = ""
-            # Topp fag
             tf = krav.get("top_fag")
+            topp_fag = ""
             if isinstance(tf, list) and tf:
-                row[5].text = ", ".join(
+                topp_fag = ", ".join(
                     f"{(f.get('label') or '?')} ({float(f.get('score',0)):.1f}%)" for f in tf
                 )
-            else:
-                row[5].text = ""
+            for cell, txt in ((row[4], forklaring), (row[5], topp_fag)):
+                if txt:
+                    run = cell.paragraphs[0].add_run(txt)
+                    run.font.size = Pt(9)
+                    run.font.color.rgb = RGBColor(120, 120, 120)
             if grp in GROUP_COLORS:
                 # Viktig: lag ny shading-node for hver celle (ikke gjenbruk samme node)
                 for cell_in_row in row:
                     shd = OxmlElement('w:shd')
                     shd.set(qn('w:fill'), GROUP_COLORS[grp])
                     cell_in_row._tc.get_or_add_tcPr().append(shd)
+    return doc
 
+
+def _doc_bytes(doc: Document) -> io.BytesIO:
     out = io.BytesIO()
-    # Juster typografi for "Forklaring" og "Topp fag" (kolonner 5 og 6) til liten/grå
-    for r_i, row in enumerate(table.rows):
-        if r_i == 0:
-            continue  # hopp header
-        for c_i in (4, 5):  # 0-indeksert: 5. og 6. kolonne
-            for p in row.cells[c_i].paragraphs:
-                for run in p.runs:
-                    run.font.size = Pt(9)
-                    run.font.color.rgb = RGBColor(120, 120, 120)
     doc.save(out)
     out.seek(0)
     return out
 
 
-def generate_graphical_report_docx(
+def generate_colored_delivery_report(grouped_requirements: defaultdict) -> io.BytesIO:
+    return _doc_bytes(_build_delivery_doc(grouped_requirements))
+
+
+def _png(fig) -> io.BytesIO:
+    """Figur → PNG i minnet (ingen midlertidige filer; trygt med flere samtidige rapportjobber)."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches='tight')
+    plt.close(fig)
+    buf.seek(0)
+    return buf
+
+
+def _build_graphical_doc(
     total_requirements_found: int, keyword_counts: defaultdict,
     synonym_counts: defaultdict, semantic_search_counts: defaultdict,
     grouped_requirements: defaultdict, all_requirements: dict
-) -> io.BytesIO:
-    tmp_paths = []  # Why: rydde opp midlertidige bilder etter lagring
+) -> Document:
     plt.ioff()
     doc = Document()
     doc.add_heading('Grafisk Kravsporingsoversikt', 0)
@@ -627,8 +523,6 @@ def generate_graphical_report_docx(
     doc.add_paragraph(f"Totalt antall unike krav identifisert: {total_requirements_found}")
     doc.add_paragraph("")
 
-    ts = int(time.time())
-
     # --- Fordeling av trefftyper (pie) ---
     try:
         labels_pie = ['Eksakte Nøkkelord', 'Eksakte Synonymer', 'Maskinlæresøk (AI-søk)']
@@ -638,12 +532,9 @@ def generate_graphical_report_docx(
             ax1.pie(sizes_pie, labels=labels_pie, autopct='%1.1f%%', startangle=90)
             ax1.axis('equal')
             ax1.set_title('Fordeling av Trefftyper')
-            pie_path = TEMP_ROOT / f"trefftyper_pie_{ts}.png"
-            tmp_paths.append(pie_path)
-            plt.savefig(pie_path, bbox_inches='tight')
-            plt.close(fig1)
+            pie_png = _png(fig1)
             doc.add_heading('Fordeling av Trefftyper', level=1)
-            doc.add_picture(str(pie_path), width=Inches(6))
+            doc.add_picture(pie_png, width=Inches(6))
             doc.add_paragraph("")
     except Exception as e:
         logging.warning(f"Kunne ikke lage pie-chart: {e}", exc_info=True)
@@ -662,13 +553,10 @@ def generate_graphical_report_docx(
             ax2.set_ylabel('Antall krav')
             ax2.set_title('Fordeling av Kravtyper')
             ax2.tick_params(axis='x', rotation=45)
-            bar_path = TEMP_ROOT / f"kravtyper_bar_{ts}.png"
-            tmp_paths.append(bar_path)
-            plt.tight_layout()
-            plt.savefig(bar_path, bbox_inches='tight')
-            plt.close(fig2)
+            fig2.tight_layout()
+            bar_png = _png(fig2)
             doc.add_heading('Fordeling av Kravtyper', level=1)
-            doc.add_picture(str(bar_path), width=Inches(6))
+            doc.add_picture(bar_png, width=Inches(6))
             doc.add_paragraph("")
     except Exception as e:
         logging.warning(f"Kunne ikke lage bar-chart (kravtyper): {e}", exc_info=True)
@@ -684,38 +572,35 @@ def generate_graphical_report_docx(
             ax3.set_ylabel('Antall krav')
             ax3.set_title('Fordeling av Fagområder / Leverandørgrupper')
             ax3.tick_params(axis='x', rotation=45)
-            grp_path = TEMP_ROOT / f"grupper_bar_{ts}.png"
-            tmp_paths.append(grp_path)
-            plt.tight_layout()
-            plt.savefig(grp_path, bbox_inches='tight')
-            plt.close(fig3)
+            fig3.tight_layout()
+            grp_png = _png(fig3)
             doc.add_heading('Fordeling av Fagområder / Leverandørgrupper', level=1)
-            doc.add_picture(str(grp_path), width=Inches(6))
+            doc.add_picture(grp_png, width=Inches(6))
             doc.add_paragraph("")
     except Exception as e:
         logging.warning(f"Kunne ikke lage bar-chart (grupper): {e}", exc_info=True)
 
-    out = io.BytesIO()
-    doc.save(out)
-    out.seek(0)
-    try:
-        for p in tmp_paths:
-            try:
-                os.unlink(p)
-            except Exception:
-                pass
-    except Exception:
-        pass
-    return out
+    return doc
 
 
-def generate_summary_report(
+def generate_graphical_report_docx(
+    total_requirements_found: int, keyword_counts: defaultdict,
+    synonym_counts: defaultdict, semantic_search_counts: defaultdict,
+    grouped_requirements: defaultdict, all_requirements: dict
+) -> io.BytesIO:
+    return _doc_bytes(_build_graphical_doc(
+        total_requirements_found, keyword_counts, synonym_counts, semantic_search_counts,
+        grouped_requirements, all_requirements,
+    ))
+
+
+def _build_summary_doc(
     all_requirements: dict, keywords: list, total_files_scanned: int,
     total_requirements_found: int, keyword_counts: defaultdict,
     synonym_counts: defaultdict, top_score_krav: dict,
     grouped_requirements: defaultdict, semantic_search_counts: defaultdict,
     suggested_keywords: list = None
-) -> io.BytesIO:
+) -> Document:
     doc = Document()
     style = doc.styles['Normal']
     style.font.name = 'Calibri'
@@ -774,10 +659,20 @@ def generate_summary_report(
         for s in suggested_keywords:
             doc.add_paragraph(f"- {s}")
 
-    out = io.BytesIO()
-    doc.save(out)
-    out.seek(0)
-    return out
+    return doc
+
+
+def generate_summary_report(
+    all_requirements: dict, keywords: list, total_files_scanned: int,
+    total_requirements_found: int, keyword_counts: defaultdict,
+    synonym_counts: defaultdict, top_score_krav: dict,
+    grouped_requirements: defaultdict, semantic_search_counts: defaultdict,
+    suggested_keywords: list = None
+) -> io.BytesIO:
+    return _doc_bytes(_build_summary_doc(
+        all_requirements, keywords, total_files_scanned, total_requirements_found, keyword_counts,
+        synonym_counts, top_score_krav, grouped_requirements, semantic_search_counts, suggested_keywords,
+    ))
 
 
 # === Hovedfunksjon for å lage alle rapporter og ZIP-fil ===
@@ -807,18 +702,8 @@ def _group_requirements_by_fag(requirements: list[dict]) -> "OrderedDict[str, li
         )
     return ordered
 
-def _autosize(ws):
-    for col in ws.columns:
-        maxlen = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
-            try:
-                maxlen = max(maxlen, len(str(cell.value or "")))
-            except Exception:
-                pass
-        ws.column_dimensions[col_letter].width = min(maxlen + 2, 60)
-
-def _write_excel(path: Path, rows: list[dict]):
+def _write_excel(target, rows: list[dict]):
+    """Per-fag-arbeidsbok i write-only-modus. Kolonnebredder beregnes fra verdiene før skriving."""
     PERCENT_COL_IDX = 4  # 1-basert indeks for "Treff %"
     # Hjelper: konverter lister/dict til lesbar tekst for Excel
     def _as_text(v):
@@ -830,24 +715,17 @@ def _write_excel(path: Path, rows: list[dict]):
             # kompakt JSON uten ASCII-escaping
             return json.dumps(v, ensure_ascii=False, separators=(",", ":"))
         return str(v)
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Krav"
     headers = [
         "søkeord", "funnet tekst", "kravtype", "Treff %", "Dokument og side",
         "Valgt løsning", "Risiko", "Kommentar", "Fag", "NS-referanser", "NLP-vurdering"
     ]
-    ws.append(headers)
-    # Grå bakgrunn i kolonne A (søkeord)
-    grey = PatternFill(start_color="00DDDDDD", end_color="00DDDDDD", fill_type="solid")
+    values = [headers]
     for r in rows:
         # Normaliser problemfelter til strenger
         fag_val = r.get("gruppe") or r.get("fag") or "Uspesifisert"
         if isinstance(fag_val, list):
             fag_val = ", ".join(str(x) for x in fag_val if x)
-        ns_refs_txt = _as_text(r.get("ns_refs", ""))
-        nlp_eval_txt = _as_text(r.get("nlp_eval", ""))
-        ws.append([
+        values.append([
             r.get("keyword", ""),
             r.get("match_text", "")[:5000],
             r.get("kravtype", ""),
@@ -857,55 +735,99 @@ def _write_excel(path: Path, rows: list[dict]):
             r.get("risiko", ""),
             r.get("kommentar", ""),
             fag_val,
-            ns_refs_txt,
-            nlp_eval_txt,
+            _as_text(r.get("ns_refs", "")),
+            _as_text(r.get("nlp_eval", "")),
         ])
-    # Formatering
-    for cell in ws["A"][1:]:
-        cell.fill = grey
-    ws.auto_filter.ref = ws.dimensions
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.alignment = Alignment(wrap_text=True, vertical="top")
-    _autosize(ws)
-    # Prosentformat på "Treff %"
-    for row in range(2, ws.max_row + 1):
-        ws.cell(row=row, column=PERCENT_COL_IDX).number_format = "0.0%"
-    wb.save(path)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Krav")
+    for i in range(len(headers)):
+        maxlen = max(len(str(row[i] or "")) for row in values)
+        ws.column_dimensions[get_column_letter(i + 1)].width = min(maxlen + 2, 60)
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{len(values)}"
+
+    # Grå bakgrunn i kolonne A (søkeord), prosentformat på "Treff %"
+    grey = PatternFill(start_color="00DDDDDD", end_color="00DDDDDD", fill_type="solid")
+    wrap = _named_style(wb, "Krav", alignment=_WRAP_TOP)
+    styles = {1: _named_style(wb, "Krav søkeord", alignment=_WRAP_TOP, fill=grey),
+              PERCENT_COL_IDX: _named_style(wb, "Krav prosent", alignment=_WRAP_TOP, number_format="0.0%")}
+    for r_i, row in enumerate(values):
+        cells = []
+        for c_i, v in enumerate(row, start=1):
+            c = WriteOnlyCell(ws, value=v)
+            c.style = styles.get(c_i, wrap) if r_i else wrap
+            cells.append(c)
+        ws.append(cells)
+    wb.save(target)
 
 def export_per_fag_excel_zip(requirements: list[dict], out_dir: Path) -> Path:
     """
-    Lager per-fag Excel-filer i underkatalog /per_fag og returnerer sti til ZIP.
-    Endrer ingenting i eksisterende hovedrapportflyt – kan kalles i tillegg.
+    Lager per-fag Excel-filer (per_fag/krav_<fag>.xlsx) direkte inn i per_fag_rapporter.zip
+    i out_dir og returnerer stien. Endrer ingenting i eksisterende hovedrapportflyt.
     """
     out_dir.mkdir(parents=True, exist_ok=True)
-    per_fag_dir = out_dir / "per_fag"
-    per_fag_dir.mkdir(exist_ok=True)
-
-    grouped = _group_requirements_by_fag(requirements)
-    produced = []
-    for fag, rows in grouped.items():
-        safe = re.sub(r"[^0-9A-Za-zæøåÆØÅ._ -]+", "_", fag).strip().strip("_")
-        path = per_fag_dir / f"krav_{safe or 'Uspesifisert'}.xlsx"
-        _write_excel(path, rows)
-        produced.append(path)
-
-    # ZIP
-    import zipfile
     zip_path = out_dir / "per_fag_rapporter.zip"
+    grouped = _group_requirements_by_fag(requirements)
     with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for p in produced:
-            zf.write(p, arcname=str(p.relative_to(out_dir)))
+        for fag, rows in grouped.items():
+            safe = re.sub(r"[^0-9A-Za-zæøåÆØÅ._ -]+", "_", fag).strip().strip("_")
+            with zf.open(f"per_fag/krav_{safe or 'Uspesifisert'}.xlsx", "w", force_zip64=True) as fh:
+                _write_excel(fh, rows)
     return zip_path
-    
+
+
+# === Rapportjobber (én fil hver, i ZIP-rekkefølge) ===
+def _job_excel(ctx: dict, path: Path) -> None:
+    _write_total_excel_report(path, {"requirements": ctx["requirements_list"]}, ctx["grouped_requirements"])
+
+def _job_delivery(ctx: dict, path: Path) -> None:
+    _build_delivery_doc(ctx["grouped_requirements"]).save(str(path))
+
+def _job_graphical(ctx: dict, path: Path) -> None:
+    _build_graphical_doc(
+        ctx["total_requirements_found"], ctx["keyword_counts"], ctx["synonym_counts"],
+        ctx["semantic_search_counts"], ctx["grouped_requirements"], ctx["all_requirements"],
+    ).save(str(path))
+
+def _job_summary(ctx: dict, path: Path) -> None:
+    _build_summary_doc(
+        ctx["all_requirements"], ctx["keywords_used"], ctx["total_files_scanned"],
+        ctx["total_requirements_found"], ctx["keyword_counts"], ctx["synonym_counts"],
+        ctx["top_score_krav"], ctx["grouped_requirements"], ctx["semantic_search_counts"],
+        [],  # evt. reserved arg for fremtidige avvik/varsler
+    ).save(str(path))
+
+def _job_per_fag(ctx: dict, path: Path) -> None:
+    export_per_fag_excel_zip(ctx["requirements_list"], path.parent)
+
+
+# (filnavn i ZIP, jobb, kritisk) – rekkefølgen er rekkefølgen i ZIP-filen
+_REPORT_JOBS = [
+    ("Kravsporing_rapport.xlsx", _job_excel, True),
+    ("Leverandorleveranser_rapport.docx", _job_delivery, True),
+    ("Kravsporing_Oppsummering.docx", _job_summary, True),
+    ("Grafisk_Oversikt.docx", _job_graphical, True),
+    ("per_fag_rapporter.zip", _job_per_fag, False),
+]
+
+
+def _run_report_job(idx: int, ctx: dict, temp_dir: str) -> str:
+    name, job, _critical = _REPORT_JOBS[idx]
+    path = Path(temp_dir) / name
+    job(ctx, path)
+    return str(path)
+
+
 def create_reports_and_zip(
     requirements_list: list,
     temp_dir: Path,
     processing_errors: list,
-    task_instance=None
+    task_instance=None,
 ):
     """
     Genererer alle rapporter og én samlet ZIP i temp_dir.
+    Hver delrapport skrives til disk av sin jobb og pakkes inn i ZIP i fast rekkefølge
+    så snart den er klar.
     Kaster Exception ved kritiske feil, slik at Celery markerer FAILURE.
     """
     log = logging.getLogger(__name__)
@@ -967,98 +889,56 @@ def create_reports_and_zip(
         {r.get("keyword") for r in (requirements_list or []) if r.get("keyword") and r.get("keyword") != "(AI)"}
     )
 
-    # --- Generer delrapporter (kaster ved feil) ---
-    try:
-        _progress("Genererer Excel-rapport…", 90)
-        # Merk: generate_total_excel_report_grouped forventer en struktur som vi normaliserte i tidligere revisjon.
-        excel_report = generate_total_excel_report_grouped(
-            {"requirements": requirements_list},
-            keywords_used,
-            total_files_scanned,
-            total_requirements_found,
-            keyword_counts,
-            synonym_counts,
-            semantic_search_counts,
-            grouped_requirements,
-        )
-
-        _progress("Genererer leveranse-rapport…", 92)
-        delivery_report = generate_colored_delivery_report(grouped_requirements)
-
-        _progress("Genererer grafisk rapport…", 94)
-        graphical_report = generate_graphical_report_docx(
-            total_requirements_found,
-            keyword_counts,
-            synonym_counts,
-            semantic_search_counts,
-            grouped_requirements,
-            all_requirements,
-        )
-
-        _progress("Genererer oppsummering…", 96)
-        summary_report = generate_summary_report(
-            all_requirements,
-            keywords_used,
-            total_files_scanned,
-            total_requirements_found,
-            keyword_counts,
-            synonym_counts,
-            top_score_krav,
-            grouped_requirements,
-            semantic_search_counts,
-            [],  # evt. reserved arg for fremtidige avvik/varsler
-        )
-
-    except Exception as e:
-        msg = f"Feil under rapportgenerering: {e}"
-        log.error(msg, exc_info=True)
-        if processing_errors is not None:
-            processing_errors.append(msg)
-        # Kritisk: ikke fortsett til ZIP uten rapporter
-        raise
-
-    # --- Skriv filer til disk ---
-    try:
-        _progress("Lagrer rapportfiler…", 98)
-        (temp_dir / "Kravsporing_rapport.xlsx").write_bytes(excel_report.getvalue())
-        (temp_dir / "Leverandorleveranser_rapport.docx").write_bytes(delivery_report.getvalue())
-        (temp_dir / "Kravsporing_Oppsummering.docx").write_bytes(summary_report.getvalue())
-        (temp_dir / "Grafisk_Oversikt.docx").write_bytes(graphical_report.getvalue())
-        # Generer og lagre per-fag-rapporter (valgfri ekstra leveranse)
-        try:
-            per_fag_zip = export_per_fag_excel_zip(requirements_list, temp_dir)
-        except Exception as e:
-            per_fag_zip = None
-            log.warning(f"Per-fag-eksport feilet: {e}", exc_info=True)
-    except Exception as e:
-        msg = f"Feil ved skriving av rapportfiler: {e}"
+    ctx = {
+        "requirements_list": requirements_list or [],
+        "all_requirements": all_requirements,
+        "grouped_requirements": grouped_requirements,
+        "total_requirements_found": total_requirements_found,
+        "total_files_scanned": total_files_scanned,
+        "keyword_counts": keyword_counts,
+        "synonym_counts": synonym_counts,
+        "semantic_search_counts": semantic_search_counts,
+        "keywords_used": keywords_used,
+        "top_score_krav": top_score_krav,
+    }
+
+    reported = False
+
+    def _fail(msg: str):
+        nonlocal reported
+        reported = True
         log.error(msg, exc_info=True)
         if processing_errors is not None:
             processing_errors.append(msg)
-        raise
 
-    # --- Bygg ZIP ---
+    # --- Generer delrapporter og pakk ZIP fortløpende (kaster ved kritiske feil) ---
+    _progress("Genererer rapporter…", 90)
+    zip_final_path = temp_dir / "Kravsporing_Resultater.zip"
     try:
-        _progress("Pakker ZIP…", 99)
-        zip_final_path = temp_dir / "Kravsporing_Resultater.zip"
         with zipfile.ZipFile(zip_final_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            zipf.write(temp_dir / "Kravsporing_rapport.xlsx", arcname="Kravsporing_rapport.xlsx")
-            zipf.write(temp_dir / "Leverandorleveranser_rapport.docx", arcname="Leverandorleveranser_rapport.docx")
-            zipf.write(temp_dir / "Kravsporing_Oppsummering.docx", arcname="Kravsporing_Oppsummering.docx")
-            zipf.write(temp_dir / "Grafisk_Oversikt.docx", arcname="Grafisk_Oversikt.docx")
-            # Ta med per-fag ZIP hvis produsert
-            if (temp_dir / "per_fag_rapporter.zip").exists():
-                zipf.write(temp_dir / "per_fag_rapporter.zip", arcname="per_fag_rapporter.zip")
+            for i, (name, _job, critical) in enumerate(_REPORT_JOBS):
+                _progress(f"Genererer {name}…", 90 + (8 * i) // len(_REPORT_JOBS))
+                try:
+                    path = Path(_run_report_job(i, ctx, str(temp_dir)))
+                except Exception as e:
+                    if critical:
+                        _fail(f"Feil under rapportgenerering ({name}): {e}")
+                        # Kritisk: ikke lever ZIP uten rapporter
+                        raise
+                    log.warning(f"Per-fag-eksport feilet: {e}", exc_info=True)
+                    continue
+                zipf.write(path, arcname=name)
+
+            _progress("Pakker ZIP…", 99)
             if processing_errors:
                 error_report_path = temp_dir / "feilrapport.txt"
                 error_report_path.write_text("\n".join(processing_errors), encoding="utf-8")
                 zipf.write(error_report_path, arcname=error_report_path.name)
-
-        _progress("Fullfører…", 100)
-        return zip_final_path  # Nyttig for e2e-tester og kallere
     except Exception as e:
-        msg = f"Feil under ZIP-generering: {e}"
-        log.error(msg, exc_info=True)
-        if processing_errors is not None:
-            processing_errors.append(msg)
+        zip_final_path.unlink(missing_ok=True)
+        if not reported:
+            _fail(f"Feil under ZIP-generering: {e}")
         raise
+
+    _progress("Fullfører…", 100)
+    return zip_final_path  # Nyttig for e2e-tester og kallere
@@ -0,0 +1,204 @@
+# app/tasks/text_cache.py
+# -*- coding: utf-8 -*-
+"""
+Disk-cache for uttrukket dokumenttekst (kravsporing).
+
+Nøkkel: SHA-256 av filens bytes + parser-versjon. Verdien er tekst-segmentene
+(PDF: rå sidetekst per side) og meldingene som parseren produserte, slik at
+en ny skanning av en uendret pakke slipper PDF/DOCX/DOC/XLSX/MSG-parsing helt.
+
+Lagring: én gzip-komprimert JSON Lines-fil per nøkkel under KS_TEXT_CACHE_DIR,
+skrevet og lest post for post (én side per linje for PDF), slik at store dokumenter
+aldri holdes samlet i minnet. Størrelsen holdes under KS_TEXT_CACHE_MAX_MB ved
+LRU-utkasting (mtime oppdateres ved treff). Skriving er atomisk (tmp + os.replace),
+så flere prosesser kan dele mappen. Oppføringen valideres mens den leses (gzip-CRC ved
+slutten, JSON per linje); er den skadet, slettes den og lesingen kaster TextCacheCorrupt.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+_log = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parent.parent
+TEXT_CACHE_ENABLED = os.getenv("KS_TEXT_CACHE", "1") != "0"
+TEXT_CACHE_DIR = Path(os.getenv("KS_TEXT_CACHE_DIR", str(APP_DIR / "data" / "text_cache")))
+TEXT_CACHE_MAX_MB = float(os.getenv("KS_TEXT_CACHE_MAX_MB", "2048"))
+
+_HASH_CHUNK = 1024 * 1024
+_SUFFIX = ".jsonl.gz"
+_evict_lock = threading.Lock()
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class TextCacheCorrupt(Exception):
+    """Oppføringen var skadet (avkortet, gzip-CRC eller JSON) og er slettet. Behandles som miss."""
+
+
+class TextCache:
+    """
+    Innholdsadressert cache. get()/writer() kaster aldri – feil logges og behandles som miss.
+    Unntaket er iteratoren fra get(), som kaster TextCacheCorrupt når oppføringen viser seg skadet.
+    """
+
+    def __init__(self, root: Path = TEXT_CACHE_DIR, max_mb: float = TEXT_CACHE_MAX_MB):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def key(self, path: Path, parser_version: str) -> str:
+        return f"{file_sha256(path)}-v{parser_version}"
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{_SUFFIX}"
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def get(self, key: str) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        Iterator over lagrede poster, eller None ved miss. Postene leses og valideres i én passering;
+        en skadet oppføring oppdages først underveis eller ved slutten (TextCacheCorrupt), så kalleren
+        må forkaste det som er lest og behandle det som miss.
+        """
+        p = self._path(key)
+        if not p.is_file():
+            return None
+        try:
+            os.utime(p, None)  # LRU: sist brukt
+        except OSError:
+            pass
+        return self._read(p)
+
+    @staticmethod
+    def _read(p: Path) -> Iterator[Dict[str, Any]]:
+        try:
+            with gzip.open(p, "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+        except (OSError, EOFError, ValueError, zlib.error) as e:
+            # Avkortet fil (EOFError), feil CRC (BadGzipFile), skadet deflate-strøm (zlib.error),
+            # ugyldig JSON/UTF-8 (ValueError) eller slettet underveis (OSError)
+            _log.warning("Tekst-cache: ugyldig oppføring %s (%s) – slettes.", p.name, e)
+            p.unlink(missing_ok=True)
+            raise TextCacheCorrupt(p.name) from e
+
+    def writer(self, key: str) -> "_CacheWriter":
+        return _CacheWriter(self, self._path(key))
+
+    def _entries(self) -> List[tuple]:
+        out = []
+        if not self.root.exists():
+            return out
+        for p in self.root.glob(f"*/*{_SUFFIX}"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, p))
+        return out
+
+    def evict(self) -> int:
+        """Sletter minst nylig brukte oppføringer til total størrelse er under grensen."""
+        with _evict_lock:
+            entries = self._entries()
+            total = sum(e[1] for e in entries)
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            _log.info("Tekst-cache: kastet ut %d oppføringer (nå %.1f MB).", removed, total / (1024 * 1024))
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {"entries": len(entries), "bytes": sum(e[1] for e in entries), "max_bytes": self.max_bytes}
+
+
+class _CacheWriter:
+    """Skriver poster fortløpende til en tmp-fil; commit() publiserer, abort() forkaster."""
+
+    def __init__(self, cache: TextCache, path: Path):
+        self._cache = cache
+        self._path = path
+        self._tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        self._f = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._f = gzip.open(self._tmp, "wt", encoding="utf-8", compresslevel=3)
+        except Exception as e:
+            _log.warning("Tekst-cache: kunne ikke åpne %s: %s", self._tmp.name, e)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._f is None:
+            return
+        try:
+            self._f.write(json.dumps(record, ensure_ascii=False))
+            self._f.write("\n")
+        except Exception as e:
+            _log.warning("Tekst-cache: skriving til %s feilet: %s", self._tmp.name, e)
+            self.abort()
+
+    def commit(self) -> None:
+        if self._f is None:
+            return
+        try:
+            self._f.close()
+            self._f = None
+            os.replace(self._tmp, self._path)
+        except Exception as e:
+            _log.warning("Tekst-cache: kunne ikke lagre %s: %s", self._path.name, e)
+            self.abort()
+            return
+        self._cache.evict()
+
+    def abort(self) -> None:
+        if self._f is not None:
+            try:
+                self._f.close()
+            except Exception:
+                pass
+            self._f = None
+        self._tmp.unlink(missing_ok=True)
+
+
+_default: Optional[TextCache] = None
+
+
+def get_text_cache() -> Optional[TextCache]:
+    """Prosess-felles cache-instans, eller None hvis deaktivert (KS_TEXT_CACHE=0)."""
+    global _default
+    if not TEXT_CACHE_ENABLED:
+        return None
+    if _default is None:
+        _default = TextCache()
+    return _default
+
+
+__all__ = [
+    "TextCache",
+    "TextCacheCorrupt",
+    "get_text_cache",
+    "file_sha256",
+    "TEXT_CACHE_DIR",
+    "TEXT_CACHE_ENABLED",
+]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for deduplisering: blokkert klynging (method="blocking") på 1k–100k krav,
+mot dagens grådige klynging (method="exact") der den er praktisk å kjøre.
+Kravsettene bygges som i dedup_parity_smoketest (scope="global" = én stor gruppe).
+Bruk:
+  python -m app.test.bench_dedup [maks_antall] [maks_antall_exact]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import sys
+import time
+
+from app.tasks import core
+from app.tasks.core import deduplicate_requirements
+from app.test.dedup_parity_smoketest import make_requirements
+
+SIZES = [1_000, 5_000, 10_000, 20_000, 50_000, 100_000]
+
+
+def _timed(reqs: list[dict], method: str) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    out = deduplicate_requirements(reqs, threshold=93, scope="global", method=method)
+    return time.perf_counter() - t0, len(out)
+
+
+def main() -> int:
+    max_n = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    max_exact = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    core.DEDUP_EXACT_MAX = 0
+    ok = True
+    for n in (s for s in SIZES if s <= max_n):
+        reqs = make_requirements(n, seed=1)
+        t_blk, k_blk = _timed(reqs, "blocking")
+        line = f"[INFO] n={n:>7}: blocking {t_blk:7.2f}s ({k_blk} klynger, {n / max(t_blk, 1e-9):,.0f} krav/s)"
+        if n <= max_exact:
+            t_ex, k_ex = _timed(reqs, "exact")
+            line += f" | exact {t_ex:7.2f}s ({k_ex} klynger) | {t_ex / max(t_blk, 1e-9):.1f}x"
+            ok &= k_ex == k_blk
+        print(line)
+    if not ok:
+        print("[FEIL] Ulikt antall klynger mellom blocking og exact.")
+        return 1
+    print("[OK] Benchmark fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for diff-motoren (app.services.diff_engine) bak /diff_sjekk (to_blocks).
+- Paritet: små dokumenter gir nøyaktig samme blokker som tidligere to_blocks (difflib over hele dokumentet)
+- Skala: to syntetiske dokumenter på 100k linjer (endrede, slettede, innsatte og flyttede avsnitt
+  + gjentatte topp-/bunntekster); blokkene må gjenskape begge dokumentene
+Bruk:
+  python -m app.test.bench_diff [antall_linjer] [tidsbudsjett_s]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import difflib
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from app.services.diff_engine import iter_diff_blocks
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+
+
+def _norm(s: str) -> str:
+    # Som normalize_text_for_flags(s, ignore_case=False, ignore_ws=True, ignore_digits=False)
+    return re.sub(r"\s+", " ", s or "")
+
+
+def to_blocks(a: list[str], b: list[str], time_budget: float | None = None, stats: dict | None = None) -> list:
+    return list(iter_diff_blocks(a, b, normalize=_norm, time_budget=time_budget, stats=stats))
+
+
+def make_docs(n: int, seed: int = 2) -> tuple[list[str], list[str]]:
+    lines = [ln.strip() for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    rnd = random.Random(seed)
+    a: list[str] = []
+    for i in range(n):
+        if i % 50 == 0:
+            a.append("Prosjekt Eksempel – Teknisk beskrivelse")       # gjentatt topptekst
+        elif i % 50 == 49:
+            a.append(f"Side {i // 50 + 1}")
+        else:
+            a.append(f"{i // 50 + 1}.{i % 50} {rnd.choice(lines)}")
+    b: list[str] = []
+    i = 0
+    while i < len(a):
+        r = rnd.random()
+        if r < 0.01:                                   # endret avsnitt
+            words = a[i].split()
+            words[rnd.randrange(len(words))] = "ENDRET"
+            b.append(" ".join(words))
+        elif r < 0.015:                                # slettet
+            pass
+        elif r < 0.02:                                 # innsatt
+            b.append(f"Nytt krav: {rnd.choice(lines)}")
+            b.append(a[i])
+        elif r < 0.0201 and i + 40 < len(a):          # flyttet seksjon
+            b.extend(a[i + 20:i + 40])
+            b.extend(a[i:i + 20])
+            i += 40
+            continue
+        else:
+            b.append(a[i])
+        i += 1
+    return a, b
+
+
+def _old_to_blocks(a_lines, b_lines):
+    """Tidligere to_blocks (difflib over hele dokumentet), brukt som fasit for små dokumenter."""
+    a_norm = [_norm(x) for x in a_lines]
+    b_norm = [_norm(x) for x in b_lines]
+    out = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=a_norm, b=b_norm).get_opcodes():
+        blk = {"type": tag, "textA": "\n".join(a_lines[i1:i2]), "textB": "\n".join(b_lines[j1:j2])}
+        if tag == "replace":
+            aw, bw = blk["textA"].split(), blk["textB"].split()
+            wd = []
+            for t, x1, x2, y1, y2 in difflib.SequenceMatcher(a=aw, b=bw).get_opcodes():
+                if t == "equal":
+                    wd.append({"op": "=", "text": " ".join(aw[x1:x2])})
+                else:
+                    if x2 > x1:
+                        wd.append({"op": "-", "text": " ".join(aw[x1:x2])})
+                    if y2 > y1:
+                        wd.append({"op": "+", "text": " ".join(bw[y1:y2])})
+            blk["wordDiff"] = wd
+        out.append(blk)
+    return out
+
+
+def _strip(blocks):
+    return [{k: v for k, v in b.items() if k in ("type", "textA", "textB", "wordDiff")} for b in blocks]
+
+
+def _rebuilds(blocks, a, b) -> bool:
+    ta = [b_["textA"] for b_ in blocks if b_["textA"]]
+    tb = [b_["textB"] for b_ in blocks if b_["textB"]]
+    return "\n".join(ta) == "\n".join(a) and "\n".join(tb) == "\n".join(b)
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    ok = True
+
+    for size, seed in ((120, 1), (300, 2), (400, 3)):
+        a, b = make_docs(size, seed)
+        same = _strip(to_blocks(a, b)) == _strip(_old_to_blocks(a, b))
+        print(f"[INFO] Paritet {size} linjer: {'identisk' if same else 'AVVIK'}")
+        ok &= same
+
+    a, b = make_docs(n)
+    stats: dict = {}
+    t0 = time.perf_counter()
+    blocks = to_blocks(a, b, time_budget=budget, stats=stats)
+    dt = time.perf_counter() - t0
+    changed = sum(1 for x in blocks if x["type"] != "equal")
+    print(f"[INFO] {len(a)} / {len(b)} linjer: {dt:.2f}s, {len(blocks)} blokker ({changed} endringer), "
+          f"avkortet={stats.get('truncated')}")
+    if not _rebuilds(blocks, a, b):
+        print("[FEIL] Blokkene gjenskaper ikke dokumentene.")
+        ok = False
+    if not ok:
+        print("[FEIL] Diff-motoren avviker.")
+        return 1
+    print("[OK] Benchmark fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
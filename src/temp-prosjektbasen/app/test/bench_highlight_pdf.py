@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for PDF-utheving: én passering per side (app.tasks.pdf_highlight) mot
+page.search_for() per term per side (tidligere highlight_pdf). Bruker samme syntetiske
+PDF som streaming_pdf_smoketest, nøkkelord fra nokkelord.json og kravtekster fra krav.txt.
+Dekning: andel av search_for-treffene som ligger innenfor et uthevet område.
+Orddeling: nøkkelordet "ventilasjon" og kravteksten slik clean_text() gir den ("venti-lasjon")
+uthever begge delene av "venti-" / "lasjon".
+Bruk:
+  python -m app.test.bench_highlight_pdf [antall_sider] [antall_kravtekster]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fitz
+
+from app.tasks.core import clean_text
+from app.tasks.pdf_highlight import TermAutomaton, highlight_terms, page_highlight_rects
+from app.test.streaming_pdf_smoketest import APP_DIR, KRAV, _build_pdf
+
+
+def _terms(n_snippets: int) -> list[str]:
+    data = json.loads((APP_DIR / "data" / "nokkelord.json").read_text(encoding="utf-8"))
+    kws: set[str] = set()
+
+    def _collect(node):
+        if isinstance(node, dict):
+            for v in node.values():
+                _collect(v)
+        elif isinstance(node, list):
+            kws.update(k.lower() for k in node if isinstance(k, str))
+    _collect(data)
+    lines = [ln.strip() for ln in KRAV.read_text(encoding="utf-8").splitlines() if len(ln.strip()) > 15]
+    rnd = random.Random(11)
+    return sorted(kws) + rnd.sample(lines, min(n_snippets, len(lines)))
+
+
+def _covered(r: fitz.Rect, rects: list[fitz.Rect]) -> bool:
+    c = fitz.Point((r.x0 + r.x1) / 2, (r.y0 + r.y1) / 2)
+    return any(h.contains(c) for h in rects)
+
+
+def _hyphen_check() -> bool:
+    """Ord delt ved linjeskift: nøkkelord og kravtekst (som clean_text gir den) uthever begge delene."""
+    lines = ["Anlegget skal ha behovsstyrt venti-", "lasjon i alle rom med varmegjen-",
+             "vinner og sort-hvitt display."]
+    with fitz.open() as doc:
+        page = doc.new_page()
+        for i, ln in enumerate(lines):
+            page.insert_text((72, 72 + 14 * i), ln)
+        words = page.get_text("words")
+        snippet = clean_text(page.get_text("text"))
+        kw_rects = page_highlight_rects(page, TermAutomaton(["ventilasjon", "varmegjenvinner"]))
+        snip_rects = page_highlight_rects(page, TermAutomaton([snippet]))
+    kw_hit = {w[4] for w in words if _covered(fitz.Rect(w[:4]), kw_rects)}
+    snip_miss = [w[4] for w in words if not _covered(fitz.Rect(w[:4]), snip_rects)]
+    want = {"venti-", "lasjon", "varmegjen-", "vinner"}
+    print(f"[INFO] Orddeling: nøkkelord uthever {sorted(kw_hit)}; kravtekst «{snippet}» "
+          f"uthever {len(words) - len(snip_miss)}/{len(words)} ord")
+    return kw_hit == want and not snip_miss
+
+
+def main() -> int:
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    n_snip = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    terms = _terms(n_snip)
+    with tempfile.TemporaryDirectory(prefix="ks_hl_") as tmp:
+        pdf = Path(tmp) / "syntetisk.pdf"
+        _build_pdf(pdf, n_pages)
+
+        t0 = time.perf_counter()
+        ref = []
+        with fitz.open(pdf) as doc:
+            for page in doc:
+                ref.append([r for t in terms for r in page.search_for(t)])
+        t_old = time.perf_counter() - t0
+
+        automaton = TermAutomaton(terms)
+        with fitz.open(pdf) as doc:
+            stats = highlight_terms(doc, automaton)
+            doc.save(str(Path(tmp) / "uthevet.pdf"), garbage=4, deflate=True)
+        with fitz.open(pdf) as doc:
+            new = [page_highlight_rects(page, automaton) for page in doc]
+
+    hits = sum(len(r) for r in ref)
+    covered = sum(_covered(r, new[i]) for i, rs in enumerate(ref) for r in rs)
+    print(f"[INFO] {n_pages} sider, {len(terms)} termer ({n_snip} kravtekster), {hits} search_for-treff")
+    print(f"[INFO] search_for per term: {t_old:.2f}s | én passering: {stats['seconds']:.2f}s "
+          f"({t_old / max(stats['seconds'], 1e-9):.0f}x), {stats['rects']} områder på {stats['pages_hit']} sider")
+    share = covered / max(1, hits)
+    print(f"[INFO] Dekning av search_for-treff: {share:.4f}")
+    if share < 0.99:
+        print("[FEIL] One-pass utheving dekker ikke search_for-treffene.")
+        return 1
+    if not _hyphen_check():
+        print("[FEIL] Ord delt ved linjeskift uthever ikke.")
+        return 1
+    print("[OK] Benchmark fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for kombinert søk (/kombinert_sok) med LineIndex (app.services.line_index).
+- Syntetiske dokumenter: krav-tekst fra data/krav.txt, TFM-tagger med verdier og topp-/bunntekster
+- Søketabell: TFM-tagger med verdi og beskrivelse (noen feilstavet, noen med avvikende verdi)
+- Paritet: status og avvik per rad/dokument skal være identiske med tidligere løkke
+  (partial_ratio/token_set_ratio mot alle linjer + punktum/komma-variantlinjer) for et utvalg
+  rader; linjenummer i avvik sammenlignes som linjen varianten kom fra
+- Tid: gammel løkke måles på utvalget og skaleres til hele tabellen
+Bruk:
+  python -m app.test.bench_kombinert_sok [antall_rader] [antall_dokumenter] [utvalg]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import random
+import sys
+import time
+from pathlib import Path
+
+from rapidfuzz import fuzz
+
+from app.services.doc_text import fold_punct, punct_variants
+from app.services.line_index import LineIndex
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+THRESH = 80
+KODER = ["RT", "JV", "SB", "JP", "QT", "RP", "SQ", "LX", "KA", "RF", "OE", "MF", "SC", "RD", "LH"]
+
+
+def _variants(lines: list[str]) -> tuple[list[str], list[int]]:
+    """Tidligere extract_lines_backup: original + punktum→komma + komma→punktum per linje.
+    Returnerer også linjenummeret (1-basert) hver variant kom fra."""
+    out: list[str] = []
+    origin: list[int] = []
+    for ln, s in enumerate(lines, start=1):
+        for v in punct_variants(s):
+            out.append(v)
+            origin.append(ln)
+    return out, origin
+
+
+def make_case(n_rows: int, n_docs: int, seed: int = 5):
+    rnd = random.Random(seed)
+    krav = [ln.strip() for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    tags = []
+    while len(tags) < n_rows:
+        tag = f"{rnd.randint(300, 579)}.{rnd.randint(1, 40):03d}-{rnd.choice(KODER)}{rnd.randint(1, 999):03d}"
+        if tag not in tags:
+            tags.append(tag)
+    values = {t: f"{rnd.randint(1, 400)},{rnd.randint(0, 9)}" for t in tags}
+
+    docs = []
+    for d in range(n_docs):
+        raw = []
+        for i, tag in enumerate(rnd.sample(tags, min(len(tags), 250))):
+            if i % 20 == 0:
+                raw.append(f"Prosjekt Eksempel – Teknisk beskrivelse, side {i // 20 + 1}")
+            raw.append(rnd.choice(krav))
+            val = values[tag] if rnd.random() < 0.85 else f"{rnd.randint(1, 400)},{rnd.randint(0, 9)}"
+            raw.append(f"={tag} {val} l/s  {rnd.choice(krav)[:40]}")
+            if rnd.random() < 0.3:
+                raw.append(f"Se også {tag[:-3]}{rnd.randint(1, 999):03d} og {rnd.choice(KODER)}{rnd.randint(1, 99)}")
+        docs.append([s for s in (r.strip() for r in raw) if s])
+
+    table = []
+    for tag in tags:
+        t = tag if rnd.random() < 0.9 else tag.replace("-", " ", 1)
+        v = values[tag] if rnd.random() < 0.8 else f"{rnd.randint(1, 400)},{rnd.randint(0, 9)}"
+        table.append([f"={t}", v, "l/s"])
+    return table, docs
+
+
+def _prep(row, maxc):
+    return [c.strip().lstrip('=') if isinstance(c, str) else '' for c in row] + [''] * (maxc - len(row))
+
+
+def old_row(row, maxc, variant_docs):
+    """Tidligere løkke i kombinert_sok (uten Excel-skriving), over variant-linjer."""
+    raw_vals = _prep(row, maxc)
+    alt2 = raw_vals[1].replace(',', '.') if len(raw_vals) > 1 and raw_vals[1] else ''
+    out = []
+    for lines, origin in variant_docs:
+        hit_lines = []
+        for i, text in enumerate(lines, start=1):
+            if raw_vals[0]:
+                if raw_vals[0] in text:
+                    hit_lines.append(i)
+                elif fuzz.partial_ratio(raw_vals[0], text) > THRESH:
+                    hit_lines.append(i)
+                elif fuzz.token_set_ratio(raw_vals[0], text) > THRESH:
+                    hit_lines.append(i)
+        status, avvik = 'Ingen treff', ''
+        if hit_lines:
+            all_ok = True
+            for val in raw_vals[:maxc]:
+                if not val:
+                    continue
+                if not any(val in lines[ln - 1] or fuzz.partial_ratio(val, lines[ln - 1]) > THRESH for ln in hit_lines):
+                    all_ok = False
+            status = 'Komplett' if all_ok else 'Delvis'
+            if not all_ok and raw_vals[1]:
+                avvik = f"{raw_vals[1]}, ikke funnet i samme dokument"
+                for i, text in enumerate(lines, start=1):
+                    if (raw_vals[1] in text or (alt2 and alt2 in text) or
+                            fuzz.partial_ratio(raw_vals[1], text) > THRESH or
+                            (alt2 and fuzz.partial_ratio(alt2, text) > THRESH) or
+                            fuzz.token_set_ratio(raw_vals[1], text) > THRESH):
+                        avvik = f"{raw_vals[1]} funnet i linje {origin[i - 1]}"
+                        break
+        out.append((status, avvik))
+    return out
+
+
+def new_row(row, maxc, index: LineIndex, n_docs: int):
+    """Samme logikk som kombinert_sok med LineIndex."""
+    raw_vals = _prep(row, maxc)
+    row_hits = index.matches(raw_vals[0], token_set=True) if raw_vals[0] else 0
+    out = []
+    for idx in range(n_docs):
+        hit_lines = index.in_doc(idx, row_hits)
+        status, avvik = 'Ingen treff', ''
+        if hit_lines:
+            all_ok = all(index.matches(val) & hit_lines for val in raw_vals[:maxc] if val)
+            status = 'Komplett' if all_ok else 'Delvis'
+            if not all_ok and raw_vals[1]:
+                first = index.first_line(idx, index.matches(raw_vals[1], token_set=True))
+                avvik = (f"{raw_vals[1]} funnet i linje {first}" if first is not None
+                         else f"{raw_vals[1]}, ikke funnet i samme dokument")
+        out.append((status, avvik))
+    return out
+
+
+def main() -> int:
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_docs = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    sample = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+    table, docs = make_case(n_rows, n_docs)
+    maxc = max(len(r) for r in table)
+    n_lines = sum(len(d) for d in docs)
+    print(f"[INFO] {len(table)} rader, {n_docs} dokumenter, {n_lines} linjer "
+          f"({sum(len(_variants(d)[0]) for d in docs)} med punktum/komma-varianter)")
+
+    t0 = time.perf_counter()
+    index = LineIndex(docs, threshold=THRESH, normalize=fold_punct)
+    t_build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = [new_row(r, maxc, index, n_docs) for r in table]
+    t_new = time.perf_counter() - t0
+    print(f"[INFO] Indeks: {len(index)} unike linjer på {t_build:.2f}s; søk: {t_new:.2f}s; {index.stats}")
+
+    rows = random.Random(1).sample(range(len(table)), min(sample, len(table)))
+    variant_docs = [_variants(d) for d in docs]
+    t0 = time.perf_counter()
+    old = {i: old_row(table[i], maxc, variant_docs) for i in rows}
+    t_old = (time.perf_counter() - t0) * len(table) / max(len(rows), 1)
+    counts: dict = {}
+    for res in new:
+        for status, _ in res:
+            counts[status] = counts.get(status, 0) + 1
+    print(f"[INFO] Status: {counts}")
+    print(f"[INFO] Gammel løkke (skalert fra {len(rows)} rader): {t_old:.0f}s | "
+          f"indeks: {t_build + t_new:.1f}s ({t_old / max(t_build + t_new, 1e-9):.0f}x)")
+
+    bad = [i for i in rows if old[i] != new[i]]
+    if bad:
+        i = bad[0]
+        print(f"[FEIL] {len(bad)} av {len(rows)} rader avviker, f.eks. {table[i]}: {old[i]} != {new[i]}")
+        return 1
+    print("[OK] Identiske resultater for utvalget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
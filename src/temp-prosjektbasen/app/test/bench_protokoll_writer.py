@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark + paritet for protokollgenerering (app.services.protocol_writer).
+- Tidligere vei (som i /download_protokoll og /download_funksjonstest_protokoll):
+  load_workbook per forespørsel, copy_worksheet + insert_cols per system, tømming celle for celle
+- Ny vei: mal og layout cachet per mtime, arbeidsbok skrevet i strømmemodus
+- Paritet: begge filene leses inn igjen og sammenlignes ark for ark (rekkefølge, verdier, stiler,
+  sammenslåinger, datavalidering, betinget formatering, kolonnebredder og radhøyder)
+- Cache: endret malfil (mtime) leses på nytt
+- Uten strømmevei (FAST_PATH av, som ved utestet openpyxl-versjon): samme paritet med vanlig openpyxl
+Bruk:
+  python -m app.test.bench_protokoll_writer [antall_systemer]
+Exit code != 0 ved avvik.
+"""
+from __future__ import annotations
+import io
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from copy import copy
+from pathlib import Path
+
+from openpyxl import load_workbook
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from app.services import protocol_writer
+from app.services.protocol_writer import (
+    add_betingelser, apply_status_cf, build_ft_protocol, build_mc_protocol, load_template,
+    template_cache_info, _copy_cell_style,
+)
+from app.test.common import check as _check
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+MC_TEMPLATE = DATA_DIR / "Mekanisk_Komplett.xlsx"
+FT_TEMPLATE = DATA_DIR / "Funksjonstest.xlsx"
+
+
+def _sheet_sort_key(ws_title: str):
+    base = ws_title.replace("_MC", "")
+    m = re.match(r"^\s*(\d{1,4})\.(\d{1,4})\s*$", base)
+    if m:
+        return (int(m.group(1)), int(m.group(2)), ws_title)
+    return (999999, 999999, ws_title)
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Syntetiske data
+# ────────────────────────────────────────────────────────────────────────────────
+def mc_groups(n_sys: int, seed: int = 7) -> dict:
+    """{tittel: rader} med alle kolonnevarianter, tom beskrivelse og grupper rundt 200 rader."""
+    rnd = random.Random(seed)
+    sizes = {0: 250, 1: 198, 2: 197, 3: 1}
+    groups = {}
+    for s in range(n_sys):
+        sysid = f"{3600 + s // 20}.{s % 20 + 1:03d}"
+        rows = []
+        for i in range(sizes.get(s, rnd.randint(5, 40))):
+            locs = {}
+            if s % 4 == 1:
+                locs["Plassering"] = f"Plan {i % 5}"
+            elif s % 4 == 2 and i % 3 == 0:
+                locs["Rom"] = f"R{100 + i}"
+            elif s % 7 == 3:
+                locs["Lokasjon"] = "Tak"
+            if s % 5 == 0:
+                locs["Kontrollområde"] = f"K{i % 4}" if i % 2 else ""
+            rows.append({"komponent": f"JV{i:03d}T/001", "desc": None if i == 3 else f"Ventil {i}",
+                         "locs": locs})
+        groups[f"{sysid}_MC"] = rows
+    groups["Uspesifisert_MC"] = [{"komponent": "XX001", "desc": "Ukjent", "locs": {}}]
+    return groups
+
+
+def ft_groups(n_sys: int, seed: int = 11) -> dict:
+    rnd = random.Random(seed)
+    groups = {}
+    for s in range(n_sys):
+        system = f"{3600 + s // 20}.{s % 20 + 1:03d}"
+        groups[system] = [{
+            "status": "Ikke startet" if i % 3 else "Utført",
+            "system": system,
+            "komponent": None if i == 2 else f"RT{i:03d}",
+            "test": f"Test {i}",
+            "aksept": "" if i % 4 == 0 else "OK",
+            "funksjonsvalg": rnd.choice(["Start og Stopp funksjoner", "Reguleringsfunksjoner", "Øvrig"]),
+        } for i in range(rnd.randint(3, 30))]
+    return groups
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Tidligere vei (uendret logikk fra rutene)
+# ────────────────────────────────────────────────────────────────────────────────
+def old_mc(template: Path, groups: dict) -> bytes:
+    wb = load_workbook(template)
+    malark = wb["malverk"]
+    for title, liste in groups.items():
+        kopi = wb.copy_worksheet(malark)
+        kopi.title = title
+        has_plass = any((r.get("locs") or {}).get("Plassering") for r in liste)
+        has_rom = any((r.get("locs") or {}).get("Rom") for r in liste)
+        has_lok = any((r.get("locs") or {}).get("Lokasjon") for r in liste)
+        has_ktr = any((r.get("locs") or {}).get("Kontrollområde") for r in liste)
+        primary_label = None
+        if has_plass:
+            primary_label = "Plassering"
+        elif has_rom:
+            primary_label = "Rom"
+        elif has_lok:
+            primary_label = "Lokasjon"
+        insert_at = 6
+        if primary_label:
+            kopi.insert_cols(insert_at, amount=1)
+            for r_i in (1, 2):
+                _copy_cell_style(kopi.cell(r_i, 5), kopi.cell(r_i, insert_at))
+            kopi.cell(1, insert_at, primary_label)
+            kopi.cell(2, insert_at, None)
+            insert_at += 1
+        if has_ktr:
+            kopi.insert_cols(insert_at, amount=1)
+            for r_i in (1, 2):
+                _copy_cell_style(kopi.cell(r_i, 5), kopi.cell(r_i, insert_at))
+            kopi.cell(1, insert_at, "Kontrollområde")
+            kopi.cell(2, insert_at, None)
+            insert_at += 1
+        for i in range(3, 201):
+            for j in range(1, kopi.max_column + 1):
+                kopi.cell(i, j).value = None
+        dv = DataValidation(type="list", formula1='"Ikke startet,Under arbeid,Avvik,Utført"', allow_blank=True)
+        kopi.add_data_validation(dv)
+        for col in ["A", "B", "C"]:
+            dv.add(f"{col}3:{col}200")
+            for i in range(3, 201):
+                kopi[f"{col}{i}"].value = "Ikke startet"
+        for idx, r in enumerate(liste, start=3):
+            kopi.cell(idx, 4, r["komponent"])
+            kopi.cell(idx, 5, r.get("desc", ""))
+            col_cursor = 6
+            locs = r.get("locs") or {}
+            if primary_label:
+                kopi.cell(idx, col_cursor, locs.get(primary_label, "") or "")
+                col_cursor += 1
+            if has_ktr:
+                kopi.cell(idx, col_cursor, locs.get("Kontrollområde", "") or "")
+        last = 3 + len(liste) - 1
+        if last < 200:
+            kopi.delete_rows(last + 1, 200 - last)
+        add_betingelser(kopi)
+        apply_status_cf(kopi, 3, last if last >= 3 else 3)
+    wb.remove(malark)
+    wb._sheets.sort(key=lambda s: _sheet_sort_key(s.title))
+    bio = io.BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def old_ft(template: Path, groups: dict) -> bytes:
+    wb = load_workbook(template)
+    malark = None
+    for name in wb.sheetnames:
+        if name.lower() in ("mal", "malverk", "template", "ft_mal"):
+            malark = wb[name]
+            break
+    if malark is None:
+        malark = wb[wb.sheetnames[0]]
+    patt = re.compile(r"\{SYSTEM(NAVN)?\}", re.I)
+    for system, liste in groups.items():
+        title = f"{system} - FT"
+        ws = wb[title] if title in wb.sheetnames else wb.copy_worksheet(malark)
+        ws.title = title
+        for row in ws.iter_rows(min_row=1, max_row=60, min_col=1, max_col=40):
+            for cell in row:
+                v = cell.value
+                if isinstance(v, str) and patt.search(v):
+                    cell.value = patt.sub(system, v)
+        for rr in range(29, 29 + 1000):
+            for cc in range(1, 14 + 1):
+                ws.cell(rr, cc).value = None
+        r = 29
+        for obj in liste:
+            for key, col in (("status", 1), ("system", 2), ("komponent", 3), ("test", 5), ("aksept", 7),
+                             ("funksjonsvalg", 8)):
+                ws.cell(r, col, obj.get(key))
+            r += 1
+        last = r - 1
+        if last >= 29:
+            dv_status = DataValidation(type="list", formula1='"Ikke startet,Under arbeid,Avvik,Utført"',
+                                       allow_blank=True)
+            ws.add_data_validation(dv_status)
+            dv_status.add(f"A29:A{last}")
+            apply_status_cf(ws, 29, last, columns=("A",), ref_row=1)
+            dv_funk = DataValidation(type="list", formula1='"Start og Stopp funksjoner,Reguleringsfunksjoner,'
+                                     'Sikkerhetsfunksjoner,Øvrig"', allow_blank=True)
+            ws.add_data_validation(dv_funk)
+            dv_funk.add(f"H29:H{last}")
+    wb.remove(wb[malark.title])
+    wb._sheets = [wb[n] for n in sorted(wb.sheetnames)]
+    bio = io.BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def new_mc(template: Path, groups: dict) -> bytes:
+    bio = io.BytesIO()
+    build_mc_protocol(str(template), groups, sort_key=_sheet_sort_key).save(bio)
+    return bio.getvalue()
+
+
+def new_ft(template: Path, groups: dict) -> bytes:
+    bio = io.BytesIO()
+    build_ft_protocol(str(template), groups).save(bio)
+    return bio.getvalue()
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Sammenligning av ferdige filer
+# ────────────────────────────────────────────────────────────────────────────────
+def _style(cell):
+    return (repr(cell.font), repr(cell.fill), repr(cell.border), repr(cell.alignment),
+            cell.number_format, repr(cell.protection))
+
+
+def _sheet_signature(ws) -> dict:
+    cells = {}
+    for (r, c), cell in ws._cells.items():
+        if cell.value is None and not cell.has_style:
+            continue
+        cells[r, c] = (cell.value, _style(cell) if cell.has_style else None)
+    return {
+        "cells": cells,
+        "merged": sorted(str(m) for m in ws.merged_cells.ranges),
+        "dv": [(dv.type, dv.formula1, str(dv.sqref)) for dv in ws.data_validations.dataValidation],
+        "cf": [(str(cf.sqref), [(rule.type, rule.formula, repr(rule.dxf)) for rule in cf.rules])
+               for cf in ws.conditional_formatting],
+        "cols": {k: (d.width, d.hidden, d.min, d.max) for k, d in ws.column_dimensions.items()},
+        "rows": {k: (d.height, d.hidden) for k, d in ws.row_dimensions.items() if d.height or d.hidden},
+        "format": repr(ws.sheet_format),
+        "page": (repr(ws.page_setup), repr(ws.page_margins), repr(ws.print_options)),
+        "freeze": ws.freeze_panes,
+    }
+
+
+def compare(old: bytes, new: bytes, label: str) -> bool:
+    wa, wb = load_workbook(io.BytesIO(old)), load_workbook(io.BytesIO(new))
+    if wa.sheetnames != wb.sheetnames:
+        print(f"[FEIL] {label}: arkrekkefølge avviker: {wa.sheetnames[:5]} / {wb.sheetnames[:5]}")
+        return False
+    bad = 0
+    for name in wa.sheetnames:
+        a, b = _sheet_signature(wa[name]), _sheet_signature(wb[name])
+        for key in a:
+            if a[key] == b[key]:
+                continue
+            bad += 1
+            if bad <= 5:
+                if key == "cells":
+                    diff = sorted(set(a[key].items()) ^ set(b[key].items()), key=str)[:4]
+                    print(f"[FEIL] {label} {name}: celler avviker, f.eks. {diff}")
+                else:
+                    print(f"[FEIL] {label} {name}: {key} avviker: {a[key]!r:.200} / {b[key]!r:.200}")
+    return bad == 0
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main() -> int:
+    n_sys = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    ok = True
+
+    mc, ft = mc_groups(n_sys), ft_groups(n_sys)
+    print(f"[INFO] {len(mc)} MC-ark ({sum(map(len, mc.values()))} rader), "
+          f"{len(ft)} FT-ark ({sum(map(len, ft.values()))} rader)")
+
+    for label, old_fn, new_fn, template, groups in (("MC", old_mc, new_mc, MC_TEMPLATE, mc),
+                                                    ("FT", old_ft, new_ft, FT_TEMPLATE, ft)):
+        old_bytes, t_old = _timed(old_fn, template, groups)
+        new_bytes, t_cold = _timed(new_fn, template, groups)
+        _, t_warm = _timed(new_fn, template, groups)
+        print(f"[INFO] {label}: tidligere {t_old:.1f} s → ny {t_cold:.1f} s (kald) / {t_warm:.1f} s (varm), "
+              f"{t_old / max(t_warm, 1e-9):.1f}x; fil {len(old_bytes) // 1024} → {len(new_bytes) // 1024} KiB")
+        ok &= _check(compare(old_bytes, new_bytes, label), f"{label}: arbeidsbøkene er like ({len(groups)} ark)")
+
+    small = {k: mc[k] for k in list(mc)[:6]}
+    ok &= _check(compare(old_mc(MC_TEMPLATE, small), new_mc(MC_TEMPLATE, small), "MC-liten"),
+                 "MC: 6 ark (alle grupper under 200 rader og over)")
+
+    print(f"[INFO] openpyxl {protocol_writer.openpyxl.__version__}, strømmevei: {protocol_writer.FAST_PATH}")
+    few_mc = {k: mc[k] for k in list(mc)[:20]}
+    few_ft = {k: ft[k] for k in list(ft)[:20]}
+    saved, protocol_writer.FAST_PATH = protocol_writer.FAST_PATH, False
+    try:
+        t0 = time.perf_counter()
+        ok &= _check(compare(old_mc(MC_TEMPLATE, few_mc), new_mc(MC_TEMPLATE, few_mc), "MC-vanlig")
+                     and compare(old_ft(FT_TEMPLATE, few_ft), new_ft(FT_TEMPLATE, few_ft), "FT-vanlig"),
+                     f"uten strømmevei: MC og FT like som tidligere ({len(few_mc)} + {len(few_ft)} ark, "
+                     f"{time.perf_counter() - t0:.1f} s)")
+    finally:
+        protocol_writer.FAST_PATH = saved
+
+    with tempfile.TemporaryDirectory(prefix="protokoll_") as tmp:
+        path = Path(tmp) / "Mekanisk_Komplett.xlsx"
+        shutil.copy(MC_TEMPLATE, path)
+        first = load_template(str(path))
+        ok &= _check(load_template(str(path)) is first, "uendret mal gir cachet objekt")
+        wb = load_workbook(path)
+        wb["malverk"]["D1"] = "Komponent (endret)"
+        wb.save(path)
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        second = load_template(str(path))
+        layout = second.layout(("mc",), None, sheet="malverk")
+        ok &= _check(second is not first and any(v == "Komponent (endret)" for _, _, v in layout.values(1, 1, 4, 4)),
+                     "endret mal leses på nytt")
+        out = io.BytesIO()
+        build_mc_protocol(str(path), small).save(out)
+        ok &= _check(load_workbook(out).worksheets[0]["D1"].value == "Komponent (endret)",
+                     "protokoll fra endret mal")
+    print(f"[INFO] {template_cache_info()}")
+
+    if not ok:
+        print("[FEIL] Protokollgenereringen avviker.")
+        return 1
+    print("[OK] Protokollgenerering fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
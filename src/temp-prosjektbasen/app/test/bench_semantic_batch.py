@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for semantisk nøkkelord-scoring: én encode per setning (gammel vei)
+mot batch-encoding (app.tasks.core._semantic_kw_scores_batch).
+Bruk:
+  python -m app.test.bench_semantic_batch [antall_setninger]
+Krever at SentenceTransformer er tilgjengelig. Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import random
+import sys
+import time
+
+import numpy as np
+
+from app.tasks import models as tm
+from app.tasks.core import _semantic_kw_scores_batch, SEM_BATCH_SIZE
+
+KEYWORDS = [
+    "ventilasjon", "tilluft", "avtrekk", "vav-spjeld", "varmegjenvinning", "sfp", "sd-anlegg",
+    "bacnet", "sprinkler", "tappevann", "pumpe", "belysning", "tavle", "kuldemedium", "fdv",
+]
+TEMPLATES = [
+    "{kw} skal leveres komplett og dokumenteres i FDV.",
+    "Entreprenøren skal sørge for at {kw} innreguleres til prosjektert verdi.",
+    "Alle {kw} skal merkes iht. TFM og kobles til SD-anlegget.",
+    "Det skal benyttes {kw} med dokumentert SFP < 1,5 kW/(m³/s).",
+    "Prøvedrift av {kw} skal gjennomføres før overtakelse.",
+]
+
+
+def _corpus(n: int) -> list[str]:
+    rnd = random.Random(42)
+    return [rnd.choice(TEMPLATES).format(kw=rnd.choice(KEYWORDS)) + f" Pos {i}." for i in range(n)]
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    sem = getattr(tm, "semantic_model", None)
+    if sem is None:
+        print("[FEIL] SentenceTransformer er ikke tilgjengelig – kan ikke kjøre benchmark.")
+        return 2
+
+    sents = _corpus(n)
+    kw_vecs = np.asarray(sem.encode(KEYWORDS, convert_to_numpy=True, normalize_embeddings=True))
+
+    # Gammel vei: én encode per setning (måles på et utvalg og skaleres)
+    sample = sents[: min(n, 1000)]
+    t0 = time.perf_counter()
+    old = []
+    for s in sample:
+        q = np.asarray(sem.encode([s], convert_to_numpy=True, normalize_embeddings=True)).reshape(-1)
+        old.append(float(np.max(np.dot(kw_vecs, q))) * 100.0)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    new = _semantic_kw_scores_batch(sem, sents, kw_vecs)
+    t_new = time.perf_counter() - t0
+
+    diff = max(abs(a - b) for a, b in zip(old, new[: len(old)]))
+    print(f"[INFO] Setninger: {n}, batch_size={SEM_BATCH_SIZE}")
+    print(f"[OK] Per setning: {len(sample) / t_old:,.0f} setn/s ({len(sample)} målt)")
+    print(f"[OK] Batch:       {n / t_new:,.0f} setn/s")
+    print(f"[OK] Maks avvik i score: {diff:.4f}")
+    if diff > 0.5:
+        print("[FEIL] Batch-score avviker fra per-setning-score.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
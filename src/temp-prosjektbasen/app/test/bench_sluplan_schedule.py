@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark + røyktest for kritisk linje i SluPlan (app.services.sluplan_schedule).
+- Paritet: ES/LS/slakk er identiske med en enkel referanse (relaksering til fastpunkt, uten
+  topologisk sortering) på små syntetiske planer med sammendrag, FS/SS/FF/SF og lag
+- Invarianter på store planer: alle avhengigheter oppfylt av tidligste og seneste datoer,
+  slakk >= 0, kritisk linje ikke tom og prosjektslutt = seneste tidligste slutt
+- Sykluser (også via sammendrag) gir ScheduleCycleError med oppgavene i syklusen
+- Typeformat "SS+2" / "FF-1" (lag lagres i type-feltet); lag utenfor ±MAX_LAG_DAYS avvises
+- Tid for syntetiske igangkjøringsplaner opp til 50 000 oppgaver, også via get_schedule()
+  mot SQLite
+Bruk:
+  python -m app.test.bench_sluplan_schedule [antall_oppgaver]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from app.services.sluplan_schedule import (
+    MAX_LAG_DAYS, ScheduleCycleError, compute_schedule, format_dependency_type, parse_dependency_type,
+)
+from app.test.common import check as _check
+
+BASE = date(2026, 1, 5)
+TYPES = ("FS", "SS", "FF", "SF")
+_ENDS = {"FS": (1, 0), "SS": (0, 0), "FF": (1, 1), "SF": (0, 1)}
+
+
+def synthetic_plan(n_tasks: int, seed: int = 1):
+    """Systemer à 1 sammendrag + 6 deloppgaver i FS-kjede (som _seed_default_plan), milepæler,
+    og tilfeldige avhengigheter framover mellom systemer (alle typer, lag -2..5)."""
+    rnd = random.Random(seed)
+    tasks, deps = [], []
+    next_id = 1
+    milestones = []
+    for k in range(5):
+        day = BASE + timedelta(days=7 * k)
+        tasks.append((next_id, day, day, None))
+        if milestones:
+            deps.append((milestones[-1], next_id, "FS", 0))
+        milestones.append(next_id)
+        next_id += 1
+    systems = []                                      # (sammendrag, [deloppgaver])
+    while next_id + 7 <= n_tasks:
+        start = BASE + timedelta(days=rnd.randint(0, 200))
+        parent = next_id
+        tasks.append((parent, start, start + timedelta(days=5), None))
+        next_id += 1
+        children = []
+        for d in range(6):
+            day = start + timedelta(days=d)
+            tasks.append((next_id, day, day + timedelta(days=rnd.randint(0, 3)), parent))
+            if children:
+                deps.append((children[-1], next_id, "FS", 0))
+            children.append(next_id)
+            next_id += 1
+        systems.append((parent, children))
+    for i, (parent, children) in enumerate(systems):
+        for _ in range(rnd.randint(0, 3)):
+            j = i + rnd.randint(1, 20)
+            if j >= len(systems):
+                break
+            other_parent, other_children = systems[j]
+            frm = rnd.choice(children + [parent]) if rnd.random() < 0.9 else parent
+            to = rnd.choice(other_children + [other_parent])
+            deps.append((frm, to, rnd.choice(TYPES), rnd.randint(-2, 5)))
+        if i % 50 == 0:
+            deps.append((children[-1], milestones[-1], "FS", 0))
+    return tasks, deps
+
+
+def reference(tasks, deps):
+    """Samme modell som compute_schedule, men relaksering til fastpunkt (O(V·E))."""
+    by_id = {t[0]: t for t in tasks}
+    parents = {t[3] for t in tasks if t[3] is not None}
+    base = min(t[1] for t in tasks)
+    dur, es = {}, {}
+    for tid, start, end, _ in tasks:
+        if tid in parents:
+            for x in (("s", tid), ("f", tid)):
+                dur[x], es[x] = 0, 0
+        else:
+            dur[("s", tid)] = (end - start).days + 1
+            es[("s", tid)] = (start - base).days
+
+    def node(tid, use_finish):
+        return ("f", tid) if use_finish and tid in parents else ("s", tid)
+
+    cons = []                                             # (u, v, a, b, lag)
+    for tid, _, _, parent in tasks:
+        if tid in parents:
+            cons.append((("s", tid), ("f", tid), 0, 0, 0))
+        if parent is not None:
+            cons.append((("s", parent), ("s", tid), 0, 0, 0))
+            cons.append((node(tid, 1), ("f", parent), 1, 1, 0))
+    for frm, to, typ, lag in deps:
+        a, b = _ENDS[typ]
+        cons.append((node(frm, a), node(to, b), a, b, lag))
+    changed = True
+    while changed:
+        changed = False
+        for u, v, a, b, lag in cons:
+            cand = es[u] + a * dur[u] + lag - b * dur[v]
+            if cand > es[v]:
+                es[v] = cand
+                changed = True
+    finish = max(es[x] + dur[x] for x in es)
+    ls = {x: finish - dur[x] for x in es}
+    changed = True
+    while changed:
+        changed = False
+        for u, v, a, b, lag in cons:
+            cand = ls[v] + b * dur[v] - lag - a * dur[u]
+            if cand < ls[u]:
+                ls[u] = cand
+                changed = True
+    return {tid: (base + timedelta(days=es[("s", tid)]), base + timedelta(days=ls[("s", tid)]))
+            for tid in by_id if tid not in parents}, base + timedelta(days=finish - 1)
+
+
+def check_invariants(tasks, deps, sched) -> bool:
+    t = sched.tasks
+    for frm, to, typ, lag in deps:
+        a, b = _ENDS[typ]
+        for s_attr, f_attr in (("early_start", "early_finish"), ("late_start", "late_finish")):
+            src, dst = t[frm], t[to]
+            if src.summary or dst.summary:
+                continue
+            p = getattr(src, f_attr) + timedelta(days=1) if a else getattr(src, s_attr)
+            q = getattr(dst, f_attr) + timedelta(days=1) if b else getattr(dst, s_attr)
+            if (q - p).days < lag:
+                return False
+    leaves = [x for x in t.values() if not x.summary]
+    return (all(x.total_float >= 0 for x in t.values())
+            and all(x.total_float == (x.late_start - x.early_start).days for x in leaves)
+            and bool(sched.critical_path) and all(t[c].total_float == 0 for c in sched.critical_path)
+            and sched.finish == max(x.early_finish for x in leaves))
+
+
+def bench_db(n: int) -> float:
+    from flask import Flask
+    from app.models.db import db
+    from app.models.project import Project
+    from app.models.sluplan import SluplanDependency, SluplanProject, SluplanTask
+    from app.models.user import User
+    from app.services.sluplan_service import get_schedule
+
+    tasks, deps = synthetic_plan(n, seed=5)
+    with tempfile.TemporaryDirectory(prefix="sluplan_cpm_") as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, "test.db")
+        db.init_app(app)
+        with app.app_context():
+            db.metadata.create_all(db.engine, tables=[
+                User.__table__, Project.__table__, SluplanProject.__table__, SluplanTask.__table__,
+                SluplanDependency.__table__,
+            ] + [tbl for name, tbl in db.metadata.tables.items() if name in ("sluplan_persons", "sluplan_disciplines")])
+            sp = SluplanProject(name="Bench", start_date=BASE, end_date=BASE + timedelta(days=30))
+            db.session.add(sp)
+            db.session.flush()
+            db.session.execute(SluplanTask.__table__.insert(), [
+                {"id": tid, "title": f"T{tid}", "start_date": s, "end_date": e, "parent_id": p,
+                 "project_id": sp.id, "status": "planlagt", "kind": "task"} for tid, s, e, p in tasks])
+            db.session.execute(SluplanDependency.__table__.insert(), [
+                {"from_task_id": f, "to_task_id": t, "type": format_dependency_type(typ, lag)}
+                for f, t, typ, lag in deps])
+            db.session.commit()
+            t0 = time.perf_counter()
+            result = get_schedule(sp.id)
+            elapsed = time.perf_counter() - t0
+            expected = compute_schedule(tasks, deps)
+            ok = (result["finish"] == expected.finish.isoformat()
+                  and result["critical_path"] == [str(c) for c in expected.critical_path]
+                  and len(result["tasks"]) == len(tasks))
+            if not ok:
+                raise AssertionError("get_schedule avviker fra compute_schedule")
+        return elapsed
+
+
+def main() -> int:
+    n_max = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    ok = True
+
+    ok &= _check(parse_dependency_type("SS+2") == ("SS", 2) and parse_dependency_type("ff -1") == ("FF", -1)
+                 and parse_dependency_type(None) == ("FS", 0) and parse_dependency_type("FS", "3") == ("FS", 3)
+                 and format_dependency_type("SF", -4) == "SF-4" and format_dependency_type("FS", 0) == "FS",
+                 "typeformat FS/SS/FF/SF med lag")
+    try:
+        parse_dependency_type("XX")
+        ok &= _check(False, "ukjent type avvises")
+    except ValueError:
+        ok &= _check(True, "ukjent type avvises")
+    from app.models.sluplan import SluplanDependency
+    too_long = []
+    for call in (lambda: parse_dependency_type("FS+100000"), lambda: parse_dependency_type("FS+9999", 1),
+                 lambda: format_dependency_type("FS", 100000), lambda: format_dependency_type("SS", -MAX_LAG_DAYS - 1)):
+        try:
+            too_long.append(call())
+        except ValueError as exc:
+            too_long.append(str(exc))
+    ok &= _check(too_long == ["ugyldig_lag"] * 4
+                 and len(format_dependency_type("SF", -MAX_LAG_DAYS)) <= SluplanDependency.type.type.length,
+                 f"lag utenfor ±{MAX_LAG_DAYS} avvises; største lag passer i type-feltet")
+
+    # Håndregnet: A(3d) -FS+1-> B(2d) ; A -SS+0-> C(1d) -FF+2-> B ; D(1d) alene senere
+    d = BASE
+    s = compute_schedule(
+        [("A", d, d + timedelta(days=2), None), ("B", d, d + timedelta(days=1), None),
+         ("C", d, d, None), ("D", d + timedelta(days=10), d + timedelta(days=10), None)],
+        [("A", "B", "FS", 1), ("A", "C", "SS", 0), ("C", "B", "FF", 2)])
+    ok &= _check(s.tasks["B"].early_start == d + timedelta(days=4) and s.finish == d + timedelta(days=10)
+                 and s.critical_path == ["D"] and s.tasks["A"].total_float == 5 and s.tasks["C"].total_float == 8,
+                 "håndregnet eksempel (lag, SS/FF, slakk)")
+
+    for seed in range(1, 9):
+        tasks, deps = synthetic_plan(300, seed)
+        sched = compute_schedule(tasks, deps)
+        ref, ref_finish = reference(tasks, deps)
+        same = sched.finish == ref_finish and all(
+            (sched.tasks[tid].early_start, sched.tasks[tid].late_start) == v for tid, v in ref.items())
+        ok &= _check(same and check_invariants(tasks, deps, sched),
+                     f"referanse seed {seed}: {len(tasks)} oppgaver, {len(deps)} avhengigheter, "
+                     f"{len(sched.critical_path)} kritiske")
+
+    tasks, deps = synthetic_plan(200, 3)
+    child_of = {t[0]: t[3] for t in tasks if t[3] is not None}
+    child, summary = next(iter(child_of.items()))
+    for label, extra in (
+        ("enkel syklus", [(deps[-1][1], deps[-1][0], "FS", 0)]),
+        ("selvavhengighet", [(tasks[0][0], tasks[0][0], "SS", 1)]),
+        ("via sammendrag (FS fra sammendrag til eget barn)", [(summary, child, "FS", 0)]),
+    ):
+        try:
+            compute_schedule(tasks, deps + extra)
+            ok &= _check(False, f"syklus oppdaget: {label}")
+        except ScheduleCycleError as exc:
+            ok &= _check(bool(exc.task_ids) and str(exc) == "avhengighetssyklus",
+                         f"syklus oppdaget: {label} → {exc.task_ids[:6]}")
+
+    sizes = [n for n in (1000, 10000, n_max) if n <= n_max]
+    for n in dict.fromkeys(sizes):
+        tasks, deps = synthetic_plan(n, seed=n)
+        t0 = time.perf_counter()
+        sched = compute_schedule(tasks, deps)
+        elapsed = time.perf_counter() - t0
+        ok &= _check(check_invariants(tasks, deps, sched), f"invarianter {len(tasks)} oppgaver")
+        print(f"[INFO] {len(tasks):>6} oppgaver, {len(deps):>6} avhengigheter: {elapsed * 1e3:7.1f} ms "
+              f"(slutt {sched.finish}, {len(sched.critical_path)} kritiske)")
+
+    try:
+        elapsed = bench_db(n_max)
+        ok &= _check(True, f"get_schedule() mot SQLite, {n_max} oppgaver: {elapsed * 1e3:.0f} ms")
+    except AssertionError as exc:
+        ok &= _check(False, str(exc))
+
+    if not ok:
+        print("[FEIL] Kritisk linje avviker.")
+        return 1
+    print("[OK] Kritisk linje fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for tag-motoren (app.services.tag_engine).
+- Syntetisk korpus: krav-tekst fra data/krav.txt blandet med TFM-tagger i mange varianter
+  (+byggnr=system-komponent%typekode, uten byggnr/system, små bokstaver, /NNN, æøå rundt)
+- Paritet mot tidligere kode (gjenskapt her):
+  * systembygging/komponentopptelling (build_dynamic_regex + rekonstruert full_id)
+  * protokoller iter_tags (MASTER_REGEX_GENERIC / MASTER_REGEX_PDF + reserve-søk)
+  * merkeskilt/masseliste (plassholdere erstattet direkte)
+  * scan() over byte-buffere med tilfeldige grenser (også midt i UTF-8-tegn) = finditer()
+- Gjennomstrømning (MB/s og tagger/s) gammel vs ny
+Bruk:
+  python -m app.test.bench_tag_engine [antall_linjer]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from app.services.tag_engine import (
+    LOOSE, MASTER_GENERIC, MASTER_PDF, TFM_DICT, compile_format,
+)
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+FORMAT = "{byggnr}{system}{komponent}{typekode}"
+KODER = ["RT", "JV", "SB", "JP", "QT", "RP", "SQ", "LX", "KA", "RF", "OE", "MF", "SC", "LH", "XX", "Q1"]
+
+
+# ---------------------------------------------------------------- tidligere kode
+def old_build_dynamic_regex(format_string: str) -> str:
+    parts = []
+    i = 0
+    while i < len(format_string):
+        if format_string[i:].startswith("{byggnr}"):
+            parts.append(r"(?P<byggnr_prefix>\++)(?P<byggnr>[A-Za-z0-9]+)")
+            i += len("{byggnr}")
+        elif format_string[i:].startswith("{system}"):
+            parts.append(r"(?:(?P<system_prefix>=)(?P<system>[^-\s%\n]+))?")
+            i += len("{system}")
+        elif format_string[i:].startswith("{komponent}"):
+            parts.append(r"(?P<komponent_prefix>-)(?P<komponent>[^\s%\n]+)")
+            i += len("{komponent}")
+        elif format_string[i:].startswith("{typekode}"):
+            parts.append(r"(?:(?P<typekode_prefix>%)(?P<typekode>\S+))?")
+            i += len("{typekode}")
+        else:
+            parts.append(re.escape(format_string[i]))
+            i += 1
+    return "".join(parts)
+
+
+def old_systembygging(text: str, formatval: str) -> list:
+    pattern = re.compile(old_build_dynamic_regex(formatval))
+    rows = []
+    for m in pattern.finditer(text):
+        gr = m.groupdict()
+        byggnr = (gr.get("byggnr") or "").strip()
+        system = (gr.get("system") or "").strip()
+        komponent = (gr.get("komponent") or "").strip()
+        typekode = (gr.get("typekode") or "").strip()
+        if not komponent:
+            continue
+        if "{system}" in formatval and not gr.get("system_prefix"):
+            continue
+        full_id_parts = []
+        i = 0
+        while i < len(formatval):
+            if formatval[i:].startswith("{byggnr}"):
+                full_id_parts.append((gr.get("byggnr_prefix") or "") + byggnr)
+                i += len("{byggnr}")
+            elif formatval[i:].startswith("{system}"):
+                if gr.get("system_prefix"):
+                    full_id_parts.append(gr["system_prefix"] + system)
+                i += len("{system}")
+            elif formatval[i:].startswith("{komponent}"):
+                full_id_parts.append((gr.get("komponent_prefix") or "-") + komponent)
+                i += len("{komponent}")
+            elif formatval[i:].startswith("{typekode}"):
+                if gr.get("typekode_prefix"):
+                    full_id_parts.append(gr["typekode_prefix"] + typekode)
+                i += len("{typekode}")
+            else:
+                full_id_parts.append(formatval[i])
+                i += 1
+        actual_id = komponent.lstrip("-")
+        tfm2 = actual_id[:2] if len(actual_id) >= 2 else ""
+        rows.append(("".join(full_id_parts), TFM_DICT.get(tfm2, "Ukjent"), system, actual_id))
+    return rows
+
+
+def old_opptelling(text: str, formatval: str) -> dict:
+    pattern = re.compile(old_build_dynamic_regex(formatval))
+    out: dict = {}
+    for m in pattern.finditer(text):
+        gr = m.groupdict()
+        system = (gr.get("system") or "").strip()
+        komponent = (gr.get("komponent") or "").strip()
+        if "{komponent}" in formatval and not gr.get("komponent_prefix"):
+            continue
+        if not komponent:
+            continue
+        has_system = bool(gr.get("system_prefix") and system)
+        actual_id = komponent.lstrip("-")
+        tfm2 = actual_id[:2] if len(actual_id) >= 2 else ""
+        if not tfm2.isalpha() or tfm2 not in TFM_DICT:
+            continue
+        mkey = re.match(r'([A-Za-z]{2}[A-Za-z\-]*)', actual_id)
+        key = (has_system, mkey.group(1) if mkey else tfm2)
+        out[key] = out.get(key, 0) + 1
+    return out
+
+
+OLD_MASTER_GENERIC = re.compile(
+    r"(?P<full_tag>"
+    r"(?:\+(?P<byggnr>[A-Z0-9]+))?"
+    r"(?:=(?P<system>[\d.:/]+))?"
+    r"(?:-?(?P<komponent>([A-Za-z]{2,4})[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9/]*))?"
+    r"(?:%(?P<typekode>[A-Z0-9./:_-]+))?"
+    r")",
+    re.IGNORECASE,
+)
+OLD_MASTER_PDF = re.compile(
+    r"(?P<full_tag>"
+    r"(?:\+(?P<pdf_byggnr>[^=\s+]+)=(?=\d))?"
+    r"(?:=(?P<pdf_system>\b\d{3,4}\.\d{3,4}\b))?"
+    r"(?:-?(?P<komponent>([A-Za-z]{2,4})[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9/]*))?"
+    r"(?:%(?P<pdf_typekode>[^\s+]+))?"
+    r")",
+    re.IGNORECASE,
+)
+
+
+def old_iter_tags(text: str, filename: str) -> list:
+    rx = OLD_MASTER_PDF if filename.lower().endswith(".pdf") else OLD_MASTER_GENERIC
+    out = []
+    for m in rx.finditer(text or ""):
+        gd = m.groupdict()
+        byggnr = gd.get("byggnr") or gd.get("pdf_byggnr")
+        system = gd.get("system") or gd.get("pdf_system")
+        komponent = gd.get("komponent") or gd.get("pdf_komponent")
+        typekode = gd.get("typekode") or gd.get("pdf_typekode")
+        full_tag = (gd.get("full_tag") or "").strip()
+        if not komponent and full_tag:
+            m_fallback = re.search(
+                r"-([A-Za-z]{2,4}[A-Za-z0-9]{0,6}\d{2,5}[A-Za-z0-9]*?(?:/[0-9]{1,4})?)(?=$|[\s,.;:\)\]\}])",
+                full_tag,
+                re.IGNORECASE
+            )
+            if m_fallback:
+                komponent = m_fallback.group(1)
+        if not komponent:
+            continue
+        out.append(((byggnr or "").strip(), (system or "").strip(), (komponent or "").strip().upper(),
+                    (typekode or "").strip(), full_tag))
+    return out
+
+
+def old_loose(cells: list, fmt: str) -> list:
+    placeholders = {
+        "{byggnr}": r"(?P<byggnr>\+[A-Za-z0-9]+)",
+        "{system}": r"(?P<system>=[^-]+)",
+        "{komponent}": r"(?P<komponent>-[^%]+)",
+        "{typekode}": r"(?P<typekode>[%/].+)"
+    }
+    regex_str = fmt
+    for ph, subpat in placeholders.items():
+        regex_str = regex_str.replace(ph, subpat)
+    mønster = re.compile(regex_str)
+    out = []
+    for verdi in cells:
+        for match in mønster.finditer(verdi):
+            gd = match.groupdict()
+            out.append((gd.get("byggnr", ""), gd.get("system", ""), gd.get("komponent", ""),
+                        gd.get("typekode", ""), match.group(0)))
+    return out
+
+
+# ---------------------------------------------------------------- nye varianter
+def new_systembygging(text: str, formatval: str) -> list:
+    pattern = compile_format(formatval)
+    rows = []
+    for tag in pattern.finditer(text):
+        if not tag.komponent or (pattern.has_system and not tag.system):
+            continue
+        actual_id = tag.komponent.lstrip("-")
+        tfm2 = actual_id[:2] if len(actual_id) >= 2 else ""
+        rows.append((tag.full, TFM_DICT.get(tfm2, "Ukjent"), tag.system, actual_id))
+    return rows
+
+
+_COMP_KEY = re.compile(r'([A-Za-z]{2}[A-Za-z\-]*)')
+
+
+def new_opptelling(text: str, formatval: str) -> dict:
+    out: dict = {}
+    for tag in compile_format(formatval).finditer(text):
+        if not tag.komponent:
+            continue
+        actual_id = tag.komponent.lstrip("-")
+        tfm2 = actual_id[:2] if len(actual_id) >= 2 else ""
+        if not tfm2.isalpha() or tfm2 not in TFM_DICT:
+            continue
+        mkey = _COMP_KEY.match(actual_id)
+        key = (bool(tag.system), mkey.group(1) if mkey else tfm2)
+        out[key] = out.get(key, 0) + 1
+    return out
+
+
+def new_iter_tags(text: str, filename: str) -> list:
+    pattern = MASTER_PDF if filename.lower().endswith(".pdf") else MASTER_GENERIC
+    return [tuple(t) for t in pattern.finditer(text)]
+
+
+def new_loose(cells: list, fmt: str) -> list:
+    pattern = compile_format(fmt, LOOSE)
+    return [tuple(t) for verdi in cells for t in pattern.finditer(verdi)]
+
+
+# ---------------------------------------------------------------- korpus
+def _tag(rnd: random.Random) -> str:
+    kode = rnd.choice(KODER)
+    komp = f"{kode}{rnd.randint(1, 999):03d}"
+    r = rnd.random()
+    if r < 0.1:
+        komp = komp.lower()
+    elif r < 0.15:
+        komp += f"/{rnd.randint(1, 20):03d}"
+    elif r < 0.2:
+        komp = f"{kode}{rnd.choice('ABT')}{rnd.randint(1, 99):02d}"
+    sysid = f"{rnd.randint(300, 579)}.{rnd.randint(1, 9999):0{rnd.choice((3, 4))}d}"
+    if rnd.random() < 0.1:
+        sysid += f":{rnd.randint(1, 99):03d}"
+    bygg = f"+{rnd.choice(['A', 'B1', 'K2'])}" if rnd.random() < 0.5 else ""
+    if bygg and rnd.random() < 0.1:
+        bygg = "+" + bygg
+    system = f"={sysid}" if rnd.random() < 0.8 else ""
+    typ = f"%{rnd.choice(['T01', 'RTF.2', 'a/b', 'X-1'])}" if rnd.random() < 0.3 else ""
+    dash = "-" if rnd.random() < 0.9 else ""
+    return f"{bygg}{system}{dash}{komp}{typ}"
+
+
+def make_corpus(n_lines: int, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    krav = [ln.strip() for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    lines = []
+    for i in range(n_lines):
+        r = rnd.random()
+        if r < 0.4:
+            lines.append(rnd.choice(krav))
+        elif r < 0.85:
+            sep = rnd.choice([" ", "  ", "\t", ", ", "; ", " (", " æ "])
+            lines.append(sep.join(_tag(rnd) for _ in range(rnd.randint(1, 4))) + rnd.choice(["", " l/s", ")", "."]))
+        else:
+            lines.append(f"{rnd.choice(krav)[:50]} {_tag(rnd)} {rnd.randint(1, 400)},{rnd.randint(0, 9)} m³/h")
+    return "\n".join(lines) + "\n"
+
+
+def _chunks(data: bytes, rnd: random.Random):
+    i = 0
+    while i < len(data):
+        n = rnd.randint(1, 64 * 1024)
+        yield data[i:i + n]
+        i += n
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+def main() -> int:
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    text = make_corpus(n_lines)
+    mb = len(text.encode("utf-8")) / 1e6
+    print(f"[INFO] Korpus: {n_lines} linjer, {mb:.1f} MB")
+    ok = True
+
+    cases = [
+        ("systembygging", old_systembygging, new_systembygging, (text, FORMAT)),
+        ("systembygging {system}{komponent}", old_systembygging, new_systembygging, (text, "{system}{komponent}")),
+        ("komponentopptelling", old_opptelling, new_opptelling, (text, FORMAT)),
+        ("protokoller generell", old_iter_tags, new_iter_tags, (text, "liste.xlsx")),
+        ("protokoller PDF", old_iter_tags, new_iter_tags, (text, "liste.pdf")),
+    ]
+    for name, old_fn, new_fn, args in cases:
+        old, t_old = _timed(old_fn, *args)
+        new, t_new = _timed(new_fn, *args)
+        same = old == new
+        n = len(old) if isinstance(old, list) else sum(old.values())
+        print(f"[INFO] {name}: {n} tagger | gammel {t_old:.2f}s ({mb / t_old:.1f} MB/s) → "
+              f"ny {t_new:.2f}s ({mb / t_new:.1f} MB/s, {n / t_new / 1e3:.0f}k tagger/s) "
+              f"{t_old / max(t_new, 1e-9):.1f}x | {'identisk' if same else 'AVVIK'}")
+        ok &= same
+
+    cells = [c for ln in text.splitlines()[:50_000] for c in ln.split("\t")]
+    for fmt in (FORMAT, "{system}{komponent}", "{komponent}{typekode}"):
+        old, t_old = _timed(old_loose, cells, fmt)
+        new, t_new = _timed(new_loose, cells, fmt)
+        same = old == new
+        print(f"[INFO] merkeskilt/masseliste {fmt}: {len(old)} treff, {t_old:.2f}s → {t_new:.2f}s | "
+              f"{'identisk' if same else 'AVVIK'}")
+        ok &= same
+
+    data = text.encode("utf-8")
+    rnd = random.Random(3)
+    for pattern in (compile_format(FORMAT), compile_format("{system}{komponent}"), MASTER_GENERIC, MASTER_PDF,
+                    compile_format("{system}{komponent}", LOOSE)):
+        whole = list(pattern.finditer(text[:2_000_000]))
+        streamed, t = _timed(lambda: list(pattern.scan(_chunks(text[:2_000_000].encode("utf-8"), rnd))))
+        same = whole == streamed
+        print(f"[INFO] scan {pattern!r}: {len(streamed)} tagger fra byte-biter på {t:.2f}s | "
+              f"{'identisk' if same else 'AVVIK'}")
+        ok &= same
+    streamed, t = _timed(lambda: sum(1 for _ in MASTER_GENERIC.scan(_chunks(data, rnd))))
+    print(f"[INFO] scan hele korpuset (bytes, generell): {streamed} tagger, {mb / t:.1f} MB/s")
+
+    if not ok:
+        print("[FEIL] Tag-motoren avviker fra tidligere kode.")
+        return 1
+    print("[OK] Identiske tagger; benchmark fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
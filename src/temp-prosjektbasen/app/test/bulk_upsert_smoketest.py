@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest + benchmark for masselagring fra /systemkomponent/send/* (app.services.bulk_upsert).
+- Tidligere vei: slett prosjektets rader + db.session.add per rad + commit
+- Ny vei: diff mot eksisterende rader, executemany i én transaksjon
+- Paritet: tabellinnholdet (som multimengde) er likt etter hver innsending, også med duplikater
+  og andre prosjekter i samme tabell (røres ikke)
+- Tellere: første innsending (alt nytt), samme innsending igjen (alt uendret), endret utvalg
+Bruk:
+  python -m app.test.bulk_upsert_smoketest [antall_rader]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from flask import Flask
+
+from app.models.db import db
+from app.models.komponentopptelling import Komponentopptelling
+from app.models.systembygging import Systembygging
+from app.services.bulk_upsert import sync_komponentopptelling, sync_systembygging
+from app.test.common import check as _check
+
+OTHER_PROJECT = 999
+
+
+def system_rows(n: int, seed: int = 1) -> list:
+    rnd = random.Random(seed)
+    rows = [{"full_id": f"+1234=360.{i % 40:03d}-JV{i:05d}T/001", "desc": f"Ventil {i}",
+             "files": [f"fil{rnd.randint(1, 5)}.pdf"]} for i in range(n)]
+    rows += rows[:5]                                # duplikater som før
+    return rows
+
+
+def komponent_rows(n: int, seed: int = 2) -> list:
+    rnd = random.Random(seed)
+    return [{"id": f"RT{i:05d}", "desc": "Temperaturføler", "per_file": {"a.pdf": rnd.randint(1, 3)},
+             "has_system": "Ja" if i % 3 else "Nei", "files": ["a.pdf"]} for i in range(n)]
+
+
+def old_systembygging(project_id: int, rows: list) -> None:
+    Systembygging.query.filter_by(project_id=project_id).delete()
+    for r in rows:
+        db.session.add(Systembygging(project_id=project_id, full_id=r.get("full_id", ""),
+                                     desc=r.get("desc", ""), files=", ".join(r.get("files", []))))
+    db.session.commit()
+
+
+def old_komponentopptelling(project_id: int, rows: list) -> None:
+    Komponentopptelling.query.filter_by(project_id=project_id).delete()
+    for r in rows:
+        per_file = r.get("per_file", {})
+        count = sum(per_file.values()) if isinstance(per_file, dict) else (r.get("count") or 0)
+        db.session.add(Komponentopptelling(project_id=project_id, komponent=r.get("id", ""),
+                                           desc=r.get("desc", ""), count=count,
+                                           has_system=r.get("has_system") == "Ja",
+                                           files=", ".join(r.get("files", []))))
+    db.session.commit()
+
+
+def content(model, project_id: int) -> Counter:
+    cols = [c.name for c in model.__table__.columns if c.name not in ("id", "project_id")]
+    return Counter(tuple(getattr(r, c) for c in cols)
+                   for r in model.query.filter_by(project_id=project_id).all())
+
+
+def mutate(rows: list, key: str, field: str, seed: int = 3) -> list:
+    """~10 % endret, ~5 % fjernet, ~5 % nye."""
+    rnd = random.Random(seed)
+    out = []
+    for i, r in enumerate(rows):
+        x = rnd.random()
+        if x < 0.05:
+            continue
+        r = dict(r)
+        if x < 0.15:
+            r[field] = f"{r[field]} (rev B)"
+        out.append(r)
+    out += [{**rows[0], key: f"{rows[0][key]}-NY{i}"} for i in range(len(rows) // 20)]
+    return out
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="bulk_upsert_") as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, "test.db")
+        db.init_app(app)
+        with app.app_context():
+            db.metadata.create_all(db.engine, tables=[Systembygging.__table__, Komponentopptelling.__table__])
+
+            for label, model, old_fn, new_fn, rows, key, field in (
+                ("systembygging", Systembygging, old_systembygging, sync_systembygging,
+                 system_rows(n), "full_id", "desc"),
+                ("komponentopptelling", Komponentopptelling, old_komponentopptelling, sync_komponentopptelling,
+                 komponent_rows(n), "id", "desc"),
+            ):
+                old_fn(OTHER_PROJECT, rows[:100])
+                other = content(model, OTHER_PROJECT)
+                changed = mutate(rows, key, field)
+
+                _, t_old = _timed(old_fn, 1, rows)
+                _, t_old_again = _timed(old_fn, 1, changed)
+                expected_changed = content(model, 1)
+                old_fn(1, rows)
+                expected_first = content(model, 1)
+
+                res1, _ = _timed(new_fn, 2, rows)
+                ok &= _check(content(model, 2) == expected_first and res1.inserted == len(rows),
+                             f"{label}: første innsending {res1.as_dict()}")
+                res2, _ = _timed(new_fn, 2, rows)
+                ok &= _check(content(model, 2) == expected_first and res2.unchanged == len(rows)
+                             and res2.inserted == res2.updated == res2.deleted == 0,
+                             f"{label}: samme innsending igjen {res2.as_dict()}")
+                res3, _ = _timed(new_fn, 2, changed)
+                ok &= _check(content(model, 2) == expected_changed and res3.updated > 0 and res3.deleted > 0
+                             and res3.inserted > 0 and res3.unchanged > 0,
+                             f"{label}: endret utvalg {res3.as_dict()}")
+                ok &= _check(content(model, OTHER_PROJECT) == other, f"{label}: andre prosjekter urørt")
+                print(f"[INFO] {label} ({len(rows)} rader): tidligere {t_old:.2f} s / {t_old_again:.2f} s → "
+                      f"ny {res1.seconds:.2f} s (ny) / {res2.seconds:.2f} s (uendret) / {res3.seconds:.2f} s (endret)")
+
+    if not ok:
+        print("[FEIL] Masselagringen avviker.")
+        return 1
+    print("[OK] Masselagring fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
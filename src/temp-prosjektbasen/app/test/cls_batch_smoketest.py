@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for batch-klassifisering: fag_predict_batch / classify_group_ai_batch mot
+tekst-for-tekst-kall (tom memo før hvert kall, som før), pluss tid og memo-treff.
+Bruk:
+  python -m app.test.cls_batch_smoketest [antall_tekster]
+Krever fag-modell (data/fag_profiler.pkl). Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from app.tasks import core
+from app.tasks import models as tm
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+
+
+def _texts(n: int) -> list[str]:
+    lines = [ln.strip() for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    rnd = random.Random(3)
+    # Ca. halvparten gjentas (samme krav i flere dokumenter/sider)
+    return [rnd.choice(lines) if rnd.random() < 0.5 else f"{rnd.choice(lines)} Pos {i}." for i in range(n)]
+
+
+def _clear() -> None:
+    tm._fag_memo.clear()
+    core._group_memo.clear()
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    if tm.get_fag_model() is None:
+        print("[FEIL] Fag-modell er ikke tilgjengelig – kan ikke kjøre testen.")
+        return 2
+    texts = _texts(n)
+
+    t0 = time.perf_counter()
+    ref_fag, ref_grp = [], []
+    for t in texts:
+        _clear()
+        ref_fag.append(tm.fag_predict(t))
+        _clear()
+        ref_grp.append(core.classify_group_ai(t, min_score=0.6))
+    t_single = time.perf_counter() - t0
+
+    _clear()
+    t0 = time.perf_counter()
+    new_fag = tm.fag_predict_batch(texts)
+    new_grp = core.classify_group_ai_batch(texts, min_score=0.6)
+    t_batch = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    again = core.classify_group_ai_batch(texts, min_score=0.6)
+    t_memo = time.perf_counter() - t0
+
+    print(f"[INFO] {n} tekster ({len(set(texts))} unike)")
+    print(f"[INFO] Én og én: {t_single:.2f}s | batch: {t_batch:.2f}s ({t_single / max(t_batch, 1e-9):.1f}x) "
+          f"| gjentatt (memo): {t_memo:.3f}s")
+    print(f"[INFO] Memo: fag={tm._fag_memo.stats()} gruppe={core._group_memo.stats()}")
+
+    ok = True
+    for name, a, b in (("fag_predict", ref_fag, new_fag), ("classify_group_ai", ref_grp, new_grp),
+                       ("classify_group_ai (memo)", ref_grp, again)):
+        if json.dumps(a, ensure_ascii=False) != json.dumps(b, ensure_ascii=False):
+            print(f"[FEIL] {name}: batch ga annet resultat enn tekst-for-tekst.")
+            ok = False
+    if not ok:
+        return 1
+    print("[OK] Batch-klassifisering identisk med tekst-for-tekst.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
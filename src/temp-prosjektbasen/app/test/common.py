@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Felles hjelpere for røyktestene og benchmarkene i app/test."""
+from __future__ import annotations
+
+
+def check(ok: bool, msg: str) -> bool:
+    """Skriver [OK]/[FEIL] for én sjekk og returnerer resultatet (brukes som ok &= check(...))."""
+    print(f"[{'OK' if ok else 'FEIL'}] {msg}")
+    return ok
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Paritetstest for deduplisering: blokkert klynging (method="blocking", token + tegn-n-gram) mot
+dagens grådige klynging (method="exact") på realistiske kravsett bygget fra
+data/krav.txt (nær-duplikater med skrivefeil, endrede tall, tillegg og delmengder).
+Bruk:
+  python -m app.test.dedup_parity_smoketest [antall_krav]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import json
+import random
+import sys
+from pathlib import Path
+
+from app.tasks import core
+from app.tasks.core import deduplicate_requirements
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+
+_TAILS = ["", " iht. NS 3935", " før overtakelse", " og dokumenteres i FDV", " (se tegning)"]
+
+
+def _mutate(rnd: random.Random, s: str) -> str:
+    r = rnd.random()
+    if r < 0.25 and len(s) > 20:                      # skrivefeil
+        i = rnd.randrange(1, len(s) - 1)
+        return s[:i] + s[i + 1] + s[i] + s[i + 2:]
+    if r < 0.45:                                       # endret tall / store bokstaver
+        return "".join(str(rnd.randint(0, 9)) if ch.isdigit() else ch for ch in s).upper()
+    if r < 0.70:                                       # tillegg
+        return s.rstrip(".") + rnd.choice(_TAILS[1:]) + "."
+    if r < 0.85:                                       # delmengde (første ledd)
+        parts = s.split(",")
+        return parts[0].strip() + "." if len(parts) > 1 else s
+    return s
+
+
+def make_requirements(n: int, seed: int = 1, dup_rate: float = 0.35, n_files: int = 20) -> list[dict]:
+    """Syntetiske funn på formen som extract_requirements gir (tekst, ref, score, ns_treff)."""
+    lines = [ln.strip() for ln in KRAV.read_text(encoding="utf-8").splitlines() if len(ln.strip()) > 15]
+    rnd = random.Random(seed)
+    out: list[dict] = []
+    for i in range(n):
+        if out and rnd.random() < dup_rate:
+            text = _mutate(rnd, rnd.choice(out)["text"])
+        else:
+            a, b = rnd.choice(lines), rnd.choice(lines)
+            text = a if rnd.random() < 0.3 else f"{a.rstrip('.')}; {b[0].lower()}{b[1:]}"
+            if rnd.random() < 0.5:
+                text = text.replace("skal", f"skal i sone {rnd.randint(1, 400)}", 1)
+        out.append({
+            "text": text,
+            "short_text": text[:60],
+            "ref": f"spesifikasjon_{rnd.randrange(n_files):02d}.pdf / Side {rnd.randint(1, 300)}",
+            "score": round(rnd.uniform(60, 100), 1),
+            "ns_treff": [],
+        })
+    return out
+
+
+def compare(reqs: list[dict], threshold: int = 93, scope: str = "global") -> dict:
+    exact = deduplicate_requirements(reqs, threshold=threshold, scope=scope, method="exact")
+    blocked = deduplicate_requirements(reqs, threshold=threshold, scope=scope, method="blocking")
+    a = {(r["text"], r["ref"]) for r in exact}
+    b = {(r["text"], r["ref"]) for r in blocked}
+    return {
+        "n": len(reqs),
+        "clusters_exact": len(exact),
+        "clusters_blocking": len(blocked),
+        "identical": json.dumps(exact, sort_keys=True, ensure_ascii=False) == json.dumps(blocked, sort_keys=True, ensure_ascii=False),
+        "cluster_agreement": round(len(a & b) / max(1, len(a | b)), 4),
+    }
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    core.DEDUP_EXACT_MAX = 0  # tving blokkering også for små grupper (per_file)
+    ok = True
+    for seed in (1, 2, 3):
+        for scope in ("global", "per_file"):
+            res = compare(make_requirements(n, seed=seed), scope=scope)
+            print(f"[INFO] seed={seed} scope={scope}: {res}")
+            ok &= res["cluster_agreement"] >= 0.995
+    if not ok:
+        print("[FEIL] Blokkert deduplisering avviker for mye fra eksakt klynging.")
+        return 1
+    print("[OK] Blokkert deduplisering innenfor toleranse.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for LibreOffice-poolen (.doc → .docx): lager N .doc-filer fra data/krav.txt og
+konverterer dem én og én med ett soffice-kall per fil (som før) og via ConversionPool.
+Teksten i .docx-resultatene skal være identisk; rapporterer gjennomstrømning og pool-tellere.
+En ødelagt .doc-fil tas med for å sjekke at feil isoleres uten å stoppe resten.
+Med en falsk soffice (kopierer filen, "heng" i navnet henger) sjekkes først at convert() venter
+høyst tidsavbruddet per fil ganget med 1 + runder foran i køen, og at discard() avbryter
+kø-jobber og sletter resultater som ikke ble hentet.
+Bruk:
+  python -m app.test.doc_pool_smoketest [antall_filer] [plasser]
+Krever LibreOffice (soffice, eller KS_SOFFICE_BIN) for sammenligningen. Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+from pathlib import Path
+
+from docx import Document
+
+from app.tasks import doc_convert
+from app.tasks.doc_convert import ConversionPool
+from app.tasks.parsing import _extract_text_from_docx_bytes
+from app.test.common import check as _check
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+
+
+def _make_docs(src_dir: Path, n: int) -> list[Path]:
+    lines = [ln for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    rnd = random.Random(4)
+    for i in range(n):
+        doc = Document()
+        for ln in rnd.sample(lines, min(20, len(lines))):
+            doc.add_paragraph(ln)
+        doc.save(str(src_dir / f"beskrivelse_{i:03d}.docx"))
+    inputs = sorted(str(p) for p in src_dir.glob("*.docx"))
+    subprocess.run([doc_convert.SOFFICE_BIN, "--headless", "--convert-to", "doc", "--outdir", str(src_dir), *inputs],
+                   capture_output=True, timeout=600, check=True)
+    return sorted(src_dir.glob("*.doc"))
+
+
+def _convert_single(src: Path, out_dir: Path) -> Path | None:
+    res = subprocess.run([doc_convert.SOFFICE_BIN, "--headless", "--convert-to", "docx", "--outdir", str(out_dir),
+                          str(src)], capture_output=True, text=True, timeout=120)
+    out = out_dir / (src.stem + ".docx")
+    return out if res.returncode == 0 and out.exists() else None
+
+
+_FAKE_SOFFICE = """#!{python}
+import os, shutil, sys, time
+args = sys.argv[1:]
+i = args.index("--outdir")
+for f in args[i + 2:]:
+    time.sleep(60 if "heng" in f else 0.2)
+    shutil.copy(f, os.path.join(args[i + 1], os.path.splitext(os.path.basename(f))[0] + ".docx"))
+"""
+
+
+def _fake_checks(tmp: Path) -> bool:
+    fake = tmp / "soffice"
+    fake.write_text(_FAKE_SOFFICE.format(python=sys.executable), encoding="utf-8")
+    fake.chmod(0o755)
+    src = tmp / "fake_src"
+    src.mkdir()
+
+    def docs(*names):
+        out = []
+        for name in names:
+            (src / f"{name}.doc").write_bytes(b"doc")
+            out.append(src / f"{name}.doc")
+        return out
+
+    ok = True
+    # Ventetid: 1 + uferdige jobber foran, fordelt på plassene
+    pool = ConversionPool(size=2, timeout=1.0, batch_max=1, soffice=str(fake), profile_root=tmp / "p1")
+    try:
+        hung = docs("heng_a", "heng_b", "heng_c", "heng_d", "heng_e")
+        pool.prefetch(hung)
+        waits = [pool._wait_timeout(pool._submit(p.resolve())) for p in hung]
+        ok &= _check(waits == [1.0, 2.0, 2.0, 3.0, 3.0], f"ventetid per kø-plass: {waits}")
+    finally:
+        pool.shutdown(wait=False)
+
+    # Hengende fil i en stor batch: convert() gir opp etter sitt eget tidsavbrudd, ikke hele batchens
+    pool = ConversionPool(size=1, timeout=1.0, batch_max=4, soffice=str(fake), profile_root=tmp / "p2")
+    try:
+        batch = docs("heng_x", "b", "c", "d")
+        pool.prefetch(batch)
+        t0 = time.perf_counter()
+        res = pool.convert(batch[0], tmp / "ut")
+        elapsed = time.perf_counter() - t0
+        ok &= _check(res is None and elapsed < 2.0, f"hengende fil: convert() ga opp etter {elapsed:.1f}s")
+    finally:
+        pool.shutdown(wait=False)
+
+    # discard(): ferdige resultater slettes, kø-jobber avbrytes
+    pool = ConversionPool(size=1, timeout=5.0, batch_max=1, soffice=str(fake), profile_root=tmp / "p3")
+    try:
+        files = docs("e", "f", "g", "h")
+        futs = [pool.submit(p) for p in files]
+        wait(futs[:1], timeout=10)
+        n = pool.discard(files)
+        deadline = time.time() + 10
+        while time.time() < deadline and (pool._procs or not pool._queue.empty()):
+            time.sleep(0.05)
+        time.sleep(0.3)
+        left = list(pool.root.rglob("*.docx"))
+        cancelled = sum(f.cancelled() for f in futs)
+        ok &= _check(n == 4 and not left and cancelled >= 2 and pool.stats()["discarded"] == 4,
+                     f"discard: {n} forkastet, {cancelled} avbrutt i kø, {len(left)} resultater igjen")
+    finally:
+        pool.shutdown(wait=False)
+    return ok
+
+
+def _text(p: Path | None) -> str | None:
+    return _extract_text_from_docx_bytes(p.read_bytes()) if p else None
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    slots = int(sys.argv[2]) if len(sys.argv) > 2 else doc_convert.DOC_POOL_SIZE
+    with tempfile.TemporaryDirectory(prefix="ks_docpool_fake_") as tmp:
+        if not _fake_checks(Path(tmp)):
+            print("[FEIL] Ventetid/forkasting i konverteringspoolen avviker.")
+            return 1
+    if shutil.which(doc_convert.SOFFICE_BIN) is None:
+        print(f"[FEIL] Fant ikke '{doc_convert.SOFFICE_BIN}' (LibreOffice) – kan ikke kjøre testen.")
+        return 2
+    with tempfile.TemporaryDirectory(prefix="ks_docpool_") as tmp:
+        tmp = Path(tmp)
+        src = tmp / "src"
+        src.mkdir()
+        docs = _make_docs(src, n)
+        broken = src / "odelagt.doc"
+        broken.write_bytes(b"\xd0\xcf\x11\xe0" + bytes(random.Random(1).getrandbits(8) for _ in range(4096)))
+
+        t0 = time.perf_counter()
+        ref = [_text(_convert_single(p, tmp / "ref")) for p in docs]
+        t_single = time.perf_counter() - t0
+
+        pool = ConversionPool(size=slots, profile_root=tmp / "profiles")
+        try:
+            t0 = time.perf_counter()
+            pool.prefetch([broken, *docs])
+            new = [_text(pool.convert(p, tmp / "pool")) for p in docs]
+            pool.convert(broken, tmp / "pool")
+            t_pool = time.perf_counter() - t0
+            stats = pool.stats()
+        finally:
+            pool.shutdown()
+
+    print(f"[INFO] {n} .doc-filer + 1 ødelagt, {slots} plass(er)")
+    print(f"[INFO] soffice per fil: {t_single:.1f}s ({60 * n / max(t_single, 1e-9):.0f} filer/min) | "
+          f"pool: {t_pool:.1f}s ({60 * n / max(t_pool, 1e-9):.0f} filer/min, {t_single / max(t_pool, 1e-9):.1f}x)")
+    print(f"[INFO] Pool: {stats}")
+    if any(t is None for t in ref):
+        print("[FEIL] Referansekonvertering feilet for minst én fil.")
+        return 1
+    if new != ref:
+        bad = [p.name for p, a, b in zip(docs, ref, new) if a != b]
+        print(f"[FEIL] Poolen ga annen tekst enn soffice per fil: {', '.join(bad)}")
+        return 1
+    print("[OK] Pool-konvertering identisk med soffice per fil.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for tekstuttrekk i dokumentsammenligning (app.services.doc_text).
+- PDF-ene i data/ (NS-standarder) + en generert DOCX og XLSX
+- Sammenligner med tidligere uttrekk (extract_lines_backup + extract_lines_pdf_words, to
+  gjennomganger og punktum/komma-varianter lagret som linjer):
+  * linjene med varianter (punct_variants) skal gi nøyaktig den gamle backup-listen
+  * søkelinjene med varianter skal dekke nøyaktig samme mengde som merged_lines_for_search
+- Rapporterer tid og minne (tracemalloc-topp for linjelistene) gammel vs ny
+Bruk:
+  python -m app.test.doc_text_smoketest [pdf ...]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import fitz
+from docx import Document
+from openpyxl import Workbook, load_workbook
+
+from app.services.doc_text import extract_document, punct_variants
+
+APP_DIR = Path(__file__).resolve().parent.parent
+DATA = APP_DIR / "data"
+
+
+def _with_variants(lines):
+    out = []
+    for line in lines:
+        s = (line or "").strip()
+        if s:
+            out.extend(punct_variants(s))
+    return out
+
+
+def old_backup(path: str) -> list[str]:
+    """Tidligere extract_lines_backup (egen gjennomgang + varianter som linjer)."""
+    ext = Path(path).suffix.lower()
+    raw: list[str] = []
+    if ext == '.pdf':
+        doc = fitz.open(path)
+        raw = sum([page.get_text().splitlines() for page in doc], [])
+    elif ext == '.docx':
+        raw = [p.text for p in Document(path).paragraphs]
+    elif ext in ('.xlsx', '.xls'):
+        wb = load_workbook(path, read_only=True, data_only=True)
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                raw.append(' '.join(str(c) for c in row if c is not None))
+    return _with_variants(raw)
+
+
+def old_pdf_words(path: str) -> list[str]:
+    """Tidligere extract_lines_pdf_words (andre gjennomgang av PDF-en)."""
+    if Path(path).suffix.lower() != '.pdf':
+        return []
+    lines: list[str] = []
+    for page in fitz.open(path):
+        words = page.get_text("words")
+        if not words:
+            lines.extend(ln for ln in (page.get_text() or "").splitlines() if ln.strip())
+            continue
+        words.sort(key=lambda w: (w[5], w[6], w[7]))
+        curr, buff = None, []
+        for w in words:
+            tok = (w[4] or "").strip()
+            if not tok:
+                continue
+            if (w[5], w[6]) != curr and buff:
+                lines.append(" ".join(buff))
+                buff = []
+            curr = (w[5], w[6])
+            buff.append(tok)
+        if buff:
+            lines.append(" ".join(buff))
+    return _with_variants(lines)
+
+
+def old_merged(path: str) -> list[str]:
+    base, words = old_backup(path), old_pdf_words(path)
+    return list(dict.fromkeys(base + words)) if words else base
+
+
+def _make_office(tmp: Path) -> list[Path]:
+    doc = Document()
+    for i in range(200):
+        doc.add_paragraph(f"360.{i:03d}-RT401 Temperaturgiver, måleområde 0,5–{i}.5 °C")
+        doc.add_paragraph("")
+    docx_path = tmp / "beskrivelse.docx"
+    doc.save(str(docx_path))
+    wb = Workbook()
+    ws = wb.active
+    for i in range(300):
+        ws.append([f"=433.{i:03d}-JV001", f"{i},5", None, "m3/h", 1.25 * i])
+    xlsx_path = tmp / "liste.xlsx"
+    wb.save(str(xlsx_path))
+    return [docx_path, xlsx_path]
+
+
+def _measure(fn, path: str):
+    t0 = time.perf_counter()
+    fn(path)
+    dt = time.perf_counter() - t0
+    tracemalloc.start()
+    res = fn(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return res, dt, peak
+
+
+def main() -> int:
+    pdfs = [Path(p) for p in sys.argv[1:]] or sorted(DATA.glob("*.pdf"))
+    ok = True
+    tot_old = tot_new = mem_old = mem_new = 0.0
+    with tempfile.TemporaryDirectory(prefix="ks_doctext_") as tmp:
+        for path in [*pdfs, *_make_office(Path(tmp))]:
+            p = str(path)
+            (old_b, old_m), t_old, m_old = _measure(lambda x: (old_backup(x), old_merged(x)), p)
+            new, t_new, m_new = _measure(extract_document, p)
+            tot_old, tot_new, mem_old, mem_new = tot_old + t_old, tot_new + t_new, mem_old + m_old, mem_new + m_new
+            same_lines = _with_variants(new.lines) == old_b
+            same_search = set(_with_variants(new.search_lines())) == set(old_m)
+            print(f"[INFO] {path.name}: {len(old_b)} → {len(new.lines)} linjer, søk {len(old_m)} → "
+                  f"{len(new.search_lines())} | {t_old:.2f}s → {t_new:.2f}s | "
+                  f"{m_old / 1e6:.1f} MB → {m_new / 1e6:.1f} MB | linjer {'OK' if same_lines else 'AVVIK'}, "
+                  f"søk {'OK' if same_search else 'AVVIK'}")
+            ok &= same_lines and same_search
+    print(f"[INFO] Totalt: {tot_old:.2f}s → {tot_new:.2f}s ({tot_old / max(tot_new, 1e-9):.1f}x), "
+          f"minne {mem_old / 1e6:.1f} MB → {mem_new / 1e6:.1f} MB ({mem_old / max(mem_new, 1):.1f}x)")
+    if not ok:
+        print("[FEIL] Nytt uttrekk avviker fra tidligere uttrekk.")
+        return 1
+    print("[OK] Uttrekk identisk (med varianter som matching-lag).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest + benchmark for IFC-indeksen (app.services.ifc_index).
+- Syntetisk IFC4-modell (STEP) med elementer, typer, Pset/Qto, geometri-fyll, poster over flere
+  linjer, CRLF, escapes (\\X2\\, '') og semikolon i strenger
+- Paritet: IfcIndex.rows() gir samme rader som tidligere skanning (ifcopenshell-grenen i
+  /api/ifc/scan) med get_psets() fra modellens fasit: type-Pset først, forekomsten overstyrer
+- Fasiten sjekkes mot ekte ifcopenshell.util.element.get_psets() på en liten modell
+  (hoppes over når ifcopenshell ikke er installert)
+- Systemkriterier og TFM-filter som før; format uten treff gir tom liste
+- Fremdrift: begge faser rapporteres, stigende og til totalen
+- Minne: topp (tracemalloc) under bygging vokser ikke med filstørrelsen
+- Gjentatt skanning og eksport leser lagrede treff: tid mot første bygging
+- spool_ifc() gir samme SHA-256 som hashlib; open_index() finner indeksen igjen
+Bruk:
+  python -m app.test.ifc_index_smoketest [antall_elementer]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import hashlib
+import io
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from pathlib import Path
+
+from app.services import ifc_index
+from app.services.tag_engine import LOOSE, compile_format
+from app.test.common import check as _check
+
+KODER = ["RT", "JV", "SB", "JP", "QT", "RP", "LX", "KA"]
+CLASSES = ["IFCFLOWTERMINAL", "IFCAIRTERMINAL", "IFCDUCTSEGMENT", "IFCVALVE", "IFCPUMP", "IFCSENSOR",
+           "IFCBUILDINGELEMENTPROXY", "IFCSLAB"]
+TYPE_CLASSES = {"IFCAIRTERMINAL": "IFCAIRTERMINALTYPE", "IFCVALVE": "IFCVALVETYPE", "IFCPUMP": "IFCPUMPTYPE"}
+
+
+# ── Syntetisk modell ──────────────────────────────────────────────────────────────────────
+def _s(text: str) -> str:
+    """Python-streng → STEP-streng ('' for ', \\X2\\ for ikke-ASCII)."""
+    out = []
+    for ch in text.replace("'", "''"):
+        out.append(ch if ord(ch) < 128 else f"\\X2\\{ord(ch):04X}\\X0\\")
+    return "'" + "".join(out) + "'"
+
+
+def _r(value: float) -> str:
+    text = repr(float(value)).upper()
+    return text if "." in text else text.replace("E", ".E")
+
+
+class Model:
+    """Skriver STEP-poster og holder fasit (elementer, typer, Pset) for get_psets()."""
+
+    def __init__(self, rnd: random.Random):
+        self.rnd = rnd
+        self.next_id = 100
+        self.lines: list = []
+        self.pset_values: dict = {}    # pset-id → (navn, {egenskap: verdi})
+        self.elements: list = []       # dict per element
+        self.types: dict = {}          # type-id → dict
+        self.rels: list = []           # (rel-id, pset-id, [element-id]) skrives til slutt
+
+    def add(self, body: str) -> int:
+        eid = self.next_id
+        self.next_id += self.rnd.randint(1, 3)
+        self.lines.append(f"#{eid}={body};")
+        return eid
+
+    def geometry(self, n: int) -> None:
+        for _ in range(n):
+            pts = ",".join(f"({_r(self.rnd.uniform(-99, 99))},{_r(self.rnd.uniform(-99, 99))},0.)" for _ in range(12))
+            self.add(f"IFCCARTESIANPOINTLIST3D(({pts}),$)")
+
+    def prop(self, name: str, value):
+        """Egenskap; gir (id, python-verdi som get_psets())."""
+        if isinstance(value, bool):
+            return self.add(f"IFCPROPERTYSINGLEVALUE({_s(name)},$,IFCBOOLEAN(.{'T' if value else 'F'}.),$)"), value
+        if isinstance(value, float):
+            return self.add(f"IFCPROPERTYSINGLEVALUE({_s(name)},$,IFCREAL({_r(value)}),$)"), value
+        if isinstance(value, int):
+            return self.add(f"IFCPROPERTYSINGLEVALUE({_s(name)},$,IFCINTEGER({value}),$)"), value
+        if isinstance(value, list):
+            items = ",".join(f"IFCLABEL({_s(v)})" for v in value)
+            return self.add(f"IFCPROPERTYENUMERATEDVALUE({_s(name)},$,({items}),$)"), value
+        if value is None:
+            return self.add(f"IFCPROPERTYSINGLEVALUE({_s(name)},$,$,$)"), None
+        return self.add(f"IFCPROPERTYSINGLEVALUE({_s(name)},$,IFCLABEL({_s(value)}),$)"), value
+
+    def pset(self, name: str, props: dict) -> int:
+        ids, values = [], {}
+        for key, value in props.items():
+            pid, pv = self.prop(key, value)
+            ids.append(pid)
+            values[key] = pv
+        refs = ",".join(f"#{i}" for i in ids)
+        if name.startswith("Qto_"):
+            pset_id = self.add(f"IFCELEMENTQUANTITY('{self.guid()}',$,{_s(name)},$,$,({refs}))")
+        else:
+            pset_id = self.add(f"IFCPROPERTYSET('{self.guid()}',$,{_s(name)},$,({refs}))")
+        self.pset_values[pset_id] = (name, values)
+        return pset_id
+
+    def qto(self, name: str, length: float, count: int) -> int:
+        q1 = self.add(f"IFCQUANTITYLENGTH('Length',$,$,{_r(length)},$)")
+        q2 = self.add(f"IFCQUANTITYCOUNT('Antall',$,$,{count}.,$)")
+        pset_id = self.add(f"IFCELEMENTQUANTITY('{self.guid()}',$,{_s(name)},$,$,(#{q1},#{q2}))")
+        self.pset_values[pset_id] = (name, {"Length": length, "Antall": float(count)})
+        return pset_id
+
+    def guid(self) -> str:
+        return "".join(self.rnd.choice("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_$")
+                       for _ in range(22))
+
+    def tag(self) -> str:
+        kode = self.rnd.choice(KODER)
+        return f"={self.rnd.randint(300, 579)}.{self.rnd.randint(1, 999):03d}-{kode}{self.rnd.randint(1, 999):03d}"
+
+    def type_object(self, cls: str) -> int:
+        shared = self.pset("Pset_Felles", {"Produsent": self.rnd.choice(["Systemair", "Danfoss", "Grundfos"]),
+                                           "Merket": True, "Effekt": self.rnd.uniform(1, 50)})
+        name = f"Type {self.rnd.randint(1, 99)}; rev 'B'"
+        predefined = self.rnd.choice(["USERDEFINED", "NOTDEFINED", "DIFFUSER"])
+        tid = self.add(f"{TYPE_CLASSES[cls]}('{self.guid()}',$,{_s(name)},$,$,(#{shared}),$,$,$,.{predefined}.)")
+        self.types[tid] = {"name": name, "predefined": predefined, "psets": [shared]}
+        return tid
+
+    def element(self, cls: str, type_id, shared_pset) -> int:
+        r = self.rnd.random()
+        tag = self.tag()
+        name = f"Ventil – {tag}" if r < 0.2 else f"Element æøå {self.rnd.randint(1, 9999)}"
+        props = {"Komponent": tag if r >= 0.2 else "", "Kommentar": "a;b) 'c'" if r < 0.05 else "ok",
+                 "Nivå": self.rnd.randint(1, 9), "Tilstand": ["NY", "BRUKT"] if r < 0.3 else "NY",
+                 "Tom": None, "Aktiv": r < 0.5}
+        if r > 0.9:
+            props = {"Kommentar": "uten tagg"}
+        own = self.pset("Pset_Komponent", props)
+        qto = self.qto("Qto_Mengder", self.rnd.uniform(0.1, 20), self.rnd.randint(1, 5))
+        # Forekomsten overstyrer Produsent fra typen
+        override = self.pset("Pset_Felles", {"Produsent": "Lokal"}) if type_id and r < 0.4 else None
+        object_type = tag if 0.2 <= r < 0.25 else "Standard"
+        predefined = ",.USERDEFINED." if cls == "IFCSLAB" else ""
+        eid = self.add(f"{cls}('{self.guid()}',$,\n  {_s(name)},$,{_s(object_type)},$,$,{_s('T-' + str(r)[2:6])}"
+                       f"{predefined})")
+        psets = [own, qto] + ([override] if override else [])
+        self.elements.append({"id": eid, "cls": cls, "name": name, "object_type": object_type,
+                              "tag": "T-" + str(r)[2:6], "predefined": "USERDEFINED" if predefined else None,
+                              "type": type_id, "psets": psets, "shared": shared_pset})
+        return eid
+
+    def write(self, path: Path, crlf: bool) -> None:
+        eol = "\r\n" if crlf else "\n"
+        with open(path, "w", encoding="ascii", newline="") as f:
+            f.write("ISO-10303-21;" + eol + "HEADER;" + eol + "FILE_DESCRIPTION(('ViewDefinition'),'2;1');" + eol)
+            f.write("FILE_SCHEMA(('IFC4'));" + eol + "ENDSEC;" + eol + "DATA;" + eol)
+            for line in self.lines:
+                f.write(line.replace("\n", eol) + eol)
+            f.write("ENDSEC;" + eol + "END-ISO-10303-21;" + eol)
+
+
+def build_model(n: int, seed: int) -> Model:
+    rnd = random.Random(seed)
+    m = Model(rnd)
+    # Relasjoner før elementene (fremoverreferanser), som mange eksportører skriver
+    shared = m.pset("Pset_Prosjekt", {"Prosjekt": "Bench", "Fase": "Detalj"})
+    types = {cls: [m.type_object(cls) for _ in range(5)] for cls in TYPE_CLASSES}
+    shared_members = []
+    for i in range(n):
+        cls = rnd.choice(CLASSES)
+        type_id = rnd.choice(types[cls]) if cls in types and rnd.random() < 0.8 else None
+        eid = m.element(cls, type_id, shared if i % 3 == 0 else None)
+        m.rels.append((m.add(f"IFCRELDEFINESBYPROPERTIES('{m.guid()}',$,$,$,(#{eid}),"
+                             f"#{m.elements[-1]['psets'][0]})"), m.elements[-1]["psets"][0], [eid]))
+        for pset_id in m.elements[-1]["psets"][1:]:
+            m.add(f"IFCRELDEFINESBYPROPERTIES('{m.guid()}',$,$,$,(#{eid}),#{pset_id})")
+        if type_id:
+            m.add(f"IFCRELDEFINESBYTYPE('{m.guid()}',$,$,$,(#{eid}),#{type_id})")
+        if i % 3 == 0:
+            shared_members.append(eid)
+        if i % 4 == 0:
+            m.geometry(3)
+    refs = ",".join(f"#{e}" for e in shared_members)
+    m.add(f"IFCRELDEFINESBYPROPERTIES('{m.guid()}',$,$,$,({refs}),#{shared})")
+    return m
+
+
+# ── Tidligere skanning (ifcopenshell-grenen i /api/ifc/scan) ─────────────────────────────
+class FakeType:
+    def __init__(self, info):
+        self.Name = info["name"]
+        self.PredefinedType = info["predefined"]
+
+
+class FakeRel:
+    def __init__(self, t):
+        self.RelatingType = t
+
+
+class FakeElem:
+    def __init__(self, e, m: Model):
+        self.cls = "Ifc" + {"IFCFLOWTERMINAL": "FlowTerminal", "IFCAIRTERMINAL": "AirTerminal",
+                            "IFCDUCTSEGMENT": "DuctSegment", "IFCVALVE": "Valve", "IFCPUMP": "Pump",
+                            "IFCSENSOR": "Sensor", "IFCBUILDINGELEMENTPROXY": "BuildingElementProxy",
+                            "IFCSLAB": "Slab"}[e["cls"]]
+        self.Name, self.Tag, self.ObjectType = e["name"], e["tag"], e["object_type"]
+        self.GlobalId = None
+        self.PredefinedType = e["predefined"]
+        self.IsTypedBy = [FakeRel(FakeType(m.types[e["type"]]))] if e["type"] else []
+
+    def is_a(self):
+        return self.cls
+
+
+def fake_get_psets(e, m: Model) -> dict:
+    psets: dict = {}
+    ids = list(m.types[e["type"]]["psets"]) if e["type"] else []
+    for pset_id in ids:
+        name, values = m.pset_values[pset_id]
+        psets[name] = {**values, "id": pset_id}
+    # IsDefinedBy i relasjonsrekkefølge; den felles Pset-relasjonen skrives sist
+    for pset_id in e["psets"] + ([e["shared"]] if e["shared"] else []):
+        name, values = m.pset_values[pset_id]
+        psets.setdefault(name, {}).update({**values, "id": pset_id})
+    return psets
+
+
+def build_candidate_strings(elem, psets_dict: dict) -> list:
+    cands = []
+    for attr in ("Name", "Tag", "ObjectType", "GlobalId", "PredefinedType"):
+        val = getattr(elem, attr, None)
+        if val:
+            cands.append(str(val))
+    for rel in elem.IsTypedBy:
+        t = rel.RelatingType
+        if t and getattr(t, "Name", None):
+            cands.append(str(t.Name))
+        if t and getattr(t, "PredefinedType", None):
+            cands.append(str(t.PredefinedType))
+    for pset_name, props in (psets_dict or {}).items():
+        cands.append(pset_name)
+        for k, v in props.items():
+            if v is None:
+                continue
+            cands.append(f"{k}={v}")
+    return [s for s in cands if isinstance(s, str) and s]
+
+
+def old_scan(m: Model, guids: dict, fmt: str, system_kriterier: list, tfm_settings: dict) -> list:
+    pattern = compile_format(fmt, LOOSE)
+    treff = []
+    for e in m.elements:
+        elem = FakeElem(e, m)
+        elem.GlobalId = guids[e["id"]]
+        psets = fake_get_psets(e, m)
+        candidates = build_candidate_strings(elem, psets)
+        if "{system}" in fmt and not any("=" in c for c in candidates):
+            continue
+        matched_value, tag = None, None
+        for c in candidates:
+            tag = pattern.search(str(c))
+            if tag:
+                matched_value = tag.full
+                break
+        if not matched_value:
+            continue
+        if pattern.has_system and system_kriterier and tag.system:
+            if tag.system[1:3] not in system_kriterier:
+                continue
+        if not ifc_index.tfm_active(tag.komponent, tfm_settings):
+            continue
+        row = OrderedDict()
+        row["Komponent-ID"] = matched_value
+        row["IFC Class"] = elem.is_a()
+        row["Name"] = elem.Name
+        row["Tag"] = elem.Tag
+        row["ObjectType"] = elem.ObjectType
+        row["GlobalId"] = elem.GlobalId
+        if elem.IsTypedBy:
+            t = elem.IsTypedBy[0].RelatingType
+            row["Type.Name"] = t.Name
+            row["Type.PredefinedType"] = t.PredefinedType
+        for pset_name, props in psets.items():
+            for k, v in props.items():
+                if v is not None:
+                    row[f"Pset:{pset_name}.{k}"] = str(v)
+        treff.append(row)
+    return treff
+
+
+def _guids(path: Path) -> dict:
+    """GlobalId per element-id (generatoren skriver dem tilfeldig)."""
+    out = {}
+    for eid, name, raw in ifc_index.iter_records(path, lambda n: n in ifc_index._ELEMENT_CLASSES):
+        out[eid] = ifc_index.parse_args(raw)[0]
+    return out
+
+
+# ── Hjelpere ──────────────────────────────────────────────────────────────────────────────
+def _real_psets_check(tmp: Path) -> bool:
+    """fake_get_psets() mot ifcopenshell.util.element.get_psets() på samme modell."""
+    try:
+        import ifcopenshell
+        from ifcopenshell.util.element import get_psets
+    except Exception as e:
+        print(f"[INFO] ifcopenshell ikke tilgjengelig ({e}) – hopper over sjekk mot ekte get_psets()")
+        return True
+    model = build_model(300, 7)
+    path = tmp / "ekte_psets.ifc"
+    model.write(path, crlf=False)
+    ifc = ifcopenshell.open(str(path))
+    bad = [e["id"] for e in model.elements if get_psets(ifc.by_id(e["id"])) != fake_get_psets(e, model)]
+    if bad:
+        print(f"[INFO] #{bad[0]}: ekte {get_psets(ifc.by_id(bad[0]))}")
+    return _check(not bad, f"fasit som ekte get_psets(): {len(model.elements) - len(bad)}/{len(model.elements)} elementer")
+
+
+def _build(path: Path, progress=None, trace: bool = False):
+    sha = hashlib.sha256(path.read_bytes()).hexdigest()
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    index = ifc_index.build_index(path, sha, progress, source_name=path.name)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    tracemalloc.stop()
+    return index, elapsed, peak
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="ifc_index_") as tmp:
+        tmp = Path(tmp)
+        ifc_index.IFC_INDEX_DIR = tmp / "index"
+        ifc_index.IFC_READ_BYTES = 256 * 1024
+        ifc_index.IFC_INDEX_BATCH = 1000
+        ifc_index.IFC_PSET_CACHE = 2000
+
+        # Enhetsnivå: tolking av argumenter
+        args = ifc_index.parse_args(b"'a''b;c',#12,.T.,IFCLABEL('\\X2\\00E6\\X0\\'),(1,2.5,-3.E2),$,*")
+        ok &= _check(args == ["a'b;c", 12, "T", ("IFCLABEL", "æ"), [1, 2.5, -300.0], None, None],
+                     f"parse_args: {args}")
+
+        ok &= _real_psets_check(tmp)
+
+        model = build_model(n, 1)
+        path = tmp / "modell.ifc"
+        model.write(path, crlf=False)
+        crlf_path = tmp / "modell_crlf.ifc"
+        model.write(crlf_path, crlf=True)
+        size_mb = path.stat().st_size / 1e6
+        print(f"[INFO] {n} elementer, {size_mb:.1f} MB STEP")
+
+        events = []
+        index, t_build, _ = _build(path, lambda phase, done, total: events.append((phase, done, total)))
+        phases = [e[0] for e in events]
+        ok &= _check(phases and phases[0] == "les" and phases[-1] == "psett" and sorted(set(phases)) == ["les", "psett"]
+                     and phases == sorted(phases, key=["les", "psett"].index), "fremdrift: les → psett")
+        for phase in ("les", "psett"):
+            seq = [(d, t) for p, d, t in events if p == phase]
+            ok &= _check(all(a[0] <= b[0] for a, b in zip(seq, seq[1:])) and seq[-1][0] == seq[-1][1],
+                         f"fremdrift {phase}: {len(seq)} meldinger, stigende til {seq[-1][1]}")
+        ok &= _check(int(index.meta()["elements"]) == n and index.meta()["schema"] == "IFC4",
+                     f"meta: {index.meta()['elements']} elementer, {index.meta()['schema']}")
+
+        guids = _guids(path)
+        tfm = {"KA": False}
+        cases = [("{system}{komponent}", [], {}), ("{system}{komponent}", ["36", "40", "41", "42"], {}),
+                 ("{komponent}", [], tfm), ("{byggnr}{system}{komponent}{typekode}", [], {}), ("{typekode}", [], {})]
+        pattern_cache = {}
+        for fmt, kriterier, settings in cases:
+            pattern = pattern_cache.setdefault(fmt, compile_format(fmt, LOOSE))
+            new = index.rows(fmt, pattern, kriterier, settings)
+            old = old_scan(model, guids, fmt, kriterier, settings)
+            same = [dict(r) for r in new] == [dict(r) for r in old] and all(list(a) == list(b) for a, b in zip(new, old))
+            if not same and old and new:
+                diff = next(((a, b) for a, b in zip(new, old) if a != b), None)
+                print(f"[INFO] første avvik: {diff}")
+            ok &= _check(same, f"paritet {fmt} kriterier={kriterier} tfm={settings}: {len(new)} rader")
+
+        crlf_index, _, _ = _build(crlf_path)
+        fmt = "{system}{komponent}"
+        ok &= _check(crlf_index.rows(fmt, compile_format(fmt, LOOSE)) == index.rows(fmt, compile_format(fmt, LOOSE)),
+                     "CRLF-fil gir samme rader")
+
+        # Gjentatt skanning / eksport fra indeksen
+        pattern = compile_format(fmt, LOOSE)
+        reopened = ifc_index.open_index(index.sha)
+        ok &= _check(reopened is not None and reopened.path == index.path, "open_index finner indeksen")
+        ok &= _check(ifc_index.open_index("0" * 64) is None and ifc_index.open_index("../x") is None,
+                     "ukjent/ugyldig modell gir None")
+        t0 = time.perf_counter()
+        rows = reopened.rows(fmt, pattern, ["36"])
+        t_repeat = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        old_scan(model, guids, fmt, ["36"], {})
+        t_old = time.perf_counter() - t0
+        print(f"[INFO] bygging {t_build:.2f} s, gjentatt skanning {t_repeat * 1e3:.0f} ms "
+              f"({len(rows)} rader; tidligere løkke over ferdig modell {t_old * 1e3:.0f} ms)")
+        ok &= _check(t_repeat < t_build / 3, "gjentatt skanning leser lagrede treff")
+
+        # Minne (tracemalloc gjør byggingen tregere, så mindre modeller): dobbel modell, samme topp
+        peaks = []
+        for k, count in enumerate((max(n // 8, 500), max(n // 4, 1000))):
+            mem_path = tmp / f"minne_{k}.ifc"
+            build_model(count, 10 + k).write(mem_path, crlf=False)
+            peaks.append((mem_path.stat().st_size, _build(mem_path, trace=True)[2]))
+        print(f"[INFO] bygging {size_mb / t_build:.1f} MB/s; minnetopp "
+              + " / ".join(f"{peak / 1e6:.1f} MB ({size / 1e6:.1f} MB fil)" for size, peak in peaks))
+        ok &= _check(peaks[1][1] < peaks[0][1] * 1.5 and peaks[1][1] < 16e6, "minnetopp uavhengig av filstørrelsen")
+
+        # Mellomlagring med hash
+        data = path.read_bytes()
+        spool = tmp / "spool"
+        spool.mkdir()
+        spooled, sha = ifc_index.spool_ifc(io.BytesIO(data), spool)
+        ok &= _check(sha == hashlib.sha256(data).hexdigest() and spooled.read_bytes() == data,
+                     "spool_ifc: samme innhold og SHA-256")
+
+        # Opprydding: grense under én indeks fjerner de eldste
+        ifc_index.IFC_INDEX_MAX_MB = index.path.stat().st_size * 1.5 / 1024 / 1024
+        removed = ifc_index.evict(keep=index.path)
+        left = list(ifc_index.IFC_INDEX_DIR.glob("*/*.sqlite"))
+        ok &= _check(removed >= 1 and index.path in left, f"evict: {removed} fjernet, aktiv indeks beholdt")
+
+    if not ok:
+        print("[FEIL] IFC-indeksen avviker.")
+        return 1
+    print("[OK] IFC-indeks fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
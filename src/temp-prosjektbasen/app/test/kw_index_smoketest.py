@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Paritetstest for nøkkelord-indeksen på kravsetningene i data/krav.txt, pluss treffrate/latens.
+- nokkelord.json (kort liste): full skanning direkte, identisk med token_set_ratio-skanning
+- Syntetisk stor liste (N nøkkelord fra ordforrådet i krav.txt): kun kandidatscoring er raskere
+  enn full skanning; avvik rapporteres; standardoppsettet (med kontrollskann) er innenfor
+  KW_INDEX_TOLERANCE og raskere enn direkte rapidfuzz-skanning av hele listen
+Bruk:
+  python -m app.test.kw_index_smoketest [antall_nokkelord]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from app.tasks.kw_index import KeywordIndex, get_keyword_index, KW_INDEX_TOLERANCE
+from app.test.common import check as _check
+
+APP_DIR = Path(__file__).resolve().parent.parent
+NOKKELORD = APP_DIR / "data" / "nokkelord.json"
+KRAV = APP_DIR / "data" / "krav.txt"
+
+
+def _per_sentence(fn, samples) -> float:
+    t0 = time.perf_counter()
+    for s in samples:
+        fn(s)
+    return 1000 * (time.perf_counter() - t0) / max(1, len(samples))
+
+
+def synthetic_keywords(samples, n: int, seed: int = 3):
+    rnd = random.Random(seed)
+    vocab = sorted({w.strip(".,;:()«»\"").lower() for s in samples for w in s.split()} - {""})
+    out = set()
+    while len(out) < n:
+        # Flerords-termer med bøyningsvarianter, så de fleste setninger går via fuzzy-scoring
+        words = [w if rnd.random() < 0.5 else (w[:-1] if len(w) > 4 and rnd.random() < 0.5 else w + "ene")
+                 for w in rnd.sample(vocab, rnd.choice([2, 2, 3]))]
+        out.add(" ".join(words))
+    return sorted(out)
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    ok = True
+    data = json.loads(NOKKELORD.read_text(encoding="utf-8"))
+    groups = [fs for samling in data.values() for fs in samling.keys()]
+    kw_all, idx = get_keyword_index(NOKKELORD, groups)
+    samples = [ln.strip() for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+
+    # Kort liste: full skanning direkte
+    t_full = _per_sentence(idx.score_full, samples)
+    res = idx.parity_check(samples, tolerance=0)
+    st = idx.stats()
+    print(f"[INFO] {len(kw_all)} nøkkelord ({st['mode']}), {len(samples)} setninger: "
+          f"{st['avg_latency_ms']} ms/setning, referanse {t_full:.3f} ms/setning")
+    ok &= _check(res["ok"], f"nokkelord.json identisk med full skanning: {res}")
+
+    # Stor liste: indeks
+    big = synthetic_keywords(samples, n)
+    fast = KeywordIndex(big, verify=False)
+    exact = KeywordIndex(big)
+    direct = KeywordIndex(big, min_keywords=len(big) + 1)
+    t_full = _per_sentence(fast.score_full, samples)
+    t_fast = _per_sentence(fast.score, samples)
+    t_exact = _per_sentence(exact.score, samples)
+    t_direct = _per_sentence(direct.score, samples)
+    diffs = [abs(fast.score(s)[0] - fast.score_full(s)[0]) for s in samples]
+    same = sum(d == 0 for d in diffs) / len(diffs)
+    st = fast.stats()
+    print(f"[INFO] {len(big)} nøkkelord: full {t_full:.3f} ms, indeks {t_fast:.3f} ms "
+          f"(kandidater={st['avg_candidates']}, treffrate={st['hit_rate']}), indeks+kontroll {t_exact:.3f} ms "
+          f"(scoret={exact.stats()['avg_candidates']}), direkte rapidfuzz {t_direct:.3f} ms/setning")
+    print(f"[INFO] kun kandidater: {same:.1%} identisk score, maks avvik {max(diffs):.1f}, "
+          f"snitt {sum(diffs) / len(diffs):.2f} poeng")
+    ok &= _check(t_fast < t_full / 2, "kandidatscoring raskere enn full skanning")
+    res = exact.parity_check(samples, tolerance=KW_INDEX_TOLERANCE)
+    ok &= _check(res["ok"], f"standardoppsett (med kontrollskann) innenfor toleranse: {res}")
+    ok &= _check(t_exact < t_direct, "standardoppsett raskere enn direkte rapidfuzz-skanning")
+
+    # Få kandidater: kandidatscoringen bommer, kontrollskannen skal likevel holde toleransen
+    narrow = KeywordIndex(big, max_candidates=2).parity_check(samples, tolerance=KW_INDEX_TOLERANCE)
+    narrow_fast = KeywordIndex(big, max_candidates=2, verify=False).parity_check(samples, tolerance=KW_INDEX_TOLERANCE)
+    print(f"[INFO] 2 kandidater: uten kontrollskann {narrow_fast}")
+    ok &= _check(narrow["ok"] and not narrow_fast["ok"], f"2 kandidater med kontrollskann innenfor toleranse: {narrow}")
+
+    if not ok:
+        print("[FEIL] Nøkkelord-indeksen avviker.")
+        return 1
+    print("[OK] Nøkkelord-indeks fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
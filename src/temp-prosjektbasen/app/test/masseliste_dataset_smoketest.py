@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest + benchmark for masseliste-datasettet (app.services.masseliste_dataset).
+- Paritet: kolonner og rader er identiske med tidligere /api/parse-masseliste
+  (pandas.read_excel(dtype=str).fillna("")), også med tall/datoer/bool, tomme og dupliserte
+  kolonnenavn, feilceller, tomme rader i midten og tomme rader/kolonner til slutt
+- Sider, fritekstsøk, filter per kolonne og sortering (tekst og tall) stemmer med en
+  referanse i Python over pandas-radene; ukjent kolonne avvises med ValueError
+- write_xlsx() skriver hele utvalget; samme fil lastet opp igjen gjenbruker datasettet
+- Tid, minnetopp (tracemalloc) og svarstørrelse: tidligere hele arket som JSON vs første side
+Bruk:
+  python -m app.test.masseliste_dataset_smoketest [antall_rader]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, time as dtime
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from app.services import masseliste_dataset as mds
+from app.test.common import check as _check
+
+_ASCII_LOWER = {c: c + 32 for c in range(ord("A"), ord("Z") + 1)}
+KODER = ["RTA", "JVB", "SBC", "JPA", "QTB", "LXA", "KAØ"]
+
+
+def write_mixed(path: Path) -> None:
+    wb = Workbook()
+    ws = wb.active
+    # bool blandet med tall i samme kolonne blir "1"/"0" i pandas (hele kolonnen avgjør) – ikke med her
+    ws.append(["Komponent", None, "Antall", "Antall", 2024, "Dato", "Antall.1", "Aktiv", "Antall"])
+    ws.append(["360.001-RTA001", "x", 1, 2.5, 3.0, datetime(2024, 1, 2, 3, 4, 5), "a", True])
+    ws.append([None] * 8)
+    ws.append(["b", None, 7, 1e20, 0.1 + 0.2, datetime(2024, 5, 6), None, None])
+    ws.append([" mellomrom ", None, -0.0, 123456789012, 1.5e-7, dtime(12, 30), "c", False])
+    ws.append(["d", "#N/A", None, -7, None, None, None, None, None, None, "langt ute"])
+    ws.append(["Æøå", None, None, None, None, None, None])
+    ws.append([None] * 8)
+    ws.append([None] * 8)
+    ws2 = wb.create_sheet("Ark2")
+    ws2.append(["ignoreres"])
+    wb.save(path)
+
+
+def write_large(path: Path, n: int, seed: int) -> None:
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Masseliste")
+    ws.append(["Komponent", "Beskrivelse", "System", "Antall", "Lengde", "Etasje", "Leverandør", "Merknad"])
+    for i in range(n):
+        kode = rnd.choice(KODER)
+        ws.append([f"={rnd.randint(300, 579)}.{rnd.randint(1, 999):03d}-{kode}{rnd.randint(1, 999):03d}"[1:],
+                   f"{rnd.choice(['Ventil', 'Spjeld', 'Pumpe', 'Føler'])} {rnd.randint(1, 99)}",
+                   f"{rnd.randint(300, 579)}.{rnd.randint(1, 99):03d}", rnd.randint(1, 40),
+                   round(rnd.uniform(0.1, 120), 2) if rnd.random() < 0.9 else None,
+                   f"U{rnd.randint(1, 2)}" if rnd.random() < 0.3 else f"{rnd.randint(1, 9)}. etg",
+                   rnd.choice(["Systemair", "Danfoss", "Grundfos", "ABB", None]),
+                   "" if rnd.random() < 0.8 else f"rad {i}"])
+    wb.save(path)
+
+
+def old_parse(path: Path):
+    """Tidligere /api/parse-masseliste."""
+    df = pd.read_excel(path, dtype=str).fillna("")
+    data = df.to_dict(orient="records")
+    return {"rows": data, "columns": list(df.columns)}
+
+
+def _str_keys(rows):
+    return [{str(k): v for k, v in r.items()} for r in rows]
+
+
+def _all(ds, **query):
+    out, offset = [], 0
+    while True:
+        page = ds.page(offset=offset, limit=mds.MASSELISTE_PAGE_MAX, **query)
+        out += page["rows"]
+        offset += page["limit"]
+        if offset >= page["matched"]:
+            return out, page["matched"]
+
+
+def _ref_filter(rows, columns, q="", filters=None, sort=None, order="asc", numeric=False):
+    terms = [t.casefold() for t in q.split()]
+    out = [r for r in rows
+           if all(any(t in str(r[c]).casefold() for c in columns) for t in terms)
+           and all(v.casefold() in r[k].casefold() for k, v in (filters or {}).items())]
+    if sort:
+        # Som SQLite: tomme sist, tall numerisk, tekst med NOCASE (bare ASCII), lik verdi i radrekkefølge
+        filled = [r for r in out if r[sort] != ""]
+        empty = [r for r in out if r[sort] == ""]
+        key = (lambda r: float(r[sort])) if numeric else (lambda r: r[sort].translate(_ASCII_LOWER))
+        out = sorted(filled, key=key, reverse=order == "desc") + empty
+    return out
+
+
+def _measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    ok = True
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory(prefix="masseliste_") as tmp:
+        tmp = Path(tmp)
+        mds.MASSELISTE_DATA_DIR = tmp / "data"
+
+        # Paritet med blandede celletyper
+        mixed = tmp / "blandet.xlsx"
+        write_mixed(mixed)
+        old = old_parse(mixed)
+        ds = mds.load_upload(io.BytesIO(mixed.read_bytes()), "blandet.xlsx")
+        rows, _ = _all(ds)
+        ok &= _check(ds.columns == [str(c) for c in old["columns"]], f"kolonner: {ds.columns}")
+        ok &= _check(rows == _str_keys(old["rows"]), f"rader: {len(rows)} (tidligere {len(old['rows'])})")
+        if rows != _str_keys(old["rows"]):
+            print("[INFO] ny:", rows)
+            print("[INFO] før:", _str_keys(old["rows"]))
+
+        # Stor masseliste
+        large = tmp / "stor.xlsx"
+        t0 = time.perf_counter()
+        write_large(large, n, 1)
+        print(f"[INFO] {n} rader, {large.stat().st_size / 1e6:.1f} MB xlsx (skrevet på {time.perf_counter() - t0:.1f} s)")
+        t0 = time.perf_counter()
+        old = old_parse(large)
+        old_json = len(json.dumps(old, ensure_ascii=False))
+        t_old = time.perf_counter() - t0
+        data = large.read_bytes()
+        t0 = time.perf_counter()
+        ds = mds.load_upload(io.BytesIO(data), "stor.xlsx")
+        first = ds.page(limit=mds.MASSELISTE_PAGE_SIZE)
+        first_json = len(json.dumps(first, ensure_ascii=False))
+        t_new = time.perf_counter() - t0
+        print(f"[INFO] tidligere: {t_old:.1f} s, svar {old_json / 1e6:.1f} MB; "
+              f"nå: {t_new:.1f} s til første side, {first_json / 1e3:.0f} kB")
+        ok &= _check(first_json < old_json / 50, "første side i stedet for hele arket")
+
+        # Minnetopp (tracemalloc gjør innlesingen flere ganger tregere, så en mindre fil)
+        small = tmp / "minne.xlsx"
+        write_large(small, max(n // 4, 1000), 2)
+        _, _, peak_old = _measure(lambda: json.dumps(old_parse(small), ensure_ascii=False))
+        small_data = small.read_bytes()
+        _, _, peak_new = _measure(lambda: mds.load_upload(io.BytesIO(small_data), "minne.xlsx").page())
+        print(f"[INFO] minnetopp {max(n // 4, 1000)} rader: tidligere {peak_old / 1e6:.0f} MB, nå {peak_new / 1e6:.0f} MB")
+        ok &= _check(peak_new < peak_old / 3, "minnetopp ved innlesing")
+
+        ref = _str_keys(old["rows"])
+        ok &= _check(first["total"] == len(ref) and first["rows"] == ref[:mds.MASSELISTE_PAGE_SIZE],
+                     f"første side: {len(first['rows'])} av {first['total']}")
+        deep = ds.page(offset=n - 150, limit=100)
+        ok &= _check(deep["rows"] == ref[n - 150:n - 50], "side langt ute i datasettet")
+
+        queries = [
+            ({"q": "ventil danfoss"}, False),
+            ({"q": "FØLER", "filters": {"Etasje": "u1"}}, False),
+            ({"filters": {"Leverandør": "grund", "Komponent": "-rta"}}, False),
+            ({"sort": "Beskrivelse"}, False),
+            ({"sort": "Lengde", "order": "desc", "q": "pumpe"}, True),
+            ({"sort": "Antall", "filters": {"System": "4"}}, True),
+        ]
+        for query, numeric in queries:
+            t0 = time.perf_counter()
+            got, matched = _all(ds, **query)
+            elapsed = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            page = ds.page(offset=0, limit=mds.MASSELISTE_PAGE_SIZE, **query)
+            t_page = time.perf_counter() - t0
+            want = _ref_filter(ref, ds.columns, numeric=numeric, **query)
+            ok &= _check(got == want and page["rows"] == want[:mds.MASSELISTE_PAGE_SIZE] and matched == len(want),
+                         f"{query}: {matched} treff, side {t_page * 1e3:.0f} ms (alle sider {elapsed * 1e3:.0f} ms)")
+
+        try:
+            ds.page(sort="Finnes ikke")
+            ok &= _check(False, "ukjent kolonne avvises")
+        except ValueError:
+            ok &= _check(True, "ukjent kolonne avvises")
+
+        # Eksport av utvalget
+        out = tmp / "eksport.xlsx"
+        query = {"q": "ventil", "filters": {"Leverandør": "abb"}, "sort": "Komponent"}
+        t0 = time.perf_counter()
+        count = mds.write_xlsx(ds, out, ["Komponent", "Antall", "Leverandør"], **query)
+        t_export = time.perf_counter() - t0
+        exported = list(load_workbook(out, read_only=True).active.iter_rows(values_only=True))
+        want = [(r["Komponent"], r["Antall"], r["Leverandør"]) for r in _all(ds, **query)[0]]
+        ok &= _check(exported[0] == ("Komponent", "Antall", "Leverandør") and exported[1:] == want and count == len(want),
+                     f"write_xlsx: {count} rader ({t_export * 1e3:.0f} ms)")
+
+        # Samme fil igjen
+        t0 = time.perf_counter()
+        again = mds.load_upload(io.BytesIO(data), "stor (kopi).xlsx")
+        t_again = time.perf_counter() - t0
+        ok &= _check(again.id == ds.id and t_again < t_new / 3, f"samme fil gjenbrukes ({t_again * 1e3:.0f} ms)")
+        ok &= _check(mds.open_dataset("0" * 64) is None and mds.open_dataset("../x") is None, "ukjent datasett gir None")
+
+    if not ok:
+        print("[FEIL] Masseliste-datasettet avviker.")
+        return 1
+    print("[OK] Masseliste-datasett fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for parallell filbehandling i process_files_task: kjører samme filsett
+sekvensielt og som chord av deltasks (Celery i eager-modus) og sjekker at funnene er identiske.
+Bruk:
+  python -m app.test.parallel_files_smoketest [antall_deltasks]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from app.celery_instance import celery
+
+# Eager-modus med minne-backend: chorden kjøres i denne prosessen uten broker/Redis
+celery.conf.update(task_always_eager=True, task_eager_propagates=True, result_backend="cache+memory://")
+
+from app.tasks.main import (  # noqa: E402
+    _iter_files, _merge_chunks, _resolve_file_workers, _split_files, process_files_task,
+)
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+N_FILES = 6
+
+
+def _groups() -> list:
+    data = json.loads((APP_DIR / "data" / "nokkelord.json").read_text(encoding="utf-8"))
+    return [fs for samling in data.values() for fs in samling.keys()]
+
+
+def _run(src: Path, workers: int) -> dict:
+    """Kopierer filene til en egen temp-mappe (rapportene skrives dit) og kjører tasken."""
+    tmp = Path(tempfile.mkdtemp(prefix="ks_par_"))
+    try:
+        for f in src.iterdir():
+            shutil.copy(f, tmp / f.name)
+        res = process_files_task.apply(args=(
+            str(tmp), [], 0.0, 1, "Ingen", "keywords_ai", _groups(), "ventilasjon", {"file_workers": workers},
+        ))
+        return res.get()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> int:
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    if _resolve_file_workers({"file_workers": workers}, N_FILES) != workers:
+        print(f"[FEIL] {workers} deltasks ble ikke valgt for {N_FILES} filer (KS_MAX_FILE_WORKERS?).")
+        return 1
+
+    files = [Path(f"f{i}") for i in range(7)]
+    chunks = _split_files(files, workers)
+    merged = _merge_chunks([[([str(f)], [], {}) for f in c] for c in chunks], len(files))
+    if [m[0][0] for m in merged] != [str(f) for f in files]:
+        print("[FEIL] Deltask-resultatene flettes ikke tilbake i filrekkefølge.")
+        return 1
+    print(f"[OK] {len(files)} filer fordelt på {workers} deltasks flettes tilbake i filrekkefølge.")
+
+    lines = [ln for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    src = Path(tempfile.mkdtemp(prefix="ks_par_src_"))
+    try:
+        step = max(1, len(lines) // N_FILES)
+        for i in range(N_FILES):
+            (src / f"spesifikasjon_{i:02d}.txt").write_text("\n".join(lines[i * step:(i + 1) * step]), encoding="utf-8")
+        n_files = len(list(_iter_files(src)))
+        serial = _run(src, 1)
+        parallel = _run(src, workers)
+    finally:
+        shutil.rmtree(src, ignore_errors=True)
+
+    # Tekst-cache-tellere kan avvike (andre kjøring treffer cachen); sammenlign kun funn/feil
+    a = json.dumps([serial["preview"], serial["errors"]], ensure_ascii=False, sort_keys=True)
+    b = json.dumps([parallel["preview"], parallel["errors"]], ensure_ascii=False, sort_keys=True)
+    n_reqs = len(serial["preview"]["requirements"])
+    if a != b:
+        print(f"[FEIL] Chord med {workers} deltasks ga annet resultat enn sekvensiell kjøring.")
+        return 1
+    if not n_reqs:
+        print("[FEIL] Ingen funn – testen sammenligner ingenting.")
+        return 1
+    print(f"[OK] {n_files} filer, {n_reqs} funn – identisk resultat sekvensielt og med {workers} deltasks.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
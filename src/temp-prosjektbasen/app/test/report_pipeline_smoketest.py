@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest + benchmark for rapportbyggeren: create_reports_and_zip mot tidligere utgave
+(stilobjekter satt per celle i kravarkene, egen formateringsrunde over tabellradene i
+leverandørrapporten) på syntetiske funn. ZIP-innhold (filnavn, Excel-celler med verdi og stil
+i alle ark, inkl. per-fag-arbeidsbøkene, og Word-tekst/tabeller med skriftstørrelse/farge)
+skal være identisk, og ny utgave raskere. Rapporterer tid og toppminne (tracemalloc).
+Utheving: highlight_pdf med kravtekstene fra funn i en syntetisk PDF som snippets skal
+utheve hele kravteksten på sin side.
+Bruk:
+  python -m app.test.report_pipeline_smoketest [antall_krav]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import io
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from collections import defaultdict
+from pathlib import Path
+
+import fitz
+from docx import Document
+from docx.shared import Pt, RGBColor
+from openpyxl import load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+from app.tasks import reporting
+from app.tasks.core import _parse_ref, extract_requirements_from_pages, iter_clean_pages
+from app.tasks.parsing import _iter_pdf_pages
+from app.tasks.pdf_highlight import TermAutomaton, page_highlight_rects
+from app.test.dedup_parity_smoketest import make_requirements
+from app.test.streaming_pdf_smoketest import _build_pdf, _kwargs
+
+_GRUPPER = ["elektro", "ventilasjon", "rørlegger", "byggautomasjon", "Uspesifisert"]
+_KEYWORDS = ["ventilasjon", "brannspjeld", "kabel", "sprinkler", "(AI)"]
+_STAMP = re.compile(r"(generert: )\d{4}-\d\d-\d\d \d\d:\d\d(:\d\d)?", re.IGNORECASE)
+
+
+def make_report_requirements(n: int, seed: int = 5) -> list[dict]:
+    """Funn på formen rapportene leser (keyword, gruppe/fag, kravtype, ns_refs …)."""
+    rnd = random.Random(seed)
+    out = make_requirements(n, seed=seed)
+    for i, r in enumerate(out):
+        r["keyword"] = rnd.choice(_KEYWORDS)
+        r["match_text"] = r["text"]
+        r["kravtype"] = rnd.choice(["Krav", "Funksjon", "Dokumentasjon"])
+        r["score"] = rnd.choice([100.0, 96.0, r["score"]])
+        r["fag"] = [rnd.choice(_GRUPPER)]
+        if i % 3:
+            r["gruppe"] = r["fag"][0]
+        if i % 4 == 0:
+            r["ns_refs"] = ["NS 3935", "NS-EN 12599"]
+        if i % 5 == 0:
+            r["nlp_eval"] = {"kvalitet": rnd.randint(1, 5)}
+    return out
+
+
+def old_stream_krav_sheet(wb, title: str, items: list, gruppe_of, boxed_header: bool = False) -> None:
+    """Tidligere kravark: font/fill/border/alignment satt som objekter på hver celle."""
+    headers = reporting._KRAV_HEADERS
+    ws = wb.create_sheet(title)
+    for i, h in enumerate(headers, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = reporting._krav_col_width(h)
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{len(items) + 1}"
+    hdr = []
+    for h in headers:
+        c = WriteOnlyCell(ws, value=h)
+        c.font = reporting._HDR_FONT
+        c.fill = reporting._HDR_FILL
+        if boxed_header:
+            c.alignment = reporting._WRAP_TOP
+            c.border = reporting._CELL_BORDER
+        hdr.append(c)
+    ws.append(hdr)
+    for krav in items:
+        row = []
+        for i, v in enumerate(reporting._krav_row(krav, gruppe_of(krav))):
+            c = WriteOnlyCell(ws, value=v)
+            c.alignment = reporting._WRAP_TOP
+            c.border = reporting._CELL_BORDER
+            if i == 4:
+                c.number_format = "0.0%"
+            row.append(c)
+        ws.append(row)
+
+
+def old_build_delivery_doc(grouped_requirements):
+    """Tidligere leverandørrapport: liten/grå skrift satt i en egen runde over alle tabellrader."""
+    doc = _build_delivery_doc(grouped_requirements)
+    for table in doc.tables:
+        for r_i, row in enumerate(table.rows):
+            if r_i == 0:
+                continue
+            for c_i in (4, 5):
+                for p in row.cells[c_i].paragraphs:
+                    for run in p.runs:
+                        run.font.size = Pt(9)
+                        run.font.color.rgb = RGBColor(120, 120, 120)
+    return doc
+
+
+_build_delivery_doc = reporting._build_delivery_doc
+
+
+def _style(c) -> tuple:
+    fill = c.fill.fgColor.rgb if c.fill.fill_type else None
+    return (c.number_format, c.alignment.wrap_text, c.alignment.vertical, getattr(c.border.left, "style", None),
+            getattr(c.border.bottom, "style", None), fill, c.font.b)
+
+
+def _xlsx_dump(data: bytes) -> list:
+    wb = load_workbook(io.BytesIO(data))
+    out = []
+    for ws in wb.worksheets:
+        out.append((ws.title, ws.auto_filter.ref,
+                    {k: round(d.width or 0, 2) for k, d in ws.column_dimensions.items()},
+                    [[(c.value, _style(c)) for c in row] for row in ws.iter_rows()]))
+    return out
+
+
+def _docx_dump(data: bytes) -> list:
+    doc = Document(io.BytesIO(data))
+    out = [_STAMP.sub(r"\1<tid>", p.text) for p in doc.paragraphs]
+    for t in doc.tables:
+        out.append([[(c.text, [(r.font.size, str(r.font.color.rgb)) for p in c.paragraphs for r in p.runs if r.text])
+                     for c in row.cells] for row in t.rows])
+    out.append(len(doc.inline_shapes))
+    return out
+
+
+def dump_zip(data: bytes) -> dict:
+    """Normalisert innhold av en rapport-ZIP (nestede ZIP-filer pakkes ut rekursivt)."""
+    out = {}
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        for name in zf.namelist():
+            raw = zf.read(name)
+            if name.endswith(".zip"):
+                out[name] = dump_zip(raw)
+            elif name.endswith(".xlsx"):
+                out[name] = _xlsx_dump(raw)
+            elif name.endswith(".docx"):
+                out[name] = _docx_dump(raw)
+            else:
+                out[name] = raw
+    return out
+
+
+def _run(reqs: list[dict]) -> tuple[bytes, float]:
+    with tempfile.TemporaryDirectory(prefix="ks_report_") as tmp:
+        t0 = time.perf_counter()
+        path = reporting.create_reports_and_zip([dict(r) for r in reqs], Path(tmp), [])
+        return path.read_bytes(), time.perf_counter() - t0
+
+
+def _run_old(reqs: list[dict]) -> tuple[bytes, float]:
+    saved = reporting._stream_krav_sheet, reporting._build_delivery_doc
+    reporting._stream_krav_sheet, reporting._build_delivery_doc = old_stream_krav_sheet, old_build_delivery_doc
+    try:
+        return _run(reqs)
+    finally:
+        reporting._stream_krav_sheet, reporting._build_delivery_doc = saved
+
+
+def _peak(reqs: list[dict]) -> float:
+    tracemalloc.start()
+    _run(reqs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def _best(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _job_times(reqs: list[dict], tmp: Path) -> dict:
+    """Beste av tre for jobbene som er endret: (tidligere, nå) i sekunder."""
+    grouped = defaultdict(list)
+    for r in reqs:
+        grouped[r.get("gruppe") or r["fag"][0]].append(r)
+    xlsx, docx = tmp / "rapport.xlsx", tmp / "leveranser.docx"
+    excel = lambda: reporting._write_total_excel_report(xlsx, {"requirements": reqs}, grouped)
+    new_sheet = reporting._stream_krav_sheet
+    reporting._stream_krav_sheet = old_stream_krav_sheet
+    try:
+        t_excel_old = _best(excel)
+    finally:
+        reporting._stream_krav_sheet = new_sheet
+    return {
+        "Kravsporing_rapport.xlsx": (t_excel_old, _best(excel)),
+        "Leverandorleveranser_rapport.docx": (_best(lambda: old_build_delivery_doc(grouped).save(str(docx))),
+                                              _best(lambda: _build_delivery_doc(grouped).save(str(docx)))),
+    }
+
+
+def _highlighted(page) -> list:
+    """Rektanglene i uthevingsannotasjonene på siden (fire hjørnepunkter per område)."""
+    out = []
+    for annot in page.annots():
+        v = annot.vertices or []
+        out += [fitz.Quad(v[i:i + 4]).rect for i in range(0, len(v), 4)]
+    return out
+
+
+def _highlight_check(n_pages: int = 6) -> bool:
+    """Kravtekstene fra funnene skal være uthevet når de sendes til highlight_pdf som snippets."""
+    with tempfile.TemporaryDirectory(prefix="ks_report_") as tmp:
+        tmp = Path(tmp)
+        pdf, out = tmp / "syntetisk.pdf", tmp / "uthevet.pdf"
+        _build_pdf(pdf, n_pages)
+        reqs = extract_requirements_from_pages(iter_clean_pages(_iter_pdf_pages(fitz.open(pdf))), **_kwargs())
+        reporting.highlight_pdf(str(pdf), [], str(out), snippets=[r["text"] for r in reqs])
+        data = out.read_bytes()
+    missing = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for r in reqs:
+            page = doc[_parse_ref(r["ref"])[1] - 1]
+            hl = _highlighted(page)
+            want = page_highlight_rects(page, TermAutomaton([r["text"].rstrip(" .!?;:")]))
+            if not want or not all(any(h.contains((w.tl + w.br) / 2) for h in hl) for w in want):
+                missing.append(r["ref"])
+    print(f"[INFO] Utheving: {len(reqs) - len(missing)}/{len(reqs)} kravtekster uthevet")
+    return bool(reqs) and not missing
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    reqs = make_report_requirements(n)
+
+    old, t_old = _run_old(reqs)
+    new, t_new = _run(reqs)
+    print(f"[INFO] {n} funn, toppminne {_peak(reqs) / 1e6:.1f} MB; hele ZIP-en: tidligere {t_old:.2f}s, nå {t_new:.2f}s")
+
+    a, b = dump_zip(old), dump_zip(new)
+    print(f"[INFO] ZIP-innhold: {', '.join(a)}")
+    if list(a) != list(b):
+        print(f"[FEIL] Ulike filer i ZIP: {list(a)} != {list(b)}")
+        return 1
+    bad = [k for k in a if a[k] != b[k]]
+    if bad:
+        print(f"[FEIL] Ulikt innhold i: {', '.join(bad)}")
+        return 1
+    print("[OK] Rapportene er identiske med tidligere utgave (verdier og stiler).")
+
+    with tempfile.TemporaryDirectory(prefix="ks_report_") as tmp:
+        times = _job_times([dict(r) for r in reqs], Path(tmp))
+    for name, (t_o, t_n) in times.items():
+        print(f"[INFO] {name}: tidligere {t_o:.2f}s, nå {t_n:.2f}s ({t_o / max(t_n, 1e-9):.2f}x)")
+    t_o, t_n = (sum(t[i] for t in times.values()) for i in (0, 1))
+    if t_n >= t_o:
+        print(f"[FEIL] Endrede rapportjobber er ikke raskere ({t_n:.2f}s mot {t_o:.2f}s).")
+        return 1
+    print(f"[OK] Endrede rapportjobber {t_o / t_n:.2f}x raskere.")
+
+    if not _highlight_check():
+        print("[FEIL] Kravtekstene er ikke uthevet av highlight_pdf.")
+        return 1
+    print("[OK] Kravtekstene er uthevet i PDF-ene.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
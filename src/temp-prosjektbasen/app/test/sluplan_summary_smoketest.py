@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest + benchmark for SQL-aggregatene i SluPlan (app.services.sluplan_summary).
+- Paritet: summarize_by_discipline/by_user/by_time_window, get_alerts og /api/reports/summary
+  (per status) er identiske med tidligere Python-løkker over hele oppgavelisten
+  (joinedload), også med statusvarianter ('Pågår', 'PÅGÅR', ' ferdig ', '') og oppgaver
+  uten fag/ressurs
+- get_dashboard_snapshot() gir de samme delene i ett kall
+- Indekser: opprettes i en eksisterende database uten dem, og brukes av spørringene
+- Tid: tidligere fem rapporter vs ett dashbord-kall
+Bruk:
+  python -m app.test.sluplan_summary_smoketest [antall_oppgaver]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from flask import Flask
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import joinedload
+
+from app.models.db import db
+from app.models.project import Project
+from app.models.sluplan import (
+    SluplanComment, SluplanDependency, SluplanDiscipline, SluplanFile, SluplanPerson, SluplanProject,
+    SluplanTask,
+)
+from app.models.user import User
+from app.services import sluplan_service as svc
+from app.test.common import check as _check
+
+TODAY = date(2026, 3, 2)
+STATUSES = ["planlagt", "Pågår", "PÅGÅR", "pågår", " ferdig ", "Ferdig", "done", "in progress", "", "venter"]
+
+
+# ── Tidligere implementasjoner (sluplan_service før SQL-aggregering) ──────────────────────
+def _bucket(status):
+    if not status:
+        return "planned"
+    normalized = status.strip().lower()
+    if normalized in {"ferdig", "done", "completed"}:
+        return "completed"
+    if normalized in {"pågår", "in progress", "in_progress", "progress"}:
+        return "in_progress"
+    return "planned"
+
+
+def _dur(task):
+    return max(0, (task.end_date - task.start_date).days) + 1
+
+
+def old_summarize(project_id: int, by: str):
+    rel = SluplanTask.discipline if by == "discipline" else SluplanTask.assignee
+    summary = {}
+    for task in db.session.execute(
+            select(SluplanTask).options(joinedload(rel)).where(SluplanTask.project_id == project_id)).scalars():
+        if by == "discipline":
+            key = task.discipline.name if task.discipline else (task.kind.capitalize() if task.kind else "Annet")
+        else:
+            key = task.assignee.name if task.assignee else "Ikke tildelt"
+        entry = summary.setdefault(key, {by: key, "task_count": 0, "planned": 0, "in_progress": 0,
+                                         "completed": 0, "total_duration_days": 0})
+        entry["task_count"] += 1
+        entry[_bucket(task.status)] += 1
+        entry["total_duration_days"] += _dur(task)
+    result = [{**item, "average_duration_days": round(item["total_duration_days"] / (item["task_count"] or 1), 2)}
+              for item in summary.values()]
+    result.sort(key=lambda e: e[by].lower())
+    return result
+
+
+def old_time_window(project_id: int, start: date, end: date):
+    planned = in_progress = completed = total = 0
+    tasks = []
+    for task in db.session.execute(
+            select(SluplanTask).options(joinedload(SluplanTask.assignee), joinedload(SluplanTask.discipline))
+            .where(SluplanTask.project_id == project_id)).scalars():
+        if task.end_date < start or task.start_date > end:
+            continue
+        b = _bucket(task.status)
+        completed += b == "completed"
+        in_progress += b == "in_progress"
+        planned += b == "planned"
+        total += _dur(task)
+        tasks.append({"id": str(task.id), "title": task.title, "start": task.start_date.isoformat(),
+                      "end": task.end_date.isoformat(), "assignee": task.assignee.name if task.assignee else None,
+                      "assignee_email": task.assignee.email if task.assignee else None, "status": task.status,
+                      "discipline": task.discipline.name if task.discipline else None, "duration_days": _dur(task)})
+    tasks.sort(key=lambda i: (i["start"], i["title"]))
+    return {"from": start.isoformat(), "to": end.isoformat(), "total_tasks": planned + in_progress + completed,
+            "planned": planned, "in_progress": in_progress, "completed": completed,
+            "total_duration_days": total, "tasks": tasks}
+
+
+def old_alerts(project_id: int, today: date):
+    lists = {"upcoming": [], "today": [], "overdue": []}
+    for task in db.session.execute(select(SluplanTask).options(joinedload(SluplanTask.assignee))
+                                   .where(SluplanTask.project_id == project_id)).scalars():
+        if (task.status or "").strip().lower() == "ferdig":
+            continue
+        d = (task.end_date - today).days
+        payload = {"id": str(task.id), "title": task.title, "start": task.start_date.isoformat(),
+                   "end": task.end_date.isoformat(), "assignee": task.assignee.name if task.assignee else None,
+                   "assignee_email": task.assignee.email if task.assignee else None, "status": task.status,
+                   "kind": task.kind, "days_until_due": d}
+        if d < 0:
+            lists["overdue"].append(payload)
+        elif d == 0:
+            lists["today"].append(payload)
+        elif d <= 7:
+            lists["upcoming"].append(payload)
+    for items in lists.values():
+        items.sort(key=lambda i: (i.get("days_until_due") or 0, i.get("title") or ""))
+    return {"reference_date": today.isoformat(), **lists}
+
+
+def old_status_summary(project_id: int):
+    # Ruten flatet ut get_tasks()-treet; uten parent_id i testdataene er det alle oppgavene.
+    tasks = db.session.execute(select(SluplanTask).where(SluplanTask.project_id == project_id)).scalars().all()
+    return {"total": len(tasks), "per_status": dict(Counter(t.status or "ukjent" for t in tasks))}
+
+
+def _strip(payload: dict) -> dict:
+    return {k: v for k, v in payload.items() if k not in ("project", "generated_at")}
+
+
+# ── Oppsett ───────────────────────────────────────────────────────────────────────────────
+def populate(n_tasks: int) -> int:
+    rnd = random.Random(4)
+    persons = [SluplanPerson(name=f"Person {i}", email=f"p{i}@example.com") for i in range(40)]
+    disciplines = [SluplanDiscipline(name=name) for name in ("Elektro", "Ventilasjon", "Rør", "automasjon", "Byggherre")]
+    db.session.add_all(persons + disciplines)
+    other = SluplanProject(name="Annen", start_date=TODAY, end_date=TODAY)
+    project = SluplanProject(name="Bench", start_date=TODAY, end_date=TODAY + timedelta(days=120))
+    db.session.add_all([other, project])
+    db.session.flush()
+    rows = []
+    for i in range(n_tasks):
+        start = TODAY + timedelta(days=rnd.randint(-60, 120))
+        rows.append({
+            "title": f"Oppgave {rnd.randint(0, n_tasks // 3)}", "start_date": start,
+            "end_date": start + timedelta(days=rnd.randint(-1, 20)),   # noen med slutt før start
+            "status": rnd.choice(STATUSES), "kind": rnd.choice(["task", "subtask", "milestone", "system"]),
+            "project_id": project.id if i % 10 else other.id,
+            "assignee_id": persons[rnd.randrange(40)].id if rnd.random() < 0.8 else None,
+            "discipline_id": disciplines[rnd.randrange(5)].id if rnd.random() < 0.7 else None,
+        })
+    db.session.execute(SluplanTask.__table__.insert(), rows)
+    db.session.commit()
+    return project.id
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="sluplan_summary_") as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, "test.db")
+        db.init_app(app)
+        with app.app_context():
+            tables = [User.__table__, Project.__table__, SluplanProject.__table__, SluplanPerson.__table__,
+                      SluplanDiscipline.__table__, SluplanTask.__table__, SluplanDependency.__table__,
+                      SluplanComment.__table__, SluplanFile.__table__]
+            db.metadata.create_all(db.engine, tables=tables)
+            # Eksisterende database: tabellene fantes før indeksene
+            with db.engine.begin() as conn:
+                for table in (SluplanTask.__table__, SluplanDependency.__table__):
+                    for index in table.indexes:
+                        conn.execute(text(f"DROP INDEX {index.name}"))
+            pid = populate(n)
+
+            t0 = time.perf_counter()
+            old = {
+                "summary": old_status_summary(pid),
+                "by_discipline": old_summarize(pid, "discipline"),
+                "by_user": old_summarize(pid, "user"),
+                "time_window": old_time_window(pid, TODAY, TODAY + timedelta(days=30)),
+                "alerts": old_alerts(pid, TODAY),
+            }
+            t_old = time.perf_counter() - t0
+
+            names = {ix["name"] for ix in inspect(db.engine).get_indexes("sluplan_tasks")}
+            ok &= _check(not names & {ix.name for ix in SluplanTask.__table__.indexes}, "ingen indekser før første kall")
+
+            t0 = time.perf_counter()
+            snap = svc.get_dashboard_snapshot(pid, TODAY.isoformat(), (TODAY + timedelta(days=30)).isoformat(),
+                                              reference_date=TODAY)
+            t_first = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            snap = svc.get_dashboard_snapshot(pid, TODAY.isoformat(), (TODAY + timedelta(days=30)).isoformat(),
+                                              reference_date=TODAY)
+            t_new = time.perf_counter() - t0
+
+            names = {ix["name"] for ix in inspect(db.engine).get_indexes("sluplan_tasks")}
+            ok &= _check({ix.name for ix in SluplanTask.__table__.indexes} <= names,
+                         f"indekser opprettet i eksisterende database: {sorted(names)}")
+            plan = " ".join(str(r[-1]) for r in db.session.execute(text(
+                "EXPLAIN QUERY PLAN SELECT status, count(*) FROM sluplan_tasks WHERE project_id = :p "
+                "GROUP BY discipline_id, status"), {"p": pid}))
+            ok &= _check("INDEX ix_sluplan_tasks_project" in plan, f"spørringsplan bruker indeks: {plan}")
+
+            ok &= _check(snap["summary"] == old["summary"], f"per status: {snap['summary']['total']} oppgaver")
+            ok &= _check(snap["by_discipline"] == old["by_discipline"],
+                         f"per fag: {[e['discipline'] for e in snap['by_discipline']]}")
+            ok &= _check(snap["by_user"] == old["by_user"], f"per bruker: {len(snap['by_user'])} rader")
+            ok &= _check(_strip(snap["time_window"]) == old["time_window"],
+                         f"tidsvindu: {snap['time_window']['total_tasks']} oppgaver")
+            ok &= _check(_strip(snap["alerts"]) == old["alerts"],
+                         f"varsler: {len(snap['alerts']['overdue'])} forfalt, {len(snap['alerts']['today'])} i dag, "
+                         f"{len(snap['alerts']['upcoming'])} kommende")
+
+            single = {
+                "summary": svc.summarize_by_status(pid),
+                "by_discipline": svc.summarize_by_discipline(pid),
+                "by_user": svc.summarize_by_user(pid),
+                "time_window": _strip(svc.summarize_by_time_window(pid, TODAY.isoformat(),
+                                                                   (TODAY + timedelta(days=30)).isoformat())),
+                "alerts": _strip(svc.get_alerts(pid, TODAY)),
+            }
+            ok &= _check(single == old, "enkeltkallene gir samme resultat som før")
+            try:
+                svc.get_dashboard_snapshot(pid, "ugyldig")
+                ok &= _check(False, "ugyldig from avvises")
+            except ValueError as exc:
+                ok &= _check(str(exc) == "from_ugyldig", "ugyldig from avvises")
+
+            print(f"[INFO] {n} oppgaver ({n - n // 10} i prosjektet): fem rapporter {t_old * 1e3:.0f} ms → "
+                  f"dashbord {t_new * 1e3:.0f} ms (første kall med indeksbygging {t_first * 1e3:.0f} ms)")
+
+    if not ok:
+        print("[FEIL] SluPlan-aggregatene avviker.")
+        return 1
+    print("[OK] SluPlan-aggregater fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
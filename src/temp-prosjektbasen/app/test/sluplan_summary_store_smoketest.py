@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest + benchmark for det materialiserte SluPlan-sammendraget
+(app.services.sluplan_summary_store).
+- Tabellene opprettes i en database som mangler dem; første lesing bygger prosjektet
+- Inkrementelt: create_task, update_task_fields (status/fag/ressurs/datoer/type), sletting
+  med kaskade til underoppgaver, reset_plan og import_plan holder sammendraget lik en full
+  utregning (check_consistency) og lik summarize_groups(grouped_counts())
+- Rollback etterlater ingen differanser; andre prosjekter påvirkes ikke
+- Første lesing bygger i en egen transaksjon og committer ikke forespørselens sesjon
+- Grupper legges til med upsert (ON CONFLICT); dialekter uten den bruker savepoint + UPDATE
+- Endringer utenom ORM-en oppdages av kontrollen og repareres med repair=True
+- Lesetid per fag ved 1 000 og N oppgaver: lagret sammendrag vs full aggregering
+Bruk:
+  python -m app.test.sluplan_summary_store_smoketest [antall_oppgaver]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from flask import Flask
+from sqlalchemy import event, inspect, select, text
+
+from app.models.db import db
+from app.models.project import Project
+from app.models.sluplan import (
+    SluplanComment, SluplanDependency, SluplanDiscipline, SluplanFile, SluplanPerson, SluplanProject,
+    SluplanTask,
+)
+from app.models.user import User
+from app.services import sluplan_service as svc
+from app.services.sluplan_summary import grouped_counts, status_counts, summarize_groups
+from app.services import sluplan_summary_store as store
+from app.services.sluplan_summary_store import check_consistency, summary_groups
+from app.test.common import check as _check
+
+TODAY = date(2026, 3, 2)
+STATUSES = ["planlagt", "Pågår", "PÅGÅR", " ferdig ", "Ferdig", "done", "in progress", "venter"]
+PERSONS = [f"Person {i}" for i in range(12)]
+DISCIPLINES = ["Elektro", "Ventilasjon", "Rør", "automasjon"]
+
+
+def populate(project_id: int, n_tasks: int, seed: int) -> None:
+    """Oppgaver rett i tabellen (Core, som en eksisterende database før sammendraget fantes)."""
+    rnd = random.Random(seed)
+    persons = list(db.session.execute(select(SluplanPerson.id)).scalars())
+    disciplines = list(db.session.execute(select(SluplanDiscipline.id)).scalars())
+    rows = []
+    for _ in range(n_tasks):
+        start = TODAY + timedelta(days=rnd.randint(-60, 120))
+        rows.append({
+            "title": f"Oppgave {rnd.randint(0, 999)}", "start_date": start,
+            "end_date": start + timedelta(days=rnd.randint(0, 20)), "status": rnd.choice(STATUSES),
+            "kind": rnd.choice(["task", "subtask", "milestone"]), "project_id": project_id,
+            "assignee_id": rnd.choice(persons) if rnd.random() < 0.8 else None,
+            "discipline_id": rnd.choice(disciplines) if rnd.random() < 0.7 else None,
+        })
+    db.session.execute(SluplanTask.__table__.insert(), rows)
+    db.session.commit()
+
+
+def expected(project_id: int) -> dict:
+    groups = grouped_counts(project_id)
+    per_status = status_counts(groups)
+    return {"summary": {"total": sum(per_status.values()), "per_status": per_status},
+            "by_discipline": summarize_groups(groups, "discipline"), "by_user": summarize_groups(groups, "user")}
+
+
+def stored(project_id: int) -> dict:
+    return {"summary": svc.summarize_by_status(project_id), "by_discipline": svc.summarize_by_discipline(project_id),
+            "by_user": svc.summarize_by_user(project_id)}
+
+
+def consistent(project_id: int) -> bool:
+    same = stored(project_id) == expected(project_id)
+    return same and check_consistency(project_id)["consistent"]
+
+
+def random_edits(project_id: int, rnd: random.Random, n: int) -> None:
+    ids = list(db.session.execute(select(SluplanTask.id).where(SluplanTask.project_id == project_id)).scalars())
+    for _ in range(n):
+        op = rnd.random()
+        if op < 0.3:
+            start = TODAY + timedelta(days=rnd.randint(0, 60))
+            payload = {"project_id": project_id, "title": "Ny", "start": start.isoformat(),
+                       "end": (start + timedelta(days=rnd.randint(0, 9))).isoformat(),
+                       "status": rnd.choice(STATUSES), "kind": rnd.choice(["task", "subtask"]),
+                       "assignee": rnd.choice(PERSONS + [None]), "discipline": rnd.choice(DISCIPLINES + [None])}
+            if rnd.random() < 0.3:
+                payload["parent_id"] = str(rnd.choice(ids))
+            ids.append(int(svc.create_task(payload)["id"]))
+        else:
+            fields = rnd.choice([
+                {"status": rnd.choice(STATUSES)},
+                {"assignee": rnd.choice(PERSONS)},
+                {"discipline": rnd.choice(DISCIPLINES + [None])},
+                {"kind": "milestone"},
+                {"start": (TODAY + timedelta(days=rnd.randint(0, 30))).isoformat()},
+                {"end": (TODAY + timedelta(days=rnd.randint(0, 90))).isoformat(), "title": "Endret"},
+            ])
+            svc.update_task_fields(str(rnd.choice(ids)), fields)
+
+
+def _timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    ok = True
+    rnd = random.Random(7)
+    with tempfile.TemporaryDirectory(prefix="sluplan_store_") as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, "test.db")
+        db.init_app(app)
+        with app.app_context():
+            db.metadata.create_all(db.engine, tables=[
+                User.__table__, Project.__table__, SluplanProject.__table__, SluplanPerson.__table__,
+                SluplanDiscipline.__table__, SluplanTask.__table__, SluplanDependency.__table__,
+                SluplanComment.__table__, SluplanFile.__table__])
+            db.session.add_all([SluplanPerson(name=name) for name in PERSONS]
+                               + [SluplanDiscipline(name=name) for name in DISCIPLINES])
+            small = SluplanProject(name="Liten", start_date=TODAY, end_date=TODAY + timedelta(days=60))
+            large = SluplanProject(name="Stor", start_date=TODAY, end_date=TODAY + timedelta(days=120))
+            other = SluplanProject(name="Annen", start_date=TODAY, end_date=TODAY + timedelta(days=60))
+            db.session.add_all([small, large, other])
+            db.session.commit()
+            small_id, large_id, other_id = small.id, large.id, other.id
+            populate(small_id, 1000, 1)
+            populate(large_id, n, 2)
+            populate(other_id, 500, 3)
+
+            # Oppgaver endret før prosjektet er bygget skal ikke gi halve sammendrag
+            random_edits(small_id, rnd, 20)
+            ok &= _check("sluplan_summaries" not in inspect(db.engine).get_table_names(),
+                         "ingen sammendragstabeller før første lesing")
+            report = check_consistency(small_id)
+            ok &= _check(not report["built"] and not report["consistent"], "prosjekt ikke bygget før første lesing")
+            t0 = time.perf_counter()
+            first = stored(large_id)
+            t_build = time.perf_counter() - t0
+            ok &= _check(first == expected(large_id), f"første lesing bygger sammendraget ({n} oppgaver, "
+                                                      f"{t_build * 1e3:.0f} ms)")
+            ok &= _check(consistent(small_id) and consistent(other_id), "små prosjekter bygget ved lesing")
+
+            # Lesing med ukommitterte endringer i sesjonen: ingen commit, og ingen bygging
+            late = SluplanProject(name="Sen", start_date=TODAY, end_date=TODAY + timedelta(days=30))
+            db.session.add(late)
+            db.session.commit()
+            late_id = late.id
+            populate(late_id, 200, 4)
+            db.session.add(SluplanPerson(name="Ukommittert"))
+            db.session.flush()
+            same = stored(late_id) == expected(late_id)
+            built = check_consistency(late_id)["built"]
+            db.session.rollback()
+            kept = db.session.execute(select(SluplanPerson).where(SluplanPerson.name == "Ukommittert")).first()
+            ok &= _check(same and not built and kept is None,
+                         "lesing med flushede endringer regner fra sesjonen, uten commit")
+            commits = []
+            session = db.session()
+            listener = lambda sess: commits.append(sess)
+            event.listen(session, "after_commit", listener)
+            try:
+                groups = summary_groups(late_id)
+            finally:
+                event.remove(session, "after_commit", listener)
+            ok &= _check(not commits and bool(groups) and check_consistency(late_id)["consistent"],
+                         "første lesing bygger i egen transaksjon, sesjonen committes ikke")
+
+            random_edits(small_id, rnd, 300)
+            ok &= _check(consistent(small_id), "300 opprettelser/endringer via tjenesten")
+            random_edits(large_id, rnd, 100)
+            ok &= _check(consistent(large_id) and consistent(other_id), "endringer i stort prosjekt, annet urørt")
+            saved, store._UPSERT = store._UPSERT, {}
+            try:
+                random_edits(small_id, rnd, 100)
+                ok &= _check(consistent(small_id), "uten ON CONFLICT: savepoint + UPDATE")
+            finally:
+                store._UPSERT = saved
+
+            parent = db.session.execute(select(SluplanTask).where(
+                SluplanTask.project_id == small_id, SluplanTask.parent_id.is_(None)).limit(1)).scalar_one()
+            for i in range(3):
+                svc.create_task({"project_id": small_id, "title": f"Barn {i}", "start": TODAY.isoformat(),
+                                 "parent_id": str(parent.id), "status": "Pågår"})
+            db.session.delete(parent)
+            db.session.commit()
+            ok &= _check(consistent(small_id), "sletting med kaskade til underoppgaver")
+
+            task = db.session.execute(select(SluplanTask).where(SluplanTask.project_id == small_id).limit(1)).scalar_one()
+            task.status = "ferdig"
+            task.discipline_id = None
+            db.session.flush()
+            db.session.rollback()
+            ok &= _check(consistent(small_id), "rollback etter flush etterlater ingen differanser")
+
+            svc.reset_plan(other_id, systems=["360.001", "360.002", "433.001"])
+            ok &= _check(consistent(other_id), f"reset_plan: {svc.summarize_by_status(other_id)['total']} oppgaver")
+            plan = svc.export_plan(small_id)
+            svc.import_plan(plan, project_id=other_id)
+            ok &= _check(consistent(other_id) and consistent(small_id),
+                         f"import_plan: {svc.summarize_by_status(other_id)['total']} oppgaver")
+
+            db.session.execute(text("UPDATE sluplan_tasks SET status = 'ferdig' WHERE id IN "
+                                    "(SELECT id FROM sluplan_tasks WHERE project_id = :p LIMIT 25)"), {"p": large_id})
+            db.session.commit()
+            report = svc.verify_summary(large_id)
+            ok &= _check(not report["consistent"] and bool(report["mismatches"]),
+                         f"endring utenom ORM oppdaget ({len(report['mismatches'])} grupper avviker)")
+            report = svc.verify_summary(large_id, repair=True)
+            ok &= _check(report["repaired"] and consistent(large_id), "repair bygger om")
+
+            t_small = _timed(lambda: svc.summarize_by_discipline(small_id))
+            t_large = _timed(lambda: svc.summarize_by_discipline(large_id))
+            t_full = _timed(lambda: summarize_groups(grouped_counts(large_id), "discipline"))
+            print(f"[INFO] per fag: lagret {t_small * 1e3:.1f} ms (1 000) / {t_large * 1e3:.1f} ms ({n}); "
+                  f"full aggregering {t_full * 1e3:.1f} ms ({n})")
+            ok &= _check(t_large < t_full / 3, "lesetid uavhengig av prosjektstørrelse")
+
+    if not ok:
+        print("[FEIL] SluPlan-sammendraget avviker.")
+        return 1
+    print("[OK] SluPlan-sammendrag fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
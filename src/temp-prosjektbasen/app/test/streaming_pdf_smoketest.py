@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for strømmende PDF-pipeline: bygger en syntetisk PDF og sammenligner
+extract_requirements(clean_text(<hele teksten>)) mot iter_clean_pages → extract_requirements_from_pages.
+Rapporterer toppminne (tracemalloc) og tid til første funn. Med en deterministisk
+erstatning for setningsmodellen sjekkes at en liten SEM_SCORE_CACHE_MAX (LRU) gir samme funn.
+Bruk:
+  python -m app.test.streaming_pdf_smoketest [antall_sider]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import fitz
+import numpy as np
+
+from app.tasks import core
+from app.tasks.core import (
+    clean_text,
+    extract_requirements,
+    extract_requirements_from_pages,
+    iter_clean_pages,
+    iter_requirements,
+)
+from app.tasks.parsing import _iter_pdf_pages, _pdf_to_text_with_pages
+
+APP_DIR = Path(__file__).resolve().parent.parent
+KRAV = APP_DIR / "data" / "krav.txt"
+
+
+def _kwargs() -> dict:
+    data = json.loads((APP_DIR / "data" / "nokkelord.json").read_text(encoding="utf-8"))
+    groups = [fs for samling in data.values() for fs in samling.keys()]
+    return dict(
+        selected_function_groups=groups, file_name="syntetisk.pdf", min_score=0.0, file_type="pdf",
+        ns_standard_selection="Ingen", mode="keywords_ai", fokus_text="ventilasjon",
+        use_fokus_prefilter=True, fokus_threshold=0.60, selected_groups=groups,
+    )
+
+
+def _build_pdf(path: Path, n_pages: int) -> None:
+    lines = [ln for ln in KRAV.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    rnd = random.Random(7)
+    with fitz.open() as doc:
+        for i in range(n_pages):
+            body = "\n".join(rnd.sample(lines, min(12, len(lines))))
+            if i % 7 == 0:
+                body += "\nwww.eksempel.no 12"   # URL + sidetall nær sideskift
+            if i % 11 == 0:
+                body = "...... 3\n" + body       # prikkleder rett etter sidemarkør
+            doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), body, fontsize=8)
+        doc.save(str(path))
+
+
+class _HashEncoder:
+    """Deterministisk «setningsmodell»: normaliserte hash-vektorer over ordene. Teller encodede tekster."""
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, normalize_embeddings=True):
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        self.encoded += len(texts)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for w in t.lower().split():
+                out[i, sum(map(ord, w)) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1.0, norms)
+
+
+class _WithSemantic:
+    def __init__(self, mod, sem):
+        self._mod, self.semantic_model = mod, sem
+
+    def __getattr__(self, name):
+        return getattr(self._mod, name)
+
+
+def _rounded(obj, nd: int = 3):
+    """float32-matrisene gir små avvik når en setning encodes alene i stedet for i batch."""
+    if isinstance(obj, float):
+        return round(obj, nd)
+    if isinstance(obj, dict):
+        return {k: _rounded(v, nd) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_rounded(v, nd) for v in obj]
+    return obj
+
+
+def _run_with_semantic(pdf: Path, kw: dict, cache_max: int):
+    enc = _HashEncoder()
+    orig_tm, orig_max = core._task_models, core.SEM_SCORE_CACHE_MAX
+    wrapped = _WithSemantic(orig_tm(), enc)
+    core._task_models, core.SEM_SCORE_CACHE_MAX = (lambda: wrapped), cache_max
+    try:
+        return extract_requirements_from_pages(iter_clean_pages(_iter_pdf_pages(fitz.open(pdf))), **kw), enc.encoded
+    finally:
+        core._task_models, core.SEM_SCORE_CACHE_MAX = orig_tm, orig_max
+
+
+def main() -> int:
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    kw = _kwargs()
+    with tempfile.TemporaryDirectory(prefix="ks_stream_") as tmp:
+        pdf = Path(tmp) / "syntetisk.pdf"
+        _build_pdf(pdf, n_pages)
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        with fitz.open(pdf) as doc:
+            full = _pdf_to_text_with_pages(doc)
+        ref = extract_requirements(text=clean_text(full), **kw)
+        t_full = time.perf_counter() - t0
+        peak_full = tracemalloc.get_traced_memory()[1]
+        del full
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        new = extract_requirements_from_pages(iter_clean_pages(_iter_pdf_pages(fitz.open(pdf))), **kw)
+        t_stream = time.perf_counter() - t0
+        peak_stream = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        t0 = time.perf_counter()
+        gen = iter_requirements(iter_clean_pages(_iter_pdf_pages(fitz.open(pdf))), **kw)
+        first = next(gen, None)
+        t_first = time.perf_counter() - t0
+        gen.close()
+
+        sem_ref, enc_ref = _run_with_semantic(pdf, kw, 10 ** 9)
+        sem_small, enc_small = _run_with_semantic(pdf, kw, 64)
+
+    print(f"[INFO] {n_pages} sider, {len(ref)} funn")
+    print(f"[INFO] Hel tekst:   {t_full:.2f}s, toppminne {peak_full / 1e6:.1f} MB")
+    print(f"[INFO] Strømmende:  {t_stream:.2f}s, toppminne {peak_stream / 1e6:.1f} MB, "
+          f"første funn etter {t_first:.2f}s" + ("" if first else " (ingen funn)"))
+    a = json.dumps(ref, ensure_ascii=False, sort_keys=True)
+    b = json.dumps(new, ensure_ascii=False, sort_keys=True)
+    if a != b:
+        print("[FEIL] Strømmende pipeline ga annet resultat enn hel-tekst-pipeline.")
+        return 1
+    print(f"[INFO] Semantisk score-cache: ubegrenset {enc_ref} encodede tekster, maks 64 → {enc_small}")
+    if _rounded(sem_ref) != _rounded(sem_small):
+        print("[FEIL] Begrenset semantisk score-cache ga annet resultat.")
+        return 1
+    print("[OK] Identisk resultat.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
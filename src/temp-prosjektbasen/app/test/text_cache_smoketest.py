@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for tekst-cachen (app.tasks.text_cache) via _load_items og _process_single_document:
+- Første lesing av en PDF er bom og skriver oppføringen; andre lesing er treff med samme sider
+- Oppføringen valideres i samme passering som den leses: avkortet, skadet (gzip) og ugyldig
+  JSON-oppføring kaster TextCacheCorrupt fra _load_items og slettes
+- _process_single_document forkaster delresultatet og parser filen på nytt: samme funn som fra
+  et gyldig treff, bom i tellerne og cachen skrevet på nytt – aldri et avkortet treff
+Bruk:
+  python -m app.test.text_cache_smoketest
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import gzip
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import fitz
+
+from app.tasks import parsing
+from app.tasks.text_cache import TextCache, TextCacheCorrupt
+from app.test.common import check as _check
+
+N_PAGES = 40
+
+
+def _build_pdf(path: Path) -> None:
+    with fitz.open() as doc:
+        for i in range(N_PAGES):
+            doc.new_page().insert_text((72, 72), f"Side {i + 1}: ventilasjonsaggregatet skal ha filterklasse ePM1.")
+        doc.save(str(path))
+
+
+def _pages(pdf: Path, stats: dict) -> list:
+    out = []
+    for item in parsing._load_items(pdf, stats):
+        if "pages" in item:
+            out.extend(item["pages"])
+    return out
+
+
+def _reqs(pdf: Path, stats: dict) -> list:
+    data = json.loads((Path(parsing.__file__).resolve().parent.parent / "data" / "nokkelord.json").read_text(encoding="utf-8"))
+    groups = [fs for samling in data.values() for fs in samling.keys()]
+    reqs, _errs = parsing._process_single_document(
+        None, pdf, keywords=[], min_score=0.0, ns_standard_selection="Ingen", mode="keywords_ai",
+        fokusomraade="ventilasjon", selected_groups=groups, cache_stats=stats)
+    return reqs
+
+
+def main() -> int:
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="ks_textcache_") as tmp:
+        tmp = Path(tmp)
+        cache = TextCache(root=tmp / "cache")
+        parsing.get_text_cache = lambda: cache
+        pdf = tmp / "spesifikasjon.pdf"
+        _build_pdf(pdf)
+        entry = cache._path(cache.key(pdf, parsing.PARSER_VERSION))
+
+        stats: dict = {}
+        ref = _pages(pdf, stats)
+        ok &= _check(len(ref) == N_PAGES and stats == {"misses": 1} and entry.is_file(), f"første lesing: {stats}")
+        stats = {}
+        ok &= _check(_pages(pdf, stats) == ref and stats == {"hits": 1}, f"andre lesing fra cachen: {stats}")
+        ref_reqs = _reqs(pdf, {})
+
+        raw = gzip.decompress(entry.read_bytes())
+        damage = {
+            "avkortet": lambda b: b[: len(b) // 2],
+            "skadet gzip": lambda b: b[:-60] + bytes(x ^ 0xFF for x in b[-60:-30]) + b[-30:],
+            "ugyldig JSON": lambda _: gzip.compress(raw[: len(raw) // 2] + b"{ikke json\n" + raw[len(raw) // 2:]),
+        }
+        for name, fn in damage.items():
+            good = entry.read_bytes()
+            entry.write_bytes(fn(good))
+            try:
+                _pages(pdf, {})
+                raised = False
+            except TextCacheCorrupt:
+                raised = True
+            ok &= _check(raised and not entry.is_file(), f"{name}: oppdaget under lesing og slettet")
+
+            entry.write_bytes(fn(good))
+            stats = {}
+            reqs = _reqs(pdf, stats)
+            ok &= _check(reqs == ref_reqs and stats == {"misses": 1} and entry.is_file(),
+                         f"{name}: bom, {len(reqs)} funn fra ny parsing, lagret igjen")
+            ok &= _check(_pages(pdf, {}) == ref, f"{name}: ny oppføring gir alle {N_PAGES} sider")
+
+    if not ok:
+        print("[FEIL] Tekst-cachen avviker.")
+        return 1
+    print("[OK] Tekst-cache fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
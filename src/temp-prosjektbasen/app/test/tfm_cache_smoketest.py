@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for TFM-referansecachen (app.services.tfm_data).
+- Paritet: rader og oppslag fra data/tfm.xlsx er identiske med tidligere _load_tfm_mapping
+  (pandas + iterrows per forespørsel), innstillinger med tidligere _load_tfm_settings_dict
+- Tid: tidligere lesing per kall vs varm cache
+- Invalidering: endret xlsx/json leses på nytt (mtime/størrelse); invalidate() fanger endring
+  med samme størrelse og mtime; manglende fil → tomt, opprettet fil → lest
+- Tråder: samtidige kall gir samme objekt
+Bruk:
+  python -m app.test.tfm_cache_smoketest [antall_kall]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from app.services.tfm_data import (
+    TFM_SETTINGS, TFM_XLSX, cache_info, invalidate, load_json, load_tfm_mapping, load_tfm_settings,
+)
+from app.test.common import check as _check
+
+
+def old_mapping(path: Path):
+    """Tidligere _load_tfm_mapping + iterrows i rutene."""
+    try:
+        df = pd.read_excel(path, sheet_name="TFM", header=None, dtype=str)
+    except Exception:
+        with pd.ExcelFile(path) as xls:
+            first = xls.sheet_names[0]
+        df = pd.read_excel(path, sheet_name=first, header=None, dtype=str)
+    df = df.fillna("Ikke i bruk")
+    df = df[df[0].notna() & (df[0].astype(str).str.strip() != "")]
+    rows = [(str(r[0]).strip(), str(r[1]).strip()) for _, r in df.iterrows()]
+    return rows, dict(zip(df[0].astype(str).str.strip(), df[1].astype(str).str.strip()))
+
+
+def old_settings(path: Path) -> dict:
+    if not path.exists() or path.stat().st_size == 0:
+        return {}
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "innstillinger" in data:
+        data = {i["kode"]: bool(i["aktiv"]) for i in data.get("innstillinger", []) if "kode" in i}
+    return data if isinstance(data, dict) else {}
+
+
+def main() -> int:
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    ok = True
+
+    rows, lookup = old_mapping(TFM_XLSX)
+    mapping = load_tfm_mapping()
+    ok &= _check(list(mapping.rows) == rows and dict(mapping.lookup) == lookup,
+                 f"tfm.xlsx: {len(rows)} rader identiske med tidligere lesing")
+    ok &= _check(dict(load_tfm_settings()) == old_settings(TFM_SETTINGS),
+                 f"tfm-settings.json: {len(old_settings(TFM_SETTINGS))} koder identiske")
+
+    t0 = time.perf_counter()
+    for _ in range(5):
+        old_mapping(TFM_XLSX)
+        old_settings(TFM_SETTINGS)
+    t_old = (time.perf_counter() - t0) / 5
+    t0 = time.perf_counter()
+    for _ in range(n_calls):
+        m = load_tfm_mapping()
+        s = load_tfm_settings()
+        [(k, d, s.get(k, True)) for k, d in m.rows]
+    t_new = (time.perf_counter() - t0) / n_calls
+    print(f"[INFO] Per forespørsel: {t_old * 1e3:.1f} ms → {t_new * 1e3:.3f} ms "
+          f"({t_old / max(t_new, 1e-9):.0f}x); {cache_info()}")
+
+    with tempfile.TemporaryDirectory(prefix="tfm_cache_") as tmp:
+        xlsx = Path(tmp) / "tfm.xlsx"
+        shutil.copy(TFM_XLSX, xlsx)
+        first = load_tfm_mapping(xlsx)
+        wb = load_workbook(xlsx)
+        wb["TFM"]["B2"] = "Bjelke (endret)"
+        wb.save(xlsx)
+        ok &= _check(load_tfm_mapping(xlsx).describe("AB") == "Bjelke (endret)" and first.describe("AB") == "Bjelke",
+                     "endret tfm.xlsx leses på nytt")
+        ok &= _check(load_tfm_mapping(xlsx) is load_tfm_mapping(xlsx), "uendret fil gir cachet objekt")
+
+        settings = Path(tmp) / "tfm-settings.json"
+        ok &= _check(not load_tfm_settings(settings), "manglende tfm-settings.json → tomt oppsett")
+        settings.write_text(json.dumps({"AB": True, "JV": False}), encoding="utf-8")
+        ok &= _check(dict(load_tfm_settings(settings)) == {"AB": True, "JV": False}, "ny fil leses")
+        st = settings.stat()
+        settings.write_text(json.dumps({"AB": False, "JV": True}), encoding="utf-8")   # samme størrelse
+        os.utime(settings, ns=(st.st_atime_ns, st.st_mtime_ns))                    # og samme mtime
+        stale = dict(load_tfm_settings(settings))
+        invalidate(settings)
+        ok &= _check(stale == {"AB": True, "JV": False} and
+                     dict(load_tfm_settings(settings)) == {"AB": False, "JV": True},
+                     "invalidate() fanger endring med samme mtime og størrelse")
+        settings.write_text(json.dumps({"innstillinger": [{"kode": "AB", "aktiv": 1}]}), encoding="utf-8")
+        ok &= _check(dict(load_tfm_settings(settings)) == {"AB": True}, "format {innstillinger:[...]} støttes")
+        settings.write_text("{ugyldig", encoding="utf-8")
+        ok &= _check(not load_tfm_settings(settings), "ugyldig JSON → tomt oppsett")
+
+        raw = Path(tmp) / "tfm-settings-mc.json"
+        raw.write_text(json.dumps([{"kode": "RT", "aktiv": True}]), encoding="utf-8")
+        ok &= _check(load_json(raw) == [{"kode": "RT", "aktiv": True}], "rå JSON (protokoller) caches")
+
+        invalidate(xlsx)
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: load_tfm_mapping(xlsx), range(32)))
+        ok &= _check(all(r.rows == results[0].rows for r in results) and
+                     len({id(r) for r in results[1:]}) <= 8, "samtidige kall fra 8 tråder")
+
+    if not ok:
+        print("[FEIL] TFM-cachen avviker.")
+        return 1
+    print("[OK] TFM-cache fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Røyktest for strømmende tekstuttrekk i systemkomponent (app.services.upload_text).
+- Paritet: taggene fra spool_upload → iter_text → TagPattern.scan_batches er identiske med
+  tidligere extract_text_from_bytes + finditer for PDF, XLSX (flere ark, tomme rader), DOCX,
+  TXT (multibyte-tegn delt mellom buffere) og filene i app/data
+- Tid til første bit med treff vs tidligere tid til første treff (hele filen lest først)
+- Toppminne (tracemalloc) for tidligere vei vs ny vei
+Bruk:
+  python -m app.test.upload_stream_smoketest [antall_sider]
+Exit code != 0 ved feil.
+"""
+from __future__ import annotations
+import io
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import docx
+import fitz
+from openpyxl import Workbook, load_workbook
+from werkzeug.datastructures import FileStorage
+
+from app.services import upload_text
+from app.services.tag_engine import compile_format
+from app.services.upload_text import iter_text, spool_upload
+from app.test.common import check as _check
+
+APP_DIR = Path(__file__).resolve().parent.parent
+FORMATS = ("{byggnr}{system}{komponent}{typekode}", "{system}{komponent}", "{komponent}")
+
+
+def old_extract(filename: str, data: bytes) -> str:
+    """Tidligere extract_text_from_bytes (routes/systemkomponent.py)."""
+    name = filename.lower()
+    bio = io.BytesIO(data)
+    try:
+        if name.endswith(".pdf"):
+            doc = fitz.open(stream=data, filetype="pdf")
+            text = ""
+            for page in doc:
+                text += page.get_text()
+            return text
+        if name.endswith(".docx"):
+            return "\n".join(p.text for p in docx.Document(bio).paragraphs)
+        if name.endswith(".xlsx"):
+            wb = load_workbook(filename=bio, data_only=True)
+            text = ""
+            for ws in wb.worksheets:
+                for row in ws.iter_rows(values_only=True):
+                    text += " ".join("" if c is None else str(c) for c in row) + "\n"
+            return text
+        if name.endswith(".txt"):
+            return data.decode(errors="ignore")
+    except Exception as e:
+        print(f"[INFO] tidligere lesing feilet for {filename}: {e}")
+    return ""
+
+
+def _tag_line(rnd: random.Random, i: int) -> str:
+    sys_id = f"={rnd.choice(['360', '320', '433'])}.{rnd.randint(1, 99):03d}"
+    komp = f"-{rnd.choice(['JV', 'RT', 'KA', 'QD'])}{rnd.randint(1, 999):03d}"
+    typek = rnd.choice(["", "%T01", "%RTA"])
+    return f"Linje {i}: +1234{sys_id}{komp}{typek} æøå {komp} slutt"
+
+
+def build_files(tmp: Path, n_pages: int) -> dict:
+    rnd = random.Random(11)
+    files = {}
+    with fitz.open() as doc:
+        for p in range(n_pages):
+            body = "\n".join(_tag_line(rnd, p * 40 + i) for i in range(40))
+            doc.new_page().insert_textbox(fitz.Rect(30, 30, 580, 820), body, fontsize=6)
+        files["stor.pdf"] = doc.tobytes()
+
+    wb = Workbook()
+    for s in range(3):
+        ws = wb.active if s == 0 else wb.create_sheet(f"Ark{s}")
+        for r in range(1, 3000):
+            if r % 17 == 0:
+                continue                                   # tomme rader
+            ws.cell(row=r, column=1, value=_tag_line(rnd, r))
+            ws.cell(row=r, column=3 + r % 4, value=r * 1.5 if r % 5 else None)
+    bio = io.BytesIO()
+    wb.save(bio)
+    files["liste.xlsx"] = bio.getvalue()
+
+    d = docx.Document()
+    for i in range(1200):
+        d.add_paragraph(_tag_line(rnd, i))
+    bio = io.BytesIO()
+    d.save(bio)
+    files["beskrivelse.docx"] = bio.getvalue()
+
+    files["notat.txt"] = "\n".join(_tag_line(rnd, i) for i in range(5000)).encode("utf-8")
+    files["ukjent.csv"] = b"=360.001-JV001\n"
+    for p in sorted(APP_DIR.glob("data/*.xlsx"))[:3] + sorted(APP_DIR.glob("data/*.pdf"))[:1]:
+        files[p.name] = p.read_bytes()
+    return files
+
+
+def new_tags(pattern, tmp: Path, name: str, data: bytes, i: int = 0):
+    path = spool_upload(FileStorage(io.BytesIO(data), filename=name), tmp, i)
+    try:
+        return [t for batch in pattern.scan_batches(iter_text(path, name)) for t in batch]
+    finally:
+        path.unlink()
+
+
+def first_hit(pattern, tmp: Path, name: str, data: bytes) -> float:
+    t0 = time.perf_counter()
+    path = spool_upload(FileStorage(io.BytesIO(data), filename=name), tmp)
+    try:
+        for batch in pattern.scan_batches(iter_text(path, name)):
+            if batch:
+                return time.perf_counter() - t0
+    finally:
+        path.unlink()
+    return float("nan")
+
+
+def main() -> int:
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="upload_stream_") as tmp_name:
+        tmp = Path(tmp_name)
+        files = build_files(tmp, n_pages)
+
+        for fmt in FORMATS:
+            pattern = compile_format(fmt)
+            for i, (name, data) in enumerate(files.items()):
+                old = list(pattern.finditer(old_extract(name, data)))
+                new = new_tags(pattern, tmp, name, data, i)
+                ok &= _check(old == new, f"{fmt} / {name}: {len(new)} tagger")
+
+        # TXT med små buffere: multibyte-tegn og linjer delt mellom buffere
+        pattern = compile_format(FORMATS[0])
+        saved = upload_text.UPLOAD_CHUNK_BYTES
+        upload_text.UPLOAD_CHUNK_BYTES = 7
+        try:
+            old = list(pattern.finditer(old_extract("notat.txt", files["notat.txt"])))
+            ok &= _check(old == new_tags(pattern, tmp, "notat.txt", files["notat.txt"]),
+                         "notat.txt med 7-byte buffere")
+        finally:
+            upload_text.UPLOAD_CHUNK_BYTES = saved
+        ok &= _check(not any(tmp.iterdir()), "midlertidige filer er slettet")
+
+        data = files["stor.pdf"]
+        t0 = time.perf_counter()
+        old = list(pattern.finditer(old_extract("stor.pdf", data)))
+        t_old = time.perf_counter() - t0
+        t_first = first_hit(pattern, tmp, "stor.pdf", data)
+        print(f"[INFO] stor.pdf ({n_pages} sider, {len(data) / 1e6:.1f} MB, {len(old)} tagger): "
+              f"første treff etter {t_old * 1e3:.0f} ms → {t_first * 1e3:.1f} ms")
+        ok &= _check(t_first < 1.0, "første treff under 1 s")
+
+        tracemalloc.start()
+        n_old = sum(1 for _ in pattern.finditer(old_extract("stor.pdf", bytes(data))))
+        peak_old = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        src = tmp / "kilde.pdf"
+        src.write_bytes(data)
+        tracemalloc.start()
+        with open(src, "rb") as fh:
+            n_new = sum(len(b) for b in pattern.scan_batches(iter_text(spool_upload(fh, tmp, 1), "stor.pdf")))
+        peak_new = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"[INFO] Toppminne (Python-heap, uten PDF-bytes i minnet): "
+              f"{peak_old / 1e6:.1f} MB → {peak_new / 1e6:.1f} MB")
+        ok &= _check(n_new == n_old and peak_new < peak_old, "lavere toppminne enn tidligere vei")
+
+    if not ok:
+        print("[FEIL] Strømmende uttrekk avviker.")
+        return 1
+    print("[OK] Strømmende uttrekk fullført.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())